@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so that request metrics include the other middleware.
+    'recipes.metrics.MetricsMiddleware',
+    # Before the middleware writing sessions, so that it sees their writes.
+    'recipes.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,7 +59,8 @@ ROOT_URLCONF = 'recipe_manager.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # The Django backend, timing rendering for request metrics.
+        'BACKEND': 'recipes.metrics.DjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -73,13 +79,198 @@ WSGI_APPLICATION = 'recipe_manager.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+#
+# RECIPES_DB_PROFILE selects how SQLite connections are set up:
+# 'development' (default) keeps SQLite's defaults and a connection per
+# request. 'production' switches the database to write-ahead logging, so
+# readers are not blocked by a writer, makes commits skip the fsync that
+# WAL does not need (a power loss can drop the last commits, never corrupt
+# the file), gives every connection a larger page cache, memory-mapped
+# reads and in-memory temporary tables, waits for locks instead of failing
+# at once, and keeps connections open between requests with health checks.
+# Write transactions take the write lock when they begin (IMMEDIATE), so a
+# reader turning writer cannot fail with "database is locked" midway.
+# Compare the profiles with the benchmark_sqlite management command.
+
+SQLITE_PRODUCTION_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    # Page cache per connection, in KiB when negative: 32 MiB.
+    'PRAGMA cache_size=-32768',
+    # Memory-mapped I/O shared by all connections through the OS: 256 MiB.
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA temp_store=MEMORY',
+    # Rows sampled per index by PRAGMA optimize, bounding its run time.
+    'PRAGMA analysis_limit=400',
+]
+
+DATABASE_PROFILES = {
+    'development': {},
+    'production': {
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': '; '.join(SQLITE_PRODUCTION_PRAGMAS),
+            'transaction_mode': 'IMMEDIATE',
+            # Seconds to wait for a lock held by another connection.
+            'timeout': 5,
+        },
+    },
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        **DATABASE_PROFILES[
+            os.environ.get('RECIPES_DB_PROFILE', 'development')
+        ],
     }
 }
 
+# RECIPES_DB_REPLICAS lists read replicas of the database, separated by
+# commas: SQLite files kept up to date from the primary by replication or
+# by copying the file. They are added as the 'replica1', 'replica2', ...
+# aliases with the same profile, and the recipe list and detail pages,
+# search, the JSON API and exports read from them; the admin, imports and
+# everything else use the primary. See recipes/routers.py.
+
+for number, name in enumerate(
+    filter(None, os.environ.get('RECIPES_DB_REPLICAS', '').split(',')), 1
+):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'NAME': name,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+RECIPES_READ_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+DATABASE_ROUTERS = ['recipes.routers.ReplicaRouter']
+
+# The longest the replicas are expected to lag behind the primary, in
+# seconds. A client's reads stay on the primary for this long after it
+# writes, and pages read from a replica this soon after a write are not
+# cached.
+
+RECIPES_REPLICA_LAG_SECONDS = 5
+
+# Every process runs PRAGMA optimize on its SQLite connection after a
+# request at most once per this many seconds, keeping the statistics the
+# query planner chooses indexes with up to date; None disables it. See
+# recipes/database.py.
+
+RECIPES_SQLITE_OPTIMIZE_INTERVAL = 3600
+
+# Recipe search backend: 'fts5' (SQLite full-text table maintained by
+# triggers) or 'index' (portable inverted index maintained by signals).
+# See recipes/search.py.
+
+RECIPES_SEARCH_BACKEND = 'fts5'
+
+# Number of distinct queries whose ranked results are cached per process,
+# and the number of results kept per query.
+
+RECIPES_SEARCH_CACHE_SIZE = 1024
+RECIPES_SEARCH_MAX_RESULTS = 1000
+
+# The in-process ingredient matching index is rebuilt after recipes change,
+# but at most once per this many seconds. See recipes/matching.py.
+
+RECIPES_MATCHING_INDEX_MAX_AGE = 60
+
+# Searches finding nothing are retried with misspelled words corrected
+# against a trigram index of recipe and ingredient names, rebuilt at most
+# once per this many seconds. See recipes/fuzzy.py.
+
+RECIPES_FUZZY_INDEX_MAX_AGE = 60
+
+# Serve the recipe pages and JSON endpoints with async views, which use the
+# async ORM. Enable this when running under an ASGI server such as uvicorn;
+# under WSGI the synchronous views are faster. Compare the two with the
+# loadtest management command.
+
+RECIPES_ASYNC_VIEWS = os.environ.get('RECIPES_ASYNC_VIEWS') == '1'
+
+# Typeahead suggestions are kept in memory and updated from this process's
+# signals; they are reloaded from the database after this many seconds to
+# pick up changes made by other processes. See recipes/suggest.py.
+
+RECIPES_SUGGEST_MAX_AGE = 300
+
+# Requests taking at least this many seconds are logged to the
+# recipes.metrics logger with their slowest and most repeated SQL queries;
+# None disables the log. Per-route latency, SQL and template histograms
+# are served at /metrics either way. See recipes/metrics.py.
+
+RECIPES_SLOW_REQUEST_SECONDS = 1.0
+
+# /metrics is served to staff users and to clients sending this token as
+# "Authorization: Bearer <token>", such as a Prometheus scraper with
+# bearer_token set. Without a token only staff users can read it.
+
+RECIPES_METRICS_TOKEN = os.environ.get('RECIPES_METRICS_TOKEN')
+
+# Update nutrition totals, cards, the inverted search index and similar
+# recipes in background jobs run by the run_jobs command, rather than in
+# the requests changing recipes. Workers drop cached pages once they are
+# done, so use a cache shared between processes (file or redis) with it.
+# See recipes/jobs.py.
+
+RECIPES_BACKGROUND_JOBS = os.environ.get('RECIPES_BACKGROUND_JOBS') == '1'
+
+# A job waits this many seconds after it is first queued, so that further
+# changes to the same recipe are handled by the same run.
+
+RECIPES_JOB_COALESCE_SECONDS = 2
+
+# A job claimed by a worker is left to it for this many seconds, then
+# given to another worker; jobs must finish well within it.
+
+RECIPES_JOB_VISIBILITY_TIMEOUT = 300
+
+# A failing job is retried after this many seconds, doubled on every
+# further attempt, and kept as failed after RECIPES_JOB_MAX_ATTEMPTS.
+
+RECIPES_JOB_RETRY_SECONDS = 10
+RECIPES_JOB_MAX_ATTEMPTS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+#
+# RECIPES_CACHE_BACKEND selects the cache: 'locmem' (default, development),
+# 'file' or 'redis'. RECIPES_CACHE_LOCATION overrides the directory or URL.
+
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recipe-manager',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get(
+            'RECIPES_CACHE_LOCATION', BASE_DIR / 'cache'
+        ),
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get(
+            'RECIPES_CACHE_LOCATION', 'redis://127.0.0.1:6379'
+        ),
+    },
+}
+
+CACHE_BACKEND = os.environ.get('RECIPES_CACHE_BACKEND', 'locmem')
+
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_BACKEND],
+}
+
+# Rendered recipe pages are invalidated by signals when recipes change, so
+# they can be kept until evicted.
+RECIPES_CACHE_TIMEOUT = None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
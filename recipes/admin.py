@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Recipe, Ingredient, Tag
+from django.db.models import Count
+from django.utils import timezone
+from .models import Food, Job, Recipe, Ingredient, Tag
 
 
 class IngredientInline(admin.TabularInline):
@@ -24,10 +26,16 @@ class TagAdmin(admin.ModelAdmin):
     list_display = ['name', 'recipe_count']
     search_fields = ['name']
 
+    def get_queryset(self, request):
+        """Count recipes for the whole changelist in one aggregate query."""
+        return super().get_queryset(request).annotate(
+            recipe_count=Count('recipes')
+        )
+
+    @admin.display(description='Recipes', ordering='recipe_count')
     def recipe_count(self, obj):
         """Return the number of recipes with this tag."""
-        return obj.recipes.count()
-    recipe_count.short_description = 'Recipes'
+        return obj.recipe_count
 
 
 @admin.register(Ingredient)
@@ -37,3 +45,32 @@ class IngredientAdmin(admin.ModelAdmin):
     list_filter = ['recipe']
     search_fields = ['name', 'recipe__name']
 
+
+@admin.register(Food)
+class FoodAdmin(admin.ModelAdmin):
+    """Admin interface for Food model."""
+    list_display = ['name', 'canonical_name', 'calories', 'protein', 'fat',
+                    'carbohydrate']
+    search_fields = ['name', 'canonical_name']
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """Admin interface for queued background jobs."""
+    list_display = ['task', 'key', 'attempts', 'available_at', 'worker',
+                    'failed_at']
+    list_filter = ['task', ('failed_at', admin.EmptyFieldListFilter)]
+    search_fields = ['key', 'last_error']
+    readonly_fields = [field.name for field in Job._meta.fields]
+    actions = ['retry']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Retry selected jobs now')
+    def retry(self, request, queryset):
+        """Give the selected jobs their attempts again, to run at once."""
+        count = queryset.update(
+            available_at=timezone.now(), attempts=0, failed_at=None,
+        )
+        self.message_user(request, f"{count} jobs queued again.")
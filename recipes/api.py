@@ -0,0 +1,594 @@
+"""JSON API for recipes.
+
+Recipes are serialized straight from ``values()`` rows, without creating
+model instances. Clients choose the fields they need with
+``?fields=name,tags``; related ingredients and tags are only loaded when
+requested, with one query per relation for the whole response.
+
+The ``Async`` views serve the list, detail, batch and search endpoints
+with the async ORM when the project runs under ASGI; see
+``RECIPES_ASYNC_VIEWS``.
+"""
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.views import View
+
+from . import fuzzy, suggest, units
+from .matching import canonicalize, match_recipes
+from .models import Ingredient, Recipe
+from .pagination import IdListPaginator, InvalidCursor, KeysetPaginator
+from .routers import ReplicaReadsMixin
+from .search import (
+    aall_matches, acached_search_ids, all_matches, cached_search_ids,
+    get_max_results, is_complete,
+)
+
+SCALAR_FIELDS = (
+    'id', 'name', 'description', 'servings', 'prep_time', 'cook_time',
+    'total_time', 'instructions', 'calories', 'protein', 'fat',
+    'carbohydrate', 'created_at', 'updated_at',
+)
+NUTRITION_FIELDS = ('calories', 'protein', 'fat', 'carbohydrate')
+RELATED_FIELDS = ('ingredients', 'tags')
+ALL_FIELDS = SCALAR_FIELDS + RELATED_FIELDS
+SUMMARY_FIELDS = ('id', 'name', 'description', 'tags')
+
+# Range filters of the list and search endpoints: parameter -> lookup.
+RANGE_FILTERS = {
+    'max_prep_time': 'prep_time__lte',
+    'max_cook_time': 'cook_time__lte',
+    'max_total_time': 'total_time__lte',
+    'min_servings': 'servings__gte',
+    'max_servings': 'servings__lte',
+}
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+MAX_BATCH_SIZE = 100
+MAX_PANTRY_SIZE = 50
+DEFAULT_SUGGESTIONS = 10
+
+
+class ApiError(Exception):
+    """Error reported to the client as a JSON body."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class CompactJSONResponse(JsonResponse):
+    """JSON response without insignificant whitespace."""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('json_dumps_params', {'separators': (',', ':')})
+        super().__init__(data, encoder=DjangoJSONEncoder, safe=False, **kwargs)
+
+
+def parse_fields(request, default) -> tuple[str, ...]:
+    """Return the fields requested with ``?fields=``, ``id`` always first."""
+    raw = request.GET.get('fields')
+    if not raw:
+        fields = default
+    else:
+        fields = [field.strip() for field in raw.split(',') if field.strip()]
+        unknown = sorted(set(fields) - set(ALL_FIELDS))
+        if unknown:
+            raise ApiError(f"Unknown fields: {', '.join(unknown)}.")
+    return ('id', *(field for field in dict.fromkeys(fields) if field != 'id'))
+
+
+def parse_limit(request) -> int:
+    """Return the page size requested with ``?limit=``."""
+    raw = request.GET.get('limit')
+    if raw is None:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ApiError("limit must be an integer.")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ApiError(f"limit must be between 1 and {MAX_PAGE_SIZE}.")
+    return limit
+
+
+def parse_filters(request) -> dict[str, int]:
+    """Return the lookups of the range filters given as parameters."""
+    filters = {}
+    for name, lookup in RANGE_FILTERS.items():
+        raw = request.GET.get(name)
+        if not raw:
+            continue
+        try:
+            value = int(raw)
+        except ValueError:
+            raise ApiError(f"{name} must be an integer.")
+        if value < 0:
+            raise ApiError(f"{name} must not be negative.")
+        filters[lookup] = value
+    return filters
+
+
+def parse_ids(request) -> list[int]:
+    """Return the distinct recipe ids requested with ``?ids=``."""
+    try:
+        ids = [
+            int(pk) for pk in request.GET.get('ids', '').split(',')
+            if pk.strip()
+        ]
+    except ValueError:
+        raise ApiError("ids must be a comma-separated list of integers.")
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise ApiError("The ids parameter is required.")
+    if len(ids) > MAX_BATCH_SIZE:
+        raise ApiError(f"At most {MAX_BATCH_SIZE} ids may be requested.")
+    return ids
+
+
+def parse_query(request) -> str:
+    """Return the required search query given with ``?q=``."""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        raise ApiError("The q parameter is required.")
+    return query
+
+
+def parse_scaling(request) -> tuple[int | None, str | None]:
+    """Return the ``?servings=`` and ``?units=`` to scale recipes to."""
+    try:
+        return units.parse_scaling(request.GET)
+    except units.ScalingError as error:
+        raise ApiError(str(error))
+
+
+def scale_document(document, servings, variant) -> dict:
+    """Scale the ingredients and nutrition totals of a document of a
+    recipe of ``servings``.
+
+    ``variant`` is the ``(servings, units)`` requested.
+    """
+    target, system = variant
+    if not any(variant):
+        return document
+    try:
+        factor = units.scale_factor(servings, target)
+    except units.ScalingError as error:
+        raise ApiError(str(error))
+    items = document.get('ingredients', [])
+    converted = units.convert(
+        [item['quantity'] for item in items],
+        [item['unit'] for item in items],
+        [factor] * len(items),
+        system,
+    )
+    for item, (quantity, unit) in zip(items, converted):
+        item['quantity'] = quantity
+        item['unit'] = unit
+    for field in NUTRITION_FIELDS:
+        if document.get(field) is not None:
+            document[field] = round(document[field] * factor, 1)
+    if target and 'servings' in document:
+        document['servings'] = target
+    return document
+
+
+def filter_ids(query, ids, filters) -> list[int]:
+    """Return the ranked ids of recipes matching ``query`` and ``filters``.
+
+    ``ids`` are the cached results of the search. When they are not
+    complete, the search runs again with the filters applied before its
+    results are cut, so that matches ranked lower are not lost.
+    """
+    if not filters:
+        return ids
+    if not is_complete(ids):
+        return list(
+            all_matches(query, ids).filter(**filters)
+            .values_list('pk', flat=True)[:get_max_results()]
+        )
+    matching = set(
+        Recipe.objects.filter(pk__in=ids, **filters)
+        .values_list('pk', flat=True)
+    )
+    return [pk for pk in ids if pk in matching]
+
+
+async def afilter_ids(query, ids, filters) -> list[int]:
+    """Asynchronous version of ``filter_ids``."""
+    if not filters:
+        return ids
+    if not is_complete(ids):
+        matches = await aall_matches(query, ids)
+        return [
+            pk async for pk in matches.filter(**filters)
+            .values_list('pk', flat=True)[:get_max_results()]
+        ]
+    matching = {
+        pk async for pk in Recipe.objects.filter(pk__in=ids, **filters)
+        .values_list('pk', flat=True)
+    }
+    return [pk for pk in ids if pk in matching]
+
+
+def recipe_values(fields, extra=()):
+    """Return a ``values()`` queryset selecting the scalar ``fields``."""
+    columns = [field for field in fields if field in SCALAR_FIELDS]
+    columns.extend(field for field in extra if field not in columns)
+    return Recipe.objects.values(*columns)
+
+
+def _related_querysets(ids, fields) -> dict:
+    """Return ``(recipe_id, ...)`` row querysets of the requested
+    relations."""
+    querysets = {}
+    if ids and 'ingredients' in fields:
+        querysets['ingredients'] = Ingredient.objects.filter(
+            recipe_id__in=ids
+        ).values_list('recipe_id', 'quantity', 'unit', 'name')
+    if ids and 'tags' in fields:
+        querysets['tags'] = Recipe.tags.through.objects.filter(
+            recipe_id__in=ids
+        ).order_by('tag__name').values_list('recipe_id', 'tag__name')
+    return querysets
+
+
+def _group(field, related_rows) -> defaultdict:
+    """Group related rows by recipe id into API values."""
+    grouped = defaultdict(list)
+    for recipe_id, *values in related_rows:
+        if field == 'ingredients':
+            quantity, unit, name = values
+            grouped[recipe_id].append(
+                {'quantity': quantity, 'unit': unit, 'name': name}
+            )
+        else:
+            grouped[recipe_id].append(values[0])
+    return grouped
+
+
+def _documents(rows, fields, related) -> list[dict]:
+    documents = []
+    for row in rows:
+        document = {}
+        for field in fields:
+            if field in related:
+                document[field] = related[field].get(row['id'], [])
+            else:
+                document[field] = row[field]
+        documents.append(document)
+    return documents
+
+
+def serialize(rows, fields) -> list[dict]:
+    """Turn ``values()`` rows into API documents with only ``fields``.
+
+    Requested relations are attached with a single query each.
+    """
+    rows = list(rows)
+    querysets = _related_querysets([row['id'] for row in rows], fields)
+    related = {
+        field: _group(field, queryset)
+        for field, queryset in querysets.items()
+    }
+    return _documents(rows, fields, related)
+
+
+async def aserialize(rows, fields) -> list[dict]:
+    """Asynchronous version of ``serialize``."""
+    rows = list(rows)
+    querysets = _related_querysets([row['id'] for row in rows], fields)
+    related = {
+        field: _group(field, [item async for item in queryset])
+        for field, queryset in querysets.items()
+    }
+    return _documents(rows, fields, related)
+
+
+class ApiView(ReplicaReadsMixin, View):
+    """Base view rendering ``ApiError`` as a JSON error response.
+
+    The API only reads, from a read replica when there are any.
+    """
+    http_method_names = ['get', 'head', 'options']
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except ApiError as error:
+            return self.error_response(error)
+
+    @staticmethod
+    def error_response(error: ApiError):
+        return CompactJSONResponse(
+            {'error': error.message}, status=error.status
+        )
+
+    def http_method_not_allowed(self, request, *args, **kwargs):
+        return self.method_not_allowed_response()
+
+    def method_not_allowed_response(self):
+        return CompactJSONResponse(
+            {'error': "Method not allowed."},
+            status=405,
+            headers={'Allow': ', '.join(self._allowed_methods())},
+        )
+
+    def get_page(self, paginator):
+        """Return the page selected by ``after``/``before`` cursors."""
+        try:
+            return paginator.get_page(
+                after=self.request.GET.get('after'),
+                before=self.request.GET.get('before'),
+            )
+        except InvalidCursor:
+            raise ApiError("Invalid page cursor.")
+
+    def paginated_response(self, paginator, fields, **extra):
+        """Render the page selected by ``after``/``before`` cursors.
+
+        ``extra`` items are added to the response object.
+        """
+        page = self.get_page(paginator)
+        return self.page_response(
+            page, serialize(page.object_list, fields), extra
+        )
+
+    @staticmethod
+    def page_response(page, documents, extra):
+        return CompactJSONResponse({
+            'results': documents,
+            'next': page.next_cursor,
+            'previous': page.previous_cursor,
+            **extra,
+        })
+
+
+class RecipeListApiView(ApiView):
+    """List recipes, newest first, with cursor pagination.
+
+    ``?max_prep_time=``, ``?max_cook_time=``, ``?max_total_time=``,
+    ``?min_servings=`` and ``?max_servings=`` filter the list, here and in
+    search results.
+    """
+
+    def get(self, request):
+        fields = parse_fields(request, SUMMARY_FIELDS)
+        queryset = recipe_values(fields, extra=('created_at',)).filter(
+            **parse_filters(request)
+        )
+        paginator = KeysetPaginator(queryset, parse_limit(request))
+        return self.paginated_response(paginator, fields)
+
+
+class RecipeSearchApiView(ApiView):
+    """Full-text search with results ranked by relevance.
+
+    When nothing matches, misspelled words are corrected and the corrected
+    query, reported as ``corrected_query``, is searched instead.
+    """
+
+    def get(self, request):
+        query = parse_query(request)
+        fields = parse_fields(request, SUMMARY_FIELDS)
+        filters = parse_filters(request)
+        ids = cached_search_ids(query)
+        corrected = None
+        if not ids:
+            corrected = fuzzy.correct_query(query)
+            if corrected:
+                ids = cached_search_ids(corrected)
+        ids = filter_ids(corrected or query, ids, filters)
+        paginator = IdListPaginator(
+            recipe_values(fields), ids, parse_limit(request)
+        )
+        return self.paginated_response(
+            paginator, fields, corrected_query=corrected
+        )
+
+
+class RecipeBatchApiView(ApiView):
+    """Fetch several recipes by id in one request: ``?ids=1,2,3``."""
+
+    def get(self, request):
+        ids = parse_ids(request)
+        fields = parse_fields(request, SUMMARY_FIELDS)
+        rows = recipe_values(fields).in_bulk(ids)
+        found = [rows[pk] for pk in ids if pk in rows]
+        return CompactJSONResponse({
+            'results': serialize(found, fields),
+            'missing': [pk for pk in ids if pk not in rows],
+        })
+
+
+class RecipeDetailApiView(ApiView):
+    """Return a single recipe, with all fields by default.
+
+    ``?servings=N`` scales the ingredients and ``?units=metric|us``
+    converts them.
+    """
+
+    def get(self, request, id):
+        fields = parse_fields(request, ALL_FIELDS)
+        variant = parse_scaling(request)
+        row = recipe_values(fields, extra=('servings',)).filter(pk=id).first()
+        if row is None:
+            raise ApiError("Recipe not found.", status=404)
+        document = serialize([row], fields)[0]
+        return CompactJSONResponse(
+            scale_document(document, row['servings'], variant)
+        )
+
+
+class RecipeMatchApiView(ApiView):
+    """Rank recipes by how many of their ingredients the client has.
+
+    ``?ingredients=tomato,basil,pasta`` lists the pantry. Each result
+    carries its ``coverage`` (the fraction of its ingredients found in the
+    pantry) and the canonical names of the ``missing`` ones.
+    """
+
+    def get(self, request):
+        names = [
+            name.strip()
+            for name in request.GET.get('ingredients', '').split(',')
+            if name.strip()
+        ]
+        if not names:
+            raise ApiError("The ingredients parameter is required.")
+        if len(names) > MAX_PANTRY_SIZE:
+            raise ApiError(
+                f"At most {MAX_PANTRY_SIZE} ingredients may be given."
+            )
+        try:
+            min_coverage = float(request.GET.get('min_coverage', 0))
+        except ValueError:
+            raise ApiError("min_coverage must be a number.")
+        if not 0 <= min_coverage <= 1:
+            raise ApiError("min_coverage must be between 0 and 1.")
+        fields = parse_fields(request, SUMMARY_FIELDS)
+        matches = match_recipes(
+            names, limit=parse_limit(request), min_coverage=min_coverage
+        )
+
+        ids = [pk for pk, _, _ in matches]
+        rows = recipe_values(fields).in_bulk(ids)
+        pantry = {canonicalize(name) for name in names}
+        missing = defaultdict(set)
+        for recipe_id, name in Ingredient.objects.filter(
+            recipe_id__in=ids
+        ).exclude(canonical_name__in=pantry).values_list(
+            'recipe_id', 'canonical_name'
+        ):
+            missing[recipe_id].add(name)
+
+        # Recipes deleted since the index was built are skipped.
+        matches = [match for match in matches if match[0] in rows]
+        documents = serialize([rows[pk] for pk, _, _ in matches], fields)
+        for document, (pk, covered, total) in zip(documents, matches):
+            document['coverage'] = round(covered / total, 4)
+            document['missing'] = sorted(missing[pk] - {''})
+        return CompactJSONResponse({'results': documents})
+
+
+class SuggestApiView(ApiView):
+    """Typeahead completions of ``?q=`` across recipe, ingredient and tag
+    names, most popular first.
+
+    Served from an in-process index without database queries.
+    """
+
+    def get(self, request):
+        query = request.GET.get('q', '')
+        raw = request.GET.get('limit', DEFAULT_SUGGESTIONS)
+        try:
+            limit = int(raw)
+        except ValueError:
+            raise ApiError("limit must be an integer.")
+        if not 1 <= limit <= suggest.MAX_SUGGESTIONS:
+            raise ApiError(
+                f"limit must be between 1 and {suggest.MAX_SUGGESTIONS}."
+            )
+        return CompactJSONResponse({
+            'query': query,
+            'suggestions': suggest.suggest(query, limit),
+        })
+
+
+class AsyncApiView(ApiView):
+    """Base view for API endpoints with asynchronous handlers."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            return await View.dispatch(self, request, *args, **kwargs)
+        except ApiError as error:
+            return self.error_response(error)
+
+    async def http_method_not_allowed(self, request, *args, **kwargs):
+        return self.method_not_allowed_response()
+
+    async def aget_page(self, paginator):
+        """Asynchronous version of ``get_page``."""
+        try:
+            return await paginator.aget_page(
+                after=self.request.GET.get('after'),
+                before=self.request.GET.get('before'),
+            )
+        except InvalidCursor:
+            raise ApiError("Invalid page cursor.")
+
+    async def apaginated_response(self, paginator, fields, **extra):
+        """Asynchronous version of ``paginated_response``."""
+        page = await self.aget_page(paginator)
+        return self.page_response(
+            page, await aserialize(page.object_list, fields), extra
+        )
+
+
+class AsyncRecipeListApiView(AsyncApiView):
+    """Asynchronous version of ``RecipeListApiView``."""
+
+    async def get(self, request):
+        fields = parse_fields(request, SUMMARY_FIELDS)
+        queryset = recipe_values(fields, extra=('created_at',)).filter(
+            **parse_filters(request)
+        )
+        paginator = KeysetPaginator(queryset, parse_limit(request))
+        return await self.apaginated_response(paginator, fields)
+
+
+class AsyncRecipeSearchApiView(AsyncApiView):
+    """Asynchronous version of ``RecipeSearchApiView``."""
+
+    async def get(self, request):
+        query = parse_query(request)
+        fields = parse_fields(request, SUMMARY_FIELDS)
+        filters = parse_filters(request)
+        ids = await acached_search_ids(query)
+        corrected = None
+        if not ids:
+            corrected = await sync_to_async(fuzzy.correct_query)(query)
+            if corrected:
+                ids = await acached_search_ids(corrected)
+        ids = await afilter_ids(corrected or query, ids, filters)
+        paginator = IdListPaginator(
+            recipe_values(fields), ids, parse_limit(request)
+        )
+        return await self.apaginated_response(
+            paginator, fields, corrected_query=corrected
+        )
+
+
+class AsyncRecipeBatchApiView(AsyncApiView):
+    """Asynchronous version of ``RecipeBatchApiView``."""
+
+    async def get(self, request):
+        ids = parse_ids(request)
+        fields = parse_fields(request, SUMMARY_FIELDS)
+        rows = await recipe_values(fields).ain_bulk(ids)
+        found = [rows[pk] for pk in ids if pk in rows]
+        return CompactJSONResponse({
+            'results': await aserialize(found, fields),
+            'missing': [pk for pk in ids if pk not in rows],
+        })
+
+
+class AsyncRecipeDetailApiView(AsyncApiView):
+    """Asynchronous version of ``RecipeDetailApiView``."""
+
+    async def get(self, request, id):
+        fields = parse_fields(request, ALL_FIELDS)
+        variant = parse_scaling(request)
+        row = await recipe_values(fields, extra=('servings',)).filter(
+            pk=id
+        ).afirst()
+        if row is None:
+            raise ApiError("Recipe not found.", status=404)
+        document = (await aserialize([row], fields))[0]
+        return CompactJSONResponse(
+            scale_document(document, row['servings'], variant)
+        )
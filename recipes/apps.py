@@ -6,3 +6,5 @@ class RecipesConfig(AppConfig):
     name = 'recipes'
     verbose_name = 'Recipes'
 
+    def ready(self):
+        from . import database, metrics, signals  # noqa: F401
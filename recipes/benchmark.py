@@ -0,0 +1,481 @@
+"""In-process benchmarks of the main request paths on synthetic catalogs.
+
+A catalog of ``size`` recipes generated by ``recipes.synthetic`` lives in
+its own SQLite file. It is built once through the bulk importer and reused
+by later runs with the same size and seed, so 10k, 100k and 1M recipe
+catalogs can sit side by side.
+
+Each scenario sends requests through the full middleware stack with the
+test client and records the latency and SQL query count of every
+request. The cache is a private local-memory one, cleared before every
+request, so results measure database and rendering work rather than
+cache hits. The ``import`` scenario bulk imports new synthetic records in
+a transaction that is rolled back, leaving the catalog unchanged.
+
+Results are plain JSON dicts; ``compare()`` lists the regressions of a
+run against a stored baseline of the same catalog.
+
+``concurrent_reads()`` compares database profiles (``DATABASE_PROFILES``
+in the settings) instead: reader processes load list pages and recipes
+from a copy of the catalog while a writer process keeps saving recipes
+and their ingredients, each on its own connection set up by the profile.
+"""
+import os
+import multiprocessing
+import platform
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models import Max, Min
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import synthetic
+from .cache import search_results
+from .importing import RecipeImporter
+from .loadtest import Stats
+from .models import Ingredient, Recipe, RecipeCard
+
+# Run in this order: importing marks the in-process indexes stale.
+SCENARIOS = (
+    'list', 'list_filtered', 'search_popular', 'search_rare',
+    'ingredient_search', 'detail', 'import',
+)
+IMPORT_BATCH_SIZE = 100
+# Pantry of the ingredient search: common ingredients.
+PANTRY = ('onion', 'garlic', 'tomato', 'olive oil', 'salt')
+# Recipes per list page read by ``concurrent_reads``.
+PAGE_SIZE = 24
+# Slower or faster results within this many milliseconds are noise.
+NOISE_MS = 0.5
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recipes-benchmark',
+    },
+}
+
+
+class BenchmarkError(Exception):
+    """Raised when a benchmark cannot be run or compared."""
+
+
+def build_catalog(size: int, seed: int, progress=None) -> int:
+    """Import ``size`` synthetic recipes; return how many were imported."""
+    importer = RecipeImporter(progress=progress)
+    importer.run(synthetic.records(size, seed))
+    return importer.recipes
+
+
+@contextmanager
+def use_catalog(path, size: int, seed: int, progress=None):
+    """Run the block against the catalog database at ``path``.
+
+    The database is created, migrated and filled on first use, like a
+    test database kept with ``--keepdb``.
+    """
+    test_settings = connection.settings_dict['TEST']
+    test_name = test_settings.get('NAME')
+    test_settings['NAME'] = str(path)
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False, keepdb=True
+    )
+    try:
+        count = Recipe.objects.count()
+        if not count:
+            count = build_catalog(size, seed, progress)
+        if count != size:
+            raise BenchmarkError(
+                f"{path} holds {count} recipes, not {size}; delete it to "
+                f"build it again."
+            )
+        yield
+    finally:
+        connection.creation.destroy_test_db(
+            old_name, verbosity=0, keepdb=True
+        )
+        test_settings['NAME'] = test_name
+
+
+def summarize(stats: Stats, queries, unit: str, items: int) -> dict:
+    """Return the result of a scenario from its timings."""
+    elapsed = sum(stats.latencies)
+    return {
+        'operations': len(stats.latencies),
+        'errors': stats.errors,
+        'unit': unit,
+        'throughput': items / elapsed if elapsed else 0.0,
+        'p50_ms': stats.percentile(0.5),
+        'p95_ms': stats.percentile(0.95),
+        'p99_ms': stats.percentile(0.99),
+        'queries': max(queries, default=0),
+    }
+
+
+class Benchmark:
+    """Scenarios over the recipes of the current database."""
+
+    def __init__(self, seed: int = 0, requests: int = 100,
+                 warmup: int = 10):
+        self.seed = seed
+        self.requests = requests
+        self.warmup = warmup
+        self.client = Client()
+
+    def paths(self, name: str) -> list[str]:
+        """Return the paths the ``name`` scenario requests in turn."""
+        terms = synthetic.search_terms()
+        list_url = reverse('recipes:list')
+        if name == 'list':
+            return [list_url]
+        if name == 'list_filtered':
+            return [f'{list_url}?tag={synthetic.TAGS[0]}&max_total_time=30']
+        if name == 'search_popular':
+            return [f'{list_url}?q={terms["popular"]}']
+        if name == 'search_rare':
+            return [f'{list_url}?q={terms["rare"]}']
+        if name == 'ingredient_search':
+            return [f'{reverse("recipes:api-match")}?ingredients='
+                    f'{",".join(PANTRY)}']
+        if name == 'detail':
+            bounds = Recipe.objects.aggregate(low=Min('pk'), high=Max('pk'))
+            if bounds['low'] is None:
+                raise BenchmarkError("The catalog is empty.")
+            pks = range(bounds['low'], bounds['high'] + 1)
+            rng = random.Random(self.seed)
+            return [
+                reverse('recipes:detail', args=[pk])
+                for pk in rng.sample(pks, min(len(pks), self.requests))
+            ]
+        raise BenchmarkError(f"Unknown scenario {name!r}.")
+
+    def get(self, path: str) -> tuple[int, float, int]:
+        """Request ``path`` with cold caches; return its status, latency
+        and query count."""
+        cache.clear()
+        search_results.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = self.client.get(path)
+            latency = time.perf_counter() - started
+        return response.status_code, latency, len(queries)
+
+    def run_requests(self, name: str) -> dict:
+        paths = self.paths(name)
+        for number in range(self.warmup):
+            self.get(paths[number % len(paths)])
+        stats = Stats()
+        queries = []
+        for number in range(self.requests):
+            status, latency, count = self.get(paths[number % len(paths)])
+            stats.record(status, latency)
+            if status != 200:
+                stats.errors += 1
+            queries.append(count)
+        return summarize(stats, queries, 'requests', self.requests)
+
+    def run_import(self) -> dict:
+        """Import new records in batches and roll them back."""
+        batches = max(1, self.requests // 10)
+        records = synthetic.records(
+            (batches + 1) * IMPORT_BATCH_SIZE, self.seed + 1
+        )
+        stats = Stats()
+        queries = []
+        with transaction.atomic():
+            importer = RecipeImporter(batch_size=IMPORT_BATCH_SIZE)
+            for number in range(batches + 1):
+                batch = [next(records) for _ in range(IMPORT_BATCH_SIZE)]
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    importer.run(batch)
+                    latency = time.perf_counter() - started
+                # The first batch creates the tags; leave it out.
+                if number:
+                    stats.record(200, latency)
+                    queries.append(len(captured))
+            transaction.set_rollback(True)
+        return summarize(
+            stats, queries, 'recipes', batches * IMPORT_BATCH_SIZE
+        )
+
+    def run(self, names=SCENARIOS) -> dict:
+        """Run the ``names`` scenarios; return ``{name: result}``."""
+        results = {}
+        with override_settings(CACHES=CACHES, ALLOWED_HOSTS=['testserver']):
+            for name in SCENARIOS:
+                if name not in names:
+                    continue
+                if name == 'import':
+                    results[name] = self.run_import()
+                else:
+                    results[name] = self.run_requests(name)
+        return results
+
+
+def environment(size: int, seed: int) -> dict:
+    """Return what a run's results depend on besides the code."""
+    return {
+        'size': size,
+        'seed': seed,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'machine': platform.machine(),
+    }
+
+
+def compare(results: dict, baseline: dict,
+            tolerance: float = 0.25) -> list[str]:
+    """Return the regressions of ``results`` against ``baseline``.
+
+    Both are ``{'environment': ..., 'scenarios': ...}`` run documents. A
+    scenario regresses when its p95 latency grows or its throughput
+    drops by more than ``tolerance``, or when it runs more queries.
+    """
+    for key in ('size', 'seed'):
+        if results['environment'][key] != baseline['environment'][key]:
+            raise BenchmarkError(
+                f"The baseline was run with {key} "
+                f"{baseline['environment'][key]}, not "
+                f"{results['environment'][key]}."
+            )
+    regressions = []
+    for name, result in results['scenarios'].items():
+        base = baseline['scenarios'].get(name)
+        if base is None:
+            continue
+        limit = base['p95_ms'] * (1 + tolerance) + NOISE_MS
+        if result['p95_ms'] > limit:
+            regressions.append(
+                f"{name}: p95 {result['p95_ms']:.1f} ms, baseline "
+                f"{base['p95_ms']:.1f} ms"
+            )
+        if result['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {result['throughput']:.1f} {result['unit']}/s, "
+                f"baseline {base['throughput']:.1f}"
+            )
+        if result['queries'] > base['queries']:
+            regressions.append(
+                f"{name}: {result['queries']} queries, baseline "
+                f"{base['queries']}"
+            )
+        if result['errors'] > base['errors']:
+            regressions.append(
+                f"{name}: {result['errors']} errors, baseline "
+                f"{base['errors']}"
+            )
+    return regressions
+
+
+def copy_database(source, target) -> None:
+    """Copy the SQLite database ``source`` to ``target`` in rollback
+    journal mode."""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(f'{target}{suffix}'):
+            os.remove(f'{target}{suffix}')
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+        dst.execute('PRAGMA journal_mode=DELETE')
+    src.close()
+    dst.close()
+
+
+def profile_connection(profile: str, name, alias: str):
+    """Return a new, unopened connection to the SQLite database ``name``
+    set up as the ``profile`` database profile does."""
+    settings_dict = {
+        **connections.settings['default'],
+        # Django's defaults, for profiles leaving them out.
+        'CONN_MAX_AGE': 0,
+        'CONN_HEALTH_CHECKS': False,
+        'OPTIONS': {},
+        **settings.DATABASE_PROFILES[profile],
+        'NAME': str(name),
+    }
+    return type(connections['default'])(settings_dict, alias)
+
+
+class ConcurrentReads:
+    """Reader processes and one writer process sharing a database for a
+    fixed duration.
+
+    Processes rather than threads, as with a multi-process server, so
+    the readers do not take turns on the GIL.
+    """
+
+    # Seconds given to the processes to start before measuring.
+    STARTUP = 0.5
+
+    def __init__(self, profile: str, name, readers: int = 4,
+                 duration: float = 5.0, seed: int = 0):
+        self.profile = profile
+        self.name = name
+        self.readers = readers
+        self.duration = duration
+        self.seed = seed
+        self.pks = list(Recipe.objects.values_list('pk', flat=True))
+        if not self.pks:
+            raise BenchmarkError("The catalog is empty.")
+        self.page = RecipeCard.objects.all()[:PAGE_SIZE].query \
+            .sql_with_params()
+        # Queries of one recipe, taking its id as their only parameter.
+        self.recipe_queries = [
+            queryset.query.sql_with_params()[0] for queryset in (
+                Recipe.objects.filter(pk=0),
+                Ingredient.objects.filter(recipe=0),
+            )
+        ]
+        self.columns = [
+            field.column for field in Ingredient._meta.concrete_fields
+            if not field.primary_key
+        ]
+        self.started = self.deadline = None
+
+    def wait_for_start(self) -> None:
+        time.sleep(max(0.0, self.started - time.monotonic()))
+
+    def read(self, number: int) -> dict:
+        """Load a list page and a recipe until the deadline."""
+        db = profile_connection(self.profile, self.name, f'reader-{number}')
+        rng = random.Random(self.seed + number)
+        latencies = []
+        errors = 0
+        self.wait_for_start()
+        try:
+            while time.monotonic() < self.deadline:
+                pk = rng.choice(self.pks)
+                started = time.perf_counter()
+                try:
+                    with db.cursor() as cursor:
+                        cursor.execute(*self.page)
+                        cursor.fetchall()
+                        for sql in self.recipe_queries:
+                            cursor.execute(sql, [pk])
+                            cursor.fetchall()
+                except DatabaseError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+        finally:
+            db.close()
+        return {'latencies': latencies, 'errors': errors}
+
+    def write(self) -> dict:
+        """Save recipes with their ingredients until the deadline."""
+        db = profile_connection(self.profile, self.name, 'writer')
+        recipe_table = Recipe._meta.db_table
+        ingredient_table = Ingredient._meta.db_table
+        columns = ', '.join(self.columns)
+        placeholders = ', '.join(['%s'] * len(self.columns))
+        db.ensure_connection()
+        # Django's transaction mode for the profile.
+        mode = db.transaction_mode or 'DEFERRED'
+        rng = random.Random(self.seed)
+        writes = errors = 0
+        self.wait_for_start()
+        try:
+            while time.monotonic() < self.deadline:
+                pk = rng.choice(self.pks)
+                try:
+                    with db.cursor() as cursor:
+                        cursor.execute(f'BEGIN {mode}')
+                        cursor.execute(
+                            f'UPDATE {recipe_table} SET description = %s, '
+                            f'updated_at = %s WHERE id = %s',
+                            [f'Edited {writes}', timezone.now(), pk],
+                        )
+                        cursor.execute(
+                            f'SELECT {columns} FROM {ingredient_table} '
+                            f'WHERE recipe_id = %s', [pk],
+                        )
+                        rows = cursor.fetchall()
+                        cursor.execute(
+                            f'DELETE FROM {ingredient_table} '
+                            f'WHERE recipe_id = %s', [pk],
+                        )
+                        cursor.executemany(
+                            f'INSERT INTO {ingredient_table} ({columns}) '
+                            f'VALUES ({placeholders})', rows,
+                        )
+                        cursor.execute('COMMIT')
+                except DatabaseError:
+                    errors += 1
+                    if db.connection.in_transaction:
+                        db.connection.rollback()
+                    continue
+                writes += 1
+        finally:
+            db.close()
+        return {'writes': writes, 'errors': errors}
+
+    def work(self, queue, number: int | None) -> None:
+        """Run a reader, or the writer if ``number`` is None, and put its
+        results on ``queue``."""
+        if number is None:
+            queue.put(('writer', self.write()))
+        else:
+            queue.put(('reader', self.read(number)))
+
+    def run(self) -> dict:
+        """Run the readers and the writer; return the results."""
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise BenchmarkError("Concurrent reads need the fork start "
+                                 "method, which this platform lacks.")
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        self.started = time.monotonic() + self.STARTUP
+        self.deadline = self.started + self.duration
+        # Children must open their own connections.
+        connections.close_all()
+        processes = [
+            context.Process(target=self.work, args=(queue, number))
+            for number in [None, *range(self.readers)]
+        ]
+        for process in processes:
+            process.start()
+        outcomes = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        stats = Stats()
+        writer = {}
+        for kind, outcome in outcomes:
+            if kind == 'writer':
+                writer = outcome
+            else:
+                stats.latencies.extend(outcome['latencies'])
+                stats.errors += outcome['errors']
+        return {
+            'readers': self.readers,
+            'reads_per_second': len(stats.latencies) / self.duration,
+            'read_p50_ms': stats.percentile(0.5),
+            'read_p99_ms': stats.percentile(0.99),
+            'read_errors': stats.errors,
+            'writes_per_second': writer['writes'] / self.duration,
+            'write_errors': writer['errors'],
+        }
+
+
+def concurrent_reads(profiles, directory, readers: int = 4,
+                     duration: float = 5.0, seed: int = 0) -> dict:
+    """Run ``ConcurrentReads`` on a copy of the current database for each
+    of ``profiles``; return ``{profile: result}``."""
+    source = connection.settings_dict['NAME']
+    results = {}
+    for profile in profiles:
+        name = os.path.join(directory, f'{profile}.sqlite3')
+        copy_database(source, name)
+        results[profile] = ConcurrentReads(
+            profile, name, readers, duration, seed
+        ).run()
+    return results
@@ -0,0 +1,274 @@
+"""Caching of rendered recipe pages, list cards and search results.
+
+Page and card entries are keyed by recipe id and deleted from model
+signals whenever a recipe, one of its ingredients or one of its tags
+changes, so they never need to expire on their own.
+
+Search results are kept in a bounded in-process LRU cache. Entries are
+stamped with a generation counter held in the shared cache; any recipe
+or ingredient change bumps it, which makes every cached result stale in
+every process at once.
+
+With read replicas (see ``recipes.routers``), a page or search read from
+a replica within ``RECIPES_REPLICA_LAG_SECONDS`` of the last committed
+write may predate it, so it is served but not cached.
+
+Functions prefixed with ``a`` are asynchronous versions for async views.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+
+from . import metrics, routers
+from .units import SYSTEMS
+
+CARD_FRAGMENT = 'recipe_card'
+SEARCH_GENERATION_KEY = 'recipes:search:generation'
+WRITTEN_AT_KEY = 'recipes:written_at'
+
+# Detail pages scaled with ``?servings=&units=`` are cached for these
+# servings counts in every unit system; other counts are rendered on each
+# request. Every cached variant is one more key to delete when a recipe
+# changes.
+CACHED_SERVINGS = range(1, 13)
+DETAIL_VARIANTS = frozenset(
+    (servings, system)
+    for servings in (None, *CACHED_SERVINGS)
+    for system in (None, *SYSTEMS)
+)
+
+
+def get_timeout() -> int | None:
+    """Return the timeout for cached recipe pages, in seconds."""
+    return getattr(settings, 'RECIPES_CACHE_TIMEOUT', None)
+
+
+def detail_key(recipe_id, variant=None) -> str:
+    """Return the key of a rendered detail page.
+
+    ``variant`` is the ``(servings, units)`` the page is scaled to.
+    """
+    key = f'recipes:detail:{recipe_id}'
+    if variant and any(variant):
+        servings, system = variant
+        key += f':{servings or ""}:{system or ""}'
+    return key
+
+
+def is_cached_variant(variant) -> bool:
+    """Return True if detail pages scaled to ``variant`` are cached."""
+    return variant in DETAIL_VARIANTS
+
+
+def get_card_timeout(stale: bool = False) -> int | None:
+    """Return the timeout for cached list cards; 0, caching nothing, for
+    ``stale`` pages."""
+    return 0 if stale else get_timeout()
+
+
+def card_key(recipe_id) -> str:
+    """Return the key of the ``{% cache %}`` fragment for a list card."""
+    return make_template_fragment_key(CARD_FRAGMENT, [recipe_id])
+
+
+def get_detail(recipe_id, variant=None):
+    """Return the cached ``(updated_at, content)`` of a detail page."""
+    cached = cache.get(detail_key(recipe_id, variant))
+    metrics.registry.record_cache('detail', cached is not None)
+    return cached
+
+
+async def aget_detail(recipe_id, variant=None):
+    """Asynchronous version of ``get_detail``."""
+    cached = await cache.aget(detail_key(recipe_id, variant))
+    metrics.registry.record_cache('detail', cached is not None)
+    return cached
+
+
+def set_detail(recipe_id, updated_at, content: bytes, variant=None) -> None:
+    """Cache the rendered detail page of a recipe."""
+    cache.set(
+        detail_key(recipe_id, variant), (updated_at, content), get_timeout()
+    )
+
+
+async def aset_detail(recipe_id, updated_at, content: bytes,
+                      variant=None) -> None:
+    """Asynchronous version of ``set_detail``."""
+    await cache.aset(
+        detail_key(recipe_id, variant), (updated_at, content), get_timeout()
+    )
+
+
+def invalidate_recipes(recipe_ids) -> None:
+    """Drop every cached page, scaled page and card of the given recipes."""
+    keys = []
+    for recipe_id in recipe_ids:
+        keys.extend(
+            detail_key(recipe_id, variant) for variant in DETAIL_VARIANTS
+        )
+        keys.append(card_key(recipe_id))
+    if keys:
+        cache.delete_many(keys)
+        note_write()
+
+
+def note_write() -> None:
+    """Record the time the current transaction commits, when replicas
+    are read."""
+    if routers.get_replicas():
+        transaction.on_commit(_set_written_at)
+
+
+def _set_written_at() -> None:
+    cache.set(WRITTEN_AT_KEY, time.time(), None)
+
+
+def _within_lag(written_at) -> bool:
+    return (
+        written_at is not None
+        and time.time() - written_at < routers.get_replica_lag()
+    )
+
+
+def replica_may_be_stale() -> bool:
+    """Return True if the current request reads from a replica that may
+    not have caught up with the last write yet."""
+    return (
+        routers.reading_from_replica()
+        and _within_lag(cache.get(WRITTEN_AT_KEY))
+    )
+
+
+async def areplica_may_be_stale() -> bool:
+    """Asynchronous version of ``replica_may_be_stale``."""
+    return (
+        routers.reading_from_replica()
+        and _within_lag(await cache.aget(WRITTEN_AT_KEY))
+    )
+
+
+def get_search_generation() -> int:
+    """Return the current search results generation."""
+    generation = cache.get(SEARCH_GENERATION_KEY)
+    if generation is None:
+        # Start from the clock rather than zero so that a counter lost to
+        # eviction or a cache flush never repeats an earlier generation.
+        cache.add(SEARCH_GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(SEARCH_GENERATION_KEY, 0)
+    return generation
+
+
+async def aget_search_generation() -> int:
+    """Asynchronous version of ``get_search_generation``."""
+    generation = await cache.aget(SEARCH_GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(SEARCH_GENERATION_KEY, time.time_ns(), None)
+        generation = await cache.aget(SEARCH_GENERATION_KEY, 0)
+    return generation
+
+
+def bump_search_generation() -> None:
+    """Invalidate all cached search results in every process."""
+    try:
+        cache.incr(SEARCH_GENERATION_KEY)
+    except ValueError:
+        # The counter is missing; starting a new one is enough.
+        get_search_generation()
+    note_write()
+
+
+class SearchResultCache:
+    """Bounded LRU cache of ordered recipe ids per normalized query."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, query: str) -> tuple[int, ...] | None:
+        """Return the cached ids for ``query`` if they are still current."""
+        return self._lookup(query, get_search_generation())
+
+    async def aget(self, query: str) -> tuple[int, ...] | None:
+        """Asynchronous version of ``get``."""
+        return self._lookup(query, await aget_search_generation())
+
+    def _lookup(self, query: str, generation: int):
+        with self._lock:
+            entry = self._entries.get(query)
+            hit = entry is not None and entry[0] == generation
+            if hit:
+                self._entries.move_to_end(query)
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.registry.record_cache('search', hit)
+        return entry[1] if hit else None
+
+    def set(self, query: str, ids, generation: int | None = None) -> None:
+        """Store ``ids`` for ``query``, evicting the least recently used.
+
+        Pass the ``generation`` read before computing ``ids`` so that
+        results computed concurrently with a write are never stored as
+        current.
+        """
+        if generation is None:
+            generation = get_search_generation()
+        with self._lock:
+            self._entries[query] = (generation, tuple(ids))
+            self._entries.move_to_end(query)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, query: str, compute) -> tuple[int, ...]:
+        """Return cached ids for ``query``, calling ``compute`` on a miss."""
+        ids = self.get(query)
+        if ids is None:
+            generation = get_search_generation()
+            ids = tuple(compute())
+            if not replica_may_be_stale():
+                self.set(query, ids, generation)
+        return ids
+
+    async def aget_or_set(self, query: str, acompute) -> tuple[int, ...]:
+        """Asynchronous version of ``get_or_set``; ``acompute`` is awaited."""
+        ids = await self.aget(query)
+        if ids is None:
+            generation = await aget_search_generation()
+            ids = tuple(await acompute())
+            if not await areplica_may_be_stale():
+                self.set(query, ids, generation)
+        return ids
+
+    def clear(self) -> None:
+        """Drop all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        """Return counters suitable for monitoring."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'generation': get_search_generation(),
+            }
+
+
+search_results = SearchResultCache(
+    getattr(settings, 'RECIPES_SEARCH_CACHE_SIZE', 1024)
+)
@@ -0,0 +1,64 @@
+"""Upkeep of SQLite connections.
+
+SQLite's query planner picks indexes using statistics gathered by
+``ANALYZE``; without them it guesses, and on skewed data it can guess
+wrong. ``PRAGMA optimize`` runs ``ANALYZE`` only on the tables whose
+statistics are missing or out of date, bounded by ``analysis_limit``, so
+it is cheap enough to run regularly. After a request finishes, each
+process runs it on its open SQLite connections at most once per
+``RECIPES_SQLITE_OPTIMIZE_INTERVAL`` seconds.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import connections
+from django.dispatch import receiver
+
+from . import routers
+
+_lock = threading.Lock()
+_last_optimized = None
+
+
+def get_optimize_interval() -> float | None:
+    """Return the seconds between ``PRAGMA optimize`` runs, or None."""
+    return getattr(settings, 'RECIPES_SQLITE_OPTIMIZE_INTERVAL', None)
+
+
+def optimize(connection) -> None:
+    """Run ``PRAGMA optimize`` on a SQLite connection."""
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA optimize')
+
+
+def optimize_due() -> bool:
+    """Return True, and restart the interval, if an optimize is due."""
+    global _last_optimized
+    interval = get_optimize_interval()
+    if interval is None:
+        return False
+    now = time.monotonic()
+    with _lock:
+        if _last_optimized is not None and now - _last_optimized < interval:
+            return False
+        _last_optimized = now
+        return True
+
+
+@receiver(request_finished)
+def optimize_connections(sender, **kwargs):
+    """Optimize this thread's open SQLite connections when due.
+
+    Read replicas are left alone; their statistics come from the primary.
+    """
+    replicas = routers.get_replicas()
+    open_connections = [
+        connection for connection in connections.all(initialized_only=True)
+        if connection.vendor == 'sqlite' and connection.connection is not None
+        and not connection.in_atomic_block and connection.alias not in replicas
+    ]
+    if open_connections and optimize_due():
+        for connection in open_connections:
+            optimize(connection)
@@ -0,0 +1,113 @@
+"""Streaming export of the whole recipe catalog.
+
+Recipes are read in primary-key order, one keyset chunk at a time, and
+each chunk's ingredients and tags are loaded with one query per relation.
+Documents are yielded as soon as their chunk is serialized, so memory use
+is bounded by the chunk size rather than by the catalog size.
+
+The output uses the same shapes that ``import_recipes`` reads, so an
+export can be loaded into another database as-is.
+"""
+import csv
+import io
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .api import ALL_FIELDS, RELATED_FIELDS, serialize
+from .importing import escape
+from .models import Recipe
+
+FORMATS = ('jsonl', 'csv')
+CONTENT_TYPES = {
+    'jsonl': 'application/jsonl',
+    'csv': 'text/csv',
+}
+
+
+def iter_chunks(chunk_size: int = 1000):
+    """Yield lists of denormalized recipe documents, oldest first."""
+    columns = [field for field in ALL_FIELDS if field not in RELATED_FIELDS]
+    queryset = Recipe.objects.order_by('pk').values(*columns)
+    last_pk = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not rows:
+            return
+        yield serialize(rows, ALL_FIELDS)
+        last_pk = rows[-1]['id']
+
+
+def iter_jsonl(chunks):
+    """Yield JSON Lines text, one string per chunk of documents."""
+    for documents in chunks:
+        yield ''.join(
+            json.dumps(document, cls=DjangoJSONEncoder, separators=(',', ':'))
+            + '\n'
+            for document in documents
+        )
+
+
+def _csv_cell(value) -> str:
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_row(document) -> list[str]:
+    row = []
+    for field in ALL_FIELDS:
+        value = document[field]
+        if field == 'tags':
+            value = ';'.join(escape(name) for name in value)
+        elif field == 'ingredients':
+            value = ';'.join(
+                '|'.join(
+                    escape(_csv_cell(item[key]))
+                    for key in ('quantity', 'unit', 'name')
+                )
+                for item in value
+            )
+        row.append(_csv_cell(value))
+    return row
+
+
+def iter_csv(chunks):
+    """Yield CSV text in the column layout read by ``import_recipes``."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ALL_FIELDS)
+    for documents in chunks:
+        writer.writerows(_csv_row(document) for document in documents)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Header of an empty export.
+        yield buffer.getvalue()
+
+
+def gzip_stream(chunks):
+    """Compress an iterable of byte strings into a gzip stream."""
+    compressor = zlib.compressobj(wbits=31)  # 31 selects the gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export(format: str = 'jsonl', compress: bool = False,
+           chunk_size: int = 1000):
+    """Yield the encoded export as byte strings."""
+    writers = {'jsonl': iter_jsonl, 'csv': iter_csv}
+    if format not in writers:
+        raise ValueError(f"Unknown export format {format!r}")
+    chunks = (
+        text.encode('utf-8')
+        for text in writers[format](iter_chunks(chunk_size))
+    )
+    return gzip_stream(chunks) if compress else chunks
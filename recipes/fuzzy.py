@@ -0,0 +1,200 @@
+"""Typo-tolerant correction of search queries.
+
+The vocabulary is every word of the recipe and ingredient names, counted
+by how many names use it. A character-trigram index maps each trigram of
+a word, padded so the first and last letters form trigrams of their own,
+to the words containing it. An insertion, deletion or substitution
+changes at most three trigrams and an adjacent transposition four, so a
+word within ``k`` edits of a query word shares all but ``4 * k`` of its
+trigrams; counting shared trigrams over the postings yields a short list
+of candidates, which are then ranked by their actual edit distance and by
+how common they are.
+
+Only words missing from the vocabulary are corrected, and search falls
+back to the corrected query only when the exact one finds nothing. The
+index is rebuilt when recipes or ingredients have changed, at most once
+every ``RECIPES_FUZZY_INDEX_MAX_AGE`` seconds.
+"""
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Count
+
+from . import cache
+from .models import Ingredient, Recipe
+from .search import query_tokens
+
+# Candidates re-ranked by edit distance for every misspelled word.
+MAX_CANDIDATES = 50
+
+
+def trigrams(word: str) -> set[str]:
+    """Return the trigrams of ``word`` padded with two leading spaces and
+    one trailing space."""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edits(word: str) -> int:
+    """Return the number of typos tolerated in a word of this length."""
+    if len(word) < 4:
+        return 0
+    if len(word) < 6:
+        return 1
+    return 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Return the edit distance of ``a`` and ``b``, or ``limit + 1`` if it
+    exceeds ``limit``.
+
+    Insertions, deletions, substitutions and transpositions of adjacent
+    characters each count as one edit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, row = previous, row, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            row[j] = min(
+                previous[j] + 1, row[j - 1] + 1, previous[j - 1] + cost
+            )
+            if (i > 1 and j > 1 and a[i - 1] == b[j - 2]
+                    and a[i - 2] == b[j - 1]):
+                row[j] = min(row[j], before[j - 2] + 1)
+        if min(row) > limit:
+            return limit + 1
+    return min(row[-1], limit + 1)
+
+
+class TrigramIndex:
+    """Trigram index over a vocabulary of words."""
+
+    def __init__(self, counts):
+        """Build the index from ``{word: number of names using it}``."""
+        self.words = sorted(counts)
+        self.counts = array('I', [counts[word] for word in self.words])
+        postings = defaultdict(lambda: array('I'))
+        for position, word in enumerate(self.words):
+            for trigram in trigrams(word):
+                postings[trigram].append(position)
+        self.postings = dict(postings)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        i = bisect_left(self.words, word)
+        return i < len(self.words) and self.words[i] == word
+
+    def has_prefix(self, prefix: str) -> bool:
+        """Return True if a word of the vocabulary starts with ``prefix``."""
+        i = bisect_left(self.words, prefix)
+        return i < len(self.words) and self.words[i].startswith(prefix)
+
+    def candidates(self, word: str, edits: int) -> list[int]:
+        """Return positions of words that may be within ``edits`` edits."""
+        grams = trigrams(word)
+        shared = defaultdict(int)
+        for trigram in grams:
+            for position in self.postings.get(trigram, ()):
+                shared[position] += 1
+        needed = max(len(grams) - 4 * edits, 1)
+        return heapq.nlargest(
+            MAX_CANDIDATES,
+            (position for position, count in shared.items()
+             if count >= needed),
+            key=shared.__getitem__,
+        )
+
+    def correct(self, word: str) -> str | None:
+        """Return the closest known word to ``word``, or None.
+
+        Ties in edit distance go to the word used by more names.
+        """
+        edits = max_edits(word)
+        if not edits:
+            return None
+        best = None
+        for position in self.candidates(word, edits):
+            candidate = self.words[position]
+            distance = edit_distance(word, candidate, edits)
+            if distance > edits:
+                continue
+            rank = (distance, -self.counts[position], candidate)
+            if best is None or rank < best:
+                best = rank
+        return best[2] if best else None
+
+    def correct_query(self, query: str) -> str | None:
+        """Return ``query`` with unknown words corrected, or None if no
+        word could be corrected.
+
+        The last word is kept if it is the prefix of a known word, since
+        search matches it as a prefix.
+        """
+        tokens = query_tokens(query)
+        corrected = []
+        for i, token in enumerate(tokens):
+            known = (
+                self.has_prefix(token) if i == len(tokens) - 1
+                else token in self
+            )
+            corrected.append(
+                token if known else self.correct(token) or token
+            )
+        if corrected == tokens:
+            return None
+        return ' '.join(corrected)
+
+
+def load_counts() -> dict:
+    """Return ``{word: count}`` over recipe and ingredient names."""
+    counts = defaultdict(int)
+    names = [
+        Recipe.objects.order_by().values_list('name')
+        .annotate(count=Count('pk')),
+        Ingredient.objects.order_by().values_list('name')
+        .annotate(count=Count('pk')),
+    ]
+    for queryset in names:
+        for name, count in queryset.iterator():
+            for word in query_tokens(name):
+                if word.isalpha():
+                    counts[word] += count
+    return counts
+
+
+_index = None
+_index_generation = None
+_index_built_at = 0.0
+_index_lock = threading.Lock()
+
+
+def get_index() -> TrigramIndex:
+    """Return this process's index, rebuilding it if it is out of date."""
+    global _index, _index_generation, _index_built_at
+    generation = cache.get_search_generation()
+    max_age = getattr(settings, 'RECIPES_FUZZY_INDEX_MAX_AGE', 60)
+    with _index_lock:
+        if _index is None or (
+            generation != _index_generation
+            and time.monotonic() - _index_built_at >= max_age
+        ):
+            _index = TrigramIndex(load_counts())
+            _index_generation = generation
+            _index_built_at = time.monotonic()
+        return _index
+
+
+def correct_query(query: str) -> str | None:
+    """Return a spelling correction of ``query``, or None."""
+    return get_index().correct_query(query)
@@ -0,0 +1,312 @@
+"""Bulk import of recipes from JSON Lines or CSV.
+
+Input is read lazily and written in chunks with ``bulk_create``, one
+transaction per chunk, so memory use does not grow with the input size.
+After each committed chunk the number of consumed records is written to a
+checkpoint file; an interrupted import resumes from there.
+
+JSON Lines records look like the API's recipe documents::
+
+    {"name": "Pasta", "instructions": "Boil", "servings": 2,
+     "tags": ["italian"],
+     "ingredients": [{"quantity": "200", "unit": "g", "name": "spaghetti"}]}
+
+CSV files have a header row with the scalar recipe columns plus ``tags``
+(names separated by ``;``) and ``ingredients`` (entries separated by
+``;``, each written as ``quantity|unit|name``). A backslash escapes a
+``;`` or ``|`` that is part of a name, and a backslash itself.
+"""
+import csv
+import json
+import os
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+
+from . import cache, nutrition, projection, search, suggest, tasks
+from .matching import canonicalize
+from .models import Ingredient, Recipe, Tag
+
+INT_FIELDS = ('servings', 'prep_time', 'cook_time')
+TEXT_FIELDS = ('name', 'description', 'instructions')
+
+
+class RecordError(ValueError):
+    """Raised for an input record that cannot be imported."""
+
+    def __init__(self, number: int, message: str):
+        super().__init__(f"Record {number}: {message}")
+        self.number = number
+
+
+def iter_jsonl(lines):
+    """Yield one record per non-blank line of JSON Lines input."""
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as exc:
+            raise RecordError(number, f"invalid JSON ({exc.msg})") from exc
+
+
+def escape(text: str) -> str:
+    """Escape the separators of the CSV ``tags`` and ``ingredients``
+    columns in ``text``."""
+    for char in ('\\', ';', '|'):
+        text = text.replace(char, '\\' + char)
+    return text
+
+
+def split_escaped(text: str, separator: str,
+                  unescape: bool = True) -> list[str]:
+    """Split ``text`` on the occurrences of ``separator`` that are not
+    escaped; with ``unescape``, also remove the escapes from the parts."""
+    parts = ['']
+    chars = iter(text)
+    for char in chars:
+        if char == '\\':
+            escaped = next(chars, '')
+            parts[-1] += escaped if unescape else char + escaped
+        elif char == separator:
+            parts.append('')
+        else:
+            parts[-1] += char
+    return parts
+
+
+def iter_csv(lines):
+    """Yield one record per CSV row, in the same shape as JSON Lines."""
+    for row in csv.DictReader(lines):
+        record = {
+            key: value for key, value in row.items()
+            if key not in ('tags', 'ingredients')
+        }
+        record['tags'] = [
+            name.strip()
+            for name in split_escaped(row.get('tags') or '', ';')
+            if name.strip()
+        ]
+        ingredients = []
+        # Entries keep their escapes until they are split into fields.
+        for entry in split_escaped(
+            row.get('ingredients') or '', ';', unescape=False
+        ):
+            if not entry.strip():
+                continue
+            fields = split_escaped(entry, '|')
+            # Unescaped separators after the unit belong to the name.
+            quantity, unit, name = (
+                fields[:2] + ['|'.join(fields[2:])] + ['', '']
+            )[:3]
+            if not name:
+                # A bare name without quantity or unit.
+                quantity, unit, name = '', '', quantity
+            ingredients.append(
+                {'quantity': quantity, 'unit': unit, 'name': name}
+            )
+        record['ingredients'] = ingredients
+        yield record
+
+
+READERS = {
+    'jsonl': iter_jsonl,
+    'csv': iter_csv,
+}
+
+
+def detect_format(path: str) -> str:
+    """Guess the input format from a file name."""
+    return 'csv' if str(path).lower().endswith('.csv') else 'jsonl'
+
+
+def _optional_int(number, record, field):
+    value = record.get(field)
+    if value in (None, ''):
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise RecordError(number, f"{field} must be an integer")
+    if value < 0 or (field == 'servings' and value < 1):
+        raise RecordError(number, f"{field} is out of range")
+    return value
+
+
+def _quantity(number, value):
+    if value in (None, ''):
+        return None
+    try:
+        quantity = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise RecordError(number, f"invalid quantity {value!r}")
+    if not quantity.is_finite() or quantity < 0:
+        raise RecordError(number, f"invalid quantity {value!r}")
+    return quantity.quantize(Decimal('0.01'))
+
+
+def parse_record(number: int, record):
+    """Validate a raw record.
+
+    Returns an unsaved ``Recipe``, a list of ingredient field dicts and a
+    list of tag names.
+    """
+    if not isinstance(record, dict):
+        raise RecordError(number, "expected an object")
+    values = {
+        field: str(record.get(field) or '').strip() for field in TEXT_FIELDS
+    }
+    for field in ('name', 'instructions'):
+        if not values[field]:
+            raise RecordError(number, f"{field} is required")
+    if len(values['name']) > Recipe._meta.get_field('name').max_length:
+        raise RecordError(number, "name is too long")
+    for field in INT_FIELDS:
+        values[field] = _optional_int(number, record, field)
+
+    items = record.get('ingredients') or []
+    if not isinstance(items, list):
+        raise RecordError(number, "ingredients must be a list")
+    ingredients = []
+    for item in items:
+        if isinstance(item, str):
+            item = {'name': item}
+        elif not isinstance(item, dict):
+            raise RecordError(
+                number, "ingredients must be objects or names"
+            )
+        name = str(item.get('name') or '').strip()
+        if not name:
+            raise RecordError(number, "ingredient name is required")
+        ingredients.append({
+            'quantity': _quantity(number, item.get('quantity')),
+            'unit': str(item.get('unit') or '').strip(),
+            'name': name,
+            'canonical_name': canonicalize(name),
+        })
+    names = record.get('tags') or []
+    if not isinstance(names, list) or not all(
+        isinstance(name, str) for name in names
+    ):
+        raise RecordError(number, "tags must be a list of names")
+    tags = list(dict.fromkeys(
+        name.strip() for name in names if name.strip()
+    ))
+    return Recipe(**values), ingredients, tags
+
+
+class Checkpoint:
+    """Number of input records already imported, persisted to a file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self) -> int:
+        try:
+            with open(self.path) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def save(self, count: int) -> None:
+        # Write-then-rename so a crash never leaves a truncated file.
+        temp = f'{self.path}.tmp'
+        with open(temp, 'w') as f:
+            f.write(str(count))
+        os.replace(temp, self.path)
+
+    def clear(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class RecipeImporter:
+    """Insert parsed records in chunks of ``batch_size``."""
+
+    def __init__(self, batch_size: int = 1000, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.tag_ids = dict(Tag.objects.values_list('name', 'id'))
+        self.recipes = 0
+        self.ingredients = 0
+
+    def run(self, records, checkpoint: Checkpoint | None = None,
+            skip: int = 0) -> int:
+        """Import ``records`` after skipping the first ``skip`` of them.
+
+        Returns the number of records consumed, including skipped ones.
+        """
+        consumed = skip
+        records = islice(records, skip, None)
+        started = time.monotonic()
+        while True:
+            chunk = [
+                parse_record(consumed + i, record)
+                for i, record in enumerate(
+                    islice(records, self.batch_size), start=1
+                )
+            ]
+            if not chunk:
+                break
+            self._import_chunk(chunk)
+            consumed += len(chunk)
+            if checkpoint is not None:
+                checkpoint.save(consumed)
+            if self.progress is not None:
+                self.progress(consumed, self.rate(started))
+        return consumed
+
+    def rate(self, started: float) -> float:
+        """Return imported recipes per second since ``started``."""
+        elapsed = time.monotonic() - started
+        return self.recipes / elapsed if elapsed > 0 else 0.0
+
+    def _resolve_tags(self, names) -> None:
+        """Add ids for tag names not seen yet, creating the tags."""
+        missing = set(names) - self.tag_ids.keys()
+        if not missing:
+            return
+        Tag.objects.bulk_create(
+            [Tag(name=name) for name in missing], ignore_conflicts=True
+        )
+        self.tag_ids.update(
+            Tag.objects.filter(name__in=missing).values_list('name', 'id')
+        )
+
+    def _import_chunk(self, chunk) -> None:
+        with transaction.atomic():
+            recipes = Recipe.objects.bulk_create(
+                [recipe for recipe, _, _ in chunk]
+            )
+            self._resolve_tags(
+                name for _, _, tags in chunk for name in tags
+            )
+            ingredients = []
+            taggings = []
+            for recipe, (_, recipe_ingredients, tags) in zip(recipes, chunk):
+                ingredients.extend(
+                    Ingredient(recipe_id=recipe.pk, **fields)
+                    for fields in recipe_ingredients
+                )
+                taggings.extend(
+                    Recipe.tags.through(
+                        recipe_id=recipe.pk, tag_id=self.tag_ids[name]
+                    )
+                    for name in tags
+                )
+            Ingredient.objects.bulk_create(ingredients, self.batch_size)
+            Recipe.tags.through.objects.bulk_create(taggings, self.batch_size)
+            # bulk_create sends no signals, so update derived data here.
+            nutrition.add_recipes(ingredients)
+            projection.refresh_cards(recipe.pk for recipe in recipes)
+            tasks.queue_similarity(recipe.pk for recipe in recipes)
+            if search.uses_inverted_index():
+                search.index_recipes(recipes)
+        cache.bump_search_generation()
+        suggest.invalidate()
+        self.recipes += len(recipes)
+        self.ingredients += len(ingredients)
@@ -0,0 +1,348 @@
+"""Background jobs kept in the database.
+
+Signal handlers keep data derived from recipes (nutrition totals, list
+cards, the inverted search index, similar recipes) up to date as rows are
+saved, so saving a recipe with ten ingredients from the admin recomputed
+it ten times within the request. With ``RECIPES_BACKGROUND_JOBS`` on, they
+queue ``Job`` rows instead, through ``recipes.tasks``, and ``run_jobs``
+workers do the work.
+
+A task is a function registered with ``@task(name)`` that takes a list of
+keys (strings). A task is queued at most once per key: queueing it again
+before it runs changes nothing, so the edits made to a recipe within
+``RECIPES_JOB_COALESCE_SECONDS`` of the first run its job once. Workers
+claim available jobs of one task at a time, up to a batch, and run the
+batch with one call in one transaction.
+
+A claimed job is hidden from other workers for
+``RECIPES_JOB_VISIBILITY_TIMEOUT`` seconds. If its worker dies, another
+one runs it after that, so tasks must be idempotent. A job queued again
+while it runs is run again afterwards. A failing batch is retried one job
+at a time; a failing job is retried after ``RECIPES_JOB_RETRY_SECONDS``,
+doubled on every attempt, and is kept with its error once
+``RECIPES_JOB_MAX_ATTEMPTS`` attempts have failed, until queued again.
+
+Finished jobs are counted per task in ``JobCounter`` rows, and
+``/metrics`` serves these counts with the backlog, so the numbers cover
+every worker process.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Count, F, Min, Q, Subquery
+from django.utils import timezone
+
+from . import metrics
+from .models import Job, JobCounter
+
+logger = logging.getLogger(__name__)
+
+# Registered tasks: name -> (function, coalescing delay or None).
+TASKS = {}
+
+
+def in_background() -> bool:
+    """Return True if derived data is updated by background jobs."""
+    return getattr(settings, 'RECIPES_BACKGROUND_JOBS', False)
+
+
+def get_coalesce_delay() -> float:
+    """Return the seconds a queued job waits for more of the same."""
+    return getattr(settings, 'RECIPES_JOB_COALESCE_SECONDS', 0)
+
+
+def get_visibility_timeout() -> float:
+    """Return the seconds a claimed job is hidden from other workers."""
+    return getattr(settings, 'RECIPES_JOB_VISIBILITY_TIMEOUT', 300)
+
+
+def get_max_attempts() -> int:
+    """Return how many times a failing job is run."""
+    return getattr(settings, 'RECIPES_JOB_MAX_ATTEMPTS', 5)
+
+
+def get_retry_delay() -> float:
+    """Return the seconds before the first retry of a failed job."""
+    return getattr(settings, 'RECIPES_JOB_RETRY_SECONDS', 10)
+
+
+def task(name: str, delay: float | None = None):
+    """Register a function of a list of keys as the task ``name``.
+
+    ``delay`` overrides ``RECIPES_JOB_COALESCE_SECONDS`` for the task.
+    """
+    def register(function):
+        TASKS[name] = (function, delay)
+        return function
+    return register
+
+
+def enqueue(name: str, keys) -> int:
+    """Queue the task ``name`` for each of ``keys``; return how many.
+
+    Jobs already queued are left waiting as they are, but failed jobs are
+    given their attempts again.
+    """
+    _, delay = TASKS[name]
+    now = timezone.now()
+    available_at = now + timedelta(
+        seconds=get_coalesce_delay() if delay is None else delay
+    )
+    jobs = [
+        Job(task=name, key=key, queued_at=now, available_at=available_at)
+        for key in dict.fromkeys(str(key) for key in keys)
+    ]
+    Job.objects.bulk_create(
+        jobs,
+        update_conflicts=True,
+        unique_fields=['task', 'key'],
+        update_fields=['queued_at', 'attempts', 'failed_at', 'last_error'],
+    )
+    return len(jobs)
+
+
+def count(name: str, **amounts) -> None:
+    """Add ``amounts`` to the ``JobCounter`` fields of task ``name``."""
+    increments = {
+        field: F(field) + value for field, value in amounts.items()
+    }
+    if not JobCounter.objects.filter(task=name).update(**increments):
+        JobCounter.objects.get_or_create(task=name)
+        JobCounter.objects.filter(task=name).update(**increments)
+
+
+def _release(jobs) -> None:
+    """Return claimed jobs to the queue as they are."""
+    Job.objects.filter(
+        pk__in=[job.pk for job in jobs], worker=jobs[0].worker
+    ).update(worker='', claimed_at=None, locked_until=None)
+
+
+class Worker:
+    """Claims and runs available jobs in ``threads`` threads.
+
+    Several workers, in one process or many, may share the queue.
+    """
+
+    def __init__(self, threads: int = 1, batch_size: int = 100,
+                 poll_interval: float = 1.0, name: str | None = None):
+        self.threads = threads
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = threading.Event()
+        self.processed = 0
+        self._lock = threading.Lock()
+
+    def claim(self) -> tuple[str | None, list[Job]]:
+        """Claim a batch of available jobs of one task.
+
+        Returns the task name and the claimed jobs, or ``(None, [])``.
+        """
+        now = timezone.now()
+        available = Job.objects.filter(
+            Q(locked_until__isnull=True) | Q(locked_until__lte=now),
+            failed_at__isnull=True,
+            available_at__lte=now,
+        ).order_by('available_at', 'pk')
+        token = f'{self.name}:{uuid.uuid4().hex[:12]}'
+        # A single statement, so that SQLite takes the write lock at once
+        # rather than failing to upgrade a read lock under contention.
+        batch = available.filter(
+            task=Subquery(available.values('task')[:1])
+        ).values('pk')[:self.batch_size]
+        if not Job.objects.filter(pk__in=batch).update(
+            worker=token,
+            claimed_at=now,
+            locked_until=now + timedelta(seconds=get_visibility_timeout()),
+            attempts=F('attempts') + 1,
+        ):
+            return None, []
+        jobs = list(Job.objects.filter(worker=token))
+        return jobs[0].task, jobs
+
+    def run_once(self) -> int:
+        """Claim and run one batch of jobs; return its size."""
+        name, jobs = self.claim()
+        if not jobs:
+            return 0
+        # Jobs whose worker died on their last attempt.
+        expired = [job for job in jobs if job.attempts > get_max_attempts()]
+        for job in expired:
+            self.fail(name, job, "Not finished within the visibility "
+                                 "timeout.")
+        jobs = [job for job in jobs if job.attempts <= get_max_attempts()]
+        if name not in TASKS:
+            for job in jobs:
+                self.fail(name, job, f"Unknown task {name!r}.")
+        elif jobs:
+            self.run_batch(name, jobs)
+        with self._lock:
+            self.processed += len(jobs) + len(expired)
+        return len(jobs) + len(expired)
+
+    def run_batch(self, name: str, jobs) -> None:
+        """Run claimed jobs of task ``name`` and record the outcome."""
+        function, _ = TASKS[name]
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                # Renewing the claim first takes the write lock, which a
+                # SQLite transaction that has read cannot wait for.
+                Job.objects.filter(
+                    pk__in=[job.pk for job in jobs], worker=jobs[0].worker
+                ).update(locked_until=timezone.now() + timedelta(
+                    seconds=get_visibility_timeout()
+                ))
+                function([job.key for job in jobs])
+                self.finish(jobs)
+                count(name, succeeded=len(jobs),
+                      seconds=time.perf_counter() - started)
+        except Exception as exc:
+            if len(jobs) > 1:
+                logger.warning(
+                    "A batch of %d %s jobs failed; running them one at a "
+                    "time.", len(jobs), name
+                )
+                for job in jobs:
+                    self.run_batch(name, [job])
+                return
+            job, = jobs
+            self.fail(name, job, ''.join(traceback.format_exception(exc)))
+            return
+        logger.debug("Ran %d %s jobs in %.3f s.", len(jobs), name,
+                     time.perf_counter() - started)
+
+    @staticmethod
+    def finish(jobs) -> None:
+        """Remove finished jobs, except those queued again since they
+        were claimed."""
+        Job.objects.filter(
+            pk__in=[job.pk for job in jobs], worker=jobs[0].worker,
+            queued_at__lte=F('claimed_at'),
+        ).delete()
+        _release(jobs)
+
+    @staticmethod
+    def fail(name: str, job: Job, error: str) -> None:
+        """Schedule a retry of a failed job, or keep it as failed after
+        its last attempt."""
+        now = timezone.now()
+        mine = Job.objects.filter(
+            pk=job.pk, worker=job.worker, queued_at__lte=F('claimed_at')
+        )
+        if job.attempts >= get_max_attempts():
+            mine.update(failed_at=now, last_error=error)
+            count(name, failed=1)
+            logger.error("Job %s(%s) failed after %d attempts:\n%s",
+                         name, job.key, job.attempts, error)
+        else:
+            delay = get_retry_delay() * 2 ** (job.attempts - 1)
+            mine.update(
+                available_at=now + timedelta(seconds=delay),
+                last_error=error,
+            )
+            count(name, retried=1)
+            logger.warning("Job %s(%s) failed; retrying in %g s:\n%s",
+                           name, job.key, delay, error)
+        _release([job])
+
+    def work(self, burst: bool = False) -> None:
+        """Run batches until stopped, or with ``burst``, until no job is
+        available."""
+        while not self.stopping.is_set():
+            try:
+                ran = self.run_once()
+            except DatabaseError:
+                # Such as a busy database; jobs left claimed are run again
+                # after the visibility timeout.
+                logger.exception("Cannot run jobs; trying again.")
+                self.stopping.wait(self.poll_interval)
+                continue
+            if not ran:
+                if burst:
+                    return
+                self.stopping.wait(self.poll_interval)
+
+    def run(self, burst: bool = False) -> int:
+        """Work in ``threads`` threads; return the number of jobs run."""
+        if self.threads == 1:
+            self.work(burst)
+            return self.processed
+        threads = [
+            threading.Thread(
+                target=self._work_in_thread, args=(burst,),
+                name=f'{self.name}:{number}',
+            )
+            for number in range(self.threads)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.processed
+
+    def _work_in_thread(self, burst: bool) -> None:
+        try:
+            self.work(burst)
+        finally:
+            connections.close_all()
+
+    def stop(self) -> None:
+        """Stop once the running batches are done."""
+        self.stopping.set()
+
+
+def collect_metrics():
+    """Return the backlog and throughput metrics of the jobs."""
+    now = timezone.now()
+    backlog = metrics.GaugeMetric(
+        'recipes_jobs_backlog',
+        "Queued jobs by task and state (waiting, running or failed).",
+    )
+    oldest = metrics.GaugeMetric(
+        'recipes_jobs_oldest_seconds',
+        "Seconds since the oldest waiting or running job was queued.",
+    )
+    finished = metrics.CounterMetric(
+        'recipes_jobs_total', "Finished job attempts by task and result.",
+    )
+    seconds = metrics.CounterMetric(
+        'recipes_jobs_seconds_total', "Time spent running jobs by task.",
+    )
+    for row in Job.objects.order_by().values('task').annotate(
+        total=Count('pk'),
+        failed=Count('pk', filter=Q(failed_at__isnull=False)),
+        running=Count('pk', filter=Q(
+            failed_at__isnull=True, locked_until__gt=now
+        )),
+        oldest=Min('queued_at', filter=Q(failed_at__isnull=True)),
+    ):
+        task_label = ('task', row['task'])
+        waiting = row['total'] - row['failed'] - row['running']
+        for state in ('waiting', 'running', 'failed'):
+            value = waiting if state == 'waiting' else row[state]
+            backlog.set((task_label, ('state', state)), value)
+        if row['oldest'] is not None:
+            oldest.set(
+                (task_label,), (now - row['oldest']).total_seconds()
+            )
+    for counter in JobCounter.objects.all():
+        task_label = ('task', counter.task)
+        for result in ('succeeded', 'retried', 'failed'):
+            finished.inc(
+                (task_label, ('result', result)), getattr(counter, result)
+            )
+        seconds.inc((task_label,), counter.seconds)
+    return [backlog, oldest, finished, seconds]
+
+
+metrics.registry.add_collector(collect_metrics)
@@ -0,0 +1,190 @@
+"""HTTP load generator for comparing deployments of the project.
+
+Every simulated client holds one keep-alive connection and sends GET
+requests back to back, cycling through the given paths, until the run
+ends. Clients are asyncio tasks over plain streams, so a single process
+drives a thousand concurrent connections.
+
+Typical comparison of the synchronous views under WSGI with the async
+views under ASGI, with the same number of worker processes::
+
+    gunicorn --workers 4 --threads 32 --bind :8001 recipe_manager.wsgi
+    RECIPES_ASYNC_VIEWS=1 uvicorn --workers 4 --port 8002 \\
+        recipe_manager.asgi:application
+    python manage.py loadtest http://127.0.0.1:8001 http://127.0.0.1:8002
+
+Neither server is a dependency of the project.
+"""
+import asyncio
+import itertools
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+# Headroom for descriptors other than client sockets.
+RESERVED_FILES = 64
+# Seconds after which a request counts as an error.
+REQUEST_TIMEOUT = 30
+
+
+class LoadTestError(Exception):
+    """Raised when a load test cannot be run."""
+
+
+class Stats:
+    """Latencies and outcomes of the requests of one run."""
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def record(self, status: int, latency: float) -> None:
+        self.statuses[status] += 1
+        self.latencies.append(latency)
+
+    def percentile(self, fraction: float) -> float:
+        """Return a latency percentile in milliseconds."""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = min(int(fraction * len(ordered)), len(ordered) - 1)
+        return ordered[index] * 1000
+
+    def summary(self) -> dict:
+        requests = len(self.latencies)
+        return {
+            'requests': requests,
+            'errors': self.errors,
+            'requests_per_second': (
+                requests / self.elapsed if self.elapsed else 0.0
+            ),
+            'p50_ms': self.percentile(0.5),
+            'p90_ms': self.percentile(0.9),
+            'p99_ms': self.percentile(0.99),
+            'statuses': dict(sorted(self.statuses.items())),
+        }
+
+
+def raise_open_file_limit(concurrency: int) -> int:
+    """Raise the soft open file limit towards what ``concurrency`` needs.
+
+    Returns the resulting limit, or 0 if it cannot be determined.
+    """
+    if resource is None:
+        return 0
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    needed = concurrency + RESERVED_FILES
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        if hard != resource.RLIM_INFINITY:
+            needed = min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (needed, hard))
+        soft = needed
+    return soft
+
+
+async def _read_body(reader, headers: dict) -> bool:
+    """Consume a response body; return False if the server closes."""
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                return True
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+        return headers.get('connection', '').lower() != 'close'
+    await reader.read()
+    return False
+
+
+async def _exchange(reader, writer, request: bytes) -> tuple[int, bool]:
+    """Send one request; return its status and whether to reuse the
+    connection."""
+    writer.write(request)
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("Connection closed by server")
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return status, await _read_body(reader, headers)
+
+
+async def _client(host, port, requests, deadline, stats) -> None:
+    reader = writer = None
+    for request in itertools.cycle(requests):
+        if time.monotonic() >= deadline:
+            break
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            start = time.perf_counter()
+            status, keep_alive = await asyncio.wait_for(
+                _exchange(reader, writer, request), REQUEST_TIMEOUT
+            )
+            stats.record(status, time.perf_counter() - start)
+        except (OSError, ValueError, IndexError,
+                asyncio.IncompleteReadError):
+            # Timeouts are OSErrors too.
+            stats.errors += 1
+            keep_alive = False
+            # Back off so a refusing server is not hammered in a loop.
+            await asyncio.sleep(0.05)
+        if not keep_alive and writer is not None:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def _run(url, paths, concurrency, duration) -> Stats:
+    parts = urlsplit(url)
+    if parts.scheme != 'http' or not parts.hostname:
+        raise LoadTestError(f"Only http:// URLs are supported: {url!r}")
+    host, port = parts.hostname, parts.port or 80
+    base = parts.path.rstrip('/')
+    requests = [
+        (
+            f"GET {base}{path} HTTP/1.1\r\n"
+            f"Host: {parts.netloc}\r\n"
+            "Connection: keep-alive\r\n\r\n"
+        ).encode('latin-1')
+        for path in paths
+    ]
+    stats = Stats()
+    start = time.monotonic()
+    deadline = start + duration
+    await asyncio.gather(*(
+        # Stagger the starting path so clients spread over all of them.
+        _client(host, port, requests[i % len(requests):] +
+                requests[:i % len(requests)], deadline, stats)
+        for i in range(concurrency)
+    ))
+    stats.elapsed = time.monotonic() - start
+    return stats
+
+
+def run(url: str, paths=('/',), concurrency: int = 1000,
+        duration: float = 10.0) -> dict:
+    """Load ``url`` with ``concurrency`` clients for ``duration`` seconds.
+
+    ``paths`` are appended to the path of ``url``. Returns a summary of
+    throughput, latency percentiles and response statuses.
+    """
+    if not paths:
+        raise LoadTestError("At least one path is required.")
+    stats = asyncio.run(_run(url, list(paths), concurrency, duration))
+    return stats.summary()
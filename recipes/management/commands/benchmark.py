@@ -0,0 +1,147 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import benchmark
+
+
+class Command(BaseCommand):
+    """Benchmark the main request paths on a synthetic catalog."""
+    help = (
+        "Build (once) a seeded synthetic catalog of --size recipes in its "
+        "own SQLite file, then time the list, search, detail and import "
+        "paths on it. Results can be saved as JSON with --output and "
+        "compared with a saved run with --baseline, failing on "
+        "regressions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size',
+            type=int,
+            default=10000,
+            help="Recipes in the catalog, e.g. 10000, 100000 or 1000000 "
+                 "(default: 10000)",
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help="Seed of the generated catalog and requests (default: 0)",
+        )
+        parser.add_argument(
+            '--catalog',
+            help="Catalog database file (default: "
+                 "benchmarks/catalog-<size>-<seed>.sqlite3)",
+        )
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            dest='scenarios',
+            choices=benchmark.SCENARIOS,
+            help="Scenario to run; repeat for several (default: all)",
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=100,
+            help="Measured requests per scenario (default: 100)",
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=10,
+            help="Unmeasured requests before each scenario (default: 10)",
+        )
+        parser.add_argument(
+            '--output',
+            help="Write the results to this JSON file",
+        )
+        parser.add_argument(
+            '--baseline',
+            help="Fail if the results regress from this JSON file's",
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.25,
+            help="Allowed relative slowdown against the baseline "
+                 "(default: 0.25)",
+        )
+
+    def handle(self, *args, **options):
+        size = options['size']
+        if size < 1 or options['requests'] < 1:
+            raise CommandError("--size and --requests must be at least 1.")
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline'], encoding='utf-8') as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as exc:
+                raise CommandError(
+                    f"Cannot read {options['baseline']}: {exc}"
+                )
+        catalog = Path(options['catalog'] or Path(
+            settings.BASE_DIR, 'benchmarks',
+            f'catalog-{size}-{options["seed"]}.sqlite3',
+        ))
+        catalog.parent.mkdir(parents=True, exist_ok=True)
+
+        runner = benchmark.Benchmark(
+            seed=options['seed'], requests=options['requests'],
+            warmup=options['warmup'],
+        )
+        try:
+            with benchmark.use_catalog(
+                catalog, size, options['seed'], self.report_progress
+            ):
+                scenarios = runner.run(
+                    options['scenarios'] or benchmark.SCENARIOS
+                )
+        except benchmark.BenchmarkError as exc:
+            raise CommandError(str(exc))
+        results = {
+            'environment': benchmark.environment(size, options['seed']),
+            'scenarios': scenarios,
+        }
+
+        self.stdout.write(
+            f"{'Scenario':<20} {'Ops':>6} {'Errors':>7} {'Throughput':>14} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'Queries':>8}"
+        )
+        for name, result in scenarios.items():
+            throughput = f"{result['throughput']:.1f} {result['unit'][0]}/s"
+            self.stdout.write(
+                f"{name:<20} {result['operations']:>6} "
+                f"{result['errors']:>7} {throughput:>14} "
+                f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+                f"{result['p99_ms']:>8.1f} {result['queries']:>8}"
+            )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+                f.write('\n')
+
+        if baseline is not None:
+            try:
+                regressions = benchmark.compare(
+                    results, baseline, options['tolerance']
+                )
+            except (benchmark.BenchmarkError, KeyError) as exc:
+                raise CommandError(f"Cannot compare with the baseline: {exc}")
+            if regressions:
+                raise CommandError(
+                    "Regressions against the baseline:\n"
+                    + "\n".join(regressions)
+                )
+            self.stdout.write(self.style.SUCCESS(
+                "No regressions against the baseline."
+            ))
+
+    def report_progress(self, consumed, rate):
+        self.stdout.write(
+            f"Building the catalog: {consumed} recipes ({rate:.0f}/sec)"
+        )
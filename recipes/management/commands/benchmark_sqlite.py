@@ -0,0 +1,112 @@
+import json
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import benchmark
+
+
+class Command(BaseCommand):
+    """Compare concurrent read throughput of the SQLite profiles."""
+    help = (
+        "Read list pages and recipes from several processes while another "
+        "keeps saving recipes, once for each database profile in "
+        "DATABASE_PROFILES, on copies of a synthetic catalog built as by "
+        "the benchmark command."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size',
+            type=int,
+            default=10000,
+            help="Recipes in the catalog (default: 10000)",
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help="Seed of the generated catalog (default: 0)",
+        )
+        parser.add_argument(
+            '--catalog',
+            help="Catalog database file (default: "
+                 "benchmarks/catalog-<size>-<seed>.sqlite3)",
+        )
+        parser.add_argument(
+            '--profile',
+            action='append',
+            dest='profiles',
+            choices=sorted(settings.DATABASE_PROFILES),
+            help="Profile to run; repeat for several (default: all)",
+        )
+        parser.add_argument(
+            '--readers',
+            type=int,
+            default=4,
+            help="Concurrent reader processes (default: 4)",
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=5.0,
+            help="Seconds to run each profile for (default: 5)",
+        )
+        parser.add_argument(
+            '--output',
+            help="Write the results to this JSON file",
+        )
+
+    def handle(self, *args, **options):
+        size = options['size']
+        if size < 1 or options['readers'] < 1:
+            raise CommandError("--size and --readers must be at least 1.")
+        catalog = Path(options['catalog'] or Path(
+            settings.BASE_DIR, 'benchmarks',
+            f'catalog-{size}-{options["seed"]}.sqlite3',
+        ))
+        catalog.parent.mkdir(parents=True, exist_ok=True)
+        profiles = options['profiles'] or list(settings.DATABASE_PROFILES)
+
+        try:
+            with benchmark.use_catalog(
+                catalog, size, options['seed'], self.report_progress
+            ), tempfile.TemporaryDirectory() as directory:
+                results = benchmark.concurrent_reads(
+                    profiles, directory, options['readers'],
+                    options['duration'], options['seed'],
+                )
+        except benchmark.BenchmarkError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(
+            f"{'Profile':<14} {'Reads/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+            f"{'Errors':>7} {'Writes/s':>9} {'Errors':>7}"
+        )
+        for profile, result in results.items():
+            self.stdout.write(
+                f"{profile:<14} {result['reads_per_second']:>9.1f} "
+                f"{result['read_p50_ms']:>8.1f} "
+                f"{result['read_p99_ms']:>8.1f} "
+                f"{result['read_errors']:>7} "
+                f"{result['writes_per_second']:>9.1f} "
+                f"{result['write_errors']:>7}"
+            )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({
+                    'environment': benchmark.environment(
+                        size, options['seed']
+                    ),
+                    'readers': options['readers'],
+                    'duration': options['duration'],
+                    'profiles': results,
+                }, f, indent=2)
+                f.write('\n')
+
+    def report_progress(self, consumed, rate):
+        self.stdout.write(
+            f"Building the catalog: {consumed} recipes ({rate:.0f}/sec)"
+        )
@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.exporting import FORMATS, export
+
+
+class Command(BaseCommand):
+    """Stream every recipe to a JSON Lines or CSV file."""
+    help = (
+        "Export all recipes with their ingredients and tags. Recipes are "
+        "read and written in chunks, so memory use does not grow with the "
+        "catalog size. The output can be loaded with import_recipes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            default='jsonl',
+            help="Output format (default: jsonl)",
+        )
+        parser.add_argument(
+            '--output',
+            default='-',
+            help="Output file, or - for standard output (default: -)",
+        )
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help="Compress the output with gzip",
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help="Recipes read per query (default: 1000)",
+        )
+
+    def handle(self, *args, **options):
+        chunks = export(
+            options['format'],
+            compress=options['gzip'],
+            chunk_size=options['chunk_size'],
+        )
+        path = options['output']
+        if path == '-':
+            stream = getattr(self.stdout, 'buffer', None)
+            if stream is None and options['gzip']:
+                raise CommandError(
+                    "Cannot write gzip output to a text stream; use --output."
+                )
+            self.write_chunks(chunks, stream)
+            if stream is not None:
+                stream.flush()
+            return
+        try:
+            with open(path, 'wb') as f:
+                written = self.write_chunks(chunks, f)
+        except OSError as exc:
+            raise CommandError(f"Cannot write {path}: {exc}")
+        self.stderr.write(f"Wrote {written} bytes to {path}.")
+
+    def write_chunks(self, chunks, stream) -> int:
+        """Write ``chunks`` to a binary stream, returning the byte count."""
+        written = 0
+        for chunk in chunks:
+            if stream is None:
+                # Text-only stdout, as when captured by call_command().
+                self.stdout.write(chunk.decode('utf-8'), ending='')
+            else:
+                stream.write(chunk)
+            written += len(chunk)
+        return written
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.importing import (
+    READERS, Checkpoint, RecipeImporter, RecordError, detect_format,
+)
+
+
+class Command(BaseCommand):
+    """Bulk import recipes from a JSON Lines or CSV file."""
+    help = (
+        "Import recipes from JSON Lines or CSV. Records are inserted in "
+        "chunks, one transaction each; after a failure, rerun with --resume "
+        "to continue from the last committed chunk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file")
+        parser.add_argument(
+            '--format',
+            choices=sorted(READERS),
+            help="Input format (default: guessed from the file extension)",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help="Recipes per chunk and transaction (default: 1000)",
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help="Checkpoint file (default: <path>.checkpoint)",
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help="Skip the records recorded in the checkpoint file",
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        reader = READERS[options['format'] or detect_format(path)]
+        checkpoint = Checkpoint(
+            options['checkpoint'] or f'{path}.checkpoint'
+        )
+        skip = checkpoint.load() if options['resume'] else 0
+        if skip:
+            self.stdout.write(f"Resuming after {skip} records.")
+
+        importer = RecipeImporter(
+            batch_size=options['batch_size'], progress=self.report_progress
+        )
+        try:
+            with open(path, newline='', encoding='utf-8') as f:
+                consumed = importer.run(reader(f), checkpoint, skip=skip)
+        except OSError as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+        except RecordError as exc:
+            raise CommandError(
+                f"{exc}. Imported records are committed; fix the input and "
+                f"rerun with --resume."
+            )
+        checkpoint.clear()
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {importer.recipes} recipes and "
+            f"{importer.ingredients} ingredients from {consumed} records."
+        ))
+
+    def report_progress(self, consumed, rate):
+        self.stdout.write(f"{consumed} records ({rate:.0f} rows/sec)")
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import nutrition
+
+
+class Command(BaseCommand):
+    """Load the nutrient reference table from a CSV file."""
+    help = (
+        "Insert or update foods from a CSV table of nutrients per 100 g, "
+        "such as a USDA-style dump, then recompute the nutrition totals of "
+        "all recipes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV food table")
+        parser.add_argument(
+            '--encoding',
+            default='utf-8',
+            help="Encoding of the file (default: utf-8)",
+        )
+        parser.add_argument(
+            '--no-rebuild',
+            action='store_true',
+            help="Skip recomputing recipe totals; run rebuild_nutrition later",
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            with open(path, newline='', encoding=options['encoding']) as f:
+                count = nutrition.load_foods(f)
+        except (OSError, UnicodeDecodeError) as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+        except nutrition.FoodTableError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f"Loaded {count} foods."))
+        if not options['no_rebuild']:
+            recipes = nutrition.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                f"Recomputed nutrition of {recipes} recipes."
+            ))
@@ -0,0 +1,84 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import loadtest
+
+
+class Command(BaseCommand):
+    """Compare the throughput of running servers under concurrent load."""
+    help = (
+        "Send GET requests to one or more running servers from many "
+        "concurrent keep-alive connections and report throughput and "
+        "latency percentiles for each, e.g. a WSGI server with the default "
+        "views against an ASGI server with RECIPES_ASYNC_VIEWS=1."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'urls',
+            nargs='+',
+            metavar='url',
+            help="Base URL of a running server, e.g. http://127.0.0.1:8000",
+        )
+        parser.add_argument(
+            '--path',
+            action='append',
+            dest='paths',
+            help=(
+                "Path requested under each URL; repeat to cycle through "
+                "several (default: /recipes/)"
+            ),
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1000,
+            help="Number of concurrent connections (default: 1000)",
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=10.0,
+            help="Seconds to measure each server for (default: 10)",
+        )
+        parser.add_argument(
+            '--warmup',
+            type=float,
+            default=2.0,
+            help="Seconds of unmeasured load before each run (default: 2)",
+        )
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        if concurrency < 1:
+            raise CommandError("--concurrency must be at least 1.")
+        paths = options['paths'] or ['/recipes/']
+        limit = loadtest.raise_open_file_limit(concurrency)
+        if limit and limit < concurrency + loadtest.RESERVED_FILES:
+            self.stderr.write(self.style.WARNING(
+                f"The open file limit is {limit}; some of the {concurrency} "
+                "connections will fail. Raise it with ulimit -n."
+            ))
+
+        self.stdout.write(
+            f"{'Server':<32} {'Requests':>9} {'Errors':>7} {'Req/s':>9} "
+            f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8}  Statuses"
+        )
+        for url in options['urls']:
+            try:
+                if options['warmup'] > 0:
+                    loadtest.run(url, paths, concurrency, options['warmup'])
+                result = loadtest.run(
+                    url, paths, concurrency, options['duration']
+                )
+            except loadtest.LoadTestError as exc:
+                raise CommandError(str(exc))
+            statuses = ' '.join(
+                f"{status}:{count}"
+                for status, count in result['statuses'].items()
+            )
+            self.stdout.write(
+                f"{url:<32} {result['requests']:>9} {result['errors']:>7} "
+                f"{result['requests_per_second']:>9.1f} "
+                f"{result['p50_ms']:>8.1f} {result['p90_ms']:>8.1f} "
+                f"{result['p99_ms']:>8.1f}  {statuses}"
+            )
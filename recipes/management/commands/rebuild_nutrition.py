@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from recipes import nutrition
+
+
+class Command(BaseCommand):
+    """Recompute the nutrition totals of every recipe."""
+    help = "Recompute the stored nutrition totals and cards of all recipes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help="Number of recipes recomputed per batch (default: 1000)",
+        )
+
+    def handle(self, *args, **options):
+        count = nutrition.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed nutrition of {count} recipes."
+        ))
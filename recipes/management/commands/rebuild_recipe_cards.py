@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recipes import projection
+
+
+class Command(BaseCommand):
+    """Rebuild the recipe list projection from scratch."""
+    help = "Rebuild the precomputed list cards of all recipes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help="Number of recipes rebuilt per batch (default: 1000)",
+        )
+
+    def handle(self, *args, **options):
+        count = projection.rebuild_cards(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} recipe cards."))
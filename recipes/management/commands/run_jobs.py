@@ -0,0 +1,65 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import jobs
+
+
+class Command(BaseCommand):
+    """Run queued background jobs."""
+    help = (
+        "Run the background jobs queued while RECIPES_BACKGROUND_JOBS is "
+        "on, in --threads threads, until stopped with SIGINT or SIGTERM or, "
+        "with --burst, until none is available. Any number of these may "
+        "run at once, on any machine sharing the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=1,
+            help="Threads running jobs (default: 1)",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help="Jobs of one task claimed and run together (default: 100)",
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help="Seconds to wait when no job is available (default: 1)",
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help="Exit once no job is available instead of waiting",
+        )
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1 or options['batch_size'] < 1:
+            raise CommandError(
+                "--threads and --batch-size must be at least 1."
+            )
+        worker = jobs.Worker(
+            threads=options['threads'], batch_size=options['batch_size'],
+            poll_interval=options['poll_interval'],
+        )
+        # Running batches are finished, not rolled back and left locked
+        # until the visibility timeout.
+        handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                handlers[signum] = signal.signal(
+                    signum, lambda signum, frame: worker.stop()
+                )
+        try:
+            count = worker.run(burst=options['burst'])
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(f"Ran {count} jobs."))
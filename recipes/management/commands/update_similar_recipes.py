@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from recipes import similar
+
+
+class Command(BaseCommand):
+    """Recompute the precomputed similar recipes."""
+    help = (
+        "Recompute the similar recipes of recipes changed since the last "
+        "run and of the recipes they affect, or of all recipes with "
+        "--rebuild. Meant to be run periodically, e.g. from cron, unless "
+        "RECIPES_BACKGROUND_JOBS is on and run_jobs workers do it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help="Recompute every recipe instead of the queued changes",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help="Recipes written per chunk with --rebuild (default: 1000)",
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            count = similar.rebuild(batch_size=options['batch_size'])
+        else:
+            count = similar.update()
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed similar recipes of {count} recipes."
+        ))
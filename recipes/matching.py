@@ -0,0 +1,243 @@
+"""Ranking recipes by how much of them a pantry covers.
+
+Ingredient names are reduced to a canonical vocabulary ("Tomatoes",
+"tomato, diced" -> "tomato") when saved, and an in-process inverted index
+maps each canonical ingredient to the recipes using it. Recipes are
+addressed by their position in a sorted id array. Postings of common
+ingredients are bitmaps held in Python integers; rare ones are sorted
+position arrays, converted to bitmaps only when queried.
+
+A pantry query adds the bitmaps of its ingredients into bit-sliced
+counters, so the number of covered ingredients of every recipe is
+computed with a few dozen whole-bitmap operations instead of a loop over
+recipes. Recipes are then grouped by their own ingredient count to rank
+by the covered fraction.
+
+The index is rebuilt from the ``Ingredient.canonical_name`` column when
+recipes or ingredients have changed, at most once every
+``RECIPES_MATCHING_INDEX_MAX_AGE`` seconds.
+"""
+import re
+import threading
+import time
+from array import array
+from collections import defaultdict
+
+from django.conf import settings
+
+from . import cache
+from .models import Ingredient
+from .search import normalize, stem
+
+# Words describing preparation, size or freshness rather than what the
+# ingredient is.
+DESCRIPTORS = frozenset({
+    'about', 'and', 'boneless', 'chopped', 'coarsely', 'cooked', 'crushed',
+    'cubed', 'diced', 'dried', 'extra', 'finely', 'fresh', 'freshly',
+    'frozen', 'grated', 'ground', 'halved', 'large', 'lightly', 'medium',
+    'melted', 'minced', 'of', 'optional', 'or', 'peeled', 'roughly',
+    'shredded', 'skinless', 'sliced', 'small', 'softened', 'taste', 'thinly',
+    'to', 'whole',
+})
+
+# A posting list becomes a bitmap once the ingredient is used by at
+# least one recipe in BITMAP_RATIO; a bitmap is then at most 8 times the
+# size of the position array it replaces.
+BITMAP_RATIO = 256
+
+_PARENTHESES_RE = re.compile(r'\([^)]*\)')
+_WORD_RE = re.compile(r'[^\W\d_]+')
+
+
+def canonicalize(name: str) -> str:
+    """Return the canonical vocabulary entry for an ingredient name.
+
+    Text after a comma and in parentheses is dropped along with
+    descriptive words, and the remaining words are singularized.
+    """
+    text = _PARENTHESES_RE.sub(' ', normalize(name)).split(',')[0]
+    return ' '.join(
+        stem(word) for word in _WORD_RE.findall(text)
+        if word not in DESCRIPTORS
+    )
+
+
+def _bitmap(positions, size: int) -> int:
+    """Return an integer with the bits at ``positions`` set."""
+    buffer = bytearray((size + 7) // 8)
+    for position in positions:
+        buffer[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def _positions(bitmap: int, limit: int) -> list[int]:
+    """Return up to ``limit`` set bit positions, highest first."""
+    positions = []
+    while bitmap and len(positions) < limit:
+        position = bitmap.bit_length() - 1
+        positions.append(position)
+        bitmap ^= 1 << position
+    return positions
+
+
+class IngredientIndex:
+    """Inverted index from canonical ingredient to recipes."""
+
+    def __init__(self, recipes):
+        """Build the index from ``(recipe_id, canonical names)`` pairs.
+
+        Recipes must be given in increasing id order.
+        """
+        self.ids = array('q')
+        postings = defaultdict(lambda: array('I'))
+        by_size = defaultdict(lambda: array('I'))
+        for recipe_id, names in recipes:
+            names = set(names) - {''}
+            if not names:
+                continue
+            position = len(self.ids)
+            self.ids.append(recipe_id)
+            by_size[len(names)].append(position)
+            for name in names:
+                postings[name].append(position)
+
+        self.size = len(self.ids)
+        self.full = (1 << self.size) - 1
+        threshold = self.size / BITMAP_RATIO
+        self.postings = {
+            name: _bitmap(positions, self.size)
+            if len(positions) >= threshold else positions
+            for name, positions in postings.items()
+        }
+        # Bitmaps of the recipes having exactly n distinct ingredients.
+        self.sizes = {
+            n: _bitmap(positions, self.size)
+            for n, positions in by_size.items()
+        }
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, name):
+        return name in self.postings
+
+    def _posting_bitmap(self, name: str) -> int:
+        posting = self.postings[name]
+        if isinstance(posting, int):
+            return posting
+        return _bitmap(posting, self.size)
+
+    def _counters(self, bitmaps) -> list[int]:
+        """Add ``bitmaps`` bitwise; return the bit planes of the sums."""
+        planes = []
+        for carry in bitmaps:
+            for i, plane in enumerate(planes):
+                planes[i] = plane ^ carry
+                carry &= plane
+                if not carry:
+                    break
+            else:
+                planes.append(carry)
+        return planes
+
+    def _equal(self, planes, count: int) -> int:
+        """Return the bitmap of recipes whose sum equals ``count``."""
+        if count >> len(planes):
+            return 0
+        bitmap = self.full
+        for i, plane in enumerate(planes):
+            bitmap &= plane if count >> i & 1 else self.full ^ plane
+            if not bitmap:
+                break
+        return bitmap
+
+    def match(self, pantry, limit: int = 20, min_coverage: float = 0.0):
+        """Return the recipes best covered by the ``pantry`` ingredients.
+
+        ``pantry`` holds canonical names. Results are ``(recipe_id,
+        covered, total)`` tuples, ordered by the covered fraction, then by
+        the number of covered ingredients, then newest first.
+        """
+        names = [name for name in dict.fromkeys(pantry) if name in self]
+        if not names or limit <= 0:
+            return []
+        planes = self._counters(
+            self._posting_bitmap(name) for name in names
+        )
+        covered = {count: self._equal(planes, count)
+                   for count in range(1, len(names) + 1)}
+        groups = sorted(
+            ((count, total) for count in covered if covered[count]
+             for total in self.sizes if total >= count
+             and count / total >= min_coverage),
+            key=lambda group: (group[0] / group[1], group[0]),
+            reverse=True,
+        )
+        results = []
+        for count, total in groups:
+            bitmap = covered[count] & self.sizes[total]
+            for position in _positions(bitmap, limit - len(results)):
+                results.append((self.ids[position], count, total))
+            if len(results) >= limit:
+                break
+        return results
+
+
+def build_index() -> IngredientIndex:
+    """Build an index of every recipe's canonical ingredients."""
+    rows = (
+        Ingredient.objects.exclude(canonical_name='')
+        .order_by('recipe_id')
+        .values_list('recipe_id', 'canonical_name')
+        .iterator(chunk_size=10000)
+    )
+
+    def recipes():
+        current, names = None, []
+        for recipe_id, name in rows:
+            if recipe_id != current:
+                if names:
+                    yield current, names
+                current, names = recipe_id, []
+            names.append(name)
+        if names:
+            yield current, names
+
+    return IngredientIndex(recipes())
+
+
+_index = None
+_index_generation = None
+_index_built_at = 0.0
+_index_lock = threading.Lock()
+
+
+def get_index() -> IngredientIndex:
+    """Return this process's index, rebuilding it if it is out of date.
+
+    The index follows the search generation, which moves on every recipe
+    and ingredient change; a stale index is kept for up to
+    ``RECIPES_MATCHING_INDEX_MAX_AGE`` seconds to bound rebuild work under
+    frequent edits.
+    """
+    global _index, _index_generation, _index_built_at
+    generation = cache.get_search_generation()
+    max_age = getattr(settings, 'RECIPES_MATCHING_INDEX_MAX_AGE', 60)
+    with _index_lock:
+        if _index is None or (
+            generation != _index_generation
+            and time.monotonic() - _index_built_at >= max_age
+        ):
+            _index = build_index()
+            _index_generation = generation
+            _index_built_at = time.monotonic()
+        return _index
+
+
+def match_recipes(ingredients, limit: int = 20, min_coverage: float = 0.0):
+    """Rank recipes by the share of their ingredients in ``ingredients``.
+
+    ``ingredients`` are free-text names; see ``IngredientIndex.match``.
+    """
+    pantry = [canonicalize(name) for name in ingredients]
+    return get_index().match(pantry, limit=limit, min_coverage=min_coverage)
@@ -0,0 +1,447 @@
+"""Per-route request metrics in the Prometheus text format.
+
+``MetricsMiddleware`` times every request. A database execute wrapper,
+installed on each connection as it opens, adds the time, count and
+returned rows of the request's SQL queries, and the ``DjangoTemplates``
+backend adds the time spent rendering templates. Both find the request
+through a context variable, so they also work for async views and for
+ORM calls run in ``sync_to_async`` threads; queries run outside a request
+cost one context variable lookup.
+
+Histograms are kept per route (URL pattern name) and method, in this
+process: every worker process of a server keeps and serves its own, as
+``prometheus_client`` does without its multiprocess mode. The ``/metrics``
+view serves them, to staff users and to scrapers bearing
+``RECIPES_METRICS_TOKEN``, along with request counts by status, hit and miss
+counts of the page and search result caches, and the metrics of
+collectors such as the background job queue's, read on every scrape.
+
+Requests slower than ``RECIPES_SLOW_REQUEST_SECONDS`` are logged to the
+``recipes.metrics`` logger with their slowest and most repeated queries.
+Times end when the view returns its response, so the body of a streaming
+response is not included.
+"""
+import bisect
+import contextvars
+import hmac
+import logging
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends import django as django_backend
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+SECONDS_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0,
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 4, 5, 10, 20, 50, 100, 500)
+ROW_BUCKETS = (0, 1, 10, 25, 50, 100, 250, 1000, 10000, 100000)
+# Queries kept per request for the slow request log.
+MAX_LOGGED_QUERIES = 500
+# Queries listed per section of a slow request log entry.
+LOGGED_QUERIES = 10
+UNMATCHED_ROUTE = 'unmatched'
+
+
+class RequestStats:
+    """Work done by the database and templates during one request."""
+
+    __slots__ = (
+        'started', 'queries', 'sql_time', 'rows', 'render_time',
+        'rendering', 'statements',
+    )
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.rows = 0
+        self.render_time = 0.0
+        self.rendering = False
+        self.statements = []
+
+    def add_query(self, sql: str, duration: float) -> None:
+        self.queries += 1
+        self.sql_time += duration
+        if len(self.statements) < MAX_LOGGED_QUERIES:
+            self.statements.append((sql, duration))
+
+
+_current = contextvars.ContextVar('recipes_request_stats', default=None)
+
+
+def _labels(labels) -> str:
+    """Return ``{name="value",...}`` for ``(name, value)`` pairs."""
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('"', r'\"')
+         .replace('\n', r'\n'))
+        for name, value in labels
+    )
+    return '{%s}' % ','.join(
+        f'{name}="{value}"' for name, value in escaped
+    )
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class HistogramMetric:
+    """Prometheus histogram with one series per label set."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        # labels -> [bucket counts, sum, count]
+        self.series = {}
+
+    def observe(self, labels, value) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * len(self.buckets), 0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self):
+        """Yield the sample lines of every series."""
+        for labels, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield (f'{self.name}_bucket'
+                       f'{_labels((*labels, ("le", _number(bound))))} '
+                       f'{cumulative}')
+            yield (f'{self.name}_bucket{_labels((*labels, ("le", "+Inf")))} '
+                   f'{count}')
+            yield f'{self.name}_sum{_labels(labels)} {_number(total)}'
+            yield f'{self.name}_count{_labels(labels)} {count}'
+
+
+class CounterMetric:
+    """Prometheus counter with one series per label set."""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.series = Counter()
+
+    def inc(self, labels, amount=1) -> None:
+        self.series[labels] += amount
+
+    def samples(self):
+        for labels, value in self.series.items():
+            yield f'{self.name}{_labels(labels)} {_number(value)}'
+
+
+class GaugeMetric(CounterMetric):
+    """Prometheus gauge with one series per label set."""
+
+    kind = 'gauge'
+
+    def set(self, labels, value) -> None:
+        self.series[labels] = value
+
+
+class Registry:
+    """The metrics of this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = CounterMetric(
+            'recipes_requests_total', "Requests by route, method and status."
+        )
+        self.duration = HistogramMetric(
+            'recipes_request_duration_seconds',
+            "Wall time of requests.", SECONDS_BUCKETS,
+        )
+        self.sql_time = HistogramMetric(
+            'recipes_request_sql_seconds',
+            "Time spent in SQL queries per request.", SECONDS_BUCKETS,
+        )
+        self.queries = HistogramMetric(
+            'recipes_request_queries',
+            "SQL queries per request.", QUERY_BUCKETS,
+        )
+        self.rows = HistogramMetric(
+            'recipes_request_rows',
+            "Rows returned by SQL queries per request.", ROW_BUCKETS,
+        )
+        self.render_time = HistogramMetric(
+            'recipes_request_template_seconds',
+            "Time spent rendering templates per request.", SECONDS_BUCKETS,
+        )
+        self.cache = CounterMetric(
+            'recipes_cache_requests_total',
+            "Cache lookups by cache and result (hit or miss).",
+        )
+        self.metrics = (
+            self.requests, self.duration, self.sql_time, self.queries,
+            self.rows, self.render_time, self.cache,
+        )
+        # Functions returning metrics read when scraped.
+        self.collectors = []
+
+    def record(self, route: str, method: str, status: int,
+               duration: float, stats: RequestStats) -> None:
+        """Record a finished request."""
+        labels = (('route', route), ('method', method))
+        with self._lock:
+            self.requests.inc((*labels, ('status', str(status))))
+            self.duration.observe(labels, duration)
+            self.sql_time.observe(labels, stats.sql_time)
+            self.queries.observe(labels, stats.queries)
+            self.rows.observe(labels, stats.rows)
+            self.render_time.observe(labels, stats.render_time)
+
+    def record_cache(self, name: str, hit: bool) -> None:
+        """Count a lookup in the cache called ``name``."""
+        with self._lock:
+            self.cache.inc((('cache', name),
+                            ('result', 'hit' if hit else 'miss')))
+
+    def add_collector(self, collect) -> None:
+        """Render the metrics returned by ``collect()`` with the others.
+
+        Collectors serve values kept elsewhere, such as in the database,
+        and are called on every scrape.
+        """
+        if collect not in self.collectors:
+            self.collectors.append(collect)
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text format."""
+        with self._lock:
+            lines = self._render(self.metrics)
+        for collect in self.collectors:
+            lines.extend(self._render(collect()))
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render(metrics) -> list[str]:
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return lines
+
+    def clear(self) -> None:
+        """Drop every recorded value."""
+        with self._lock:
+            for metric in self.metrics:
+                metric.series.clear()
+
+
+registry = Registry()
+
+
+class RowCounter:
+    """Database cursor proxy counting the rows fetched through it."""
+
+    __slots__ = ('cursor', 'stats')
+
+    def __init__(self, cursor, stats: RequestStats):
+        self.cursor = cursor
+        self.stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        for row in self.cursor:
+            self.stats.rows += 1
+            yield row
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            self.stats.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self.cursor.fetchmany(*args, **kwargs)
+        self.stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        self.stats.rows += len(rows)
+        return rows
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper timing the queries of requests."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        result = execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, time.perf_counter() - started)
+    if not many:
+        cursor = context['cursor']
+        if isinstance(cursor.cursor, RowCounter):
+            cursor.cursor.stats = stats
+        else:
+            cursor.cursor = RowCounter(cursor.cursor, stats)
+    return result
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    """Add ``record_query`` to every new database connection."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Template(django_backend.Template):
+    """Django template timing its rendering within a request."""
+
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        # Templates rendered by other templates are already timed.
+        if stats is None or stats.rendering:
+            return super().render(context, request)
+        stats.rendering = True
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.render_time += time.perf_counter() - started
+            stats.rendering = False
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """The Django template backend with timed rendering."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
+
+
+def get_token() -> str | None:
+    """Return the bearer token granting access to ``/metrics``, or None."""
+    return getattr(settings, 'RECIPES_METRICS_TOKEN', None) or None
+
+
+def is_authorized(request) -> bool:
+    """Return True if ``request`` may read the metrics: it comes from a
+    staff user or bears ``RECIPES_METRICS_TOKEN``."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_active and user.is_staff:
+        return True
+    token = get_token()
+    scheme, _, credentials = request.headers.get(
+        'Authorization', ''
+    ).partition(' ')
+    return (
+        token is not None and scheme.lower() == 'bearer'
+        and hmac.compare_digest(credentials.strip().encode(), token.encode())
+    )
+
+
+def get_slow_threshold() -> float | None:
+    """Return the duration of slow requests in seconds, or None."""
+    return getattr(settings, 'RECIPES_SLOW_REQUEST_SECONDS', None)
+
+
+def log_slow_request(request, route: str, duration: float,
+                     stats: RequestStats) -> None:
+    """Log a slow request with its slowest and most repeated queries."""
+    lines = [
+        f"Slow request {request.method} {request.get_full_path()} "
+        f"({route}): {duration * 1000:.1f} ms, {stats.queries} queries in "
+        f"{stats.sql_time * 1000:.1f} ms returning {stats.rows} rows, "
+        f"templates {stats.render_time * 1000:.1f} ms"
+    ]
+    slowest = sorted(
+        stats.statements, key=lambda statement: statement[1], reverse=True
+    )[:LOGGED_QUERIES]
+    if slowest:
+        lines.append("Slowest queries:")
+        lines.extend(
+            f"  {duration * 1000:8.2f} ms  {sql}"
+            for sql, duration in slowest
+        )
+    repeated = [
+        (sql, count) for sql, count in
+        Counter(sql for sql, _ in stats.statements)
+        .most_common(LOGGED_QUERIES)
+        if count > 1
+    ]
+    if repeated:
+        lines.append("Repeated queries:")
+        lines.extend(f"  {count:8d} x   {sql}" for sql, count in repeated)
+    logger.warning(
+        '\n'.join(lines),
+        extra={'request': request, 'route': route, 'duration': duration},
+    )
+
+
+class MetricsMiddleware:
+    """Record the metrics of every request; put it first in MIDDLEWARE."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, stats)
+        return response
+
+    def finish(self, request, response, stats: RequestStats) -> None:
+        duration = time.perf_counter() - stats.started
+        route = (
+            getattr(request.resolver_match, 'view_name', None)
+            or UNMATCHED_ROUTE
+        )
+        registry.record(
+            route, request.method, response.status_code, duration, stats
+        )
+        threshold = get_slow_threshold()
+        if threshold is not None and duration >= threshold:
+            log_slow_request(request, route, duration, stats)
@@ -0,0 +1,140 @@
+# Generated by Django 6.1.2 on 2026-10-18 02:09
+
+import django.db.models.deletion
+import recipes.models
+from django.db import migrations, models
+
+FTS_SQL = [
+    """
+    CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5(
+        name, description, instructions, ingredients,
+        tokenize = 'porter unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    # Column weights for bm25(): name, description, instructions,
+    # ingredients. Stored in the table config so ``rank`` uses them.
+    """
+    INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rank)
+    VALUES ('rank', 'bm25(10.0, 2.0, 1.0, 5.0)')
+    """,
+    """
+    INSERT INTO recipes_recipe_fts
+        (rowid, name, description, instructions, ingredients)
+    SELECT r.id, r.name, r.description, r.instructions,
+           COALESCE((SELECT group_concat(i.name, ' ')
+                     FROM recipes_ingredient i
+                     WHERE i.recipe_id = r.id), '')
+    FROM recipes_recipe r
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_fts_ai AFTER INSERT ON recipes_recipe
+    BEGIN
+        INSERT INTO recipes_recipe_fts
+            (rowid, name, description, instructions, ingredients)
+        VALUES (new.id, new.name, new.description, new.instructions, '');
+    END
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_fts_au
+    AFTER UPDATE OF name, description, instructions ON recipes_recipe
+    BEGIN
+        UPDATE recipes_recipe_fts
+        SET name = new.name,
+            description = new.description,
+            instructions = new.instructions
+        WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_fts_ad AFTER DELETE ON recipes_recipe
+    BEGIN
+        DELETE FROM recipes_recipe_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER recipes_ingredient_fts_ai AFTER INSERT ON recipes_ingredient
+    BEGIN
+        UPDATE recipes_recipe_fts
+        SET ingredients = COALESCE((SELECT group_concat(name, ' ')
+                                    FROM recipes_ingredient
+                                    WHERE recipe_id = new.recipe_id), '')
+        WHERE rowid = new.recipe_id;
+    END
+    """,
+    """
+    CREATE TRIGGER recipes_ingredient_fts_au
+    AFTER UPDATE OF name, recipe_id ON recipes_ingredient
+    BEGIN
+        UPDATE recipes_recipe_fts
+        SET ingredients = COALESCE((SELECT group_concat(name, ' ')
+                                    FROM recipes_ingredient
+                                    WHERE recipe_id = recipes_recipe_fts.rowid), '')
+        WHERE rowid IN (old.recipe_id, new.recipe_id);
+    END
+    """,
+    """
+    CREATE TRIGGER recipes_ingredient_fts_ad AFTER DELETE ON recipes_ingredient
+    BEGIN
+        UPDATE recipes_recipe_fts
+        SET ingredients = COALESCE((SELECT group_concat(name, ' ')
+                                    FROM recipes_ingredient
+                                    WHERE recipe_id = old.recipe_id), '')
+        WHERE rowid = old.recipe_id;
+    END
+    """,
+]
+
+DROP_FTS_SQL = [
+    'DROP TRIGGER IF EXISTS recipes_ingredient_fts_ad',
+    'DROP TRIGGER IF EXISTS recipes_ingredient_fts_au',
+    'DROP TRIGGER IF EXISTS recipes_ingredient_fts_ai',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_ad',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_au',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_ai',
+    'DROP TABLE IF EXISTS recipes_recipe_fts',
+]
+
+
+def _run_on_sqlite(statements):
+    """Return a RunPython callable executing ``statements`` on SQLite only.
+
+    Other databases fall back to the portable inverted index.
+    """
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeFullText',
+            fields=[
+                ('recipe', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='full_text', serialize=False, to='recipes.recipe')),
+                ('name', models.TextField()),
+                ('description', models.TextField()),
+                ('instructions', models.TextField()),
+                ('ingredients', models.TextField()),
+                ('document', recipes.models.FullTextField(db_column='recipes_recipe_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'verbose_name': 'Recipe full text',
+                'verbose_name_plural': 'Recipe full texts',
+                'db_table': 'recipes_recipe_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(
+            _run_on_sqlite(FTS_SQL), _run_on_sqlite(DROP_FTS_SQL)
+        ),
+    ]
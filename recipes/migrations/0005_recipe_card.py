@@ -0,0 +1,79 @@
+# Generated by Django 6.1.2 on 2026-10-18 02:21
+
+import django.db.models.deletion
+import unicodedata
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+
+def _normalize(text):
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return stripped.casefold()
+
+
+def populate_cards(apps, schema_editor):
+    """Build a card for every existing recipe."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeCard = apps.get_model('recipes', 'RecipeCard')
+    ingredients = defaultdict(list)
+    for recipe_id, name in Ingredient.objects.values_list('recipe_id', 'name'):
+        ingredients[recipe_id].append(name)
+    tags = defaultdict(list)
+    for recipe_id, name in Recipe.tags.through.objects.order_by(
+        'tag__name'
+    ).values_list('recipe_id', 'tag__name'):
+        tags[recipe_id].append(name)
+    cards = []
+    for recipe in Recipe.objects.iterator(chunk_size=1000):
+        names = ingredients[recipe.pk]
+        if recipe.prep_time is None and recipe.cook_time is None:
+            total_time = None
+        else:
+            total_time = (recipe.prep_time or 0) + (recipe.cook_time or 0)
+        cards.append(RecipeCard(
+            recipe_id=recipe.pk,
+            name=recipe.name,
+            summary=Truncator(recipe.description).words(30),
+            tag_names=tags[recipe.pk],
+            ingredient_count=len(names),
+            total_time=total_time,
+            search_text=_normalize(' '.join(
+                [recipe.name, recipe.description, *names, *tags[recipe.pk]]
+            )),
+            created_at=recipe.created_at,
+        ))
+    RecipeCard.objects.bulk_create(cards, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeCard',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='recipes.recipe')),
+                ('name', models.CharField(max_length=200)),
+                ('summary', models.TextField(blank=True, help_text='Description truncated for display')),
+                ('tag_names', models.JSONField(default=list)),
+                ('ingredient_count', models.PositiveIntegerField(default=0)),
+                ('total_time', models.PositiveIntegerField(blank=True, help_text='Preparation plus cooking time in minutes', null=True)),
+                ('search_text', models.TextField(blank=True, help_text='Normalized name, description, ingredients and tags')),
+                ('created_at', models.DateTimeField(help_text='Copied from the recipe')),
+            ],
+            options={
+                'verbose_name': 'Recipe card',
+                'verbose_name_plural': 'Recipe cards',
+                'ordering': ['-created_at', '-recipe_id'],
+                'indexes': [models.Index(fields=['-created_at', '-recipe'], name='card_created_recipe_idx')],
+            },
+        ),
+        migrations.RunPython(populate_cards, migrations.RunPython.noop),
+    ]
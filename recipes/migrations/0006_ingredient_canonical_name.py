@@ -0,0 +1,49 @@
+# Generated by Django 6.1.2 on 2026-10-18 02:26
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+from recipes.matching import canonicalize
+
+full_text = import_module('recipes.migrations.0003_recipe_full_text')
+
+# SQLite drops a table's triggers when Django rebuilds it to add or remove
+# a column, so the FTS triggers on recipes_ingredient are recreated
+# afterwards, in either direction.
+restore_fts_triggers = full_text._run_on_sqlite([
+    statement.replace('CREATE TRIGGER', 'CREATE TRIGGER IF NOT EXISTS')
+    for statement in full_text.FTS_SQL
+    if 'TRIGGER recipes_ingredient_fts' in statement
+])
+
+
+def canonicalize_names(apps, schema_editor):
+    """Fill in the canonical name of every existing ingredient."""
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    batch = []
+    for ingredient in Ingredient.objects.only('name').iterator(chunk_size=1000):
+        ingredient.canonical_name = canonicalize(ingredient.name)
+        batch.append(ingredient)
+        if len(batch) >= 1000:
+            Ingredient.objects.bulk_update(batch, ['canonical_name'])
+            batch = []
+    Ingredient.objects.bulk_update(batch, ['canonical_name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_card'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_fts_triggers),
+        migrations.AddField(
+            model_name='ingredient',
+            name='canonical_name',
+            field=models.CharField(blank=True, editable=False, help_text='Normalized name used for ingredient matching', max_length=200),
+        ),
+        migrations.RunPython(restore_fts_triggers, migrations.RunPython.noop),
+        migrations.RunPython(canonicalize_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 6.1.2 on 2026-10-18 02:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_ingredient_canonical_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Food',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Food name', max_length=200, unique=True)),
+                ('canonical_name', models.CharField(db_index=True, editable=False, help_text='Normalized name matched against ingredients', max_length=200)),
+                ('calories', models.FloatField(help_text='Energy in kcal per 100 g')),
+                ('protein', models.FloatField(help_text='Protein in grams per 100 g')),
+                ('fat', models.FloatField(help_text='Fat in grams per 100 g')),
+                ('carbohydrate', models.FloatField(help_text='Carbohydrate in grams per 100 g')),
+                ('density', models.FloatField(blank=True, help_text='Grams per millilitre, for ingredients measured by volume', null=True)),
+                ('unit_weight', models.FloatField(blank=True, help_text='Grams per piece, for ingredients counted without a unit', null=True)),
+            ],
+            options={
+                'verbose_name': 'Food',
+                'verbose_name_plural': 'Foods',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='calories',
+            field=models.FloatField(blank=True, editable=False, help_text='Energy in kcal', null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='carbohydrate',
+            field=models.FloatField(blank=True, editable=False, help_text='Carbohydrate in grams', null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='fat',
+            field=models.FloatField(blank=True, editable=False, help_text='Fat in grams', null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='nutrition_coverage',
+            field=models.FloatField(blank=True, editable=False, help_text='Share of measured ingredients counted in the totals', null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='protein',
+            field=models.FloatField(blank=True, editable=False, help_text='Protein in grams', null=True),
+        ),
+        migrations.AddField(
+            model_name='recipecard',
+            name='calories_per_serving',
+            field=models.FloatField(blank=True, help_text='Recipe calories divided by its servings', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='recipecard',
+            index=models.Index(fields=['calories_per_serving', 'recipe'], name='card_calories_recipe_idx'),
+        ),
+    ]
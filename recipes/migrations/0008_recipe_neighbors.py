@@ -0,0 +1,54 @@
+# Generated by Django 6.1.2 on 2026-10-18 02:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def queue_recipes(apps, schema_editor):
+    """Queue every existing recipe for its first similarity update."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    SimilarityUpdate = apps.get_model('recipes', 'SimilarityUpdate')
+    now = timezone.now()
+    SimilarityUpdate.objects.bulk_create(
+        (SimilarityUpdate(recipe_id=pk, queued_at=now)
+         for pk in Recipe.objects.values_list('pk', flat=True).iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_nutrition'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarityUpdate',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='recipes.recipe')),
+                ('queued_at', models.DateTimeField(help_text='When the recipe last changed')),
+            ],
+            options={
+                'verbose_name': 'Similarity update',
+                'verbose_name_plural': 'Similarity updates',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(help_text="Cosine similarity of the recipes' feature vectors")),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.recipe')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='recipes.recipe')),
+            ],
+            options={
+                'verbose_name': 'Recipe neighbor',
+                'verbose_name_plural': 'Recipe neighbors',
+                'ordering': ['recipe_id', '-score'],
+                'constraints': [models.UniqueConstraint(fields=('recipe', 'neighbor'), name='unique_recipe_neighbor')],
+            },
+        ),
+        migrations.RunPython(queue_recipes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 6.1.2 on 2026-10-18 03:02
+
+from importlib import import_module
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+full_text = import_module('recipes.migrations.0003_recipe_full_text')
+
+# Adding the stored generated column makes Django rebuild recipes_recipe,
+# which drops its FTS triggers; they are recreated afterwards, in either
+# direction.
+restore_fts_triggers = full_text._run_on_sqlite([
+    statement.replace('CREATE TRIGGER', 'CREATE TRIGGER IF NOT EXISTS')
+    for statement in full_text.FTS_SQL
+    if 'TRIGGER recipes_recipe_fts' in statement
+])
+
+
+def copy_to_cards(apps, schema_editor):
+    """Copy the servings and times of every recipe to its card."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeCard = apps.get_model('recipes', 'RecipeCard')
+    fields = ('servings', 'prep_time', 'cook_time')
+    RecipeCard.objects.update(**{
+        field: models.Subquery(
+            Recipe.objects.filter(pk=models.OuterRef('pk')).values(field)
+        )
+        for field in fields
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_neighbors'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_fts_triggers),
+        migrations.AddField(
+            model_name='recipe',
+            name='total_time',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(cook_time__isnull=True, prep_time__isnull=True, then=models.Value(None)), default=django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Coalesce('prep_time', 0), '+', django.db.models.functions.comparison.Coalesce('cook_time', 0))), help_text='Preparation plus cooking time in minutes', output_field=models.IntegerField(blank=True, null=True)),
+        ),
+        migrations.RunPython(restore_fts_triggers, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='recipecard',
+            name='cook_time',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipecard',
+            name='prep_time',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipecard',
+            name='servings',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(copy_to_cards, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['total_time', '-created_at', '-id'], name='recipe_total_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['prep_time', '-created_at', '-id'], name='recipe_prep_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['cook_time', '-created_at', '-id'], name='recipe_cook_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['servings', '-created_at', '-id'], name='recipe_servings_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipecard',
+            index=models.Index(fields=['total_time', '-created_at', '-recipe'], name='card_total_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipecard',
+            index=models.Index(fields=['prep_time', '-created_at', '-recipe'], name='card_prep_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipecard',
+            index=models.Index(fields=['cook_time', '-created_at', '-recipe'], name='card_cook_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipecard',
+            index=models.Index(fields=['servings', '-created_at', '-recipe'], name='card_servings_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 6.1.2 on 2026-10-18 03:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_range_filters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(max_length=100, unique=True)),
+                ('succeeded', models.PositiveBigIntegerField(default=0)),
+                ('retried', models.PositiveBigIntegerField(default=0)),
+                ('failed', models.PositiveBigIntegerField(default=0)),
+                ('seconds', models.FloatField(default=0, help_text='Time spent running the task')),
+            ],
+            options={
+                'verbose_name': 'Job counter',
+                'verbose_name_plural': 'Job counters',
+            },
+        ),
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(max_length=100)),
+                ('key', models.CharField(blank=True, help_text='Argument of the task; a task is queued once per key', max_length=200)),
+                ('queued_at', models.DateTimeField(help_text='When the job was last queued')),
+                ('available_at', models.DateTimeField(help_text='When the job may run next')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('worker', models.CharField(blank=True, help_text='Claim of the worker running the job', max_length=100)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('locked_until', models.DateTimeField(blank=True, help_text='When the job may be claimed again if still unfinished', null=True)),
+                ('failed_at', models.DateTimeField(blank=True, help_text='When the job failed its last attempt', null=True)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Job',
+                'verbose_name_plural': 'Jobs',
+                'indexes': [models.Index(fields=['available_at'], name='job_available_idx')],
+                'constraints': [models.UniqueConstraint(fields=('task', 'key'), name='unique_job_task_key')],
+            },
+        ),
+    ]
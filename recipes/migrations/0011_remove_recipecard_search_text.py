@@ -0,0 +1,17 @@
+# Generated by Django 6.1.2 on 2026-10-18 03:54
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_jobs'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='recipecard',
+            name='search_text',
+        ),
+    ]
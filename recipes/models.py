@@ -1,5 +1,65 @@
 from django.db import models
 from django.core.validators import MinValueValidator
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+class RecipeQuerySet(models.QuerySet):
+    """QuerySet with recipe-specific query helpers."""
+
+    def search(self, query: str):
+        """Return recipes matching ``query``, best matches first.
+
+        Each result is annotated with ``search_rank`` (higher is better).
+        """
+        from .search import search
+        return search(self, query)
+
+    def touch(self) -> int:
+        """Bump ``updated_at`` without sending save signals.
+
+        Used when related rows change, so that a recipe's modification
+        time (and with it its HTTP validators) reflects its ingredients
+        and tags as well.
+        """
+        return self.update(updated_at=timezone.now())
+
+
+class RecipeCardQuerySet(models.QuerySet):
+    """QuerySet with tag filtering and faceting for recipe cards."""
+
+    def tagged(self, names):
+        """Return cards of recipes carrying every tag in ``names``.
+
+        Each tag is one ``EXISTS`` probe into the unique (recipe, tag)
+        index of the through table, so walking the cards in list order
+        stops as soon as a page is filled, however common the tags are.
+        """
+        through = Recipe.tags.through
+        queryset = self
+        for name in dict.fromkeys(names):
+            queryset = queryset.filter(models.Exists(
+                through.objects.filter(
+                    recipe_id=models.OuterRef('pk'), tag__name=name
+                )
+            ))
+        return queryset
+
+    def tag_counts(self):
+        """Return ``(tag name, count)`` pairs for the recipes in this set.
+
+        Counted with a single aggregate query, most common tags first.
+        """
+        taggings = Recipe.tags.through.objects.all()
+        if self.query.has_filters():
+            taggings = taggings.filter(
+                recipe_id__in=self.order_by().values('pk')
+            )
+        return (
+            taggings.values_list('tag__name')
+            .annotate(count=models.Count('pk'))
+            .order_by('-count', 'tag__name')
+        )
 
 
 class Tag(models.Model):
@@ -35,6 +95,20 @@ class Recipe(models.Model):
         blank=True,
         help_text="Cooking time in minutes"
     )
+    # Stored, so that it can be indexed for range filters; None when
+    # neither time is known.
+    total_time = models.GeneratedField(
+        expression=models.Case(
+            models.When(
+                prep_time__isnull=True, cook_time__isnull=True,
+                then=models.Value(None),
+            ),
+            default=Coalesce('prep_time', 0) + Coalesce('cook_time', 0),
+        ),
+        output_field=models.IntegerField(null=True, blank=True),
+        db_persist=True,
+        help_text="Preparation plus cooking time in minutes"
+    )
     instructions = models.TextField(help_text="Recipe instructions")
     tags = models.ManyToManyField(
         Tag,
@@ -42,17 +116,86 @@ class Recipe(models.Model):
         blank=True,
         help_text="Tags for categorizing this recipe"
     )
+    # Nutrition totals of the whole recipe, computed from its ingredients
+    # by ``recipes.nutrition``; None while no ingredient could be counted.
+    calories = models.FloatField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Energy in kcal"
+    )
+    protein = models.FloatField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Protein in grams"
+    )
+    fat = models.FloatField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Fat in grams"
+    )
+    carbohydrate = models.FloatField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Carbohydrate in grams"
+    )
+    nutrition_coverage = models.FloatField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Share of measured ingredients counted in the totals"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
         verbose_name = 'Recipe'
         verbose_name_plural = 'Recipes'
+        indexes = [
+            # Supports the default ordering and keyset pagination over it.
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='recipe_created_id_idx'
+            ),
+            # Range filters, each seeking into its column with the rows of
+            # equal values in list order.
+            models.Index(
+                fields=['total_time', '-created_at', '-id'],
+                name='recipe_total_time_idx'
+            ),
+            models.Index(
+                fields=['prep_time', '-created_at', '-id'],
+                name='recipe_prep_time_idx'
+            ),
+            models.Index(
+                fields=['cook_time', '-created_at', '-id'],
+                name='recipe_cook_time_idx'
+            ),
+            models.Index(
+                fields=['servings', '-created_at', '-id'],
+                name='recipe_servings_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.name
 
+    @property
+    def nutrition_per_serving(self) -> dict | None:
+        """Return the nutrition totals divided by the servings, or None."""
+        if self.calories is None or not self.servings:
+            return None
+        return {
+            field: round(getattr(self, field) / self.servings, 1)
+            for field in ('calories', 'protein', 'fat', 'carbohydrate')
+        }
+
 
 class Ingredient(models.Model):
     """Ingredient model for recipe ingredients."""
@@ -76,6 +219,12 @@ class Ingredient(models.Model):
         help_text="Unit of measurement (e.g., cups, tablespoons, grams)"
     )
     name = models.CharField(max_length=200, help_text="Ingredient name")
+    canonical_name = models.CharField(
+        max_length=200,
+        blank=True,
+        editable=False,
+        help_text="Normalized name used for ingredient matching"
+    )
 
     class Meta:
         ordering = ['recipe', 'name']
@@ -90,3 +239,352 @@ class Ingredient(models.Model):
         else:
             return self.name
 
+
+class Food(models.Model):
+    """Nutrient reference entry, loaded from a CSV food table.
+
+    Amounts are per 100 grams. Ingredients are matched to foods by
+    canonical name (see ``recipes.nutrition``).
+    """
+    name = models.CharField(max_length=200, unique=True, help_text="Food name")
+    canonical_name = models.CharField(
+        max_length=200,
+        db_index=True,
+        editable=False,
+        help_text="Normalized name matched against ingredients"
+    )
+    calories = models.FloatField(help_text="Energy in kcal per 100 g")
+    protein = models.FloatField(help_text="Protein in grams per 100 g")
+    fat = models.FloatField(help_text="Fat in grams per 100 g")
+    carbohydrate = models.FloatField(
+        help_text="Carbohydrate in grams per 100 g"
+    )
+    density = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Grams per millilitre, for ingredients measured by volume"
+    )
+    unit_weight = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Grams per piece, for ingredients counted without a unit"
+    )
+
+    class Meta:
+        ordering = ['name']
+        verbose_name = 'Food'
+        verbose_name_plural = 'Foods'
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class RecipeNeighbor(models.Model):
+    """Precomputed similar recipe of a recipe.
+
+    Rows are written by ``recipes.similar``, a few per recipe, and shown
+    on its detail page in descending score order.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='neighbors'
+    )
+    neighbor = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    score = models.FloatField(
+        help_text="Cosine similarity of the recipes' feature vectors"
+    )
+
+    class Meta:
+        ordering = ['recipe_id', '-score']
+        verbose_name = 'Recipe neighbor'
+        verbose_name_plural = 'Recipe neighbors'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'neighbor'],
+                name='unique_recipe_neighbor'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.neighbor_id} near {self.recipe_id}"
+
+
+class SimilarityUpdate(models.Model):
+    """Recipe whose similar recipes are due to be recomputed."""
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+'
+    )
+    queued_at = models.DateTimeField(
+        help_text="When the recipe last changed"
+    )
+
+    class Meta:
+        verbose_name = 'Similarity update'
+        verbose_name_plural = 'Similarity updates'
+
+    def __str__(self) -> str:
+        return f"Similarity update for recipe {self.recipe_id}"
+
+
+class SearchTerm(models.Model):
+    """A normalized term in the recipe search index."""
+    term = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        verbose_name = 'Search term'
+        verbose_name_plural = 'Search terms'
+
+    def __str__(self) -> str:
+        return self.term
+
+
+class SearchDocument(models.Model):
+    """Per-recipe statistics used for search ranking."""
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document'
+    )
+    length = models.FloatField(
+        default=0,
+        help_text="Field-weighted number of indexed terms"
+    )
+
+    class Meta:
+        verbose_name = 'Search document'
+        verbose_name_plural = 'Search documents'
+
+    def __str__(self) -> str:
+        return f"Search document for recipe {self.recipe_id}"
+
+
+class SearchPosting(models.Model):
+    """Occurrence of a search term in a recipe."""
+    term = models.ForeignKey(
+        SearchTerm,
+        on_delete=models.CASCADE,
+        related_name='postings'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='search_postings'
+    )
+    frequency = models.FloatField(
+        help_text="Field-weighted term frequency"
+    )
+
+    class Meta:
+        verbose_name = 'Search posting'
+        verbose_name_plural = 'Search postings'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['term', 'recipe'],
+                name='unique_search_posting'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.term_id} in {self.recipe_id}"
+
+
+class FullTextField(models.TextField):
+    """Column of a full-text virtual table supporting ``__match`` lookups."""
+
+
+@FullTextField.register_lookup
+class Match(models.Lookup):
+    """SQLite ``MATCH`` operator for full-text queries."""
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", (*lhs_params, *rhs_params)
+
+
+class RecipeFullText(models.Model):
+    """Row of the FTS5 virtual table mirroring recipe text.
+
+    The table and the triggers that keep it in sync with ``Recipe`` and
+    ``Ingredient`` are created by migration; Django never writes to it.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column='rowid',
+        related_name='full_text'
+    )
+    name = models.TextField()
+    description = models.TextField()
+    instructions = models.TextField()
+    ingredients = models.TextField()
+    # FTS5 hidden columns: the table-named column accepts MATCH queries
+    # and ``rank`` holds the configured bm25() score of the current match.
+    document = FullTextField(db_column='recipes_recipe_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'recipes_recipe_fts'
+        verbose_name = 'Recipe full text'
+        verbose_name_plural = 'Recipe full texts'
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class RecipeCard(models.Model):
+    """Read-optimized projection of a recipe as shown on list pages.
+
+    One row per recipe, holding everything a list card displays, so list
+    pages are read from this table alone. Rows are kept up to date by
+    signal handlers (see ``recipes.projection``).
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='card'
+    )
+    name = models.CharField(max_length=200)
+    summary = models.TextField(
+        blank=True,
+        help_text="Description truncated for display"
+    )
+    tag_names = models.JSONField(default=list)
+    ingredient_count = models.PositiveIntegerField(default=0)
+    servings = models.PositiveIntegerField(null=True, blank=True)
+    prep_time = models.PositiveIntegerField(null=True, blank=True)
+    cook_time = models.PositiveIntegerField(null=True, blank=True)
+    total_time = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Preparation plus cooking time in minutes"
+    )
+    calories_per_serving = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Recipe calories divided by its servings"
+    )
+    created_at = models.DateTimeField(help_text="Copied from the recipe")
+
+    objects = RecipeCardQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-created_at', '-recipe_id']
+        verbose_name = 'Recipe card'
+        verbose_name_plural = 'Recipe cards'
+        indexes = [
+            models.Index(
+                fields=['-created_at', '-recipe'],
+                name='card_created_recipe_idx'
+            ),
+            # Supports filtering by calories and keyset pagination in
+            # calorie order, in either direction.
+            models.Index(
+                fields=['calories_per_serving', 'recipe'],
+                name='card_calories_recipe_idx'
+            ),
+            # Range filters, as on ``Recipe``.
+            models.Index(
+                fields=['total_time', '-created_at', '-recipe'],
+                name='card_total_time_idx'
+            ),
+            models.Index(
+                fields=['prep_time', '-created_at', '-recipe'],
+                name='card_prep_time_idx'
+            ),
+            models.Index(
+                fields=['cook_time', '-created_at', '-recipe'],
+                name='card_cook_time_idx'
+            ),
+            models.Index(
+                fields=['servings', '-created_at', '-recipe'],
+                name='card_servings_idx'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class Job(models.Model):
+    """Background job run by the ``run_jobs`` workers; see
+    ``recipes.jobs``."""
+    task = models.CharField(max_length=100)
+    key = models.CharField(
+        max_length=200,
+        blank=True,
+        help_text="Argument of the task; a task is queued once per key"
+    )
+    queued_at = models.DateTimeField(help_text="When the job was last queued")
+    available_at = models.DateTimeField(
+        help_text="When the job may run next"
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    worker = models.CharField(
+        max_length=100,
+        blank=True,
+        help_text="Claim of the worker running the job"
+    )
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    locked_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When the job may be claimed again if still unfinished"
+    )
+    failed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When the job failed its last attempt"
+    )
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = 'Job'
+        verbose_name_plural = 'Jobs'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['task', 'key'],
+                name='unique_job_task_key'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['available_at'],
+                name='job_available_idx'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.task}({self.key})"
+
+
+class JobCounter(models.Model):
+    """Jobs finished per task, for throughput metrics."""
+    task = models.CharField(max_length=100, unique=True)
+    succeeded = models.PositiveBigIntegerField(default=0)
+    retried = models.PositiveBigIntegerField(default=0)
+    failed = models.PositiveBigIntegerField(default=0)
+    seconds = models.FloatField(
+        default=0,
+        help_text="Time spent running the task"
+    )
+
+    class Meta:
+        verbose_name = 'Job counter'
+        verbose_name_plural = 'Job counters'
+
+    def __str__(self) -> str:
+        return self.task
@@ -0,0 +1,320 @@
+"""Nutrition totals of recipes from a reference table of foods.
+
+Foods are loaded from a CSV table with one row per food and nutrient
+amounts per 100 grams: either a plain ``name,calories,protein,fat,
+carbohydrate[,density,unit_weight]`` file or a USDA-style dump such as the
+SR Legacy abbreviated table (``Shrt_Desc``, ``Energ_Kcal``, ...), whose
+household portions (``GmWt_1``/``GmWt_Desc1``) provide densities and
+piece weights.
+
+Ingredients are matched to foods by canonical name (see
+``recipes.matching.canonicalize``), falling back to shorter runs of its
+words: "red onion" is counted as "onion" when no "red onion" food exists.
+Quantities are converted to grams through the unit registry; volumes use
+the food's density, or that of water when it has none, and counts ("2
+eggs", "1 clove garlic") use its piece weight.
+
+Totals are computed for a batch of recipes with two queries and stored on
+``Recipe``. Signal handlers recompute a recipe's totals when its
+ingredients change; ``rebuild_nutrition`` recomputes all of them, e.g.
+after loading a new food table.
+"""
+import csv
+import re
+
+from django.db import transaction
+
+from . import cache, projection, units
+from .matching import canonicalize
+from .models import Food, Ingredient, Recipe
+
+NUTRIENTS = ('calories', 'protein', 'fat', 'carbohydrate')
+NUTRITION_FIELDS = (*NUTRIENTS, 'nutrition_coverage')
+# Grams per millilitre for foods without a known density.
+DEFAULT_DENSITY = 1.0
+
+# Accepted CSV headers of each Food field, normalized by ``_header``.
+COLUMNS = {
+    'name': ('name', 'description', 'shrt_desc', 'long_desc', 'food'),
+    'calories': ('calories', 'kcal', 'energy_kcal', 'energ_kcal'),
+    'protein': ('protein', 'protein_g'),
+    'fat': ('fat', 'fat_g', 'total_fat', 'lipid_tot_g', 'total_lipid_fat_g'),
+    'carbohydrate': (
+        'carbohydrate', 'carbohydrates', 'carbs', 'carbohydrate_g',
+        'carbohydrt_g', 'carbohydrate_by_difference_g',
+    ),
+    'density': ('density', 'density_g_ml'),
+    'unit_weight': ('unit_weight', 'unit_weight_g', 'piece_weight_g'),
+}
+# USDA household portion columns: (gram weight, description).
+PORTIONS = (('gmwt_1', 'gmwt_desc1'), ('gmwt_2', 'gmwt_desc2'))
+
+_HEADER_RE = re.compile(r'[^a-z0-9]+')
+_PORTION_RE = re.compile(r'(\d+(?:\.\d+)?|\d+/\d+)\s+(.+)')
+
+
+class FoodTableError(ValueError):
+    """Raised for a food table that cannot be loaded."""
+
+
+def _header(name: str) -> str:
+    return _HEADER_RE.sub('_', name.lower()).strip('_')
+
+
+def _number(line: int, value):
+    """Return a CSV cell as a float, or None if it is empty."""
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise FoodTableError(f"Line {line}: invalid number {value!r}.")
+
+
+def _portion(grams, description):
+    """Return the ``(density, unit_weight)`` given by a household portion.
+
+    "1 cup" gives grams per millilitre, "1 large" grams per piece.
+    """
+    match = _PORTION_RE.fullmatch((description or '').strip())
+    if not grams or match is None:
+        return None, None
+    amount, unit = match.groups()
+    numerator, _, denominator = amount.partition('/')
+    amount = float(numerator) / float(denominator or 1)
+    unit = unit.split(',')[0].split('(')[0]
+    parsed = units.parse_unit(unit)
+    if parsed is None:
+        return None, grams / amount
+    dimension, size = units.UNITS[parsed]
+    if dimension == units.VOLUME:
+        return grams / (amount * size), None
+    return None, None
+
+
+def parse_foods(lines):
+    """Yield unsaved ``Food`` rows from the lines of a CSV food table."""
+    reader = csv.reader(lines)
+    try:
+        headers = [_header(name) for name in next(reader)]
+    except StopIteration:
+        raise FoodTableError("The food table is empty.")
+    positions = {}
+    for field, names in COLUMNS.items():
+        for name in names:
+            if name in headers:
+                positions[field] = headers.index(name)
+                break
+    missing = {'name', 'calories'} - positions.keys()
+    if missing:
+        raise FoodTableError(
+            f"Missing columns: {', '.join(sorted(missing))}."
+        )
+    portions = [
+        (headers.index(grams), headers.index(description))
+        for grams, description in PORTIONS
+        if grams in headers and description in headers
+    ]
+
+    for line, row in enumerate(reader, start=2):
+        if not any(row):
+            continue
+        row += [''] * (len(headers) - len(row))
+        values = {
+            field: (
+                row[position].strip() if field == 'name'
+                else _number(line, row[position])
+            )
+            for field, position in positions.items()
+        }
+        if not values['name'] or values['calories'] is None:
+            continue
+        for grams, description in portions:
+            density, unit_weight = _portion(
+                _number(line, row[grams]), row[description]
+            )
+            if values.get('density') is None:
+                values['density'] = density
+            if values.get('unit_weight') is None:
+                values['unit_weight'] = unit_weight
+        for nutrient in ('protein', 'fat', 'carbohydrate'):
+            values[nutrient] = values.get(nutrient) or 0.0
+        yield Food(canonical_name=canonicalize(values['name']), **values)
+
+
+def load_foods(lines, batch_size: int = 1000) -> int:
+    """Insert or update the foods of a CSV table; return how many were read.
+
+    Foods are upserted by name, so a table can be reloaded after fixes.
+    """
+    count = 0
+    update_fields = [
+        field.name for field in Food._meta.concrete_fields
+        if field.name not in ('id', 'name')
+    ]
+    batch = {}
+
+    def flush():
+        Food.objects.bulk_create(
+            batch.values(),
+            update_conflicts=True,
+            unique_fields=['name'],
+            update_fields=update_fields,
+        )
+        batch.clear()
+
+    with transaction.atomic():
+        for food in parse_foods(lines):
+            batch[food.name] = food
+            count += 1
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    return count
+
+
+def candidate_names(canonical: str) -> list[str]:
+    """Return the food names an ingredient may match, best first.
+
+    Leading words are dropped first, since English puts the head noun
+    last ("red onion" -> "onion"), then trailing ones ("chicken breast"
+    -> "chicken").
+    """
+    words = canonical.split()
+    return [
+        *(' '.join(words[start:]) for start in range(len(words))),
+        *(' '.join(words[:end]) for end in range(len(words) - 1, 0, -1)),
+    ]
+
+
+def grams(quantity, unit: str, food) -> float | None:
+    """Return the weight of an ingredient amount, or None if unknown."""
+    parsed = units.parse_unit(unit)
+    if parsed is None:
+        if food.unit_weight is None:
+            return None
+        return float(quantity) * food.unit_weight
+    dimension, size = units.UNITS[parsed]
+    amount = float(quantity) * size
+    if dimension == units.VOLUME:
+        amount *= food.density or DEFAULT_DENSITY
+    return amount
+
+
+def compute(recipe_ids) -> dict[int, dict]:
+    """Return the nutrition totals of recipes among ``recipe_ids``.
+
+    Recipes with no countable ingredient are left out.
+    """
+    return totals(
+        Ingredient.objects.filter(recipe_id__in=list(recipe_ids))
+        .exclude(quantity=None).order_by()
+        .values_list('recipe_id', 'canonical_name', 'quantity', 'unit')
+    )
+
+
+def totals(rows) -> dict[int, dict]:
+    """Return nutrition totals from ``(recipe_id, canonical_name,
+    quantity, unit)`` ingredient rows with a quantity, by recipe."""
+    rows = list(rows)
+    candidates = {
+        name: candidate_names(name) for name in {row[1] for row in rows}
+    }
+    foods = {}
+    # Among foods sharing a canonical name the first loaded one wins.
+    for food in Food.objects.filter(
+        canonical_name__in={
+            name for names in candidates.values() for name in names
+        }
+    ).order_by('-pk'):
+        foods[food.canonical_name] = food
+
+    sums = {}
+    measured = {}
+    for recipe_id, canonical, quantity, unit in rows:
+        measured[recipe_id] = measured.get(recipe_id, 0) + 1
+        food = next(
+            (foods[name] for name in candidates[canonical] if name in foods),
+            None,
+        )
+        weight = None if food is None else grams(quantity, unit, food)
+        if weight is None:
+            continue
+        total = sums.setdefault(recipe_id, dict.fromkeys(NUTRIENTS, 0.0))
+        total['counted'] = total.get('counted', 0) + 1
+        for nutrient in NUTRIENTS:
+            total[nutrient] += getattr(food, nutrient) * weight / 100
+    return {
+        recipe_id: {
+            **{
+                nutrient: round(total[nutrient], 1)
+                for nutrient in NUTRIENTS
+            },
+            'nutrition_coverage': round(
+                total['counted'] / measured[recipe_id], 3
+            ),
+        }
+        for recipe_id, total in sums.items()
+    }
+
+
+def update_recipes(recipe_ids) -> int:
+    """Recompute and store the nutrition totals of ``recipe_ids``.
+
+    Written with a bulk update, so no save signals are sent; returns the
+    number of recipe ids given.
+    """
+    recipe_ids = set(recipe_ids)
+    if not recipe_ids:
+        return 0
+    computed = compute(recipe_ids)
+    empty = dict.fromkeys(NUTRITION_FIELDS)
+    Recipe.objects.bulk_update(
+        [Recipe(pk=pk, **computed.get(pk, empty)) for pk in recipe_ids],
+        NUTRITION_FIELDS,
+    )
+    return len(recipe_ids)
+
+
+def add_recipes(ingredients) -> int:
+    """Store the nutrition totals of new recipes from their ingredients.
+
+    Used by bulk imports, which already hold the ingredient rows; recipes
+    without countable ingredients keep their empty totals, so only
+    recipes with totals are written. Returns how many were.
+    """
+    computed = totals(
+        (ingredient.recipe_id, ingredient.canonical_name,
+         ingredient.quantity, ingredient.unit)
+        for ingredient in ingredients if ingredient.quantity is not None
+    )
+    Recipe.objects.bulk_update(
+        [Recipe(pk=pk, **values) for pk, values in computed.items()],
+        NUTRITION_FIELDS,
+    )
+    return len(computed)
+
+
+def rebuild(batch_size: int = 1000) -> int:
+    """Recompute the totals of every recipe in primary key batches.
+
+    Cards and cached pages of each batch are refreshed as well. Returns
+    the number of recipes.
+    """
+    count = 0
+    last_pk = 0
+    with transaction.atomic():
+        while True:
+            ids = list(
+                Recipe.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            count += update_recipes(ids)
+            projection.refresh_cards(ids)
+            cache.invalidate_recipes(ids)
+            last_pk = ids[-1]
+    return count
@@ -0,0 +1,284 @@
+"""Keyset (cursor) pagination.
+
+Unlike OFFSET pagination, each page is fetched with a range condition on
+the ordering columns, so with a matching index every page costs the same
+as the first one no matter how deep the client navigates.
+"""
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """JSON encoder keeping full microsecond precision for datetimes.
+
+    ``DjangoJSONEncoder`` truncates to milliseconds, which would make the
+    seek condition skip or repeat rows.
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPage:
+    """A page of results with cursors pointing at its neighbours."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __repr__(self):
+        return f"<KeysetPage of {len(self.object_list)} items>"
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def has_other_pages(self) -> bool:
+        return self.has_next or self.has_previous
+
+
+class KeysetPaginator:
+    """Paginate a queryset by the values of its ordering fields.
+
+    ``ordering`` defaults to the queryset's ordering. The primary key is
+    appended as a tie-breaker if it is not already part of it, so the
+    ordering is total and no row is skipped or repeated between pages.
+    """
+
+    def __init__(self, queryset, per_page: int, ordering=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        if ordering is None:
+            ordering = (
+                queryset.query.order_by or queryset.model._meta.ordering
+            )
+        ordering = [self._resolve(field) for field in ordering]
+        if not any(field.lstrip('-') == 'pk' for field in ordering):
+            ordering.append('-pk' if ordering[-1].startswith('-') else 'pk')
+        self.ordering = ordering
+
+    def _resolve(self, field: str) -> str:
+        """Return ``field`` with the primary key name replaced by ``pk``."""
+        name = field.lstrip('-')
+        pk = self.queryset.model._meta.pk
+        if name in ('id', pk.name, pk.attname):
+            return field.replace(name, 'pk')
+        return field
+
+    def get_page(self, after: str | None = None, before: str | None = None):
+        """Return the page following ``after`` or preceding ``before``.
+
+        With neither cursor, the first page is returned.
+        """
+        values, reverse = self._cursor(after, before)
+        return self._page(list(self._rows(values, reverse)), values, reverse)
+
+    async def aget_page(self, after: str | None = None,
+                        before: str | None = None):
+        """Asynchronous version of ``get_page``."""
+        values, reverse = self._cursor(after, before)
+        rows = [row async for row in self._rows(values, reverse)]
+        return self._page(rows, values, reverse)
+
+    def _cursor(self, after, before):
+        """Return the decoded cursor and whether it is a ``before`` one."""
+        if before:
+            return self.decode_cursor(before), True
+        return (self.decode_cursor(after) if after else None), False
+
+    def _rows(self, values, reverse: bool):
+        """Return the queryset of the page after (or before) ``values``,
+        with one extra row to tell whether more follow."""
+        ordering = self.ordering
+        if reverse:
+            ordering = [self._flip(field) for field in ordering]
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._seek(ordering, values))
+        return queryset[:self.per_page + 1]
+
+    @staticmethod
+    def _flip(field: str) -> str:
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def _seek(ordering, values) -> Q:
+        """Build the condition selecting rows that sort after ``values``.
+
+        For ``(a, b)`` this is ``a >= x AND (a > x OR b > y)`` (with the
+        comparisons inverted for descending fields). The leading range on
+        ``a`` lets the database seek straight into a composite index.
+        """
+        condition = None
+        for field, value in reversed(list(zip(ordering, values))):
+            name = field.lstrip('-')
+            op = 'lt' if field.startswith('-') else 'gt'
+            strict = Q(**{f'{name}__{op}': value})
+            if condition is None:
+                condition = strict
+            else:
+                condition = strict | (Q(**{name: value}) & condition)
+        first = ordering[0]
+        op = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{op}': values[0]}) & condition
+
+    def _page(self, rows, values, reverse: bool) -> KeysetPage:
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+        if not rows:
+            return KeysetPage(rows)
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1]) if has_next else None,
+            previous_cursor=(
+                self.encode_cursor(rows[0]) if has_previous else None
+            ),
+        )
+
+    def encode_cursor(self, obj) -> str:
+        """Return an opaque cursor for the position of ``obj``."""
+        values = [
+            self._value(obj, field.lstrip('-')) for field in self.ordering
+        ]
+        data = json.dumps(values, cls=CursorEncoder).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def _value(self, obj, name: str):
+        """Return the ``name`` value of a model instance or a ``values()``
+        row."""
+        if not isinstance(obj, dict):
+            return getattr(obj, name)
+        if name == 'pk' and 'pk' not in obj:
+            name = self.queryset.model._meta.pk.attname
+        return obj[name]
+
+    def decode_cursor(self, cursor: str) -> list:
+        """Return the ordering values encoded in ``cursor``."""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded))
+        except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+            raise InvalidCursor(cursor) from exc
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise InvalidCursor(cursor)
+        opts = self.queryset.model._meta
+        decoded = []
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            try:
+                model_field = opts.pk if name == 'pk' else opts.get_field(name)
+            except FieldDoesNotExist:
+                # Annotations such as ``search_rank`` are plain numbers.
+                decoded.append(value)
+                continue
+            try:
+                decoded.append(model_field.to_python(value))
+            except ValidationError as exc:
+                raise InvalidCursor(cursor) from exc
+        return decoded
+
+
+class IdListPaginator:
+    """Paginate a precomputed, ordered list of primary keys.
+
+    Used for search results, whose ranked ids are cached. Cursors hold the
+    id of the boundary row, and each page is loaded with a single primary
+    key lookup on ``queryset``.
+    """
+
+    def __init__(self, queryset, ids, per_page: int):
+        self.queryset = queryset
+        self.ids = list(ids)
+        self.per_page = per_page
+        self._positions = None
+
+    def get_page(self, after: str | None = None, before: str | None = None):
+        """Return the page following ``after`` or preceding ``before``."""
+        start, end = self._bounds(after, before)
+        objects = self.queryset.in_bulk(self.ids[start:end])
+        return self._page(start, end, objects)
+
+    async def aget_page(self, after: str | None = None,
+                        before: str | None = None):
+        """Asynchronous version of ``get_page``."""
+        start, end = self._bounds(after, before)
+        objects = await self.queryset.ain_bulk(self.ids[start:end])
+        return self._page(start, end, objects)
+
+    def _bounds(self, after, before) -> tuple[int, int]:
+        """Return the slice of ``ids`` selected by the cursors."""
+        if before:
+            end = self._position(before)
+            return max(end - self.per_page, 0), end
+        start = self._position(after) + 1 if after else 0
+        return start, start + self.per_page
+
+    def _page(self, start: int, end: int, objects) -> KeysetPage:
+        page_ids = self.ids[start:end]
+        # Rows deleted since the ids were computed are skipped.
+        rows = [objects[pk] for pk in page_ids if pk in objects]
+        return KeysetPage(
+            rows,
+            next_cursor=(
+                self.encode_cursor(page_ids[-1])
+                if page_ids and end < len(self.ids) else None
+            ),
+            previous_cursor=(
+                self.encode_cursor(page_ids[0])
+                if page_ids and start > 0 else None
+            ),
+        )
+
+    def _position(self, cursor: str) -> int:
+        if self._positions is None:
+            self._positions = {pk: i for i, pk in enumerate(self.ids)}
+        try:
+            return self._positions[self.decode_cursor(cursor)]
+        except KeyError as exc:
+            raise InvalidCursor(cursor) from exc
+
+    @staticmethod
+    def encode_cursor(pk) -> str:
+        """Return an opaque cursor for the row with primary key ``pk``."""
+        data = json.dumps(pk).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor: str):
+        """Return the primary key encoded in ``cursor``."""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            pk = json.loads(base64.urlsafe_b64decode(padded))
+        except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+            raise InvalidCursor(cursor) from exc
+        if not isinstance(pk, int):
+            raise InvalidCursor(cursor)
+        return pk
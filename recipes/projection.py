@@ -0,0 +1,109 @@
+"""Maintenance of the ``RecipeCard`` list projection.
+
+Cards are rebuilt from the recipe tables for a set of recipe ids at a
+time, with a fixed number of queries per batch, and written with a single
+upsert. Signal handlers call ``refresh_cards`` whenever a recipe, one of
+its ingredients or its tags change.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils.text import Truncator
+
+from . import cache
+from .models import Ingredient, Recipe, RecipeCard
+
+SUMMARY_WORDS = 30
+CARD_FIELDS = (
+    'name', 'summary', 'tag_names', 'ingredient_count', 'servings',
+    'prep_time', 'cook_time', 'total_time', 'calories_per_serving',
+    'created_at',
+)
+
+
+def per_serving(calories, servings):
+    """Return ``calories`` divided by ``servings``, or None if either is
+    unknown."""
+    if calories is None or not servings:
+        return None
+    return round(calories / servings, 1)
+
+
+def build_cards(recipe_ids) -> list[RecipeCard]:
+    """Return unsaved cards for the existing recipes among ``recipe_ids``."""
+    recipe_ids = list(recipe_ids)
+    rows = Recipe.objects.filter(pk__in=recipe_ids).values(
+        'id', 'name', 'description', 'servings', 'prep_time', 'cook_time',
+        'total_time', 'calories', 'created_at',
+    )
+    ingredients = defaultdict(list)
+    for recipe_id, name in Ingredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'name'):
+        ingredients[recipe_id].append(name)
+    tags = defaultdict(list)
+    for recipe_id, name in Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('tag__name').values_list('recipe_id', 'tag__name'):
+        tags[recipe_id].append(name)
+
+    cards = []
+    for row in rows:
+        names = ingredients[row['id']]
+        tag_names = tags[row['id']]
+        cards.append(RecipeCard(
+            recipe_id=row['id'],
+            name=row['name'],
+            summary=Truncator(row['description']).words(SUMMARY_WORDS),
+            tag_names=tag_names,
+            ingredient_count=len(names),
+            servings=row['servings'],
+            prep_time=row['prep_time'],
+            cook_time=row['cook_time'],
+            total_time=row['total_time'],
+            calories_per_serving=per_serving(
+                row['calories'], row['servings']
+            ),
+            created_at=row['created_at'],
+        ))
+    return cards
+
+
+def refresh_cards(recipe_ids) -> int:
+    """Rebuild the cards of ``recipe_ids`` and return how many were written.
+
+    Ids of recipes that no longer exist are ignored; their cards are
+    removed by cascade.
+    """
+    recipe_ids = set(recipe_ids)
+    if not recipe_ids:
+        return 0
+    cards = build_cards(recipe_ids)
+    RecipeCard.objects.bulk_create(
+        cards,
+        update_conflicts=True,
+        unique_fields=['recipe'],
+        update_fields=CARD_FIELDS,
+    )
+    return len(cards)
+
+
+def rebuild_cards(batch_size: int = 1000) -> int:
+    """Rebuild every card in primary key batches; return the card count.
+
+    The cached card fragments and pages of each batch are dropped as well.
+    """
+    count = 0
+    last_pk = 0
+    with transaction.atomic():
+        while True:
+            ids = list(
+                Recipe.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            count += refresh_cards(ids)
+            cache.invalidate_recipes(ids)
+            last_pk = ids[-1]
+    return count
@@ -0,0 +1,196 @@
+"""Routing of catalog reads to read replicas.
+
+``RECIPES_READ_REPLICAS`` names database aliases holding copies of the
+``default`` database, kept up to date by replication (or by copying the
+file, for SQLite) with some lag. Views serving the catalog (recipe lists
+and pages, search, the JSON API and exports) opt in with
+``ReplicaReadsMixin`` or ``use_replicas()``, and their queries then go to
+one replica, picked per request. Everything else, including the admin,
+imports, signal handlers and management commands, reads and writes the
+primary.
+
+A client reading a lagging replica right after a write would not see its
+own change, so ``ReplicaRoutingMiddleware`` answers requests that wrote
+with a cookie sending that client's reads to the primary for
+``RECIPES_REPLICA_LAG_SECONDS``. Reads following a write in the same
+request go to the primary as well.
+
+Cached pages are dropped when the primary changes, but until the replicas
+catch up a page rendered from one would be cached with the old content;
+``recipes.cache`` does not cache what was read from a replica within
+``RECIPES_REPLICA_LAG_SECONDS`` of the last write. In-process indexes
+(ingredient matching, spelling correction, suggestions) are rebuilt on
+their own schedules and may pick up data as stale as their maximum age.
+"""
+import contextlib
+import contextvars
+import math
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+STICKY_COOKIE = 'recipes_primary_until'
+
+
+def get_replicas() -> list[str]:
+    """Return the aliases of the read replica databases."""
+    return list(getattr(settings, 'RECIPES_READ_REPLICAS', ()))
+
+
+def get_replica_lag() -> float:
+    """Return the seconds the replicas may lag behind the primary."""
+    return getattr(settings, 'RECIPES_REPLICA_LAG_SECONDS', 0)
+
+
+class RoutingState:
+    """Where the queries of one request go."""
+
+    __slots__ = ('replicas_allowed', 'sticky', 'wrote', 'replica')
+
+    def __init__(self, sticky: bool = False):
+        self.replicas_allowed = False
+        self.sticky = sticky
+        self.wrote = False
+        self.replica = None
+
+    def read_alias(self) -> str | None:
+        """Return the replica to read from, or None for the primary."""
+        if not self.replicas_allowed or self.sticky or self.wrote:
+            return None
+        if self.replica is None:
+            replicas = get_replicas()
+            if not replicas:
+                return None
+            self.replica = random.choice(replicas)
+        return self.replica
+
+
+_current = contextvars.ContextVar('recipes_routing_state', default=None)
+
+
+@contextlib.contextmanager
+def routing(state: RoutingState):
+    """Route the queries run within the block as ``state`` says."""
+    token = _current.set(state)
+    try:
+        yield state
+    finally:
+        _current.reset(token)
+
+
+def use_replicas() -> None:
+    """Let the reads of the current request go to a replica."""
+    state = _current.get()
+    if state is not None:
+        state.replicas_allowed = True
+
+
+def reading_from_replica() -> bool:
+    """Return True if the current request reads from a replica."""
+    state = _current.get()
+    return state is not None and state.read_alias() is not None
+
+
+def stream(iterable):
+    """Return ``iterable`` iterated under the current request's routing.
+
+    Streaming response bodies are iterated after the view has returned
+    and the middleware has finished; wrap them to keep their queries on
+    the request's database.
+    """
+    state = _current.get()
+    return iterable if state is None else _stream(iterable, state)
+
+
+def _stream(iterable, state: RoutingState):
+    iterator = iter(iterable)
+    while True:
+        with routing(state):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+class ReplicaRouter:
+    """Send the reads of views using replicas to a replica, and all
+    other queries to the primary."""
+
+    def db_for_read(self, model, **hints):
+        # Related objects are read from the database of their instance.
+        if hints.get('instance') is not None:
+            return None
+        state = _current.get()
+        return state.read_alias() if state is not None else None
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary, schema included.
+        return False if db in get_replicas() else None
+
+
+class ReplicaReadsMixin:
+    """Send the reads of a view to a replica."""
+
+    def setup(self, request, *args, **kwargs):
+        use_replicas()
+        super().setup(request, *args, **kwargs)
+
+
+class ReplicaRoutingMiddleware:
+    """Track the database routing of every request and keep clients that
+    wrote on the primary for a while."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with routing(self.start(request)) as state:
+            response = self.get_response(request)
+        return self.finish(state, response)
+
+    async def __acall__(self, request):
+        with routing(self.start(request)) as state:
+            response = await self.get_response(request)
+        return self.finish(state, response)
+
+    @staticmethod
+    def start(request) -> RoutingState:
+        try:
+            until = float(request.COOKIES.get(STICKY_COOKIE, 0))
+        except ValueError:
+            until = 0
+        return RoutingState(sticky=until > time.time())
+
+    @staticmethod
+    def finish(state: RoutingState, response):
+        lag = get_replica_lag()
+        if state.wrote and lag and get_replicas():
+            response.set_cookie(
+                STICKY_COOKIE, f'{time.time() + lag:.3f}',
+                max_age=math.ceil(lag), httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,453 @@
+"""Full-text search over recipes.
+
+Two interchangeable backends index recipe text (name, description,
+instructions and ingredient names) and rank matches with BM25:
+
+``fts5``
+    An SQLite FTS5 virtual table kept in sync by database triggers. This
+    is the default on SQLite.
+``index``
+    A portable inverted index stored in ordinary tables and maintained
+    from model signals. Used on databases without FTS5.
+
+Either way, searching never scans the ``Recipe`` or ``Ingredient`` tables.
+Use ``Recipe.objects.search(query)`` rather than calling a backend directly.
+"""
+import math
+import re
+import unicodedata
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, FloatField, Max, Sum, Value, When
+
+from .models import (
+    Ingredient, Recipe, SearchDocument, SearchPosting, SearchTerm,
+)
+
+# Relative importance of each indexed field when computing term frequency.
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'ingredients': 2.0,
+    'description': 1.0,
+    'instructions': 1.0,
+}
+
+# BM25 tuning parameters.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Upper bound on the number of indexed terms a prefix may expand to.
+MAX_PREFIX_EXPANSIONS = 32
+
+STOPWORDS = frozenset({
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'into', 'is', 'it', 'of', 'on', 'or', 'the', 'to', 'with',
+})
+
+_TOKEN_RE = re.compile(r'\w+')
+_ES_SUFFIXES = ('sses', 'shes', 'ches', 'xes', 'oes')
+
+
+def normalize(text: str) -> str:
+    """Return ``text`` case-folded with accents removed."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return stripped.casefold()
+
+
+def stem(token: str) -> str:
+    """Reduce a token to a crude singular form.
+
+    Only suffixes are ever removed, so the stem is always a prefix of the
+    original token. Prefix queries rely on that property.
+    """
+    if len(token) <= 3:
+        return token
+    if token.endswith(_ES_SUFFIXES):
+        return token[:-2]
+    if token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list[str]:
+    """Split ``text`` into normalized, stemmed index terms."""
+    return [
+        stem(token)
+        for token in _TOKEN_RE.findall(normalize(text))
+        if token not in STOPWORDS
+    ]
+
+
+def _recipe_term_frequencies(recipe, ingredient_names) -> Counter:
+    """Return weighted term frequencies for a recipe's indexed text."""
+    texts = {
+        'name': recipe.name,
+        'description': recipe.description,
+        'instructions': recipe.instructions,
+        'ingredients': ' '.join(ingredient_names),
+    }
+    frequencies = Counter()
+    for field, text in texts.items():
+        weight = FIELD_WEIGHTS[field]
+        for term in tokenize(text):
+            frequencies[term] += weight
+    return frequencies
+
+
+def _term_ids(terms) -> dict[str, int]:
+    """Return a term -> id map, creating any terms not yet in the index."""
+    terms = set(terms)
+    if not terms:
+        return {}
+    known = dict(
+        SearchTerm.objects.filter(term__in=terms).values_list('term', 'id')
+    )
+    missing = terms - known.keys()
+    if missing:
+        SearchTerm.objects.bulk_create(
+            [SearchTerm(term=term) for term in missing],
+            ignore_conflicts=True,
+        )
+        known.update(
+            SearchTerm.objects.filter(term__in=missing)
+            .values_list('term', 'id')
+        )
+    return known
+
+
+def _build_postings(recipe, ingredient_names):
+    """Return unsaved postings for a recipe and its weighted length."""
+    frequencies = _recipe_term_frequencies(recipe, ingredient_names)
+    term_ids = _term_ids(frequencies)
+    return [
+        SearchPosting(
+            term_id=term_ids[term], recipe_id=recipe.pk, frequency=freq
+        )
+        for term, freq in frequencies.items()
+    ], sum(frequencies.values())
+
+
+def index_recipe(recipe_id: int) -> None:
+    """(Re)build the index entries for a single recipe.
+
+    Removes the recipe from the index if it no longer exists.
+    """
+    with transaction.atomic():
+        SearchPosting.objects.filter(recipe_id=recipe_id).delete()
+        recipe = Recipe.objects.filter(pk=recipe_id).first()
+        if recipe is None:
+            SearchDocument.objects.filter(recipe_id=recipe_id).delete()
+            return
+        ingredient_names = Ingredient.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('name', flat=True)
+        postings, length = _build_postings(recipe, ingredient_names)
+        SearchPosting.objects.bulk_create(postings)
+        SearchDocument.objects.update_or_create(
+            recipe_id=recipe_id, defaults={'length': length}
+        )
+
+
+def rebuild_inverted_index(batch_size: int = 500) -> int:
+    """Rebuild the inverted index from scratch and return the recipe count."""
+    with transaction.atomic():
+        SearchPosting.objects.all().delete()
+        SearchDocument.objects.all().delete()
+        SearchTerm.objects.all().delete()
+        indexed = 0
+        recipes = Recipe.objects.order_by('pk').iterator(chunk_size=batch_size)
+        batch = []
+        for recipe in recipes:
+            batch.append(recipe)
+            if len(batch) >= batch_size:
+                indexed += _index_batch(batch)
+                batch = []
+        if batch:
+            indexed += _index_batch(batch)
+    return indexed
+
+
+def index_recipes(recipes) -> int:
+    """(Re)build the index entries for several recipe instances at once."""
+    recipes = list(recipes)
+    with transaction.atomic():
+        SearchPosting.objects.filter(recipe__in=recipes).delete()
+        SearchDocument.objects.filter(recipe__in=recipes).delete()
+        return _index_batch(recipes)
+
+
+def _index_batch(recipes) -> int:
+    names = {}
+    for recipe_id, name in Ingredient.objects.filter(
+        recipe__in=recipes
+    ).values_list('recipe_id', 'name'):
+        names.setdefault(recipe_id, []).append(name)
+    postings = []
+    documents = []
+    for recipe in recipes:
+        recipe_postings, length = _build_postings(
+            recipe, names.get(recipe.pk, [])
+        )
+        postings.extend(recipe_postings)
+        documents.append(SearchDocument(recipe_id=recipe.pk, length=length))
+    SearchPosting.objects.bulk_create(postings)
+    SearchDocument.objects.bulk_create(documents)
+    return len(recipes)
+
+
+def _query_term_groups(query: str) -> list[list[int]]:
+    """Resolve query tokens to groups of term ids, one group per token.
+
+    The last token is treated as a prefix so that partially typed words
+    still match. Returns an empty list if any token matches nothing.
+    """
+    tokens = list(dict.fromkeys(tokenize(query)))
+    if not tokens:
+        return []
+    *exact, prefix = tokens
+    exact_ids = dict(
+        SearchTerm.objects.filter(term__in=exact).values_list('term', 'id')
+    )
+    groups = []
+    for token in exact:
+        if token not in exact_ids:
+            return []
+        groups.append([exact_ids[token]])
+    # A range scan keeps the lookup on the unique index of ``term``.
+    prefix_ids = list(
+        SearchTerm.objects.filter(
+            term__gte=prefix, term__lt=prefix + '\U0010ffff'
+        ).order_by('term').values_list('id', flat=True)[:MAX_PREFIX_EXPANSIONS]
+    )
+    if not prefix_ids:
+        return []
+    groups.append(prefix_ids)
+    return groups
+
+
+def search_recipes(queryset, query: str):
+    """Filter ``queryset`` to recipes matching every token of ``query``.
+
+    Uses the inverted index. Results are annotated with ``search_rank``
+    (BM25, higher is better) and ordered by it.
+    """
+    groups = _query_term_groups(query)
+    if not groups:
+        return queryset.none()
+    term_ids = {term_id for group in groups for term_id in group}
+
+    stats = SearchDocument.objects.aggregate(
+        total=Count('pk'), length=Sum('length')
+    )
+    total_docs = stats['total'] or 1
+    avg_length = (stats['length'] or 0) / total_docs or 1.0
+    doc_freqs = dict(
+        SearchPosting.objects.filter(term_id__in=term_ids)
+        .values_list('term_id')
+        .annotate(df=Count('pk'))
+    )
+
+    idf = Case(
+        *[
+            When(
+                search_postings__term_id=term_id,
+                then=Value(math.log(
+                    1 + (total_docs - df + 0.5) / (df + 0.5)
+                )),
+            )
+            for term_id, df in doc_freqs.items()
+        ],
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    frequency = F('search_postings__frequency')
+    length = F('search_document__length')
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / Value(avg_length))
+    score = idf * frequency * Value(BM25_K1 + 1) / (frequency + norm)
+
+    matched = {}
+    if len(groups) > 1:
+        # Require every query token to match at least one posting.
+        for i, group in enumerate(groups):
+            matched[f'_search_match_{i}'] = Max(Case(
+                When(search_postings__term_id__in=group, then=Value(1)),
+                default=Value(0),
+            ))
+
+    queryset = (
+        queryset.filter(search_postings__term_id__in=term_ids)
+        .annotate(search_rank=Sum(score, output_field=FloatField()), **matched)
+    )
+    if matched:
+        queryset = queryset.filter(**{name: 1 for name in matched})
+    return queryset.order_by('-search_rank', '-created_at', '-id')
+
+
+FTS_TABLE = 'recipes_recipe_fts'
+
+
+def get_backend() -> str:
+    """Return the name of the active search backend."""
+    backend = getattr(settings, 'RECIPES_SEARCH_BACKEND', 'fts5')
+    if backend == 'fts5' and connection.vendor != 'sqlite':
+        return 'index'
+    return backend
+
+
+def uses_inverted_index() -> bool:
+    """Return True if the signal-maintained inverted index is in use."""
+    return get_backend() == 'index'
+
+
+def query_tokens(query: str) -> list[str]:
+    """Return the distinct normalized, unstemmed words of a query."""
+    return list(dict.fromkeys(
+        token for token in _TOKEN_RE.findall(normalize(query))
+        if token not in STOPWORDS
+    ))
+
+
+def normalize_query(query: str) -> str:
+    """Return a canonical form of ``query``.
+
+    Queries with the same canonical form return the same results, so it
+    is used as the key for cached search results.
+    """
+    return ' '.join(query_tokens(query))
+
+
+def fts_query(query: str) -> str:
+    """Translate user input into an FTS5 query string.
+
+    Every word is quoted so user input can never be parsed as FTS5 query
+    syntax, and the last word is matched as a prefix.
+    """
+    tokens = query_tokens(query)
+    if not tokens:
+        return ''
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_fts(queryset, query: str):
+    """Filter ``queryset`` using the FTS5 virtual table.
+
+    Results are annotated with ``search_rank`` (negated ``bm25()``, higher
+    is better) and ordered by it.
+    """
+    expression = fts_query(query)
+    if not expression:
+        return queryset.none()
+    return (
+        queryset.filter(full_text__document__match=expression)
+        .annotate(search_rank=-F('full_text__rank'))
+        .order_by('-search_rank', '-created_at', '-id')
+    )
+
+
+def search(queryset, query: str):
+    """Filter and rank ``queryset`` with the active search backend."""
+    if get_backend() == 'fts5':
+        return search_fts(queryset, query)
+    return search_recipes(queryset, query)
+
+
+def cached_search_ids(query: str) -> tuple[int, ...]:
+    """Return the ranked ids of recipes matching ``query``.
+
+    Results are cached per normalized query; at most
+    ``RECIPES_SEARCH_MAX_RESULTS`` ids are kept.
+    """
+    from .cache import search_results
+
+    return search_results.get_or_set(
+        normalize_query(query), lambda: _search_ids(query)
+    )
+
+
+async def acached_search_ids(query: str) -> tuple[int, ...]:
+    """Asynchronous version of ``cached_search_ids``.
+
+    Cache hits are answered without leaving the event loop.
+    """
+    from .cache import search_results
+
+    return await search_results.aget_or_set(
+        normalize_query(query), sync_to_async(lambda: _search_ids(query))
+    )
+
+
+def _search_ids(query: str) -> list[int]:
+    return list(
+        Recipe.objects.search(query)
+        .values_list('pk', flat=True)[:get_max_results()]
+    )
+
+
+def get_max_results() -> int:
+    """Return the number of ranked ids kept per search."""
+    return getattr(settings, 'RECIPES_SEARCH_MAX_RESULTS', 1000)
+
+
+def is_complete(ids) -> bool:
+    """Return True if ``ids``, the cached results of a search, are all of
+    its matches rather than the first ``RECIPES_SEARCH_MAX_RESULTS``."""
+    return len(ids) < get_max_results()
+
+
+def all_matches(query: str, ids):
+    """Return every recipe matching ``query``, given its cached ``ids``.
+
+    These are ``ids`` themselves when they are complete, and otherwise a
+    ``values('pk')`` queryset of the search in ranked order, to filter
+    before cutting it to ``RECIPES_SEARCH_MAX_RESULTS``, so that filters
+    and sorts also find the matches ranked lower.
+    """
+    if is_complete(ids):
+        return ids
+    return Recipe.objects.search(query).values('pk')
+
+
+async def aall_matches(query: str, ids):
+    """Asynchronous version of ``all_matches``.
+
+    Building the inverted index search runs queries, so it is done in a
+    thread.
+    """
+    if is_complete(ids):
+        return ids
+    return await sync_to_async(all_matches)(query, ids)
+
+
+def rebuild_fts_index() -> int:
+    """Repopulate the FTS5 table from the recipe tables."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f"""
+            INSERT INTO {FTS_TABLE}
+                (rowid, name, description, instructions, ingredients)
+            SELECT r.id, r.name, r.description, r.instructions,
+                   COALESCE((SELECT group_concat(i.name, ' ')
+                             FROM recipes_ingredient i
+                             WHERE i.recipe_id = r.id), '')
+            FROM recipes_recipe r
+            """
+        )
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('optimize')"
+        )
+        cursor.execute(f'SELECT count(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def rebuild_index(batch_size: int = 500) -> int:
+    """Rebuild the active backend's index and return the recipe count."""
+    if get_backend() == 'fts5':
+        return rebuild_fts_index()
+    return rebuild_inverted_index(batch_size=batch_size)
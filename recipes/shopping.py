@@ -0,0 +1,133 @@
+"""Consolidated shopping lists for meal plans.
+
+A plan maps recipe ids to servings multipliers. The ingredient rows of
+every planned recipe, with the recipe names, are read with a single query
+and folded into one dict in a single streaming pass. Rows are grouped by
+canonical ingredient name and by what their unit measures: volumes and
+masses are summed in millilitres and grams and shown in the requested
+unit system, other units ("clove") are summed as written, and an
+ingredient listed without a quantity anywhere is listed once without one.
+"""
+import csv
+import io
+import math
+
+from . import units
+from .models import Ingredient
+
+MAX_RECIPES = 100
+MAX_MULTIPLIER = 100
+CSV_FIELDS = ('name', 'quantity', 'unit', 'recipes')
+
+
+class ShoppingListError(ValueError):
+    """Raised for an invalid meal plan."""
+
+
+def parse_plan(values) -> dict[int, float]:
+    """Return ``{recipe_id: multiplier}`` from ``id`` or
+    ``id:multiplier`` items, comma-separated or repeated."""
+    plan = {}
+    for value in values:
+        for item in value.split(','):
+            item = item.strip()
+            if not item:
+                continue
+            pk, _, multiplier = item.partition(':')
+            try:
+                pk = int(pk)
+                multiplier = float(multiplier) if multiplier else 1.0
+            except ValueError:
+                raise ShoppingListError(
+                    f"Invalid recipe {item!r}; use id or id:multiplier."
+                )
+            if not (math.isfinite(multiplier)
+                    and 0 < multiplier <= MAX_MULTIPLIER):
+                raise ShoppingListError(
+                    f"Multipliers must be above 0 and at most "
+                    f"{MAX_MULTIPLIER}."
+                )
+            plan[pk] = plan.get(pk, 0.0) + multiplier
+    if not plan:
+        raise ShoppingListError("At least one recipe is required.")
+    if len(plan) > MAX_RECIPES:
+        raise ShoppingListError(
+            f"At most {MAX_RECIPES} recipes may be planned."
+        )
+    return plan
+
+
+def build_list(plan, system: str = 'metric') -> list[dict]:
+    """Return the shopping list of ``plan``, sorted by ingredient.
+
+    Items are ``{'name', 'quantity', 'unit', 'recipes'}`` dicts, where
+    ``recipes`` names the planned recipes that need the ingredient.
+    """
+    rows = (
+        Ingredient.objects.filter(recipe_id__in=plan).order_by()
+        .values_list(
+            'recipe_id', 'recipe__name', 'name', 'canonical_name',
+            'quantity', 'unit',
+        )
+        .iterator()
+    )
+    totals = {}
+    for recipe_id, recipe_name, name, canonical, quantity, unit in rows:
+        parsed = units.parse_unit(unit)
+        if quantity is None:
+            measure = None
+        elif parsed:
+            measure = units.UNITS[parsed][0]
+        else:
+            measure = unit.strip().lower()
+        key = (canonical or name.lower(), measure)
+        total = totals.get(key)
+        if total is None:
+            total = totals[key] = {
+                'name': canonical or name, 'amount': 0.0, 'unit': unit,
+                'recipes': set(),
+            }
+        if quantity is not None:
+            amount = float(quantity) * plan[recipe_id]
+            if parsed:
+                amount *= units.UNITS[parsed][1]
+            total['amount'] += amount
+        total['recipes'].add(recipe_name)
+
+    quantified = {name for name, measure in totals if measure is not None}
+    items = []
+    for (name, measure), total in totals.items():
+        if measure is None:
+            if name in quantified:
+                continue
+            quantity, unit = None, ''
+        elif measure in (units.VOLUME, units.MASS):
+            quantity, unit = units.format_amount(
+                total['amount'], measure, system
+            )
+        else:
+            quantity = units.round_quantity(total['amount'])
+            unit = total['unit']
+        items.append({
+            'name': total['name'],
+            'quantity': quantity,
+            'unit': unit,
+            'recipes': sorted(total['recipes']),
+        })
+    items.sort(key=lambda item: (item['name'], item['unit']))
+    return items
+
+
+def to_csv(items) -> str:
+    """Return the shopping list as CSV text, one ingredient per row."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_FIELDS)
+    for item in items:
+        writer.writerow([
+            item['name'],
+            '' if item['quantity'] is None else item['quantity'],
+            item['unit'],
+            ';'.join(item['recipes']),
+        ])
+    return buffer.getvalue()
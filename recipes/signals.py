@@ -0,0 +1,396 @@
+"""Signal handlers keeping derived recipe data in sync with edits.
+
+The FTS5 search table is maintained by database triggers instead.
+Nutrition totals, cards, the inverted index and similar recipes are
+updated through ``recipes.tasks``, in background jobs if enabled.
+"""
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete, pre_save,
+)
+from django.dispatch import receiver
+
+from . import cache, matching, search, suggest, tasks
+from .models import Ingredient, Recipe, RecipeNeighbor, Tag
+
+
+def _deleted_with_recipe(origin) -> bool:
+    """Return True if a deletion was started by deleting recipes."""
+    return (
+        isinstance(origin, Recipe)
+        or getattr(origin, 'model', None) is Recipe
+    )
+
+
+@receiver(pre_save, sender=Ingredient)
+def canonicalize_ingredient(sender, instance, **kwargs):
+    """Store the canonical form of an ingredient's name."""
+    instance.canonical_name = matching.canonicalize(instance.name)
+
+
+@receiver(post_save, sender=Recipe)
+def index_saved_recipe(sender, instance, raw=False, **kwargs):
+    """Reindex a recipe whenever it is saved."""
+    if not raw and search.uses_inverted_index():
+        tasks.index_recipes([instance.pk])
+
+
+@receiver(post_save, sender=Ingredient)
+def index_recipe_on_ingredient_save(sender, instance, raw=False, **kwargs):
+    """Reindex the owning recipe when one of its ingredients is saved."""
+    if not raw and search.uses_inverted_index():
+        tasks.index_recipes([instance.recipe_id])
+
+
+@receiver(post_delete, sender=Ingredient)
+def index_recipe_on_ingredient_delete(sender, instance, origin=None, **kwargs):
+    """Reindex the owning recipe when one of its ingredients is deleted.
+
+    Index rows are removed by cascade when the recipe itself is deleted, so
+    there is nothing to do in that case.
+    """
+    if search.uses_inverted_index() and not _deleted_with_recipe(origin):
+        tasks.index_recipes([instance.recipe_id])
+
+
+def _recipes_changed(recipe_ids, touch=True) -> None:
+    """Invalidate cached pages of recipes whose content changed.
+
+    With ``touch``, ``updated_at`` is bumped as well so that conditional
+    requests for the recipe stop matching.
+    """
+    recipe_ids = set(recipe_ids)
+    if not recipe_ids:
+        return
+    if touch:
+        Recipe.objects.filter(pk__in=recipe_ids).touch()
+    cache.invalidate_recipes(recipe_ids)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_cache(sender, instance, **kwargs):
+    """Drop cached pages of a saved or deleted recipe."""
+    _recipes_changed([instance.pk], touch=False)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_cache_on_ingredient_change(sender, instance, origin=None,
+                                          **kwargs):
+    """Drop cached pages of the recipe owning a changed ingredient."""
+    if not _deleted_with_recipe(origin):
+        _recipes_changed([instance.recipe_id])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def invalidate_cache_on_tag_change(sender, instance, **kwargs):
+    """Drop cached pages of every recipe carrying a renamed or deleted tag.
+
+    Deletion is handled before the fact because the tag's links to its
+    recipes are gone afterwards.
+    """
+    if not kwargs.get('created'):
+        _recipes_changed(instance.recipes.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_cache_on_tagging(sender, instance, action, reverse, pk_set,
+                                **kwargs):
+    """Drop cached pages of recipes gaining or losing tags."""
+    if action in ('post_add', 'post_remove'):
+        _recipes_changed(pk_set if reverse else [instance.pk])
+    elif action == 'pre_clear' and reverse:
+        # The affected recipes cannot be recovered once cleared.
+        _recipes_changed(instance.recipes.values_list('pk', flat=True))
+    elif action == 'post_clear' and not reverse:
+        _recipes_changed([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_search_results(sender, **kwargs):
+    """Make all cached search results stale after searchable text changes."""
+    cache.bump_search_generation()
+
+
+# Nutrition totals are copied to the cards, so they are recomputed before
+# the cards are rebuilt below.
+@receiver(post_save, sender=Recipe)
+def update_nutrition_on_recipe_save(sender, instance, created, raw=False,
+                                    **kwargs):
+    """Recompute the nutrition totals of a saved recipe.
+
+    Saving a recipe instance loaded before its ingredients changed writes
+    back stale totals, so they are recomputed here as well.
+    """
+    if not created and not raw:
+        tasks.update_nutrition([instance.pk])
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def update_nutrition_on_ingredient_change(sender, instance, origin=None,
+                                          raw=False, **kwargs):
+    """Recompute the nutrition totals of the recipe owning a changed
+    ingredient."""
+    if not raw and not _deleted_with_recipe(origin):
+        tasks.update_nutrition([instance.recipe_id])
+
+
+@receiver(post_save, sender=Recipe)
+def refresh_card_on_recipe_save(sender, instance, **kwargs):
+    """Rebuild the list card of a saved recipe."""
+    tasks.refresh_cards([instance.pk])
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def refresh_card_on_ingredient_change(sender, instance, origin=None,
+                                      **kwargs):
+    """Rebuild the card of the recipe owning a changed ingredient.
+
+    Cards are removed by cascade when the recipe itself is deleted.
+    """
+    if not _deleted_with_recipe(origin):
+        tasks.refresh_cards([instance.recipe_id])
+
+
+def _tagged_recipe_ids(tag) -> list[int]:
+    return list(tag.recipes.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Tag)
+def refresh_cards_on_tag_rename(sender, instance, created=False, **kwargs):
+    """Rebuild the cards of every recipe carrying a renamed tag."""
+    if not created:
+        tasks.refresh_cards(_tagged_recipe_ids(instance))
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_cards_on_tag_delete(sender, instance, **kwargs):
+    """Record the recipes of a tag about to be deleted.
+
+    The cards can only be rebuilt once the tag is gone, but by then its
+    links to the recipes are gone too.
+    """
+    instance._card_recipe_ids = _tagged_recipe_ids(instance)
+
+
+@receiver(post_delete, sender=Tag)
+def refresh_cards_on_tag_delete(sender, instance, **kwargs):
+    """Rebuild the cards of the recipes that carried a deleted tag."""
+    tasks.refresh_cards(getattr(instance, '_card_recipe_ids', ()))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def refresh_cards_on_tagging(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    """Rebuild the cards of recipes gaining or losing tags."""
+    if action in ('post_add', 'post_remove'):
+        tasks.refresh_cards(pk_set if reverse else [instance.pk])
+    elif action == 'pre_clear' and reverse:
+        instance._card_recipe_ids = _tagged_recipe_ids(instance)
+    elif action == 'post_clear':
+        tasks.refresh_cards(
+            getattr(instance, '_card_recipe_ids', ())
+            if reverse else [instance.pk]
+        )
+
+
+def _previous_value(instance, field: str):
+    """Return the stored value of ``field`` for an instance being saved.
+
+    Only queried while this process has suggestions loaded.
+    """
+    if instance.pk is None or suggest.loaded_index() is None:
+        return None
+    return type(instance).objects.filter(pk=instance.pk).values_list(
+        field, flat=True
+    ).first()
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_recipe_name(sender, instance, raw=False, **kwargs):
+    """Record a recipe's stored name so renames can move suggestions."""
+    instance._suggest_name = None if raw else _previous_value(instance, 'name')
+
+
+@receiver(post_save, sender=Recipe)
+def suggest_recipe_name(sender, instance, created, raw=False, **kwargs):
+    """Count a new or renamed recipe in the suggestions."""
+    previous = getattr(instance, '_suggest_name', None)
+    if created or raw:
+        suggest.adjust_many('recipe', [instance.name], 1)
+    elif previous is not None and previous != instance.name:
+        suggest.adjust_many('recipe', [previous], -1)
+        suggest.adjust_many('recipe', [instance.name], 1)
+
+
+@receiver(pre_delete, sender=Recipe)
+def forget_recipe_suggestions(sender, instance, **kwargs):
+    """Uncount a deleted recipe's name and tags.
+
+    Its ingredients are uncounted by their own delete signals, but its
+    tag links are removed without sending any.
+    """
+    if suggest.loaded_index() is None:
+        return
+    suggest.adjust_many('recipe', [instance.name], -1)
+    suggest.adjust_many(
+        'tag', instance.tags.values_list('name', flat=True), -1
+    )
+
+
+@receiver(pre_save, sender=Ingredient)
+def remember_ingredient_name(sender, instance, raw=False, **kwargs):
+    """Record an ingredient's stored canonical name."""
+    instance._suggest_name = (
+        None if raw else _previous_value(instance, 'canonical_name')
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+def suggest_ingredient_name(sender, instance, created, raw=False, **kwargs):
+    """Count a new or renamed ingredient in the suggestions."""
+    previous = getattr(instance, '_suggest_name', None)
+    if created or raw:
+        suggest.adjust_many('ingredient', [instance.canonical_name], 1)
+    elif previous is not None and previous != instance.canonical_name:
+        suggest.adjust_many('ingredient', [previous], -1)
+        suggest.adjust_many('ingredient', [instance.canonical_name], 1)
+
+
+@receiver(post_delete, sender=Ingredient)
+def forget_ingredient_suggestion(sender, instance, **kwargs):
+    """Uncount a deleted ingredient."""
+    suggest.adjust_many('ingredient', [instance.canonical_name], -1)
+
+
+@receiver(pre_save, sender=Tag)
+def remember_tag_name(sender, instance, raw=False, **kwargs):
+    """Record a tag's stored name so renames can move suggestions."""
+    instance._suggest_name = None if raw else _previous_value(instance, 'name')
+
+
+@receiver(post_save, sender=Tag)
+def suggest_tag_rename(sender, instance, **kwargs):
+    """Move the suggestion of a renamed tag."""
+    previous = getattr(instance, '_suggest_name', None)
+    if previous is not None and previous != instance.name:
+        suggest.rename('tag', previous, instance.name)
+
+
+@receiver(pre_delete, sender=Tag)
+def forget_tag_suggestion(sender, instance, **kwargs):
+    """Uncount a deleted tag."""
+    if suggest.loaded_index() is not None:
+        suggest.adjust_many(
+            'tag', [instance.name], -instance.recipes.count()
+        )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def suggest_tagging(sender, instance, action, reverse, pk_set, **kwargs):
+    """Count tags gained or lost by recipes."""
+    if suggest.loaded_index() is None:
+        return
+    if action in ('post_add', 'post_remove'):
+        delta = 1 if action == 'post_add' else -1
+        if reverse:
+            suggest.adjust_many('tag', [instance.name], delta * len(pk_set))
+        else:
+            suggest.adjust_many(
+                'tag',
+                Tag.objects.filter(pk__in=pk_set).values_list(
+                    'name', flat=True
+                ),
+                delta,
+            )
+    elif action == 'pre_clear':
+        if reverse:
+            suggest.adjust_many(
+                'tag', [instance.name], -instance.recipes.count()
+            )
+        else:
+            suggest.adjust_many(
+                'tag', instance.tags.values_list('name', flat=True), -1
+            )
+
+
+@receiver(post_save, sender=Recipe)
+def queue_similarity_on_recipe_save(sender, instance, raw=False, **kwargs):
+    """Queue a saved recipe for recomputing its similar recipes."""
+    if not raw:
+        tasks.queue_similarity([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(pre_delete, sender=Recipe)
+def invalidate_neighbor_pages(sender, instance, created=False, raw=False,
+                              **kwargs):
+    """Drop cached pages listing a renamed or deleted recipe as similar.
+
+    They show its name and link to it until their similar recipes are
+    recomputed.
+    """
+    if not created and not raw:
+        cache.invalidate_recipes(
+            RecipeNeighbor.objects.filter(neighbor=instance)
+            .values_list('recipe_id', flat=True)
+        )
+
+
+@receiver(pre_delete, sender=Recipe)
+def queue_similarity_on_recipe_delete(sender, instance, **kwargs):
+    """Queue the recipes listing a deleted recipe as similar.
+
+    Their rows pointing at it are removed by cascade, leaving a gap to
+    refill.
+    """
+    tasks.queue_similarity(
+        RecipeNeighbor.objects.filter(neighbor=instance)
+        .values_list('recipe_id', flat=True)
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def queue_similarity_on_ingredient_change(sender, instance, origin=None,
+                                          raw=False, **kwargs):
+    """Queue the recipe owning a changed ingredient."""
+    if not raw and not _deleted_with_recipe(origin):
+        tasks.queue_similarity([instance.recipe_id])
+
+
+@receiver(post_save, sender=Tag)
+def queue_similarity_on_tag_rename(sender, instance, created=False,
+                                   raw=False, **kwargs):
+    """Queue every recipe carrying a renamed tag."""
+    if not created and not raw:
+        tasks.queue_similarity(_tagged_recipe_ids(instance))
+
+
+@receiver(post_delete, sender=Tag)
+def queue_similarity_on_tag_delete(sender, instance, **kwargs):
+    """Queue the recipes that carried a deleted tag.
+
+    They are recorded before the deletion by ``remember_cards_on_tag_delete``.
+    """
+    tasks.queue_similarity(getattr(instance, '_card_recipe_ids', ()))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def queue_similarity_on_tagging(sender, instance, action, reverse, pk_set,
+                                **kwargs):
+    """Queue recipes gaining or losing tags."""
+    if action in ('post_add', 'post_remove'):
+        tasks.queue_similarity(pk_set if reverse else [instance.pk])
+    elif action == 'post_clear':
+        # Recorded by ``refresh_cards_on_tagging`` before the clear.
+        tasks.queue_similarity(
+            getattr(instance, '_card_recipe_ids', ())
+            if reverse else [instance.pk]
+        )
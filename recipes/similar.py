@@ -0,0 +1,290 @@
+"""Similar-recipe recommendations from precomputed neighbor lists.
+
+Every recipe is described by a sparse TF-IDF vector over features drawn
+from its canonical ingredient names, its tags and the terms of its name
+and description. Vectors are L2-normalized, so the similarity of two
+recipes is the dot product of their vectors. The ``NEIGHBORS`` most
+similar recipes of each recipe are stored as ``RecipeNeighbor`` rows, and
+the detail page reads them with a single query.
+
+Dot products are computed through an inverted index: a recipe's scores
+against all others are accumulated over the postings of its features
+only, so a recipe is never compared with recipes it shares nothing with.
+Features carried by a large share of recipes ("salt", "oil") add little
+to similarity but make postings long; they are left out.
+
+Changes to recipes, ingredients and tags queue the affected recipes as
+``SimilarityUpdate`` rows. ``update()`` (the ``update_similar_recipes``
+command, or background job) then recomputes the rows of the queued
+recipes, of the recipes listing them as neighbors, and of the recipes they
+are now similar enough to join the neighbors of; no other row is touched.
+``rebuild()`` recomputes every row, a chunk of recipes at a time.
+"""
+import heapq
+import math
+from array import array
+from collections import Counter, defaultdict
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from . import cache
+from .models import Ingredient, Recipe, RecipeNeighbor, SimilarityUpdate
+from .search import tokenize
+
+NEIGHBORS = 6
+# Pairs scoring lower are not worth recommending.
+MIN_SCORE = 0.05
+# Features carried by more than this share of the recipes, and by more
+# than MIN_PRUNED_FREQUENCY of them, are ignored.
+MAX_DOCUMENT_SHARE = 0.2
+MIN_PRUNED_FREQUENCY = 50
+FEATURE_WEIGHTS = {
+    'ingredient': 1.0,
+    'tag': 1.0,
+    'name': 1.0,
+    'description': 0.3,
+}
+# Recipe ids per ``IN`` query.
+CHUNK_SIZE = 500
+
+
+def _chunks(ids, size: int = CHUNK_SIZE):
+    ids = iter(ids)
+    while chunk := list(islice(ids, size)):
+        yield chunk
+
+
+def recipe_features(name: str, description: str, ingredients,
+                    tags) -> Counter:
+    """Return the weighted feature counts of one recipe.
+
+    ``ingredients`` are canonical ingredient names and ``tags`` tag names.
+    """
+    features = Counter()
+    for canonical in ingredients:
+        if canonical:
+            features[f'i:{canonical}'] += FEATURE_WEIGHTS['ingredient']
+    for tag in tags:
+        features[f't:{tag.casefold()}'] += FEATURE_WEIGHTS['tag']
+    for term in tokenize(name):
+        features[f'w:{term}'] += FEATURE_WEIGHTS['name']
+    for term in tokenize(description):
+        features[f'w:{term}'] += FEATURE_WEIGHTS['description']
+    return features
+
+
+def load_features() -> dict[int, Counter]:
+    """Return the feature counts of every recipe, with three queries."""
+    ingredients = defaultdict(list)
+    for recipe_id, canonical in (
+        Ingredient.objects.order_by().values_list('recipe_id',
+                                                  'canonical_name')
+        .iterator(chunk_size=10000)
+    ):
+        ingredients[recipe_id].append(canonical)
+    tags = defaultdict(list)
+    for recipe_id, name in (
+        Recipe.tags.through.objects.values_list('recipe_id', 'tag__name')
+        .iterator(chunk_size=10000)
+    ):
+        tags[recipe_id].append(name)
+    return {
+        pk: recipe_features(name, description, ingredients[pk], tags[pk])
+        for pk, name, description in (
+            Recipe.objects.order_by('pk')
+            .values_list('pk', 'name', 'description')
+            .iterator(chunk_size=10000)
+        )
+    }
+
+
+class SimilarityIndex:
+    """TF-IDF vectors of a set of recipes, with an inverted index."""
+
+    def __init__(self, features: dict[int, Counter]):
+        """Build the index from ``{recipe_id: feature counts}``."""
+        self.size = len(features)
+        frequencies = Counter(
+            feature for counts in features.values() for feature in counts
+        )
+        limit = max(MAX_DOCUMENT_SHARE * self.size, MIN_PRUNED_FREQUENCY)
+        self.idf = {
+            feature: math.log(self.size / frequency)
+            for feature, frequency in frequencies.items()
+            if frequency <= limit
+        }
+        self.vectors = {
+            recipe_id: self.vector(counts)
+            for recipe_id, counts in features.items()
+        }
+        postings = defaultdict(lambda: (array('q'), array('d')))
+        for recipe_id, vector in self.vectors.items():
+            for feature, weight in vector.items():
+                # Features of a single recipe cannot match another one.
+                if frequencies[feature] > 1:
+                    ids, weights = postings[feature]
+                    ids.append(recipe_id)
+                    weights.append(weight)
+        self.postings = dict(postings)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, recipe_id):
+        return recipe_id in self.vectors
+
+    def vector(self, counts) -> dict[str, float]:
+        """Return the normalized TF-IDF vector of feature ``counts``."""
+        weights = {
+            feature: count * self.idf[feature]
+            for feature, count in counts.items()
+            if self.idf.get(feature)
+        }
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        if not norm:
+            return {}
+        return {feature: weight / norm for feature, weight in weights.items()}
+
+    def scores(self, recipe_id: int) -> dict[int, float]:
+        """Return the similarity of a recipe to every recipe sharing one of
+        its features."""
+        scores = defaultdict(float)
+        for feature, weight in self.vectors.get(recipe_id, {}).items():
+            posting = self.postings.get(feature)
+            if posting is None:
+                continue
+            for other, other_weight in zip(*posting):
+                scores[other] += weight * other_weight
+        scores.pop(recipe_id, None)
+        return scores
+
+    def neighbors(self, recipe_id: int,
+                  count: int = NEIGHBORS) -> list[tuple[int, float]]:
+        """Return the ``(recipe_id, score)`` pairs of the most similar
+        recipes, best first."""
+        return heapq.nlargest(
+            count,
+            ((other, score) for other, score in
+             self.scores(recipe_id).items() if score >= MIN_SCORE),
+            key=lambda pair: (pair[1], -pair[0]),
+        )
+
+
+def build_index() -> SimilarityIndex:
+    """Build an index of every recipe."""
+    return SimilarityIndex(load_features())
+
+
+def enqueue(recipe_ids) -> None:
+    """Queue recipes whose features changed for ``update()``."""
+    now = timezone.now()
+    SimilarityUpdate.objects.bulk_create(
+        [SimilarityUpdate(recipe_id=pk, queued_at=now)
+         for pk in set(recipe_ids)],
+        update_conflicts=True,
+        unique_fields=['recipe'],
+        update_fields=['queued_at'],
+    )
+
+
+def write_neighbors(index: SimilarityIndex, recipe_ids) -> int:
+    """Replace the neighbor rows of ``recipe_ids``; return the row count.
+
+    Ids missing from the index only lose their rows.
+    """
+    recipe_ids = list(recipe_ids)
+    rows = [
+        RecipeNeighbor(recipe_id=recipe_id, neighbor_id=other, score=score)
+        for recipe_id in recipe_ids if recipe_id in index
+        for other, score in index.neighbors(recipe_id)
+    ]
+    with transaction.atomic():
+        for chunk in _chunks(recipe_ids):
+            RecipeNeighbor.objects.filter(recipe_id__in=chunk).delete()
+        RecipeNeighbor.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def _thresholds(recipe_ids) -> dict[int, float]:
+    """Return the lowest stored score of recipes with full neighbor lists.
+
+    A recipe scoring above it against one of these recipes displaces one
+    of its neighbors; any scoring recipe joins a list that is not full.
+    """
+    thresholds = {}
+    for chunk in _chunks(recipe_ids):
+        thresholds.update(
+            (row['recipe_id'], row['lowest'])
+            for row in RecipeNeighbor.objects.filter(recipe_id__in=chunk)
+            .order_by().values('recipe_id')
+            .annotate(count=Count('pk'), lowest=Min('score'))
+            if row['count'] >= NEIGHBORS
+        )
+    return thresholds
+
+
+def affected_recipes(index: SimilarityIndex, recipe_ids) -> set[int]:
+    """Return the recipes whose neighbor rows a change to ``recipe_ids``
+    may alter, including those recipes."""
+    recipe_ids = set(recipe_ids)
+    affected = set(recipe_ids)
+    for chunk in _chunks(recipe_ids):
+        affected.update(
+            RecipeNeighbor.objects.filter(neighbor_id__in=chunk)
+            .values_list('recipe_id', flat=True)
+        )
+    candidates = {}
+    for recipe_id in recipe_ids:
+        for other, score in index.scores(recipe_id).items():
+            if score >= MIN_SCORE and other not in affected:
+                candidates[other] = max(score, candidates.get(other, 0.0))
+    thresholds = _thresholds(candidates)
+    affected.update(
+        other for other, score in candidates.items()
+        if score > thresholds.get(other, 0.0)
+    )
+    return affected
+
+
+def update(index: SimilarityIndex | None = None) -> int:
+    """Recompute the neighbor rows affected by queued changes.
+
+    Returns the number of recipes whose rows were recomputed.
+    """
+    started = timezone.now()
+    queued = list(
+        SimilarityUpdate.objects.values_list('recipe_id', flat=True)
+    )
+    if not queued:
+        return 0
+    if index is None:
+        index = build_index()
+    affected = affected_recipes(index, queued)
+    with transaction.atomic():
+        write_neighbors(index, affected)
+        # Recipes changed again while this ran stay queued.
+        for chunk in _chunks(queued):
+            SimilarityUpdate.objects.filter(
+                recipe_id__in=chunk, queued_at__lte=started
+            ).delete()
+    cache.invalidate_recipes(affected)
+    return len(affected)
+
+
+def rebuild(batch_size: int = 1000) -> int:
+    """Recompute the neighbor rows of every recipe in chunks.
+
+    Returns the number of recipes.
+    """
+    started = timezone.now()
+    index = build_index()
+    recipe_ids = sorted(index.vectors)
+    for start in range(0, len(recipe_ids), batch_size):
+        chunk = recipe_ids[start:start + batch_size]
+        write_neighbors(index, chunk)
+        cache.invalidate_recipes(chunk)
+    SimilarityUpdate.objects.filter(queued_at__lte=started).delete()
+    return len(recipe_ids)
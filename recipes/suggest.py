@@ -0,0 +1,274 @@
+"""Typeahead suggestions over recipe, ingredient and tag names.
+
+Names are held in process memory, sorted by their normalized form, so
+the entries completing a prefix form one contiguous range found with
+``bisect``. A segment tree over fixed-size blocks of that array keeps the
+most popular entries of every node, so the best completions of any
+prefix, however common, are found by merging a few short lists.
+
+Popularity is the number of recipes with a given name, the number of
+ingredient rows with a given canonical name, and the number of recipes
+carrying a tag. Signal handlers apply changes made by this process to an
+overlay of adjusted counts; once the overlay grows past
+``MAX_OVERLAY_SIZE`` entries the arrays are rebuilt from memory. Changes
+made by other processes are picked up when the index is reloaded from
+the database, every ``RECIPES_SUGGEST_MAX_AGE`` seconds.
+"""
+import heapq
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Count
+
+from .models import Ingredient, Recipe, Tag
+from .search import normalize
+
+KINDS = ('recipe', 'ingredient', 'tag')
+MAX_SUGGESTIONS = 20
+BLOCK_SIZE = 32
+# Entries kept per tree node: enough for a full page of suggestions plus
+# as many overlay entries again.
+NODE_SIZE = 2 * MAX_SUGGESTIONS
+MAX_OVERLAY_SIZE = 1000
+
+_SPACE_RE = re.compile(r'\s+')
+_LAST_CHAR = chr(0x10FFFF)
+
+
+def normalize_key(text: str) -> str:
+    """Return the form of ``text`` that prefixes are matched against."""
+    return _SPACE_RE.sub(' ', normalize(text)).strip()
+
+
+class SuggestionIndex:
+    """Prefix index of popular names with an overlay of recent changes."""
+
+    def __init__(self, counts):
+        """Build the index from ``{(kind, key): (text, count)}``."""
+        self._load(counts)
+
+    def _load(self, counts) -> None:
+        entries = sorted(
+            (key, kind, text, count)
+            for (kind, key), (text, count) in counts.items()
+            if count > 0 and key
+        )
+        self.entries = entries
+        self.keys = [entry[0] for entry in entries]
+        order = sorted(range(len(entries)), key=lambda i: self._order(
+            *entries[i]
+        ))
+        self.rank = array('I', [0]) * len(entries)
+        for rank, i in enumerate(order):
+            self.rank[i] = rank
+        self.overlay = {}
+        self._build_tree()
+
+    @staticmethod
+    def _order(key, kind, text, count):
+        """Sort key of an entry: most popular, then shortest, first."""
+        return (-count, len(key), key, kind)
+
+    def _build_tree(self) -> None:
+        blocks = -(-len(self.entries) // BLOCK_SIZE)
+        self.leaves = 1
+        while self.leaves < blocks:
+            self.leaves *= 2
+        self.tree = [array('I') for _ in range(2 * self.leaves)]
+        for block in range(blocks):
+            start = block * BLOCK_SIZE
+            indexes = range(start, min(start + BLOCK_SIZE, len(self.entries)))
+            self.tree[self.leaves + block] = array(
+                'I', sorted(indexes, key=self.rank.__getitem__)[:NODE_SIZE]
+            )
+        for node in range(self.leaves - 1, 0, -1):
+            merged = heapq.merge(
+                self.tree[2 * node], self.tree[2 * node + 1],
+                key=self.rank.__getitem__,
+            )
+            self.tree[node] = array('I', list(merged)[:NODE_SIZE])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _range(self, prefix: str) -> tuple[int, int]:
+        return (
+            bisect_left(self.keys, prefix),
+            bisect_left(self.keys, prefix + _LAST_CHAR),
+        )
+
+    def _best(self, lo: int, hi: int, n: int) -> list[int]:
+        """Return the indexes of the ``n`` best entries in ``[lo, hi)``."""
+        first = -(-lo // BLOCK_SIZE)
+        last = hi // BLOCK_SIZE
+        if n > NODE_SIZE or first >= last:
+            candidates = range(lo, hi)
+        else:
+            candidates = [
+                *range(lo, first * BLOCK_SIZE), *range(last * BLOCK_SIZE, hi)
+            ]
+            # Standard bottom-up walk over the nodes covering the blocks.
+            left, right = first + self.leaves, last + self.leaves
+            while left < right:
+                if left & 1:
+                    candidates.extend(self.tree[left])
+                    left += 1
+                if right & 1:
+                    right -= 1
+                    candidates.extend(self.tree[right])
+                left //= 2
+                right //= 2
+        return heapq.nsmallest(n, candidates, key=self.rank.__getitem__)
+
+    def suggest(self, query: str, limit: int = 10) -> list[dict]:
+        """Return up to ``limit`` completions of ``query``, best first."""
+        prefix = normalize_key(query)
+        if not prefix or limit <= 0:
+            return []
+        changed = {
+            (kind, key): value for (kind, key), value in self.overlay.items()
+            if key.startswith(prefix)
+        }
+        lo, hi = self._range(prefix)
+        candidates = list(changed.items())
+        for i in self._best(lo, hi, limit + len(changed)):
+            key, kind, text, count = self.entries[i]
+            if (kind, key) not in changed:
+                candidates.append(((kind, key), (text, count)))
+        candidates = [
+            (self._order(key, kind, text, count), kind, text, count)
+            for (kind, key), (text, count) in candidates if count > 0
+        ]
+        return [
+            {'text': text, 'kind': kind, 'count': count}
+            for _, kind, text, count in sorted(candidates)[:limit]
+        ]
+
+    def _lookup(self, kind: str, key: str):
+        """Return the current ``(text, count)`` of an entry."""
+        if (kind, key) in self.overlay:
+            return self.overlay[kind, key]
+        i = bisect_left(self.keys, key)
+        while i < len(self.keys) and self.keys[i] == key:
+            if self.entries[i][1] == kind:
+                return self.entries[i][2:]
+            i += 1
+        return None, 0
+
+    def adjust(self, kind: str, text: str, delta: int) -> None:
+        """Add ``delta`` to the popularity of a name."""
+        key = normalize_key(text)
+        if not key or not delta:
+            return
+        current, count = self._lookup(kind, key)
+        self.overlay[kind, key] = (current or text, max(count + delta, 0))
+        if len(self.overlay) > MAX_OVERLAY_SIZE:
+            self.compact()
+
+    def rename(self, kind: str, old: str, new: str) -> None:
+        """Move the popularity of a name to a new spelling."""
+        old_key = normalize_key(old)
+        _, count = self._lookup(kind, old_key)
+        if old_key == normalize_key(new):
+            self.overlay[kind, old_key] = (new, count)
+            return
+        self.adjust(kind, old, -count)
+        self.adjust(kind, new, count)
+
+    def counts(self) -> dict:
+        """Return the entries with the overlay applied."""
+        counts = {
+            (kind, key): (text, count)
+            for key, kind, text, count in self.entries
+        }
+        counts.update(self.overlay)
+        return counts
+
+    def compact(self) -> None:
+        """Fold the overlay into the sorted arrays."""
+        self._load(self.counts())
+
+
+def load_counts() -> dict:
+    """Return ``{(kind, key): (text, count)}`` read from the database."""
+    counts = {}
+
+    def add(kind, text, count):
+        key = normalize_key(text)
+        previous, total = counts.get((kind, key), (text, 0))
+        counts[kind, key] = (previous, total + count)
+
+    for name, count in Recipe.objects.order_by().values_list('name').annotate(
+        count=Count('pk')
+    ):
+        add('recipe', name, count)
+    for name, count in Ingredient.objects.exclude(
+        canonical_name=''
+    ).order_by().values_list('canonical_name').annotate(count=Count('pk')):
+        add('ingredient', name, count)
+    for name, count in Tag.objects.order_by().values_list('name').annotate(
+        count=Count('recipes')
+    ):
+        add('tag', name, count)
+    return counts
+
+
+_index = None
+_loaded_at = 0.0
+_lock = threading.RLock()
+
+
+def get_index() -> SuggestionIndex:
+    """Return this process's index, loading it on first use."""
+    global _index, _loaded_at
+    max_age = getattr(settings, 'RECIPES_SUGGEST_MAX_AGE', 300)
+    with _lock:
+        if _index is None or time.monotonic() - _loaded_at > max_age:
+            _index = SuggestionIndex(load_counts())
+            _loaded_at = time.monotonic()
+        return _index
+
+
+def loaded_index() -> SuggestionIndex | None:
+    """Return the index if this process has loaded it, without loading."""
+    return _index
+
+
+def invalidate() -> None:
+    """Drop the index; it is reloaded on next use."""
+    global _index
+    with _lock:
+        _index = None
+
+
+def suggest(query: str, limit: int = 10) -> list[dict]:
+    """Return the most popular names starting with ``query``."""
+    index = get_index()
+    with _lock:
+        return index.suggest(query, limit)
+
+
+def rename(kind: str, old: str, new: str) -> None:
+    """Move the popularity of a renamed entry if the index is loaded."""
+    index = loaded_index()
+    if index is not None:
+        with _lock:
+            index.rename(kind, old, new)
+
+
+def adjust_many(kind: str, names, delta: int) -> None:
+    """Apply ``delta`` to each of ``names`` if the index is loaded."""
+    index = loaded_index()
+    if index is None:
+        return
+    totals = defaultdict(int)
+    for name in names:
+        totals[name] += delta
+    with _lock:
+        for name, total in totals.items():
+            index.adjust(kind, name, total)
@@ -0,0 +1,178 @@
+"""Seeded synthetic recipe catalogs for benchmarks.
+
+``records(count, seed)`` yields import records (see ``recipes.importing``)
+shaped like a real catalog: ingredients, dishes and tags are drawn from
+vocabularies ordered by popularity with Zipf-distributed weights, so a few
+("salt", "soup", "vegetarian") are everywhere and the tail is rare;
+ingredient counts, servings and times follow skewed distributions around
+typical values. The same count and seed always give the same records.
+"""
+import math
+import random
+from itertools import accumulate
+
+ZIPF_EXPONENT = 1.1
+
+# Ingredients with the unit they are usually measured in, most used first.
+INGREDIENTS = (
+    ('salt', 'tsp'), ('olive oil', 'tbsp'), ('garlic', 'clove'),
+    ('onion', ''), ('butter', 'g'), ('black pepper', 'tsp'),
+    ('egg', ''), ('all-purpose flour', 'cup'), ('sugar', 'cup'),
+    ('milk', 'ml'), ('water', 'ml'), ('tomato', ''), ('lemon juice', 'tbsp'),
+    ('carrot', ''), ('chicken breast', 'g'), ('parsley', 'tbsp'),
+    ('parmesan', 'g'), ('heavy cream', 'ml'), ('potato', 'g'),
+    ('vegetable broth', 'ml'), ('soy sauce', 'tbsp'), ('ginger', 'tbsp'),
+    ('rice', 'cup'), ('celery', ''), ('bell pepper', ''), ('basil', 'tbsp'),
+    ('cumin', 'tsp'), ('paprika', 'tsp'), ('honey', 'tbsp'),
+    ('baking powder', 'tsp'), ('vanilla extract', 'tsp'),
+    ('ground beef', 'g'), ('spinach', 'g'), ('mushroom', 'g'),
+    ('cheddar', 'g'), ('lime', ''), ('coriander', 'tbsp'),
+    ('chili flakes', 'tsp'), ('spaghetti', 'g'), ('bacon', 'g'),
+    ('coconut milk', 'ml'), ('chickpeas', 'g'), ('zucchini', ''),
+    ('thyme', 'tsp'), ('oregano', 'tsp'), ('brown sugar', 'cup'),
+    ('yogurt', 'g'), ('red lentils', 'cup'), ('cinnamon', 'tsp'),
+    ('salmon fillet', 'g'), ('shrimp', 'g'), ('tofu', 'g'),
+    ('broccoli', 'g'), ('cauliflower', 'g'), ('sweet potato', 'g'),
+    ('feta', 'g'), ('mozzarella', 'g'), ('dijon mustard', 'tsp'),
+    ('maple syrup', 'tbsp'), ('walnuts', 'g'), ('almonds', 'g'),
+    ('cocoa powder', 'tbsp'), ('dark chocolate', 'g'), ('oats', 'cup'),
+    ('quinoa', 'cup'), ('kale', 'g'), ('eggplant', ''), ('leek', ''),
+    ('fennel', ''), ('pork shoulder', 'g'), ('lamb', 'g'),
+    ('turmeric', 'tsp'), ('cardamom', 'tsp'), ('star anise', ''),
+    ('miso', 'tbsp'), ('tahini', 'tbsp'), ('pomegranate', ''),
+    ('saffron', 'pinch'), ('anchovy', ''), ('capers', 'tbsp'),
+    ('sumac', 'tsp'), ('lemongrass', ''), ('galangal', 'g'),
+    ('tamarind', 'tbsp'), ('sorrel', 'g'), ('juniper berries', ''),
+)
+QUANTITIES = {
+    'g': ('25', '50', '100', '150', '200', '250', '400', '500'),
+    'ml': ('50', '100', '125', '250', '400', '500'),
+    'cup': ('0.25', '0.5', '1', '1.5', '2'),
+    'tbsp': ('1', '1', '2', '3'),
+    'tsp': ('0.25', '0.5', '1', '1', '2'),
+    'clove': ('1', '2', '3', '4'),
+    'pinch': ('1',),
+    '': ('1', '1', '2', '3', '4', '6'),
+}
+DISHES = (
+    'soup', 'salad', 'pasta', 'stew', 'curry', 'cake', 'bread', 'stir-fry',
+    'casserole', 'pie', 'risotto', 'tacos', 'sandwich', 'omelette',
+    'pancakes', 'muffins', 'roast', 'gratin', 'chili', 'dumplings', 'tart',
+    'frittata', 'porridge', 'skewers', 'noodles', 'burgers', 'cookies',
+    'smoothie', 'pilaf', 'quiche',
+)
+STYLES = (
+    'easy', 'classic', 'quick', 'spicy', 'creamy', 'roasted', 'homemade',
+    'healthy', 'rustic', 'grilled', 'smoky', 'lemony', 'garlicky',
+    'crispy', 'hearty', 'summer', 'winter', 'weeknight', 'festive',
+    'golden', 'tangy', 'herby', 'sticky', 'zesty', 'charred',
+)
+TAGS = (
+    'vegetarian', 'dinner', 'quick', 'easy', 'dessert', 'healthy',
+    'vegan', 'lunch', 'breakfast', 'gluten-free', 'italian', 'comfort food',
+    'baking', 'mexican', 'indian', 'soup', 'chicken', 'seafood', 'asian',
+    'snack', 'spicy', 'low-carb', 'holiday', 'french', 'kids', 'thai',
+    'middle eastern', 'budget', 'grilling', 'one-pot', 'japanese',
+    'dairy-free', 'brunch', 'greek', 'meal prep', 'picnic', 'korean',
+    'moroccan', 'fermented', 'smoking',
+)
+DESCRIPTION_WORDS = (
+    'a', 'simple', 'family', 'favorite', 'with', 'fresh', 'flavors',
+    'ready', 'in', 'no', 'time', 'perfect', 'for', 'busy', 'weeknights',
+    'served', 'warm', 'and', 'bright', 'rich', 'tender', 'comforting',
+    'crowd', 'pleaser', 'that', 'keeps', 'well', 'make', 'ahead',
+    'leftovers', 'taste', 'even', 'better', 'next', 'day', 'from',
+    'scratch', 'seasonal', 'produce', 'light', 'satisfying',
+)
+INSTRUCTIONS = (
+    "Prepare the ingredients.", "Heat the oil in a large pan.",
+    "Add the vegetables and cook until soft.",
+    "Season to taste.", "Simmer until thickened.",
+    "Bake until golden.", "Serve immediately.", "Let rest before serving.",
+    "Whisk everything together.", "Garnish and serve warm.",
+)
+SERVINGS = {1: 3, 2: 20, 3: 5, 4: 40, 6: 20, 8: 8, 10: 2, 12: 2}
+INGREDIENTS_PER_RECIPE = (3, 15, 8)  # triangular (low, high, mode)
+TAGS_PER_RECIPE = {0: 10, 1: 30, 2: 30, 3: 20, 4: 7, 5: 3}
+# Median prep and cook times in minutes; times are log-normal around them.
+PREP_TIME = 15
+COOK_TIME = 30
+TIME_SIGMA = 0.7
+MISSING_TIME_SHARE = 0.1
+
+
+def zipf_weights(count: int, exponent: float = ZIPF_EXPONENT) -> list[float]:
+    """Return cumulative Zipf weights of ``count`` items, most common
+    first."""
+    return list(accumulate(1 / rank ** exponent
+                           for rank in range(1, count + 1)))
+
+
+def search_terms() -> dict[str, str]:
+    """Return search terms of the generated catalogs by popularity.
+
+    ``popular`` names the most common dish, ``rare`` an ingredient of the
+    tail of the distribution.
+    """
+    return {'popular': DISHES[0], 'rare': INGREDIENTS[-1][0]}
+
+
+def _time(rng, median: int) -> int | None:
+    if rng.random() < MISSING_TIME_SHARE:
+        return None
+    minutes = rng.lognormvariate(math.log(median), TIME_SIGMA)
+    return max(5, 5 * round(minutes / 5))
+
+
+def records(count: int, seed: int = 0):
+    """Yield ``count`` synthetic import records generated from ``seed``."""
+    rng = random.Random(seed)
+    ingredient_weights = zipf_weights(len(INGREDIENTS))
+    dish_weights = zipf_weights(len(DISHES))
+    style_weights = zipf_weights(len(STYLES))
+    tag_weights = zipf_weights(len(TAGS))
+    word_weights = zipf_weights(len(DESCRIPTION_WORDS))
+    servings = list(SERVINGS)
+    servings_weights = list(accumulate(SERVINGS.values()))
+    tag_counts = list(TAGS_PER_RECIPE)
+    tag_count_weights = list(accumulate(TAGS_PER_RECIPE.values()))
+    low, high, mode = INGREDIENTS_PER_RECIPE
+
+    for _ in range(count):
+        wanted = round(rng.triangular(low, high, mode))
+        chosen = dict.fromkeys(rng.choices(
+            INGREDIENTS, cum_weights=ingredient_weights, k=wanted * 2
+        ))
+        ingredients = [
+            {
+                'quantity': rng.choice(QUANTITIES[unit]),
+                'unit': unit,
+                'name': name,
+            }
+            for name, unit in list(chosen)[:wanted]
+        ]
+        main = next(
+            (item['name'] for item in ingredients
+             if item['unit'] in ('g', '')),
+            ingredients[0]['name'],
+        )
+        style, = rng.choices(STYLES, cum_weights=style_weights)
+        dish, = rng.choices(DISHES, cum_weights=dish_weights)
+        tag_count, = rng.choices(tag_counts, cum_weights=tag_count_weights)
+        yield {
+            'name': f"{style.capitalize()} {main} {dish}",
+            'description': ' '.join(rng.choices(
+                DESCRIPTION_WORDS, cum_weights=word_weights,
+                k=rng.randint(6, 20),
+            )).capitalize() + '.',
+            'instructions': ' '.join(rng.sample(INSTRUCTIONS, 4)),
+            'servings': rng.choices(
+                servings, cum_weights=servings_weights
+            )[0],
+            'prep_time': _time(rng, PREP_TIME),
+            'cook_time': _time(rng, COOK_TIME),
+            'tags': sorted(set(rng.choices(
+                TAGS, cum_weights=tag_weights, k=tag_count
+            ))),
+            'ingredients': ingredients,
+        }
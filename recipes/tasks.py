@@ -0,0 +1,89 @@
+"""Upkeep of data derived from recipes, now or in background jobs.
+
+Signal handlers call the functions here rather than the modules doing the
+work. Without ``RECIPES_BACKGROUND_JOBS`` the work is done at once; with
+it, each changed recipe is queued once as a ``refresh_recipes`` job that
+recomputes its nutrition totals, card and inverted search index entries
+together, and the queued similar recipes are recomputed by an
+``update_similar_recipes`` job. See ``recipes.jobs``.
+
+Cached pages are dropped as the recipes change, then again once the jobs
+have refreshed them, since pages rendered in between show the old cards.
+"""
+from functools import partial
+
+from django.db import transaction
+
+from . import cache, jobs, nutrition, projection, search, similar
+from .models import Recipe
+
+REFRESH_RECIPES = 'refresh_recipes'
+UPDATE_SIMILAR_RECIPES = 'update_similar_recipes'
+# Similar recipes are recomputed from the whole catalog, so changes are
+# gathered for longer.
+SIMILARITY_DELAY = 60
+
+
+@jobs.task(REFRESH_RECIPES)
+def refresh_recipes(keys) -> None:
+    """Recompute the nutrition totals, cards and inverted search index
+    entries of recipes."""
+    recipe_ids = [int(key) for key in keys]
+    # Nutrition totals are copied to the cards, so they come first.
+    nutrition.update_recipes(recipe_ids)
+    projection.refresh_cards(recipe_ids)
+    if search.uses_inverted_index():
+        recipes = list(Recipe.objects.filter(pk__in=recipe_ids))
+        search.index_recipes(recipes)
+        # Removes the entries of deleted recipes.
+        for recipe_id in set(recipe_ids) - {recipe.pk for recipe in recipes}:
+            search.index_recipe(recipe_id)
+        transaction.on_commit(cache.bump_search_generation)
+    transaction.on_commit(partial(cache.invalidate_recipes, recipe_ids))
+
+
+@jobs.task(UPDATE_SIMILAR_RECIPES, delay=SIMILARITY_DELAY)
+def update_similar_recipes(keys) -> None:
+    """Recompute the similar recipes of the queued recipes."""
+    similar.update()
+
+
+def _queue_refresh(recipe_ids) -> bool:
+    """Queue ``refresh_recipes`` jobs if jobs run in the background."""
+    if not jobs.in_background():
+        return False
+    jobs.enqueue(REFRESH_RECIPES, recipe_ids)
+    return True
+
+
+def update_nutrition(recipe_ids) -> None:
+    """Recompute the nutrition totals of recipes."""
+    if not _queue_refresh(recipe_ids):
+        nutrition.update_recipes(recipe_ids)
+
+
+def refresh_cards(recipe_ids) -> None:
+    """Rebuild the cards of recipes."""
+    if not _queue_refresh(recipe_ids):
+        projection.refresh_cards(recipe_ids)
+
+
+def index_recipes(recipe_ids) -> None:
+    """Rebuild the inverted search index entries of recipes."""
+    if not _queue_refresh(recipe_ids):
+        for recipe_id in recipe_ids:
+            search.index_recipe(recipe_id)
+
+
+def queue_similarity(recipe_ids) -> None:
+    """Queue recipes for recomputing their similar recipes.
+
+    Without background jobs they wait for the ``update_similar_recipes``
+    command.
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    similar.enqueue(recipe_ids)
+    if jobs.in_background():
+        jobs.enqueue(UPDATE_SIMILAR_RECIPES, [''])
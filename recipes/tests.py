@@ -1,7 +1,79 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.http import Http404
+from django.test import (
+    AsyncRequestFactory, TestCase, TransactionTestCase, override_settings,
+)
+from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from django.db import IntegrityError
-from .models import Recipe, Ingredient, Tag
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from .models import (
+    Food, Job, JobCounter, Recipe, RecipeCard, RecipeNeighbor, Ingredient,
+    SimilarityUpdate, Tag, SearchDocument, SearchPosting,
+)
+from .cache import (
+    WRITTEN_AT_KEY, SearchResultCache, bump_search_generation, card_key,
+    get_detail, search_results,
+)
+from .exporting import export
+from .fuzzy import TrigramIndex, edit_distance
+from .importing import RecipeImporter, iter_csv, iter_jsonl
+from . import loadtest
+from .matching import IngredientIndex, canonicalize
+from . import (
+    api, benchmark, database, jobs, metrics, nutrition, routers, shopping,
+    similar, suggest, synthetic, tasks, units, views,
+)
+from .pagination import IdListPaginator, InvalidCursor, KeysetPaginator
+from .search import (
+    cached_search_ids, fts_query, normalize_query, search_recipes, tokenize,
+)
+from .views import RecipeListView
+
+# Maximum number of SQL queries each view may run to render a page.
+QUERY_BUDGETS = {
+    # search result ids (on a search cache miss only), recipe cards, tag
+    # facet counts
+    'recipes:list': 3,
+    'recipes:detail': 4,  # recipe, ingredients, tags, similar recipes
+}
+
+
+def card_ids(response):
+    """Return the recipe ids of the cards listed in ``response``."""
+    return [card.pk for card in response.context['recipes']]
+
+
+class QueryBudgetMixin:
+    """Test mixin asserting that views stay within their query budget."""
+
+    def assertWithinQueryBudget(self, url_name, *args, data=None):
+        """GET ``url_name`` and fail if it exceeds its query budget."""
+        budget = QUERY_BUDGETS[url_name]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse(url_name, args=args), data)
+        self.assertEqual(response.status_code, 200)
+        queries = context.captured_queries
+        if len(queries) > budget:
+            self.fail(
+                f"{url_name} ran {len(queries)} queries, budget is {budget}:\n"
+                + "\n".join(query['sql'] for query in queries)
+            )
+        return response
 
 
 class RecipeModelTest(TestCase):
@@ -371,83 +443,83 @@ class RecipeListViewTest(TestCase):
         """Test that list view displays all recipes when no query is provided."""
         response = self.client.get('/recipes/')
         self.assertEqual(response.status_code, 200)
-        recipes = response.context['recipes']
-        self.assertEqual(recipes.count(), 3)
-        self.assertIn(self.recipe1, recipes)
-        self.assertIn(self.recipe2, recipes)
-        self.assertIn(self.recipe3, recipes)
+        recipes = card_ids(response)
+        self.assertEqual(len(recipes), 3)
+        self.assertIn(self.recipe1.pk, recipes)
+        self.assertIn(self.recipe2.pk, recipes)
+        self.assertIn(self.recipe3.pk, recipes)
 
     def test_search_by_recipe_name(self):
         """Test searching for recipes by name."""
         response = self.client.get('/recipes/', {'q': 'chocolate'})
         self.assertEqual(response.status_code, 200)
-        recipes = response.context['recipes']
-        self.assertIn(self.recipe1, recipes)
-        self.assertNotIn(self.recipe2, recipes)
-        self.assertNotIn(self.recipe3, recipes)
+        recipes = card_ids(response)
+        self.assertIn(self.recipe1.pk, recipes)
+        self.assertNotIn(self.recipe2.pk, recipes)
+        self.assertNotIn(self.recipe3.pk, recipes)
 
     def test_search_by_description(self):
         """Test searching for recipes by description."""
         response = self.client.get('/recipes/', {'q': 'quick meal'})
         self.assertEqual(response.status_code, 200)
-        recipes = response.context['recipes']
-        self.assertIn(self.recipe2, recipes)
-        self.assertNotIn(self.recipe1, recipes)
-        self.assertNotIn(self.recipe3, recipes)
+        recipes = card_ids(response)
+        self.assertIn(self.recipe2.pk, recipes)
+        self.assertNotIn(self.recipe1.pk, recipes)
+        self.assertNotIn(self.recipe3.pk, recipes)
 
     def test_search_by_ingredient_name(self):
         """Test searching for recipes by ingredient name."""
         response = self.client.get('/recipes/', {'q': 'flour'})
         self.assertEqual(response.status_code, 200)
-        recipes = response.context['recipes']
-        self.assertIn(self.recipe3, recipes)
-        self.assertNotIn(self.recipe1, recipes)
-        self.assertNotIn(self.recipe2, recipes)
+        recipes = card_ids(response)
+        self.assertIn(self.recipe3.pk, recipes)
+        self.assertNotIn(self.recipe1.pk, recipes)
+        self.assertNotIn(self.recipe2.pk, recipes)
 
     def test_search_across_multiple_fields(self):
         """Test searching across name, description, and ingredients."""
         response = self.client.get('/recipes/', {'q': 'chicken'})
         self.assertEqual(response.status_code, 200)
-        recipes = response.context['recipes']
+        recipes = card_ids(response)
         # Should match recipe2 by name and ingredient
-        self.assertIn(self.recipe2, recipes)
-        self.assertNotIn(self.recipe1, recipes)
-        self.assertNotIn(self.recipe3, recipes)
+        self.assertIn(self.recipe2.pk, recipes)
+        self.assertNotIn(self.recipe1.pk, recipes)
+        self.assertNotIn(self.recipe3.pk, recipes)
 
     def test_case_insensitive_search(self):
         """Test that search is case-insensitive."""
         response = self.client.get('/recipes/', {'q': 'CHOCOLATE'})
         self.assertEqual(response.status_code, 200)
-        recipes = response.context['recipes']
-        self.assertIn(self.recipe1, recipes)
+        recipes = card_ids(response)
+        self.assertIn(self.recipe1.pk, recipes)
         
         response = self.client.get('/recipes/', {'q': 'ChIcKeN'})
         self.assertEqual(response.status_code, 200)
-        recipes = response.context['recipes']
-        self.assertIn(self.recipe2, recipes)
+        recipes = card_ids(response)
+        self.assertIn(self.recipe2.pk, recipes)
 
     def test_empty_search_query(self):
         """Test handling of empty search query shows all recipes."""
         response = self.client.get('/recipes/', {'q': ''})
         self.assertEqual(response.status_code, 200)
-        recipes = response.context['recipes']
-        self.assertEqual(recipes.count(), 3)
+        recipes = card_ids(response)
+        self.assertEqual(len(recipes), 3)
         self.assertFalse(response.context['has_query'])
 
     def test_empty_search_query_with_whitespace(self):
         """Test handling of search query with only whitespace shows all recipes."""
         response = self.client.get('/recipes/', {'q': '   '})
         self.assertEqual(response.status_code, 200)
-        recipes = response.context['recipes']
-        self.assertEqual(recipes.count(), 3)
+        recipes = card_ids(response)
+        self.assertEqual(len(recipes), 3)
         self.assertFalse(response.context['has_query'])
 
     def test_no_search_results(self):
         """Test search with no matching results."""
         response = self.client.get('/recipes/', {'q': 'nonexistent'})
         self.assertEqual(response.status_code, 200)
-        recipes = response.context['recipes']
-        self.assertEqual(recipes.count(), 0)
+        recipes = card_ids(response)
+        self.assertEqual(len(recipes), 0)
         self.assertTrue(response.context['has_query'])
 
     def test_list_template_rendering(self):
@@ -566,3 +638,3353 @@ class RecipeDetailViewTest(TestCase):
         self.assertContains(response, minimal_recipe.name)
         self.assertContains(response, minimal_recipe.instructions)
 
+
+class SearchTokenizerTest(TestCase):
+    """Test cases for search text normalization."""
+
+    def test_tokenize_normalizes_case_and_accents(self):
+        """Test that tokens are case-folded and stripped of accents."""
+        self.assertEqual(tokenize("Crème BRÛLÉE"), ['creme', 'brulee'])
+
+    def test_tokenize_drops_stopwords(self):
+        """Test that common stopwords are not indexed."""
+        self.assertEqual(tokenize("salt and pepper"), ['salt', 'pepper'])
+
+    def test_tokenize_stems_plurals(self):
+        """Test that plural forms reduce to the same term as singulars."""
+        self.assertEqual(tokenize("tomatoes tomato"), ['tomato', 'tomato'])
+        self.assertEqual(tokenize("cookies"), ['cookie'])
+        self.assertEqual(tokenize("glass"), ['glass'])
+
+
+@override_settings(RECIPES_SEARCH_BACKEND='index')
+class SearchIndexTest(TestCase):
+    """Test cases for the recipe inverted index."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.soup = Recipe.objects.create(
+            name="Chicken Soup",
+            description="Warm and comforting",
+            instructions="Simmer the chicken with vegetables"
+        )
+        self.salad = Recipe.objects.create(
+            name="Garden Salad",
+            description="Fresh vegetables",
+            instructions="Toss everything together"
+        )
+        Ingredient.objects.create(recipe=self.salad, name="grilled chicken")
+
+    def test_index_created_on_save(self):
+        """Test that saving a recipe indexes its text."""
+        self.assertTrue(
+            SearchPosting.objects.filter(
+                recipe=self.soup, term__term='chicken'
+            ).exists()
+        )
+
+    def test_results_ranked_by_relevance(self):
+        """Test that a match in the name outranks a match in ingredients."""
+        results = list(search_recipes(Recipe.objects.all(), 'chicken'))
+        self.assertEqual(results, [self.soup, self.salad])
+
+    def test_all_terms_must_match(self):
+        """Test that multi-word queries require every word to match."""
+        results = search_recipes(Recipe.objects.all(), 'fresh chicken')
+        self.assertEqual(list(results), [self.salad])
+
+    def test_last_term_matches_prefix(self):
+        """Test that a partially typed final word still matches."""
+        results = search_recipes(Recipe.objects.all(), 'gard')
+        self.assertEqual(list(results), [self.salad])
+
+    def test_searches_instructions(self):
+        """Test that recipe instructions are searchable."""
+        results = search_recipes(Recipe.objects.all(), 'simmer')
+        self.assertEqual(list(results), [self.soup])
+
+    def test_index_updated_on_recipe_change(self):
+        """Test that editing a recipe replaces its index entries."""
+        self.soup.name = "Beef Soup"
+        self.soup.instructions = "Simmer the beef"
+        self.soup.save()
+        results = search_recipes(Recipe.objects.all(), 'chicken')
+        self.assertEqual(list(results), [self.salad])
+        results = search_recipes(Recipe.objects.all(), 'beef')
+        self.assertEqual(list(results), [self.soup])
+
+    def test_index_updated_on_ingredient_delete(self):
+        """Test that deleting an ingredient removes it from the index."""
+        self.salad.ingredients.all().delete()
+        results = search_recipes(Recipe.objects.all(), 'grilled')
+        self.assertEqual(list(results), [])
+
+    def test_index_removed_on_recipe_delete(self):
+        """Test that deleting a recipe removes its index entries."""
+        self.salad.delete()
+        self.assertFalse(SearchPosting.objects.filter(
+            recipe_id=self.salad.id
+        ).exists())
+        self.assertFalse(SearchDocument.objects.filter(
+            recipe_id=self.salad.id
+        ).exists())
+
+    def test_rebuild_search_index_command(self):
+        """Test that the rebuild command recreates the index."""
+        SearchPosting.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 2 recipes', out.getvalue())
+        results = search_recipes(Recipe.objects.all(), 'chicken')
+        self.assertEqual(list(results), [self.soup, self.salad])
+
+
+class FullTextSearchTest(TestCase):
+    """Test cases for the SQLite FTS5 search backend."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.soup = Recipe.objects.create(
+            name="Chicken Soup",
+            description="Warm and comforting",
+            instructions="Simmer the chicken with vegetables"
+        )
+        self.salad = Recipe.objects.create(
+            name="Garden Salad",
+            description="Fresh vegetables",
+            instructions="Toss everything together"
+        )
+        Ingredient.objects.create(recipe=self.salad, name="grilled chicken")
+
+    def test_fts_query_quotes_terms(self):
+        """Test that user input is quoted and the last word is a prefix."""
+        self.assertEqual(fts_query('fresh "chick'), '"fresh" "chick"*')
+        self.assertEqual(fts_query('NEAR NOT'), '"near" "not"*')
+        self.assertEqual(fts_query('  !! '), '')
+
+    def test_search_ranks_name_matches_first(self):
+        """Test that results are ordered by bm25() relevance."""
+        results = list(Recipe.objects.search('chicken'))
+        self.assertEqual(results, [self.soup, self.salad])
+        self.assertGreater(results[0].search_rank, results[1].search_rank)
+
+    def test_search_matches_prefix(self):
+        """Test that a partially typed final word still matches."""
+        self.assertEqual(list(Recipe.objects.search('gard')), [self.salad])
+
+    def test_search_requires_all_terms(self):
+        """Test that multi-word queries require every word to match."""
+        results = Recipe.objects.search('fresh chicken')
+        self.assertEqual(list(results), [self.salad])
+
+    def test_search_syntax_is_not_interpreted(self):
+        """Test that FTS5 operators in user input are treated as words."""
+        self.assertEqual(list(Recipe.objects.search('chicken NOT')), [])
+        self.assertEqual(list(Recipe.objects.search('name:soup')), [])
+
+    def test_triggers_track_recipe_changes(self):
+        """Test that recipe updates and deletes reach the FTS table."""
+        self.soup.name = "Beef Soup"
+        self.soup.instructions = "Simmer the beef"
+        self.soup.save()
+        self.assertEqual(list(Recipe.objects.search('beef')), [self.soup])
+        self.assertEqual(list(Recipe.objects.search('chicken')), [self.salad])
+        self.salad.delete()
+        self.assertEqual(list(Recipe.objects.search('chicken')), [])
+
+    def test_triggers_track_ingredient_changes(self):
+        """Test that ingredient edits reach the FTS table."""
+        ingredient = Ingredient.objects.create(recipe=self.soup, name="leek")
+        self.assertEqual(list(Recipe.objects.search('leek')), [self.soup])
+        ingredient.recipe = self.salad
+        ingredient.save()
+        self.assertEqual(list(Recipe.objects.search('leek')), [self.salad])
+        ingredient.delete()
+        self.assertEqual(list(Recipe.objects.search('leek')), [])
+
+    def test_search_is_chainable(self):
+        """Test that search composes with other queryset filters."""
+        results = Recipe.objects.filter(pk=self.soup.pk).search('chicken')
+        self.assertEqual(list(results), [self.soup])
+
+    def test_rebuild_search_index_command(self):
+        """Test that the rebuild command repopulates the FTS table."""
+        from django.db import connection
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM recipes_recipe_fts')
+        self.assertEqual(list(Recipe.objects.search('chicken')), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 2 recipes', out.getvalue())
+        results = list(Recipe.objects.search('chicken'))
+        self.assertEqual(results, [self.soup, self.salad])
+
+
+class KeysetPaginationTest(TestCase):
+    """Test cases for cursor-based pagination."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.recipes = [
+            Recipe.objects.create(
+                name=f"Recipe {i}",
+                instructions="Cook it"
+            )
+            for i in range(7)
+        ]
+        # Newest first, matching the default ordering
+        self.expected = list(reversed(self.recipes))
+
+    def collect_forward(self, paginator):
+        """Return all rows reachable by following next cursors."""
+        rows = []
+        page = paginator.get_page()
+        rows.extend(page)
+        while page.has_next:
+            page = paginator.get_page(after=page.next_cursor)
+            rows.extend(page)
+        return rows
+
+    def test_first_page(self):
+        """Test that the first page has a next cursor but no previous."""
+        page = KeysetPaginator(Recipe.objects.all(), 3).get_page()
+        self.assertEqual(list(page), self.expected[:3])
+        self.assertTrue(page.has_next)
+        self.assertFalse(page.has_previous)
+
+    def test_follow_next_cursors(self):
+        """Test that next cursors walk every row exactly once."""
+        paginator = KeysetPaginator(Recipe.objects.all(), 3)
+        self.assertEqual(self.collect_forward(paginator), self.expected)
+
+    def test_follow_previous_cursor(self):
+        """Test that a previous cursor returns the preceding page."""
+        paginator = KeysetPaginator(Recipe.objects.all(), 3)
+        second = paginator.get_page(after=paginator.get_page().next_cursor)
+        first = paginator.get_page(before=second.previous_cursor)
+        self.assertEqual(list(first), self.expected[:3])
+        self.assertFalse(first.has_previous)
+        self.assertTrue(first.has_next)
+
+    def test_ties_broken_by_id(self):
+        """Test that rows sharing a timestamp are neither lost nor repeated."""
+        Recipe.objects.update(created_at=self.recipes[0].created_at)
+        paginator = KeysetPaginator(Recipe.objects.all(), 2)
+        rows = self.collect_forward(paginator)
+        self.assertEqual(rows, sorted(self.recipes, key=lambda r: -r.id))
+
+    def test_paginates_search_results(self):
+        """Test that search results can be paged in relevance order."""
+        for recipe in self.recipes[:4]:
+            Ingredient.objects.create(recipe=recipe, name="garlic")
+        queryset = Recipe.objects.search('garlic')
+        rows = self.collect_forward(KeysetPaginator(queryset, 3))
+        self.assertEqual(rows, list(queryset))
+        self.assertEqual(len(rows), 4)
+
+    def test_invalid_cursor(self):
+        """Test that a malformed cursor is rejected."""
+        paginator = KeysetPaginator(Recipe.objects.all(), 3)
+        for cursor in ['not-a-cursor', 'WzFd', 'WyJ4IiwgMV0']:
+            with self.assertRaises(InvalidCursor):
+                paginator.get_page(after=cursor)
+
+    def test_list_view_paginates(self):
+        """Test that the list view serves pages linked by cursors."""
+        for i in range(RecipeListView.paginate_by):
+            Recipe.objects.create(name=f"Extra {i}", instructions="Cook it")
+        response = self.client.get('/recipes/')
+        page = response.context['page_obj']
+        self.assertEqual(len(response.context['recipes']), 24)
+        self.assertTrue(response.context['is_paginated'])
+        self.assertContains(response, f'after={page.next_cursor}')
+
+        response = self.client.get('/recipes/', {'after': page.next_cursor})
+        self.assertEqual(len(response.context['recipes']), 7)
+        self.assertEqual(
+            card_ids(response), [recipe.pk for recipe in self.expected]
+        )
+        self.assertFalse(response.context['page_obj'].has_next)
+        self.assertContains(response, 'before=')
+
+    def test_list_view_invalid_cursor_returns_404(self):
+        """Test that the list view returns 404 for a bad cursor."""
+        response = self.client.get('/recipes/', {'after': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    """Test that page views run a fixed number of queries."""
+
+    def setUp(self):
+        """Set up recipes with several ingredients and tags each."""
+        tags = [Tag.objects.create(name=f"tag {i}") for i in range(4)]
+        for i in range(5):
+            recipe = Recipe.objects.create(
+                name=f"Garlic Bread {i}",
+                instructions="Toast it"
+            )
+            recipe.tags.add(*tags)
+            for name in ["garlic", "bread", "butter"]:
+                Ingredient.objects.create(recipe=recipe, name=name)
+        self.recipe = recipe
+
+    def test_detail_view_budget(self):
+        """Test that the detail page prefetches ingredients and tags."""
+        response = self.assertWithinQueryBudget('recipes:detail', self.recipe.id)
+        self.assertContains(response, 'butter')
+        self.assertContains(response, 'tag 3')
+
+    def test_list_view_budget(self):
+        """Test that list cards load tags and counts without N+1 queries."""
+        response = self.assertWithinQueryBudget('recipes:list')
+        self.assertContains(response, '3 ingredients')
+        self.assertContains(response, 'tag 3')
+
+    def test_search_view_budget(self):
+        """Test that searching does not add per-result queries."""
+        response = self.assertWithinQueryBudget(
+            'recipes:list', data={'q': 'garlic'}
+        )
+        self.assertEqual(len(response.context['recipes']), 5)
+
+    @override_settings(RECIPES_SEARCH_BACKEND='index')
+    def test_list_view_with_inverted_index_search(self):
+        """Test that card annotations compose with inverted index search."""
+        call_command('rebuild_search_index', stdout=StringIO())
+        response = self.client.get('/recipes/', {'q': 'garlic'})
+        recipes = response.context['recipes']
+        self.assertEqual(len(recipes), 5)
+        self.assertEqual(recipes[0].ingredient_count, 3)
+
+
+class RecipePageCacheTest(TestCase):
+    """Test cases for cached recipe pages and HTTP validators."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        self.tag = Tag.objects.create(name="dessert")
+        self.recipe = Recipe.objects.create(
+            name="Apple Pie",
+            instructions="Bake it"
+        )
+        self.recipe.tags.add(self.tag)
+        Ingredient.objects.create(recipe=self.recipe, name="apples")
+        self.url = reverse('recipes:detail', args=[self.recipe.id])
+
+    def test_detail_page_served_from_cache(self):
+        """Test that a repeated detail request runs no queries."""
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.content, first.content)
+
+    def test_detail_page_validators(self):
+        """Test that ETag and Last-Modified come from updated_at."""
+        response = self.client.get(self.url)
+        self.recipe.refresh_from_db()
+        self.assertIn(
+            str(self.recipe.updated_at.timestamp()), response.headers['ETag']
+        )
+        self.assertIn('Last-Modified', response.headers)
+
+    def test_conditional_get_returns_not_modified(self):
+        """Test that a matching If-None-Match is answered with 304."""
+        etag = self.client.get(self.url).headers['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_ingredient_change_invalidates_page(self):
+        """Test that adding an ingredient refreshes page and ETag."""
+        etag = self.client.get(self.url).headers['ETag']
+        Ingredient.objects.create(recipe=self.recipe, name="cinnamon")
+        response = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'cinnamon')
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_recipe_change_invalidates_page(self):
+        """Test that editing a recipe refreshes its page."""
+        self.client.get(self.url)
+        self.recipe.name = "Pear Pie"
+        self.recipe.save()
+        self.assertContains(self.client.get(self.url), 'Pear Pie')
+
+    def test_recipe_delete_invalidates_page(self):
+        """Test that a deleted recipe is not served from cache."""
+        self.client.get(self.url)
+        self.recipe.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_tag_rename_invalidates_page_and_card(self):
+        """Test that renaming a tag refreshes pages and list cards."""
+        self.client.get(self.url)
+        self.client.get('/recipes/')
+        self.tag.name = "baking"
+        self.tag.save()
+        self.assertContains(self.client.get(self.url), 'baking')
+        self.assertContains(self.client.get('/recipes/'), 'baking')
+
+    def test_tagging_invalidates_card(self):
+        """Test that tagging through either side refreshes list cards."""
+        self.client.get('/recipes/')
+        Tag.objects.create(name="autumn").recipes.add(self.recipe)
+        self.assertContains(self.client.get('/recipes/'), 'autumn')
+        self.recipe.tags.clear()
+        self.assertNotContains(self.client.get('/recipes/'), 'autumn')
+
+    def test_tag_delete_invalidates_page(self):
+        """Test that deleting a tag removes it from cached pages."""
+        self.client.get(self.url)
+        self.tag.delete()
+        self.assertNotContains(self.client.get(self.url), 'dessert')
+
+
+class SearchResultCacheTest(TestCase):
+    """Test cases for the search result LRU cache."""
+
+    def setUp(self):
+        """Set up an empty cache."""
+        cache.clear()
+        self.results = SearchResultCache(max_entries=2)
+
+    def test_normalize_query(self):
+        """Test that equivalent queries share a cache key."""
+        self.assertEqual(normalize_query("  Chicken  and RICE "), 'chicken rice')
+        self.assertEqual(normalize_query("chicken, rice!"), 'chicken rice')
+
+    def test_hit_and_miss_counters(self):
+        """Test that lookups are counted."""
+        self.assertIsNone(self.results.get('pasta'))
+        self.results.set('pasta', [3, 1, 2])
+        self.assertEqual(self.results.get('pasta'), (3, 1, 2))
+        stats = self.results.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_least_recently_used_entry_evicted(self):
+        """Test that the least recently used query is evicted first."""
+        self.results.set('pasta', [1])
+        self.results.set('soup', [2])
+        self.results.get('pasta')
+        self.results.set('salad', [3])
+        self.assertIsNone(self.results.get('soup'))
+        self.assertEqual(self.results.get('pasta'), (1,))
+        self.assertEqual(self.results.stats()['evictions'], 1)
+
+    def test_generation_bump_invalidates_entries(self):
+        """Test that bumping the generation makes entries stale."""
+        self.results.set('pasta', [1])
+        bump_search_generation()
+        self.assertIsNone(self.results.get('pasta'))
+
+    def test_results_computed_during_write_are_stale(self):
+        """Test that results racing with a write are not served."""
+        def compute():
+            bump_search_generation()
+            return [1]
+        self.assertEqual(self.results.get_or_set('pasta', compute), (1,))
+        self.assertIsNone(self.results.get('pasta'))
+
+
+class SearchResultCacheViewTest(TestCase):
+    """Test cases for cached search results in the list view."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        search_results.clear()
+        self.recipes = [
+            Recipe.objects.create(name=f"Pasta {i}", instructions="Boil")
+            for i in range(3)
+        ]
+
+    def test_repeated_search_served_from_cache(self):
+        """Test that an equivalent query skips the search query."""
+        self.client.get('/recipes/', {'q': 'pasta'})
+        with self.assertNumQueries(2):  # cards and tag facets
+            response = self.client.get('/recipes/', {'q': ' PASTA! '})
+        self.assertEqual(len(response.context['recipes']), 3)
+        self.assertEqual(search_results.stats()['hits'], 1)
+
+    def test_recipe_change_invalidates_results(self):
+        """Test that new recipes show up in previously cached searches."""
+        self.client.get('/recipes/', {'q': 'pasta'})
+        Recipe.objects.create(name="Pasta Bake", instructions="Bake")
+        response = self.client.get('/recipes/', {'q': 'pasta'})
+        self.assertEqual(len(response.context['recipes']), 4)
+
+    def test_ingredient_change_invalidates_results(self):
+        """Test that ingredient edits show up in cached searches."""
+        self.client.get('/recipes/', {'q': 'basil'})
+        Ingredient.objects.create(recipe=self.recipes[0], name="basil")
+        response = self.client.get('/recipes/', {'q': 'basil'})
+        self.assertEqual(card_ids(response), [self.recipes[0].pk])
+
+    def test_search_results_paginate(self):
+        """Test that cached search results are paged with cursors."""
+        ids = [recipe.id for recipe in reversed(self.recipes)]
+        paginator = IdListPaginator(Recipe.objects.all(), ids, 2)
+        first = paginator.get_page()
+        second = paginator.get_page(after=first.next_cursor)
+        self.assertEqual([r.id for r in first], ids[:2])
+        self.assertEqual([r.id for r in second], ids[2:])
+        self.assertFalse(second.has_next)
+        back = paginator.get_page(before=second.previous_cursor)
+        self.assertEqual([r.id for r in back], ids[:2])
+        self.assertFalse(back.has_previous)
+
+    def test_unknown_search_cursor_returns_404(self):
+        """Test that a cursor outside the results is rejected."""
+        cursor = IdListPaginator.encode_cursor(99999)
+        response = self.client.get('/recipes/', {'q': 'pasta', 'after': cursor})
+        self.assertEqual(response.status_code, 404)
+
+    def test_stats_endpoint_requires_staff(self):
+        """Test that cache statistics are only shown to staff."""
+        url = reverse('recipes:search-cache-stats')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        self.client.force_login(staff)
+        self.client.get('/recipes/', {'q': 'pasta'})
+        stats = self.client.get(url).json()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['entries'], 1)
+
+
+class RecipeApiTest(TestCase):
+    """Test cases for the JSON API."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        search_results.clear()
+        self.tag = Tag.objects.create(name="italian")
+        self.recipes = []
+        for i in range(3):
+            recipe = Recipe.objects.create(
+                name=f"Pasta {i}",
+                description=f"Pasta number {i}",
+                servings=2,
+                instructions="Boil water"
+            )
+            recipe.tags.add(self.tag)
+            Ingredient.objects.create(
+                recipe=recipe, quantity=200, unit="g", name="spaghetti"
+            )
+            self.recipes.append(recipe)
+
+    def test_detail_returns_all_fields(self):
+        """Test that the detail endpoint returns every field by default."""
+        recipe = self.recipes[0]
+        response = self.client.get(
+            reverse('recipes:api-detail', args=[recipe.id])
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['name'], "Pasta 0")
+        self.assertEqual(data['servings'], 2)
+        self.assertEqual(data['tags'], ["italian"])
+        self.assertEqual(
+            data['ingredients'],
+            [{'quantity': '200.00', 'unit': 'g', 'name': 'spaghetti'}]
+        )
+
+    def test_detail_404(self):
+        """Test that a missing recipe returns a JSON 404."""
+        response = self.client.get(reverse('recipes:api-detail', args=[999]))
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('error', response.json())
+
+    def test_sparse_fieldsets(self):
+        """Test that only requested fields are returned."""
+        response = self.client.get(
+            reverse('recipes:api-detail', args=[self.recipes[0].id]),
+            {'fields': 'name'}
+        )
+        self.assertEqual(
+            response.json(), {'id': self.recipes[0].id, 'name': "Pasta 0"}
+        )
+
+    def test_unknown_field_rejected(self):
+        """Test that unknown fields are reported as a client error."""
+        response = self.client.get(
+            reverse('recipes:api-list'), {'fields': 'name,secret'}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['error'])
+
+    def test_response_is_compact(self):
+        """Test that responses carry no insignificant whitespace."""
+        response = self.client.get(
+            reverse('recipes:api-detail', args=[self.recipes[0].id]),
+            {'fields': 'name'}
+        )
+        self.assertNotIn(b', ', response.content)
+        self.assertNotIn(b': ', response.content)
+
+    def test_list_paginates(self):
+        """Test that the list endpoint is paged with cursors."""
+        url = reverse('recipes:api-list')
+        first = self.client.get(url, {'limit': 2}).json()
+        self.assertEqual(
+            [r['name'] for r in first['results']], ["Pasta 2", "Pasta 1"]
+        )
+        self.assertIsNone(first['previous'])
+        second = self.client.get(
+            url, {'limit': 2, 'after': first['next']}
+        ).json()
+        self.assertEqual([r['name'] for r in second['results']], ["Pasta 0"])
+        self.assertIsNone(second['next'])
+
+    def test_list_invalid_limit(self):
+        """Test that an out-of-range limit is rejected."""
+        response = self.client.get(reverse('recipes:api-list'), {'limit': 0})
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_queries_per_relation(self):
+        """Test that relations cost one query each for the whole page."""
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                reverse('recipes:api-list'), {'fields': 'name,ingredients,tags'}
+            )
+        self.assertEqual(len(response.json()['results']), 3)
+
+    def test_search(self):
+        """Test that the search endpoint returns ranked matches."""
+        Recipe.objects.create(name="Salad", instructions="Toss")
+        response = self.client.get(
+            reverse('recipes:api-search'), {'q': 'pasta', 'fields': 'name'}
+        )
+        self.assertEqual(len(response.json()['results']), 3)
+
+    def test_search_requires_query(self):
+        """Test that the search endpoint requires q."""
+        response = self.client.get(reverse('recipes:api-search'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_preserves_order_and_reports_missing(self):
+        """Test that batch fetch follows the requested order."""
+        ids = [self.recipes[2].id, 999, self.recipes[0].id]
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse('recipes:api-batch'),
+                {'ids': ','.join(map(str, ids)), 'fields': 'name,tags'}
+            )
+        data = response.json()
+        self.assertEqual(
+            [r['id'] for r in data['results']],
+            [self.recipes[2].id, self.recipes[0].id]
+        )
+        self.assertEqual(data['missing'], [999])
+
+    def test_batch_rejects_bad_ids(self):
+        """Test that malformed or oversized id lists are rejected."""
+        url = reverse('recipes:api-batch')
+        self.assertEqual(self.client.get(url, {'ids': '1,x'}).status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 400)
+        too_many = ','.join(str(i) for i in range(101))
+        self.assertEqual(
+            self.client.get(url, {'ids': too_many}).status_code, 400
+        )
+
+    def test_write_methods_not_allowed(self):
+        """Test that the API is read-only."""
+        response = self.client.post(reverse('recipes:api-list'))
+        self.assertEqual(response.status_code, 405)
+        self.assertIn('error', response.json())
+
+
+class ImportRecipesTest(TestCase):
+    """Test cases for the import_recipes command."""
+
+    def setUp(self):
+        """Set up a scratch directory for input files."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        Tag.objects.create(name="quick")
+
+    def write(self, name, text):
+        """Write an input file and return its path."""
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def jsonl(self, records):
+        """Serialize records as JSON Lines."""
+        return ''.join(json.dumps(record) + '\n' for record in records)
+
+    def record(self, i, **extra):
+        """Return a valid JSON Lines record."""
+        return {
+            'name': f"Imported {i}",
+            'instructions': "Cook",
+            'servings': 2,
+            'tags': ["quick", "imported"],
+            'ingredients': [
+                {'quantity': '1.5', 'unit': 'cup', 'name': 'rice'},
+                'salt',
+            ],
+            **extra,
+        }
+
+    def test_import_jsonl(self):
+        """Test importing recipes, ingredients and tags from JSON Lines."""
+        path = self.write('in.jsonl', self.jsonl(
+            [self.record(i) for i in range(5)]
+        ))
+        out = StringIO()
+        call_command('import_recipes', path, '--batch-size', '2', stdout=out)
+        self.assertIn('Imported 5 recipes and 10 ingredients', out.getvalue())
+        self.assertIn('rows/sec', out.getvalue())
+        recipe = Recipe.objects.get(name="Imported 3")
+        self.assertEqual(recipe.servings, 2)
+        self.assertEqual(
+            sorted(recipe.tags.values_list('name', flat=True)),
+            ["imported", "quick"]
+        )
+        rice = recipe.ingredients.get(name="rice")
+        self.assertEqual((rice.quantity, rice.unit), (Decimal('1.50'), 'cup'))
+        self.assertEqual(Tag.objects.count(), 2)
+        self.assertEqual(Recipe.objects.search('imported rice').count(), 5)
+        self.assertFalse(os.path.exists(path + '.checkpoint'))
+
+    def test_import_csv(self):
+        """Test importing recipes from CSV."""
+        path = self.write('in.csv', (
+            'name,instructions,prep_time,tags,ingredients\n'
+            'Toast,Toast the bread,5,quick;breakfast,2|slice|bread;butter\n'
+        ))
+        call_command('import_recipes', path, stdout=StringIO())
+        recipe = Recipe.objects.get(name="Toast")
+        self.assertEqual(recipe.prep_time, 5)
+        self.assertEqual(
+            list(recipe.ingredients.values_list('quantity', 'unit', 'name')),
+            [(Decimal('2.00'), 'slice', 'bread'), (None, '', 'butter')]
+        )
+        self.assertEqual(recipe.tags.count(), 2)
+
+    def test_invalid_record_keeps_committed_chunks(self):
+        """Test that a bad record aborts only its own chunk, then resume."""
+        records = [self.record(i) for i in range(5)]
+        records[3] = self.record(3, instructions="")
+        path = self.write('in.jsonl', self.jsonl(records))
+        with self.assertRaisesMessage(CommandError, 'Record 4'):
+            call_command(
+                'import_recipes', path, '--batch-size', '2',
+                stdout=StringIO()
+            )
+        self.assertEqual(Recipe.objects.count(), 2)
+        with open(path + '.checkpoint') as f:
+            self.assertEqual(f.read(), '2')
+
+        records[3] = self.record(3)
+        self.write('in.jsonl', self.jsonl(records))
+        out = StringIO()
+        call_command(
+            'import_recipes', path, '--batch-size', '2', '--resume',
+            stdout=out
+        )
+        self.assertIn('Resuming after 2 records', out.getvalue())
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('name', flat=True)),
+            [f"Imported {i}" for i in range(5)]
+        )
+
+    def test_malformed_tags_and_ingredients_are_record_errors(self):
+        """Test that tags and ingredients of the wrong type are reported
+        as bad records rather than split or crashing the import."""
+        for extra in [
+            {'tags': "quick"},
+            {'tags': ["quick", 5]},
+            {'ingredients': "rice"},
+            {'ingredients': ['salt', 1]},
+        ]:
+            with self.subTest(**extra):
+                path = self.write('in.jsonl', self.jsonl(
+                    [self.record(1), self.record(2, **extra)]
+                ))
+                with self.assertRaisesMessage(CommandError, 'Record 2'):
+                    call_command('import_recipes', path, stdout=StringIO())
+        self.assertFalse(Tag.objects.filter(name="q").exists())
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_queries_scale_with_chunks_not_rows(self):
+        """Test that rows are inserted in bulk."""
+        records = iter_jsonl(self.jsonl(
+            [self.record(i) for i in range(50)]
+        ).splitlines())
+        importer = RecipeImporter(batch_size=50)
+        with CaptureQueriesContext(connection) as context:
+            importer.run(records)
+        self.assertEqual(importer.recipes, 50)
+        self.assertLess(len(context.captured_queries), 20)
+
+    def test_csv_reader_shapes_records(self):
+        """Test that CSV rows become the same records as JSON Lines."""
+        rows = list(iter_csv([
+            'name,instructions,tags,ingredients',
+            'Soup,Simmer,,1||egg',
+        ]))
+        self.assertEqual(rows[0]['tags'], [])
+        self.assertEqual(
+            rows[0]['ingredients'],
+            [{'quantity': '1', 'unit': '', 'name': 'egg'}]
+        )
+
+
+class ExportRecipesTest(TestCase):
+    """Test cases for the streaming catalog export."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        tag = Tag.objects.create(name="quick")
+        for i in range(5):
+            recipe = Recipe.objects.create(
+                name=f"Exported {i}",
+                description="Tasty",
+                servings=2,
+                prep_time=i,
+                instructions="Cook"
+            )
+            recipe.tags.add(tag)
+            Ingredient.objects.create(
+                recipe=recipe, quantity=Decimal('1.5'), unit="cup",
+                name="rice"
+            )
+
+    def export_text(self, *args):
+        """Run export_recipes to stdout and return its output."""
+        out = StringIO()
+        call_command('export_recipes', *args, stdout=out)
+        return out.getvalue()
+
+    def test_jsonl_documents_are_denormalized(self):
+        """Test that each line holds a recipe with ingredients and tags."""
+        lines = self.export_text().splitlines()
+        self.assertEqual(len(lines), 5)
+        document = json.loads(lines[0])
+        self.assertEqual(document['name'], "Exported 0")
+        self.assertEqual(document['tags'], ["quick"])
+        self.assertEqual(
+            document['ingredients'],
+            [{'quantity': '1.50', 'unit': 'cup', 'name': 'rice'}]
+        )
+
+    def test_export_round_trips_through_import(self):
+        """Test that both formats can be loaded with import_recipes."""
+        for format in ('jsonl', 'csv'):
+            with self.subTest(format=format):
+                path = os.path.join(self.tmpdir.name, f'out.{format}')
+                call_command(
+                    'export_recipes', '--format', format, '--output', path,
+                    stderr=StringIO()
+                )
+                call_command('import_recipes', path, stdout=StringIO())
+                copy = Recipe.objects.filter(name="Exported 3").last()
+                self.assertEqual(copy.prep_time, 3)
+                self.assertEqual(
+                    list(copy.ingredients.values_list('quantity', 'name')),
+                    [(Decimal('1.50'), 'rice')]
+                )
+                self.assertEqual(
+                    list(copy.tags.values_list('name', flat=True)), ["quick"]
+                )
+        # The CSV export also contains the recipes the JSON Lines pass added.
+        self.assertEqual(Recipe.objects.count(), 20)
+
+    def test_csv_separators_in_names_round_trip(self):
+        """Test that tag and ingredient names containing the CSV list
+        separators are imported as exported."""
+        recipe = Recipe.objects.create(name="Odd", instructions="Mix")
+        recipe.tags.add(Tag.objects.create(name="salt;pepper"))
+        Ingredient.objects.create(
+            recipe=recipe, quantity=Decimal('2'), unit="pinch|es",
+            name="salt; pepper | mix \\ more"
+        )
+        path = os.path.join(self.tmpdir.name, 'out.csv')
+        call_command(
+            'export_recipes', '--format', 'csv', '--output', path,
+            stderr=StringIO()
+        )
+        recipe.delete()
+        Tag.objects.filter(name="salt;pepper").delete()
+        call_command('import_recipes', path, stdout=StringIO())
+        copy = Recipe.objects.get(name="Odd")
+        self.assertEqual(
+            list(copy.ingredients.values_list('quantity', 'unit', 'name')),
+            [(Decimal('2.00'), 'pinch|es', 'salt; pepper | mix \\ more')]
+        )
+        self.assertEqual(
+            list(copy.tags.values_list('name', flat=True)), ["salt;pepper"]
+        )
+
+    def test_gzip_output(self):
+        """Test that compressed output decompresses to the plain export."""
+        path = os.path.join(self.tmpdir.name, 'out.jsonl.gz')
+        call_command(
+            'export_recipes', '--gzip', '--output', path, stderr=StringIO()
+        )
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            self.assertEqual(f.read(), self.export_text())
+
+    def test_queries_scale_with_chunks_not_rows(self):
+        """Test that each chunk costs a fixed number of queries."""
+        with CaptureQueriesContext(connection) as context:
+            chunks = list(export(chunk_size=2))
+        self.assertEqual(len(chunks), 3)
+        # Recipes, ingredients and tags per chunk, plus the final empty read.
+        self.assertEqual(len(context.captured_queries), 3 * 3 + 1)
+
+    def test_endpoint_streams_for_staff(self):
+        """Test that the export endpoint is staff-only and streams."""
+        url = reverse('recipes:export')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        self.client.force_login(staff)
+
+        response = self.client.get(url, {'format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('recipes.csv', response['Content-Disposition'])
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertTrue(lines[0].startswith('id,name,description'))
+        self.assertEqual(len(lines), 6)
+
+        response = self.client.get(url, {'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        body = gzip.decompress(b''.join(response.streaming_content))
+        self.assertEqual(len(body.decode().splitlines()), 5)
+
+        response = self.client.get(url, {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+class RecipeCardTest(TestCase):
+    """Test cases for the RecipeCard list projection."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.tag = Tag.objects.create(name="dinner")
+        self.recipe = Recipe.objects.create(
+            name="Crème Brûlée",
+            description=" ".join(["word"] * 40),
+            prep_time=15,
+            cook_time=40,
+            instructions="Bake"
+        )
+
+    def card(self):
+        """Return the current card of the test recipe."""
+        return RecipeCard.objects.get(pk=self.recipe.pk)
+
+    def test_card_created_with_recipe(self):
+        """Test that saving a recipe builds its card."""
+        card = self.card()
+        self.assertEqual(card.name, "Crème Brûlée")
+        self.assertEqual(card.summary, " ".join(["word"] * 30) + "…")
+        self.assertEqual(card.total_time, 55)
+        self.assertEqual(card.ingredient_count, 0)
+        self.assertEqual(card.created_at, self.recipe.created_at)
+
+        self.recipe.name = "Flan"
+        self.recipe.cook_time = None
+        self.recipe.save()
+        self.assertEqual(self.card().name, "Flan")
+        self.assertEqual(self.card().total_time, 15)
+
+    def test_ingredient_changes_update_card(self):
+        """Test that ingredient edits update the ingredient count."""
+        egg = Ingredient.objects.create(recipe=self.recipe, name="Egg")
+        Ingredient.objects.create(recipe=self.recipe, name="Cream")
+        self.assertEqual(self.card().ingredient_count, 2)
+        egg.delete()
+        self.assertEqual(self.card().ingredient_count, 1)
+
+    def test_tag_changes_update_card(self):
+        """Test that tagging, renaming and deleting tags update cards."""
+        self.recipe.tags.add(self.tag)
+        self.assertEqual(self.card().tag_names, ["dinner"])
+        self.tag.name = "supper"
+        self.tag.save()
+        self.assertEqual(self.card().tag_names, ["supper"])
+        self.tag.recipes.clear()
+        self.assertEqual(self.card().tag_names, [])
+        self.tag.recipes.add(self.recipe)
+        self.assertEqual(self.card().tag_names, ["supper"])
+        self.tag.delete()
+        self.assertEqual(self.card().tag_names, [])
+
+    def test_card_deleted_with_recipe(self):
+        """Test that deleting a recipe removes its card."""
+        self.recipe.delete()
+        self.assertFalse(RecipeCard.objects.exists())
+
+    def test_rebuild_command(self):
+        """Test that the rebuild command restores missing cards."""
+        RecipeCard.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_recipe_cards', stdout=out)
+        self.assertIn("Rebuilt 1 recipe cards", out.getvalue())
+        self.assertEqual(self.card().total_time, 55)
+
+    def test_rebuild_drops_cached_cards(self):
+        """Test that rebuilding the cards drops their cached fragments."""
+        cache.set(card_key(self.recipe.pk), "stale card")
+        call_command('rebuild_recipe_cards', stdout=StringIO())
+        self.assertIsNone(cache.get(card_key(self.recipe.pk)))
+
+    def test_imported_recipes_get_cards(self):
+        """Test that bulk imports build cards without signals."""
+        records = iter_jsonl([json.dumps({
+            'name': "Rice", 'instructions': "Boil", 'tags': ["dinner"],
+            'ingredients': ["rice", "water"],
+        })])
+        RecipeImporter().run(records)
+        card = RecipeCard.objects.get(name="Rice")
+        self.assertEqual(card.ingredient_count, 2)
+        self.assertEqual(card.tag_names, ["dinner"])
+
+    def test_list_view_reads_single_table(self):
+        """Test that list cards are read with one query without joins."""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/recipes/')
+        self.assertContains(response, "55 min total")
+        cards, facets = context.captured_queries
+        self.assertIn('recipes_recipecard', cards['sql'])
+        self.assertNotIn('JOIN', cards['sql'])
+
+
+class TagFacetTest(QueryBudgetMixin, TestCase):
+    """Test cases for tag filtering and facet counts on the list view."""
+
+    def setUp(self):
+        """Set up recipes with overlapping tags."""
+        self.vegan = Tag.objects.create(name="vegan")
+        self.quick = Tag.objects.create(name="quick")
+        self.soup = Tag.objects.create(name="soup")
+        self.salad = Recipe.objects.create(name="Salad", instructions="Toss")
+        self.salad.tags.add(self.vegan, self.quick)
+        self.stew = Recipe.objects.create(name="Stew", instructions="Simmer")
+        self.stew.tags.add(self.vegan, self.soup)
+        self.toast = Recipe.objects.create(name="Toast", instructions="Toast")
+        self.toast.tags.add(self.quick)
+
+    def facets(self, response):
+        """Return the facets in ``response`` as a name to count mapping."""
+        return {
+            facet['name']: facet['count']
+            for facet in response.context['facets']
+        }
+
+    @override_settings(RECIPES_SEARCH_MAX_RESULTS=3)
+    def test_search_tags_reach_past_kept_results(self):
+        """Test that tag filters and facets of a search cover the matches
+        ranked below the results kept per search."""
+        rare = Tag.objects.create(name="rare")
+        # Ties are ranked newest first, so the first recipe comes last.
+        tagged = Recipe.objects.create(
+            name="Garlic dish 9", instructions="Cook"
+        )
+        tagged.tags.add(rare)
+        for number in range(4):
+            Recipe.objects.create(
+                name=f"Garlic dish {number}", instructions="Cook"
+            )
+        self.assertNotIn(tagged.pk, cached_search_ids('garlic'))
+        response = self.client.get('/recipes/', {'q': 'garlic'})
+        self.assertEqual(self.facets(response)['rare'], 1)
+        response = self.client.get('/recipes/', {'q': 'garlic', 'tag': 'rare'})
+        self.assertEqual(card_ids(response), [tagged.pk])
+
+    def test_single_tag_filter(self):
+        """Test filtering the list by one tag."""
+        response = self.client.get('/recipes/', {'tag': 'vegan'})
+        self.assertEqual(card_ids(response), [self.stew.pk, self.salad.pk])
+
+    def test_tags_combine_with_and(self):
+        """Test that repeated tags select recipes carrying all of them."""
+        response = self.client.get(
+            '/recipes/', {'tag': ['vegan', 'quick']}
+        )
+        self.assertEqual(card_ids(response), [self.salad.pk])
+        self.assertEqual(self.facets(response), {'quick': 1, 'vegan': 1})
+
+        response = self.client.get('/recipes/', {'tag': ['vegan', 'nope']})
+        self.assertEqual(card_ids(response), [])
+        self.assertContains(response, "No recipes have all of the selected")
+
+    def test_facet_counts_follow_results(self):
+        """Test that facets count tags within the current results."""
+        response = self.client.get('/recipes/')
+        self.assertEqual(
+            self.facets(response), {'quick': 2, 'vegan': 2, 'soup': 1}
+        )
+        response = self.client.get('/recipes/', {'tag': 'soup'})
+        self.assertEqual(self.facets(response), {'soup': 1, 'vegan': 1})
+
+    def test_facet_links_toggle_tags(self):
+        """Test that facet links add unselected and remove selected tags."""
+        response = self.client.get('/recipes/', {'tag': 'vegan'})
+        params = {
+            facet['name']: facet['params']
+            for facet in response.context['facets']
+        }
+        self.assertEqual(params['vegan'], '')
+        self.assertEqual(params['quick'], 'tag=vegan&tag=quick')
+
+    def test_tags_combine_with_search(self):
+        """Test that tag filters narrow search results."""
+        response = self.client.get('/recipes/', {'q': 'toast', 'tag': 'quick'})
+        self.assertEqual(card_ids(response), [self.toast.pk])
+        response = self.client.get('/recipes/', {'q': 'toast', 'tag': 'vegan'})
+        self.assertEqual(card_ids(response), [])
+
+    def test_tag_filter_budget(self):
+        """Test that tag filters and facets add no per-tag queries."""
+        self.assertWithinQueryBudget(
+            'recipes:list', data={'tag': ['vegan', 'quick', 'soup']}
+        )
+
+    def test_pagination_keeps_filters(self):
+        """Test that page links carry the search and tag filters."""
+        for i in range(RecipeListView.paginate_by):
+            recipe = Recipe.objects.create(name=f"Bowl {i}", instructions="Mix")
+            recipe.tags.add(self.vegan)
+        response = self.client.get('/recipes/', {'tag': 'vegan'})
+        self.assertContains(response, '?tag=vegan&amp;after=')
+        next_page = response.context['page_obj'].next_cursor
+        response = self.client.get(
+            '/recipes/', {'tag': 'vegan', 'after': next_page}
+        )
+        self.assertEqual(card_ids(response), [self.stew.pk, self.salad.pk])
+
+    def test_admin_counts_in_one_query(self):
+        """Test that the tag changelist counts recipes without N+1 queries."""
+        admin = User.objects.create_superuser('admin', password='pw')
+        self.client.force_login(admin)
+        url = reverse('admin:recipes_tag_changelist')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertContains(response, '<td class="field-recipe_count">2</td>')
+        Tag.objects.bulk_create(Tag(name=f"extra {i}") for i in range(10))
+        with self.assertNumQueries(len(context.captured_queries)):
+            self.client.get(url)
+
+
+class IngredientMatchingTest(TestCase):
+    """Test cases for the pantry matching engine."""
+
+    def test_canonicalize(self):
+        """Test that ingredient names reduce to a canonical vocabulary."""
+        for name in ["Tomatoes", "tomato, diced", "Fresh tomatoes (ripe)"]:
+            self.assertEqual(canonicalize(name), "tomato")
+        self.assertEqual(
+            canonicalize("Extra virgin Olive Oil"), "virgin olive oil"
+        )
+        self.assertEqual(canonicalize("Crème fraîche"), "creme fraiche")
+
+    def test_canonical_name_stored_on_save(self):
+        """Test that ingredients store their canonical name."""
+        recipe = Recipe.objects.create(name="Soup", instructions="Simmer")
+        ingredient = Ingredient.objects.create(
+            recipe=recipe, name="Onions, sliced"
+        )
+        ingredient.refresh_from_db()
+        self.assertEqual(ingredient.canonical_name, "onion")
+
+    def test_index_ranks_by_coverage(self):
+        """Test ranking by covered fraction, covered count, then recency."""
+        index = IngredientIndex([
+            (1, ["tomato", "basil", "pasta"]),
+            (2, ["tomato", "basil"]),
+            (3, ["tomato", "egg", "flour", "milk"]),
+            (4, []),
+            (5, ["tomato", "basil", "pasta", "garlic"]),
+            (6, ["egg"]),
+        ])
+        self.assertEqual(len(index), 5)
+        self.assertEqual(
+            index.match(["tomato", "basil", "pasta", "unknown"]),
+            [(1, 3, 3), (2, 2, 2), (5, 3, 4), (3, 1, 4)]
+        )
+        self.assertEqual(
+            index.match(["basil", "tomato"], min_coverage=0.5),
+            [(2, 2, 2), (1, 2, 3), (5, 2, 4)]
+        )
+        self.assertEqual(index.match(["egg"], limit=1), [(6, 1, 1)])
+        self.assertEqual(index.match(["unknown"]), [])
+
+    def test_counters_match_naive_counts(self):
+        """Test the bit-sliced counters against a direct count."""
+        import random
+        rng = random.Random(7)
+        vocabulary = [f"item {i}" for i in range(40)]
+        recipes = [
+            (pk, rng.sample(vocabulary, rng.randint(1, 12)))
+            for pk in range(1, 3001)
+        ]
+        index = IngredientIndex(recipes)
+        pantry = rng.sample(vocabulary, 20)
+        expected = sorted(
+            ((pk, len(set(names) & set(pantry)), len(names))
+             for pk, names in recipes if set(names) & set(pantry)),
+            key=lambda r: (r[1] / r[2], r[1], r[0]),
+            reverse=True,
+        )
+        self.assertEqual(index.match(pantry, limit=len(recipes)), expected)
+
+
+@override_settings(RECIPES_MATCHING_INDEX_MAX_AGE=0)
+class RecipeMatchApiTest(TestCase):
+    """Test cases for the pantry matching API endpoint."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        self.salad = Recipe.objects.create(name="Salad", instructions="Toss")
+        for name in ["Tomatoes", "Basil", "Olive oil"]:
+            Ingredient.objects.create(recipe=self.salad, name=name)
+        self.omelette = Recipe.objects.create(
+            name="Omelette", instructions="Fry"
+        )
+        for name in ["Eggs", "Butter"]:
+            Ingredient.objects.create(recipe=self.omelette, name=name)
+
+    def match(self, **params):
+        """Call the match endpoint and return the parsed response."""
+        return self.client.get(reverse('recipes:api-match'), params)
+
+    def test_match_returns_coverage_and_missing(self):
+        """Test that results report coverage and missing ingredients."""
+        data = self.match(ingredients="tomato, diced,basil,egg").json()
+        self.assertEqual(
+            [(r['name'], r['coverage'], r['missing'])
+             for r in data['results']],
+            [("Salad", 0.6667, ["olive oil"]), ("Omelette", 0.5, ["butter"])]
+        )
+
+    def test_index_follows_changes(self):
+        """Test that new ingredients are matched after the index rebuilds."""
+        data = self.match(ingredients="egg").json()
+        self.assertEqual([r['name'] for r in data['results']], ["Omelette"])
+        Ingredient.objects.create(recipe=self.salad, name="Eggs")
+        data = self.match(ingredients="egg", min_coverage=0.2).json()
+        self.assertEqual(
+            [r['name'] for r in data['results']], ["Omelette", "Salad"]
+        )
+
+    def test_invalid_parameters(self):
+        """Test that bad parameters are rejected with 400."""
+        for params in [
+            {},
+            {'ingredients': "egg", 'min_coverage': "2"},
+            {'ingredients': "egg", 'min_coverage': "x"},
+            {'ingredients': ",".join(["egg"] * 51)},
+        ]:
+            with self.subTest(params=params):
+                self.assertEqual(self.match(**params).status_code, 400)
+
+    def test_imported_ingredients_are_canonical(self):
+        """Test that bulk imports store canonical names too."""
+        records = iter_jsonl([json.dumps({
+            'name': "Rice", 'instructions': "Boil",
+            'ingredients': ["Rice (long grain)", "water"],
+        })])
+        RecipeImporter().run(records)
+        data = self.match(ingredients="rice,water").json()
+        self.assertEqual(data['results'][0]['name'], "Rice")
+        self.assertEqual(data['results'][0]['coverage'], 1.0)
+
+
+class SuggestionIndexTest(TestCase):
+    """Test cases for the in-memory typeahead index."""
+
+    def build(self, names):
+        """Build an index of recipe names with the given counts."""
+        return suggest.SuggestionIndex({
+            ('recipe', suggest.normalize_key(name)): (name, count)
+            for name, count in names.items()
+        })
+
+    def texts(self, index, query, limit=10):
+        """Return the suggested texts for ``query``."""
+        return [item['text'] for item in index.suggest(query, limit)]
+
+    def test_prefix_ranked_by_popularity(self):
+        """Test that completions are ordered by count, then length."""
+        index = self.build({
+            "Chicken Soup": 3, "Chickpea Curry": 5, "Chili": 9,
+            "Chicken": 3, "Crème Brûlée": 1,
+        })
+        self.assertEqual(
+            self.texts(index, "chi"),
+            ["Chili", "Chickpea Curry", "Chicken", "Chicken Soup"]
+        )
+        self.assertEqual(
+            self.texts(index, "CHICK", limit=1), ["Chickpea Curry"]
+        )
+        self.assertEqual(self.texts(index, "creme"), ["Crème Brûlée"])
+        self.assertEqual(self.texts(index, "x"), [])
+        self.assertEqual(self.texts(index, "  "), [])
+
+    def test_tree_matches_brute_force(self):
+        """Test block and tree lookups against a full scan."""
+        import random
+        rng = random.Random(3)
+        names = {
+            f"{rng.choice('abc')}{rng.choice('abc')}{i:04d}":
+                rng.randint(1, 50)
+            for i in range(2000)
+        }
+        index = self.build(names)
+        for prefix in ["a", "ab", "ca", "b0", "cc1"]:
+            expected = sorted(
+                (name for name in names if name.startswith(prefix)),
+                key=lambda name: (-names[name], len(name), name)
+            )[:20]
+            self.assertEqual(self.texts(index, prefix, 20), expected)
+
+    def test_overlay_adjusts_counts(self):
+        """Test that adjustments reorder, add and hide suggestions."""
+        index = self.build({"Pasta": 2, "Pancakes": 3})
+        index.adjust('recipe', "Pasta", 2)
+        index.adjust('recipe', "Paella", 1)
+        self.assertEqual(
+            self.texts(index, "pa"), ["Pasta", "Pancakes", "Paella"]
+        )
+        index.adjust('recipe', "Pancakes", -3)
+        self.assertEqual(self.texts(index, "pa"), ["Pasta", "Paella"])
+        index.compact()
+        self.assertEqual(index.overlay, {})
+        self.assertEqual(self.texts(index, "pa"), ["Pasta", "Paella"])
+
+    def test_overlay_beyond_node_size(self):
+        """Test that many overlay entries fall back to a range scan."""
+        index = self.build({f"item {i:03d}": 1 for i in range(200)})
+        for i in range(suggest.NODE_SIZE):
+            index.adjust('recipe', f"item {i:03d}", -1)
+        self.assertEqual(
+            self.texts(index, "item", 3), ["item 040", "item 041", "item 042"]
+        )
+
+
+class SuggestViewTest(TestCase):
+    """Test cases for the suggest endpoint and its signal updates."""
+
+    def setUp(self):
+        """Set up test data and start from an unloaded index."""
+        suggest.invalidate()
+        self.addCleanup(suggest.invalidate)
+        self.vegan = Tag.objects.create(name="Vegan")
+        self.curry = Recipe.objects.create(
+            name="Vegetable Curry", instructions="Simmer"
+        )
+        self.curry.tags.add(self.vegan)
+        Ingredient.objects.create(
+            recipe=self.curry, name="Vegetables, chopped"
+        )
+        Ingredient.objects.create(recipe=self.curry, name="Vegetable stock")
+        self.soup = Recipe.objects.create(
+            name="Vegetable Soup", instructions="Boil"
+        )
+        Ingredient.objects.create(recipe=self.soup, name="Vegetables")
+
+    def suggestions(self, query, **params):
+        """Return ``(kind, text, count)`` suggestions for ``query``."""
+        response = self.client.get(
+            reverse('recipes:suggest'), {'q': query, **params}
+        )
+        return [
+            (item['kind'], item['text'], item['count'])
+            for item in response.json()['suggestions']
+        ]
+
+    def test_suggestions_across_kinds(self):
+        """Test completions from recipe, ingredient and tag names."""
+        self.assertEqual(self.suggestions("veg"), [
+            ('ingredient', 'vegetable', 2),
+            ('tag', 'Vegan', 1),
+            ('recipe', 'Vegetable Soup', 1),
+            ('recipe', 'Vegetable Curry', 1),
+            ('ingredient', 'vegetable stock', 1),
+        ])
+
+    def test_loaded_index_serves_without_queries(self):
+        """Test that suggestions are served from memory."""
+        self.suggestions("veg")
+        with self.assertNumQueries(0):
+            self.suggestions("vegetable s")
+
+    def test_signals_update_loaded_index(self):
+        """Test that edits are reflected without reloading the index."""
+        self.suggestions("v")
+        self.soup.name = "Vegan Soup"
+        self.soup.save()
+        self.soup.tags.add(self.vegan)
+        Ingredient.objects.create(recipe=self.soup, name="Vegan cheese")
+        self.curry.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggestions("veg"), [
+                ('tag', 'Vegan', 1),
+                ('ingredient', 'vegetable', 1),
+                ('recipe', 'Vegan Soup', 1),
+                ('ingredient', 'vegan cheese', 1),
+            ])
+        self.vegan.name = "Plant-based"
+        self.vegan.save()
+        self.assertIn(('tag', 'Plant-based', 1), self.suggestions("plant"))
+        self.vegan.recipes.clear()
+        self.assertEqual(self.suggestions("plant"), [])
+
+    def test_invalid_limit(self):
+        """Test that the limit is validated."""
+        url = reverse('recipes:suggest')
+        for limit in ["0", "21", "x"]:
+            response = self.client.get(url, {'q': "v", 'limit': limit})
+            self.assertEqual(response.status_code, 400)
+
+
+class TrigramIndexTest(TestCase):
+    """Test cases for the spelling correction index."""
+
+    def setUp(self):
+        """Build an index over a small vocabulary."""
+        self.index = TrigramIndex({
+            'spaghetti': 4, 'parmesan': 3, 'pasta': 5, 'paste': 1,
+            'carbonara': 2, 'chicken': 6, 'basil': 2,
+        })
+
+    def test_edit_distance(self):
+        """Test that transpositions count as one edit and limits apply."""
+        self.assertEqual(edit_distance('spagetti', 'spaghetti', 2), 1)
+        self.assertEqual(edit_distance('chikcen', 'chicken', 2), 1)
+        self.assertEqual(edit_distance('kitten', 'sitting', 3), 3)
+        self.assertEqual(edit_distance('kitten', 'sitting', 2), 3)
+        self.assertEqual(edit_distance('a', 'abcd', 1), 2)
+
+    def test_correct_words(self):
+        """Test that misspelled words map to the closest known word."""
+        self.assertEqual(self.index.correct('spagetti'), 'spaghetti')
+        self.assertEqual(self.index.correct('parmesean'), 'parmesan')
+        self.assertEqual(self.index.correct('chikcen'), 'chicken')
+        # Transpositions near the ends change four trigrams.
+        self.assertEqual(self.index.correct('psata'), 'pasta')
+        self.assertEqual(self.index.correct('bsail'), 'basil')
+        self.assertEqual(self.index.correct('spaghetit'), 'spaghetti')
+        # Equally close words are resolved by popularity.
+        self.assertEqual(self.index.correct('pastu'), 'pasta')
+        self.assertIsNone(self.index.correct('lasagne'))
+        # Short words are never corrected.
+        self.assertIsNone(self.index.correct('pas'))
+
+    def test_correct_query(self):
+        """Test that only unknown words of a query are corrected."""
+        self.assertEqual(
+            self.index.correct_query("Spagetti with Parmesean"),
+            'spaghetti parmesan'
+        )
+        self.assertEqual(
+            self.index.correct_query("chicken carbonaro"),
+            'chicken carbonara'
+        )
+        self.assertIsNone(self.index.correct_query("chicken pasta"))
+        # A trailing prefix of a known word is left for prefix search.
+        self.assertIsNone(self.index.correct_query("carbo"))
+        self.assertIsNone(self.index.correct_query("lasagne"))
+
+
+@override_settings(RECIPES_FUZZY_INDEX_MAX_AGE=0)
+class FuzzySearchTest(TestCase):
+    """Test cases for the typo-tolerant search fallback."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.carbonara = Recipe.objects.create(
+            name="Spaghetti Carbonara", instructions="Toss"
+        )
+        Ingredient.objects.create(recipe=self.carbonara, name="Parmesan")
+        self.salad = Recipe.objects.create(
+            name="Green Salad", instructions="Toss"
+        )
+
+    def test_list_falls_back_to_corrected_query(self):
+        """Test that a misspelled search shows corrected results."""
+        response = self.client.get(
+            reverse('recipes:list'), {'q': 'spagetti parmesean'}
+        )
+        self.assertEqual(card_ids(response), [self.carbonara.pk])
+        self.assertEqual(
+            response.context['corrected_query'], 'spaghetti parmesan'
+        )
+        self.assertContains(response, 'Showing results for')
+
+    def test_exact_hits_are_not_corrected(self):
+        """Test that searches with results are left alone."""
+        response = self.client.get(reverse('recipes:list'), {'q': 'salad'})
+        self.assertEqual(card_ids(response), [self.salad.pk])
+        self.assertIsNone(response.context['corrected_query'])
+        self.assertNotContains(response, 'Showing results for')
+
+    def test_uncorrectable_query(self):
+        """Test that a query without a correction still finds nothing."""
+        response = self.client.get(reverse('recipes:list'), {'q': 'zzzzzz'})
+        self.assertEqual(card_ids(response), [])
+        self.assertContains(response, 'No recipes match')
+
+    def test_index_follows_new_recipes(self):
+        """Test that names added after the first search are corrected."""
+        self.client.get(reverse('recipes:list'), {'q': 'spagetti'})
+        risotto = Recipe.objects.create(
+            name="Mushroom Risotto", instructions="Stir"
+        )
+        response = self.client.get(reverse('recipes:list'), {'q': 'risoto'})
+        self.assertEqual(card_ids(response), [risotto.pk])
+
+    def test_api_reports_corrected_query(self):
+        """Test that the search API falls back and reports the correction."""
+        data = self.client.get(
+            reverse('recipes:api-search'), {'q': 'spagetti'}
+        ).json()
+        self.assertEqual(data['corrected_query'], 'spaghetti')
+        self.assertEqual(
+            [item['id'] for item in data['results']], [self.carbonara.pk]
+        )
+        data = self.client.get(
+            reverse('recipes:api-search'), {'q': 'salad'}
+        ).json()
+        self.assertIsNone(data['corrected_query'])
+
+
+@override_settings(RECIPES_FUZZY_INDEX_MAX_AGE=0)
+class AsyncViewTest(TestCase):
+    """Test cases for the async versions of the pages and JSON endpoints.
+
+    Each async view is called directly and compared with the synchronous
+    view served by the project URLconf.
+    """
+
+    def setUp(self):
+        """Set up test data."""
+        self.factory = AsyncRequestFactory()
+        self.vegan = Tag.objects.create(name="Vegan")
+        self.recipes = []
+        for i in range(30):
+            recipe = Recipe.objects.create(
+                name=f"Tomato Soup {i}", instructions="Simmer"
+            )
+            Ingredient.objects.create(recipe=recipe, name="Tomato")
+            if i % 3 == 0:
+                recipe.tags.add(self.vegan)
+            self.recipes.append(recipe)
+        self.pasta = Recipe.objects.create(
+            name="Spaghetti Carbonara", instructions="Toss"
+        )
+
+    async def call(self, view_class, path, data=None, **kwargs):
+        """Call ``view_class`` asynchronously and render its response."""
+        request = self.factory.get(path, data)
+        response = await view_class.as_view()(request, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    async def list_ids(self, data=None):
+        """Return the card ids and page of the async list view."""
+        response = await self.call(
+            views.AsyncRecipeListView, reverse('recipes:list'), data
+        )
+        context = response.context_data
+        return [card.pk for card in context['recipes']], context
+
+    async def test_list_matches_sync_view(self):
+        """Test that async list pages, facets and cursors match."""
+        for data in [{}, {'q': 'tomato'}, {'tag': 'Vegan'},
+                     {'q': 'soup', 'tag': 'Vegan'}]:
+            expected = await self.async_client.get(
+                reverse('recipes:list'), data
+            )
+            ids, context = await self.list_ids(data)
+            self.assertEqual(ids, card_ids(expected))
+            self.assertEqual(context['facets'], expected.context['facets'])
+            cursor = context['page_obj'].next_cursor
+            self.assertEqual(
+                cursor, expected.context['page_obj'].next_cursor
+            )
+            if cursor:
+                following = await self.async_client.get(
+                    reverse('recipes:list'), {**data, 'after': cursor}
+                )
+                ids, _ = await self.list_ids({**data, 'after': cursor})
+                self.assertEqual(ids, card_ids(following))
+
+    async def test_list_corrects_misspelled_search(self):
+        """Test that the async list falls back to a corrected query."""
+        ids, context = await self.list_ids({'q': 'spagetti'})
+        self.assertEqual(ids, [self.pasta.pk])
+        self.assertEqual(context['corrected_query'], 'spaghetti')
+
+    async def test_list_invalid_cursor(self):
+        """Test that an invalid cursor is a 404."""
+        with self.assertRaises(Http404):
+            await self.list_ids({'after': 'garbage'})
+
+    async def test_detail_page(self):
+        """Test that the async detail page is rendered, cached and
+        validated like the synchronous one."""
+        path = reverse('recipes:detail', args=[self.pasta.pk])
+        response = await self.call(
+            views.AsyncRecipeDetailView, path, id=self.pasta.pk
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Spaghetti Carbonara")
+        expected = await self.async_client.get(path)
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(response.headers['ETag'], expected.headers['ETag'])
+
+        request = self.factory.get(
+            path, headers={'if-none-match': response.headers['ETag']}
+        )
+        response = await views.AsyncRecipeDetailView.as_view()(
+            request, id=self.pasta.pk
+        )
+        self.assertEqual(response.status_code, 304)
+
+        with self.assertRaises(Http404):
+            await self.call(views.AsyncRecipeDetailView, path, id=999999)
+
+    async def test_api_matches_sync_views(self):
+        """Test that the async JSON endpoints return the same documents."""
+        ids = f'{self.pasta.pk},{self.recipes[0].pk},999999'
+        cases = [
+            (api.AsyncRecipeListApiView, 'recipes:api-list', [], {}),
+            (api.AsyncRecipeListApiView, 'recipes:api-list', [],
+             {'fields': 'name,ingredients,tags', 'limit': 5}),
+            (api.AsyncRecipeSearchApiView, 'recipes:api-search', [],
+             {'q': 'tomato', 'limit': 5}),
+            (api.AsyncRecipeSearchApiView, 'recipes:api-search', [],
+             {'q': 'spagetti'}),
+            (api.AsyncRecipeBatchApiView, 'recipes:api-batch', [],
+             {'ids': ids, 'fields': 'name,tags'}),
+            (api.AsyncRecipeDetailApiView, 'recipes:api-detail',
+             [self.pasta.pk], {}),
+        ]
+        for view_class, name, args, data in cases:
+            path = reverse(name, args=args)
+            expected = await self.async_client.get(path, data)
+            kwargs = {'id': args[0]} if args else {}
+            response = await self.call(view_class, path, data, **kwargs)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.content), expected.json())
+
+    async def test_api_pages_follow_cursors(self):
+        """Test that async list pages chain through every recipe."""
+        path = reverse('recipes:api-list')
+        seen = []
+        data = {'limit': 7, 'fields': 'id'}
+        while True:
+            response = await self.call(api.AsyncRecipeListApiView, path, data)
+            body = json.loads(response.content)
+            seen.extend(item['id'] for item in body['results'])
+            if not body['next']:
+                break
+            data['after'] = body['next']
+        self.assertEqual(len(seen), 31)
+        self.assertEqual(len(set(seen)), 31)
+
+    async def test_api_errors(self):
+        """Test that errors are reported as JSON by async endpoints."""
+        response = await self.call(
+            api.AsyncRecipeListApiView, reverse('recipes:api-list'),
+            {'limit': 0}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('limit', json.loads(response.content)['error'])
+        response = await self.call(
+            api.AsyncRecipeDetailApiView,
+            reverse('recipes:api-detail', args=[999999]), id=999999
+        )
+        self.assertEqual(response.status_code, 404)
+        response = await self.call(
+            api.AsyncRecipeSearchApiView, reverse('recipes:api-search')
+        )
+        self.assertEqual(response.status_code, 400)
+        request = self.factory.post(reverse('recipes:api-list'))
+        response = await api.AsyncRecipeListApiView.as_view()(request)
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response.headers['Allow'], 'GET, HEAD, OPTIONS')
+
+
+class LoadTestHarnessTest(TestCase):
+    """Test cases for the load generator and the loadtest command."""
+
+    def setUp(self):
+        """Serve fixed responses from a local HTTP server."""
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if self.path == '/chunked':
+                    self.send_response(200)
+                    self.send_header('Transfer-Encoding', 'chunked')
+                    self.end_headers()
+                    self.wfile.write(b'5\r\nhello\r\n0\r\n\r\n')
+                    return
+                body = b'ok' if self.path == '/ok' else b'missing'
+                self.send_response(200 if self.path == '/ok' else 404)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def test_run_counts_statuses(self):
+        """Test that responses are read over reused connections."""
+        result = loadtest.run(
+            self.url, ['/ok', '/chunked', '/gone'],
+            concurrency=4, duration=0.3,
+        )
+        self.assertEqual(result['errors'], 0)
+        self.assertGreater(result['requests'], 12)
+        self.assertEqual(set(result['statuses']), {200, 404})
+        self.assertGreater(result['requests_per_second'], 0)
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+    def test_refused_connections_are_errors(self):
+        """Test that a server that is not listening yields errors."""
+        self.server.shutdown()
+        self.server.server_close()
+        result = loadtest.run(
+            self.url, ['/ok'], concurrency=2, duration=0.2
+        )
+        self.assertEqual(result['requests'], 0)
+        self.assertGreater(result['errors'], 0)
+
+    def test_command_reports_each_server(self):
+        """Test that the command prints one row per server."""
+        out = StringIO()
+        call_command(
+            'loadtest', self.url, '--path', '/ok', '--concurrency', '2',
+            '--duration', '0.2', '--warmup', '0', stdout=out,
+        )
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith(self.url))
+        self.assertIn('200:', lines[1])
+        with self.assertRaises(CommandError):
+            call_command(
+                'loadtest', 'https://example.com', '--duration', '0',
+                '--warmup', '0', stdout=StringIO(),
+            )
+
+
+class UnitConversionTest(TestCase):
+    """Test cases for the unit registry and batch conversion."""
+
+    def test_parse_unit(self):
+        """Test that spellings and plurals map to canonical units."""
+        cases = {
+            'Cups': 'cup', 'tbsp.': 'tbsp', 'Tablespoons': 'tbsp',
+            'fluid ounces': 'fl oz', 'lbs': 'lb', 'grams': 'g',
+            'ML': 'ml', 'Litre': 'l', 'clove': None, '': None,
+        }
+        for text, unit in cases.items():
+            self.assertEqual(units.parse_unit(text), unit, text)
+
+    def test_convert_batch(self):
+        """Test scaling and conversion of many rows at once."""
+        result = units.convert(
+            [Decimal('1'), Decimal('2'), None, Decimal('3'), Decimal('600')],
+            ['cup', 'tbsp', '', 'cloves', 'g'],
+            [2, 2, 2, 2, 2],
+            'metric',
+        )
+        self.assertEqual(result, [
+            (Decimal('473.00'), 'ml'),
+            (Decimal('59.10'), 'ml'),
+            (None, ''),
+            (Decimal('6.00'), 'cloves'),
+            (Decimal('1.20'), 'kg'),
+        ])
+
+    def test_convert_to_us_units(self):
+        """Test that US display units are picked by size."""
+        result = units.convert(
+            [Decimal('250'), Decimal('10'), Decimal('100'), Decimal('1')],
+            ['ml', 'ml', 'g', 'kg'],
+            [1, 1, 1, 1],
+            'us',
+        )
+        self.assertEqual(result, [
+            (Decimal('1.06'), 'cup'),
+            (Decimal('2.03'), 'tsp'),
+            (Decimal('3.53'), 'oz'),
+            (Decimal('2.20'), 'lb'),
+        ])
+
+    def test_scale_keeps_units_as_written(self):
+        """Test that scaling without a unit system keeps the units."""
+        self.assertEqual(
+            units.convert([Decimal('1.5')], ['Cups'], [1 / 3]),
+            [(Decimal('0.50'), 'Cups')],
+        )
+
+    def test_parse_scaling(self):
+        """Test validation of the servings and units parameters."""
+        self.assertEqual(units.parse_scaling({}), (None, None))
+        self.assertEqual(
+            units.parse_scaling({'servings': '4', 'units': 'us'}), (4, 'us')
+        )
+        for params in [{'servings': 'x'}, {'servings': '0'},
+                       {'units': 'imperial'}]:
+            with self.assertRaises(units.ScalingError):
+                units.parse_scaling(params)
+
+    def test_scale_recipes_for_meal_plan(self):
+        """Test that several recipes are scaled with two queries."""
+        soup = Recipe.objects.create(
+            name="Soup", instructions="Boil", servings=2
+        )
+        Ingredient.objects.create(
+            recipe=soup, name="Stock", quantity=Decimal('1'), unit='l'
+        )
+        bread = Recipe.objects.create(
+            name="Bread", instructions="Bake", servings=8
+        )
+        Ingredient.objects.create(
+            recipe=bread, name="Flour", quantity=Decimal('500'), unit='g'
+        )
+        with self.assertNumQueries(2):
+            scaled = units.scale_recipes(
+                {soup.pk: 6, bread.pk: None, 999999: 2}, 'metric'
+            )
+        self.assertEqual(scaled, {
+            soup.pk: [
+                {'quantity': Decimal('3.00'), 'unit': 'l', 'name': "Stock"}
+            ],
+            bread.pk: [
+                {'quantity': Decimal('500.00'), 'unit': 'g', 'name': "Flour"}
+            ],
+        })
+        unknown = Recipe.objects.create(name="Stew", instructions="Stew")
+        with self.assertRaises(units.ScalingError):
+            units.scale_recipes({unknown.pk: 4})
+
+
+class ScaledRecipeViewTest(TestCase):
+    """Test cases for scaling on the detail page and API."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        self.recipe = Recipe.objects.create(
+            name="Pancakes", instructions="Fry", servings=4
+        )
+        Ingredient.objects.create(
+            recipe=self.recipe, name="Milk", quantity=Decimal('2'),
+            unit='cups'
+        )
+        Ingredient.objects.create(
+            recipe=self.recipe, name="Eggs", quantity=Decimal('2')
+        )
+        self.url = reverse('recipes:detail', args=[self.recipe.pk])
+
+    def test_detail_scaled_and_converted(self):
+        """Test that the page shows scaled, converted ingredients."""
+        response = self.client.get(
+            self.url, {'servings': 2, 'units': 'metric'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['servings'], 2)
+        self.assertEqual(response.context['ingredients'], [
+            {'quantity': Decimal('1.00'), 'name': "Eggs", 'unit': ''},
+            {'quantity': Decimal('237.00'), 'name': "Milk", 'unit': 'ml'},
+        ])
+        self.assertContains(response, "237.00")
+
+    def test_scaled_pages_are_cached_and_invalidated(self):
+        """Test that common variants are cached per variant."""
+        self.client.get(self.url, {'servings': 8})
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {'servings': 8})
+        self.assertContains(response, "4.00")
+        base = self.client.get(self.url)
+        self.assertNotEqual(base.headers['ETag'], response.headers['ETag'])
+        # Uncommon servings counts are rendered every time.
+        self.client.get(self.url, {'servings': 50})
+        with self.assertNumQueries(QUERY_BUDGETS['recipes:detail']):
+            self.client.get(self.url, {'servings': 50})
+
+        Ingredient.objects.filter(name="Eggs").get().delete()
+        response = self.client.get(self.url, {'servings': 8})
+        self.assertNotContains(response, "Eggs")
+
+    def test_invalid_scaling(self):
+        """Test that invalid parameters and unscalable recipes are 400s."""
+        self.assertEqual(
+            self.client.get(self.url, {'servings': 'many'}).status_code, 400
+        )
+        self.assertEqual(
+            self.client.get(self.url, {'units': 'imperial'}).status_code, 400
+        )
+        unknown = Recipe.objects.create(name="Stew", instructions="Stew")
+        url = reverse('recipes:detail', args=[unknown.pk])
+        self.assertEqual(
+            self.client.get(url, {'servings': 2}).status_code, 400
+        )
+        self.assertEqual(
+            self.client.get(url, {'units': 'us'}).status_code, 200
+        )
+
+    def test_api_detail_scaled(self):
+        """Test that the API scales ingredients and servings."""
+        url = reverse('recipes:api-detail', args=[self.recipe.pk])
+        data = self.client.get(url, {'servings': 6, 'units': 'metric'}).json()
+        self.assertEqual(data['servings'], 6)
+        self.assertEqual(data['ingredients'], [
+            {'quantity': '3.00', 'unit': '', 'name': "Eggs"},
+            {'quantity': '710.00', 'unit': 'ml', 'name': "Milk"},
+        ])
+        data = self.client.get(
+            url, {'servings': 6, 'fields': 'name'}
+        ).json()
+        self.assertEqual(set(data), {'id', 'name'})
+        response = self.client.get(url, {'servings': 0})
+        self.assertEqual(response.status_code, 400)
+
+
+class ShoppingListTest(TestCase):
+    """Test cases for shopping list aggregation."""
+
+    def setUp(self):
+        """Set up two recipes sharing ingredients in different units."""
+        self.soup = Recipe.objects.create(name="Soup", instructions="Boil")
+        self.stew = Recipe.objects.create(name="Stew", instructions="Stew")
+        for recipe, name, quantity, unit in [
+            (self.soup, "Tomatoes, diced", '2', 'cups'),
+            (self.soup, "Garlic", '2', 'cloves'),
+            (self.soup, "Salt", None, ''),
+            (self.soup, "Butter", '50', 'g'),
+            (self.stew, "tomato", '250', 'ml'),
+            (self.stew, "Garlic", '3', 'Cloves'),
+            (self.stew, "Salt", '1', 'tsp'),
+            (self.stew, "Onions", '2', ''),
+        ]:
+            Ingredient.objects.create(
+                recipe=recipe, name=name, unit=unit,
+                quantity=None if quantity is None else Decimal(quantity),
+            )
+        self.url = reverse('recipes:shopping-list')
+
+    def test_parse_plan(self):
+        """Test parsing ids, multipliers and repeated items."""
+        self.assertEqual(
+            shopping.parse_plan(['1,2:1.5', '1:2']), {1: 3.0, 2: 1.5}
+        )
+        for values in [[], [''], ['x'], ['1:0'], ['1:nan'], ['1:-2']]:
+            with self.assertRaises(shopping.ShoppingListError):
+                shopping.parse_plan(values)
+
+    def test_aggregates_by_ingredient_and_dimension(self):
+        """Test that quantities are summed across recipes and units."""
+        items = shopping.build_list({self.soup.pk: 1, self.stew.pk: 2})
+        self.assertEqual(
+            [(item['name'], item['quantity'], item['unit'])
+             for item in items],
+            [
+                ('butter', Decimal('50.00'), 'g'),
+                ('garlic', Decimal('8.00'), 'cloves'),
+                ('onion', Decimal('4.00'), ''),
+                ('salt', Decimal('9.86'), 'ml'),
+                ('tomato', Decimal('973.00'), 'ml'),
+            ]
+        )
+        self.assertEqual(items[-1]['recipes'], ["Soup", "Stew"])
+
+    def test_unquantified_items_are_listed_once(self):
+        """Test that an ingredient without quantities is still listed."""
+        items = shopping.build_list({self.soup.pk: 1}, 'us')
+        salt = [item for item in items if item['name'] == 'salt']
+        self.assertEqual(salt, [{
+            'name': 'salt', 'quantity': None, 'unit': '',
+            'recipes': ["Soup"],
+        }])
+
+    def test_fifty_recipes_in_one_query(self):
+        """Test that a large plan is aggregated with a single query."""
+        plan = {}
+        for i in range(50):
+            recipe = Recipe.objects.create(
+                name=f"Dish {i}", instructions="Cook"
+            )
+            Ingredient.objects.create(
+                recipe=recipe, name="Rice", quantity=Decimal('100'),
+                unit='g'
+            )
+            plan[recipe.pk] = 1
+        with self.assertNumQueries(1):
+            items = shopping.build_list(plan)
+        self.assertEqual(
+            items[0]['quantity'], Decimal('5.00')
+        )
+        self.assertEqual(items[0]['unit'], 'kg')
+
+    def test_html_json_and_csv(self):
+        """Test the three output formats of the view."""
+        recipes = f'{self.soup.pk},{self.stew.pk}:2'
+        response = self.client.get(self.url, {'recipes': recipes})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "973.00")
+        self.assertContains(response, "Soup, Stew")
+
+        data = self.client.get(
+            self.url, {'recipes': recipes, 'format': 'json', 'units': 'us'}
+        ).json()
+        self.assertEqual(data['units'], 'us')
+        tomato = data['items'][-1]
+        self.assertEqual(
+            (tomato['quantity'], tomato['unit']), ('4.11', 'cup')
+        )
+
+        response = self.client.get(
+            self.url, {'recipes': recipes, 'format': 'csv'}
+        )
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(StringIO(response.content.decode())))
+        self.assertEqual(rows[0], list(shopping.CSV_FIELDS))
+        self.assertEqual(rows[-1], ['tomato', '973.00', 'ml', 'Soup;Stew'])
+
+    def test_invalid_requests(self):
+        """Test that invalid plans and options are rejected."""
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        response = self.client.get(
+            self.url, {'recipes': 'soup', 'format': 'json'}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+        response = self.client.get(
+            self.url, {'recipes': '1', 'units': 'imperial'}
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(
+            self.url, {'recipes': '1', 'format': 'xml'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+FOOD_TABLE = """name,calories,protein,fat,carbohydrate,density,unit_weight
+"Onions, raw",40,1.1,0.1,9.3,,110
+"Butter, salted",717,0.9,81,0.1,0.96,
+"Flour, wheat, all-purpose",364,10,1,76,0.53,
+"Milk, whole",61,3.2,3.3,4.8,,
+"""
+
+
+class NutritionTest(TestCase):
+    """Test cases for food loading and per-recipe nutrition totals."""
+
+    def setUp(self):
+        """Load a small food table and create a recipe using it."""
+        nutrition.load_foods(StringIO(FOOD_TABLE))
+        self.recipe = Recipe.objects.create(
+            name="Onion tart", instructions="Bake", servings=2
+        )
+        for name, quantity, unit in [
+            ("Butter", '100', 'g'),
+            ("Flour", '1', 'cup'),
+            ("Red onions, sliced", '2', ''),
+            ("Saffron", '1', 'pinch'),
+            ("Salt", None, ''),
+        ]:
+            self.recipe.ingredients.create(
+                name=name, unit=unit,
+                quantity=None if quantity is None else Decimal(quantity),
+            )
+
+    def create_recipe(self, name, grams_of_butter, servings=1):
+        """Create a recipe whose only ingredient is butter."""
+        recipe = Recipe.objects.create(
+            name=name, instructions="Melt", servings=servings
+        )
+        recipe.ingredients.create(
+            name="butter", quantity=Decimal(grams_of_butter), unit='g'
+        )
+        return recipe
+
+    def test_parse_usda_table(self):
+        """Test reading a USDA-style table with household portions."""
+        foods = list(nutrition.parse_foods([
+            'NDB_No,Shrt_Desc,Energ_Kcal,Protein_(g),Lipid_Tot_(g),'
+            'Carbohydrt_(g),GmWt_1,GmWt_Desc1,GmWt_2,GmWt_Desc2',
+            '01123,"EGG,WHL,RAW,FRSH",143,12.56,9.51,0.72,50,1 large,,',
+            '01077,"MILK,WHL",61,3.15,3.25,4.8,244,"1 cup, whole",15,1 tbsp',
+            '09999,"UNKNOWN ENERGY",,1,1,1,,,,',
+        ]))
+        self.assertEqual(
+            [(food.name, food.canonical_name) for food in foods],
+            [("EGG,WHL,RAW,FRSH", 'egg'), ("MILK,WHL", 'milk')]
+        )
+        egg, milk = foods
+        self.assertEqual((egg.calories, egg.unit_weight), (143, 50))
+        self.assertIsNone(egg.density)
+        self.assertAlmostEqual(milk.density, 244 / 236.588)
+        self.assertIsNone(milk.unit_weight)
+
+    def test_invalid_tables(self):
+        """Test that unusable tables are rejected."""
+        for table in ['', 'name,protein\nEgg,12\n',
+                      'name,calories\nEgg,lots\n']:
+            with self.assertRaises(nutrition.FoodTableError):
+                list(nutrition.parse_foods(StringIO(table)))
+
+    def test_reload_updates_foods(self):
+        """Test that loading a table again updates foods by name."""
+        count = nutrition.load_foods(StringIO(
+            'name,calories\n"Milk, whole",64\nEgg,143\n'
+        ))
+        self.assertEqual(count, 2)
+        self.assertEqual(Food.objects.count(), 5)
+        milk = Food.objects.get(name="Milk, whole")
+        self.assertEqual((milk.calories, milk.protein), (64, 0))
+
+    def test_candidate_names(self):
+        """Test that head nouns are tried before leading words."""
+        self.assertEqual(
+            nutrition.candidate_names('red onion ring'),
+            ['red onion ring', 'onion ring', 'ring', 'red onion', 'red']
+        )
+
+    def test_totals_are_stored_on_ingredient_changes(self):
+        """Test that totals follow the ingredients of a recipe."""
+        self.recipe.refresh_from_db()
+        # 100 g butter, 1 cup of flour at 0.53 g/ml and 2 onions of 110 g.
+        flour = 236.588 * 0.53
+        self.assertAlmostEqual(
+            self.recipe.calories, 717 + 3.64 * flour + 2.2 * 40, places=0
+        )
+        self.assertAlmostEqual(
+            self.recipe.protein, 0.9 + 0.1 * flour + 2.2 * 1.1, places=0
+        )
+        # Saffron is not in the table; salt has no quantity.
+        self.assertEqual(self.recipe.nutrition_coverage, 0.75)
+        self.assertEqual(
+            self.recipe.nutrition_per_serving['calories'],
+            round(self.recipe.calories / 2, 1)
+        )
+        self.assertEqual(
+            RecipeCard.objects.get(pk=self.recipe.pk).calories_per_serving,
+            round(self.recipe.calories / 2, 1)
+        )
+
+        self.recipe.ingredients.filter(name="Butter").delete()
+        self.recipe.refresh_from_db()
+        self.assertAlmostEqual(
+            self.recipe.calories, 3.64 * flour + 2.2 * 40, places=0
+        )
+        self.recipe.ingredients.all().delete()
+        self.recipe.refresh_from_db()
+        self.assertIsNone(self.recipe.calories)
+        self.assertIsNone(self.recipe.nutrition_per_serving)
+        self.assertIsNone(
+            RecipeCard.objects.get(pk=self.recipe.pk).calories_per_serving
+        )
+
+    def test_saving_a_stale_recipe_keeps_totals(self):
+        """Test that saving an instance loaded earlier recomputes totals."""
+        stale = Recipe.objects.get(pk=self.recipe.pk)
+        self.recipe.ingredients.create(
+            name="Milk", quantity=Decimal('1'), unit='l'
+        )
+        expected = Recipe.objects.get(pk=self.recipe.pk).calories
+        self.assertGreater(expected, stale.calories)
+        stale.servings = 4
+        stale.save()
+        stale.refresh_from_db()
+        self.assertEqual(stale.calories, expected)
+        card = RecipeCard.objects.get(pk=self.recipe.pk)
+        self.assertEqual(card.calories_per_serving, round(expected / 4, 1))
+
+    def test_load_foods_command_recomputes_recipes(self):
+        """Test that loading foods updates the totals of existing recipes."""
+        self.recipe.ingredients.create(
+            name="Saffron threads", quantity=Decimal('1'), unit='g'
+        )
+        before = Recipe.objects.get(pk=self.recipe.pk).calories
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'foods.csv')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('name,calories\nSaffron,310\n')
+            out = StringIO()
+            call_command('load_foods', path, stdout=out)
+        self.assertIn('Loaded 1 foods', out.getvalue())
+        self.recipe.refresh_from_db()
+        self.assertAlmostEqual(self.recipe.calories, before + 3.1, places=1)
+
+    def test_import_computes_totals(self):
+        """Test that imported recipes get their totals in bulk."""
+        records = iter_jsonl([json.dumps({
+            'name': "Buttered milk", 'instructions': "Stir", 'servings': 2,
+            'ingredients': [
+                {'quantity': '50', 'unit': 'g', 'name': 'butter'},
+                {'quantity': '1', 'unit': 'cup', 'name': 'whole milk'},
+                {'quantity': '1', 'unit': '', 'name': 'mystery'},
+            ],
+        })])
+        RecipeImporter().run(records)
+        recipe = Recipe.objects.get(name="Buttered milk")
+        self.assertAlmostEqual(
+            recipe.calories, 358.5 + 2.36588 * 61, places=0
+        )
+        self.assertEqual(round(recipe.nutrition_coverage, 2), 0.67)
+        self.assertEqual(
+            RecipeCard.objects.get(pk=recipe.pk).calories_per_serving,
+            round(recipe.calories / 2, 1)
+        )
+
+    def test_list_filters_and_sorts_by_calories(self):
+        """Test calorie bounds and calorie order on the list page."""
+        light = self.create_recipe("Light", '10')
+        medium = self.create_recipe("Medium", '50')
+        heavy = self.create_recipe("Heavy", '200')
+        Recipe.objects.create(name="Unknown", instructions="Guess")
+        url = reverse('recipes:list')
+
+        response = self.client.get(url, {'max_calories': '400'})
+        self.assertEqual(card_ids(response), [medium.pk, light.pk])
+        response = self.client.get(
+            url, {'min_calories': '100', 'max_calories': 'lots'}
+        )
+        self.assertEqual(
+            card_ids(response), [heavy.pk, medium.pk, self.recipe.pk]
+        )
+
+        response = self.client.get(url, {'sort': 'calories'})
+        self.assertEqual(
+            card_ids(response),
+            [light.pk, medium.pk, self.recipe.pk, heavy.pk]
+        )
+        self.assertContains(response, 'kcal per serving')
+        response = self.client.get(url, {'sort': '-calories'})
+        self.assertEqual(card_ids(response)[0], heavy.pk)
+
+    def test_calorie_order_is_paginated_by_keyset(self):
+        """Test that pages in calorie order follow each other."""
+        recipes = [
+            self.create_recipe(f"Butter {i}", str(10 + i % 5))
+            for i in range(30)
+        ]
+        url = reverse('recipes:list')
+        seen = []
+        params = {'sort': 'calories', 'max_calories': '200'}
+        while True:
+            response = self.client.get(url, params)
+            seen.extend(card_ids(response))
+            page = response.context['page_obj']
+            if not page.has_next:
+                break
+            params = {**params, 'after': page.next_cursor}
+        self.assertEqual(len(seen), len(recipes))
+        calories = dict(RecipeCard.objects.values_list(
+            'pk', 'calories_per_serving'
+        ))
+        self.assertEqual(
+            seen, sorted(seen, key=lambda pk: (calories[pk], pk))
+        )
+
+    def test_calorie_order_uses_index(self):
+        """Test that the calorie ordering is served by its index."""
+        plan = RecipeCard.objects.filter(
+            calories_per_serving__lte=500
+        ).order_by('calories_per_serving', 'pk').explain()
+        self.assertIn('card_calories_recipe_idx', plan)
+
+    def test_search_results_in_calorie_order(self):
+        """Test that search results can be filtered and sorted by calories."""
+        light = self.create_recipe("Butter toast", '10')
+        heavy = self.create_recipe("Butter cake", '200')
+        response = self.client.get(
+            reverse('recipes:list'), {'q': 'butter', 'sort': 'calories'}
+        )
+        self.assertEqual(
+            card_ids(response), [light.pk, self.recipe.pk, heavy.pk]
+        )
+        response = self.client.get(
+            reverse('recipes:list'), {'q': 'butter', 'max_calories': '100'}
+        )
+        self.assertEqual(card_ids(response), [light.pk])
+
+    @override_settings(RECIPES_SEARCH_MAX_RESULTS=3)
+    def test_search_calorie_order_reaches_past_kept_results(self):
+        """Test that search results sorted by calories start with the
+        lightest match even when it is ranked below the results kept."""
+        # Ties are ranked newest first, so the first recipe comes last.
+        light = self.create_recipe("Garlic butter 9", '10')
+        for number in range(4):
+            self.create_recipe(f"Garlic butter {number}", '200')
+        self.assertNotIn(light.pk, cached_search_ids('garlic'))
+        response = self.client.get(
+            reverse('recipes:list'), {'q': 'garlic', 'sort': 'calories'}
+        )
+        self.assertEqual(card_ids(response)[0], light.pk)
+
+    def test_detail_and_api_show_nutrition(self):
+        """Test nutrition on the detail page and in the API."""
+        response = self.client.get(
+            reverse('recipes:detail', args=[self.recipe.pk])
+        )
+        self.assertContains(response, 'Nutrition per serving')
+        self.assertContains(response, '75% of the measured ingredients')
+
+        url = reverse('recipes:api-detail', args=[self.recipe.pk])
+        data = self.client.get(url, {'fields': 'calories,fat'}).json()
+        self.recipe.refresh_from_db()
+        self.assertEqual(data['calories'], self.recipe.calories)
+        data = self.client.get(
+            url, {'fields': 'calories,servings', 'servings': '4'}
+        ).json()
+        self.assertEqual(data['calories'],
+                         round(self.recipe.calories * 2, 1))
+
+
+class SimilarRecipesTest(QueryBudgetMixin, TestCase):
+    """Test cases for precomputed similar recipes."""
+
+    def setUp(self):
+        """Set up two pasta dishes, a soup and two desserts."""
+        self.italian = Tag.objects.create(name="italian")
+        self.dessert = Tag.objects.create(name="dessert")
+        self.pasta = self.create_recipe(
+            "Tomato pasta", ["tomatoes", "pasta", "garlic", "olive oil"],
+            [self.italian],
+        )
+        self.spaghetti = self.create_recipe(
+            "Garlic spaghetti", ["tomato", "spaghetti", "garlic",
+                                 "olive oil"],
+            [self.italian],
+        )
+        self.soup = self.create_recipe(
+            "Tomato soup", ["tomato", "onion", "stock"]
+        )
+        self.cake = self.create_recipe(
+            "Chocolate cake", ["flour", "sugar", "cocoa", "eggs"],
+            [self.dessert],
+        )
+        self.brownies = self.create_recipe(
+            "Brownies", ["cocoa", "sugar", "butter", "eggs"], [self.dessert]
+        )
+
+    def create_recipe(self, name, ingredients, tags=()):
+        """Create a recipe with the given ingredient names and tags."""
+        recipe = Recipe.objects.create(name=name, instructions="Cook")
+        for ingredient in ingredients:
+            recipe.ingredients.create(name=ingredient)
+        recipe.tags.add(*tags)
+        return recipe
+
+    def neighbor_ids(self, recipe):
+        """Return the stored similar recipe ids of ``recipe``, best first."""
+        return list(
+            RecipeNeighbor.objects.filter(recipe=recipe)
+            .values_list('neighbor_id', flat=True)
+        )
+
+    def test_scores_follow_shared_features(self):
+        """Test that recipes sharing the most rare features rank first."""
+        index = similar.build_index()
+        self.assertEqual(len(index), 5)
+        neighbors = index.neighbors(self.pasta.pk)
+        self.assertEqual(
+            [pk for pk, _ in neighbors], [self.spaghetti.pk, self.soup.pk]
+        )
+        self.assertGreater(neighbors[0][1], neighbors[1][1])
+        self.assertEqual(
+            [pk for pk, _ in index.neighbors(self.cake.pk)],
+            [self.brownies.pk]
+        )
+        # Similarity is symmetric.
+        self.assertAlmostEqual(
+            index.scores(self.pasta.pk)[self.spaghetti.pk],
+            index.scores(self.spaghetti.pk)[self.pasta.pk],
+        )
+
+    def test_common_features_are_pruned(self):
+        """Test that features most recipes carry are ignored."""
+        features = {
+            pk: Counter({'i:salt': 1, f'i:spice {pk % 10}': 1})
+            for pk in range(1, 101)
+        }
+        index = similar.SimilarityIndex(features)
+        self.assertNotIn('i:salt', index.postings)
+        self.assertEqual(
+            {pk for pk, _ in index.neighbors(1)},
+            {11, 21, 31, 41, 51, 61}
+        )
+
+    def test_update_processes_queue(self):
+        """Test that queued recipes get their similar recipes stored."""
+        self.assertEqual(SimilarityUpdate.objects.count(), 5)
+        self.assertEqual(similar.update(), 5)
+        self.assertFalse(SimilarityUpdate.objects.exists())
+        self.assertEqual(
+            self.neighbor_ids(self.pasta), [self.spaghetti.pk, self.soup.pk]
+        )
+        self.assertEqual(self.neighbor_ids(self.brownies), [self.cake.pk])
+        self.assertEqual(similar.update(), 0)
+
+    def test_update_only_recomputes_affected_recipes(self):
+        """Test that a change leaves unrelated neighbor rows alone."""
+        similar.update()
+        dessert_rows = set(
+            RecipeNeighbor.objects.filter(
+                recipe__in=[self.cake, self.brownies]
+            ).values_list('pk', flat=True)
+        )
+        self.soup.ingredients.create(name="pasta")
+        self.assertEqual(
+            list(SimilarityUpdate.objects.values_list('recipe', flat=True)),
+            [self.soup.pk]
+        )
+        # The soup and the pasta dish listing it.
+        self.assertEqual(similar.update(), 2)
+        self.assertEqual(
+            set(RecipeNeighbor.objects.filter(
+                recipe__in=[self.cake, self.brownies]
+            ).values_list('pk', flat=True)),
+            dessert_rows
+        )
+
+    def test_new_recipe_joins_neighbor_lists(self):
+        """Test that a new recipe is added to its neighbors' lists."""
+        similar.update()
+        muffins = self.create_recipe(
+            "Cocoa muffins", ["cocoa", "sugar", "butter", "flour"],
+            [self.dessert],
+        )
+        similar.update()
+        self.assertIn(muffins.pk, self.neighbor_ids(self.brownies))
+        self.assertIn(muffins.pk, self.neighbor_ids(self.cake))
+        self.assertEqual(self.neighbor_ids(self.pasta),
+                         [self.spaghetti.pk, self.soup.pk])
+
+    def test_deleted_recipe_is_replaced(self):
+        """Test that lists naming a deleted recipe are recomputed."""
+        similar.update()
+        self.spaghetti.delete()
+        self.assertTrue(
+            SimilarityUpdate.objects.filter(recipe=self.pasta).exists()
+        )
+        similar.update()
+        self.assertEqual(self.neighbor_ids(self.pasta), [self.soup.pk])
+
+    def test_tagging_queues_recipes(self):
+        """Test that tag changes queue the recipes concerned."""
+        similar.update()
+        self.soup.tags.add(self.italian)
+        self.italian.name = "Italian food"
+        self.italian.save()
+        self.assertEqual(
+            set(SimilarityUpdate.objects.values_list('recipe', flat=True)),
+            {self.pasta.pk, self.spaghetti.pk, self.soup.pk}
+        )
+
+    def test_rebuild_command(self):
+        """Test that the rebuild recomputes every recipe in chunks."""
+        out = StringIO()
+        call_command(
+            'update_similar_recipes', '--rebuild', '--batch-size', '2',
+            stdout=out
+        )
+        self.assertIn('of 5 recipes', out.getvalue())
+        self.assertFalse(SimilarityUpdate.objects.exists())
+        self.assertEqual(self.neighbor_ids(self.cake), [self.brownies.pk])
+
+    def test_detail_page_lists_similar_recipes(self):
+        """Test the similar recipes block of the detail page."""
+        similar.update()
+        self.assertWithinQueryBudget('recipes:detail', self.pasta.pk)
+        response = self.client.get(
+            reverse('recipes:detail', args=[self.pasta.pk])
+        )
+        self.assertContains(response, 'Similar Recipes')
+        self.assertContains(
+            response,
+            reverse('recipes:detail', args=[self.spaghetti.pk])
+        )
+        self.assertNotContains(response, 'Brownies')
+
+    def test_neighbor_changes_drop_cached_pages(self):
+        """Test that renaming or deleting a recipe drops the cached pages
+        listing it as similar."""
+        similar.update()
+        cache.clear()
+        url = reverse('recipes:detail', args=[self.pasta.pk])
+        self.assertContains(self.client.get(url), "Garlic spaghetti")
+        self.assertIsNotNone(get_detail(self.pasta.pk))
+
+        self.spaghetti.name = "Spaghetti aglio e olio"
+        self.spaghetti.save()
+        self.assertIsNone(get_detail(self.pasta.pk))
+        self.assertContains(self.client.get(url), "Spaghetti aglio e olio")
+
+        link = reverse('recipes:detail', args=[self.spaghetti.pk])
+        self.spaghetti.delete()
+        self.assertIsNone(get_detail(self.pasta.pk))
+        self.assertNotContains(self.client.get(url), link)
+
+
+class RangeFilterTest(TestCase):
+    """Test cases for the time and servings range filters."""
+
+    def setUp(self):
+        """Create recipes of different lengths and sizes."""
+        self.quick = Recipe.objects.create(
+            name="Quick salad", instructions="Toss", servings=2,
+            prep_time=10, cook_time=0,
+        )
+        self.stew = Recipe.objects.create(
+            name="Slow stew", instructions="Simmer", servings=6,
+            prep_time=20, cook_time=120,
+        )
+        self.toast = Recipe.objects.create(
+            name="Toast", instructions="Toast", servings=1, cook_time=5,
+        )
+        self.mystery = Recipe.objects.create(
+            name="Mystery salad", instructions="Guess"
+        )
+
+    def list_ids(self, **params):
+        """Return the recipe ids listed by the list view for ``params``."""
+        response = self.client.get(reverse('recipes:list'), params)
+        self.assertEqual(response.status_code, 200)
+        return set(card_ids(response))
+
+    def plan(self, queryset) -> str:
+        """Return the SQLite query plan of ``queryset``."""
+        return queryset.explain()
+
+    def assertNoTableScan(self, plan, table):
+        """Fail if ``plan`` reads every row of ``table`` without an
+        index."""
+        for line in plan.splitlines():
+            if f'SCAN {table}' in line:
+                self.assertIn('INDEX', line, plan)
+
+    def test_total_time(self):
+        """Test that the total time sums the known times."""
+        self.quick.refresh_from_db()
+        self.toast.refresh_from_db()
+        self.mystery.refresh_from_db()
+        self.assertEqual(self.quick.total_time, 10)
+        self.assertEqual(self.toast.total_time, 5)
+        self.assertIsNone(self.mystery.total_time)
+        self.quick.cook_time = 15
+        self.quick.save()
+        self.quick.refresh_from_db()
+        self.assertEqual(self.quick.total_time, 25)
+
+    def test_cards_copy_values(self):
+        """Test that cards carry the times and servings of their recipe."""
+        card = RecipeCard.objects.get(pk=self.stew.pk)
+        self.assertEqual(
+            (card.servings, card.prep_time, card.cook_time, card.total_time),
+            (6, 20, 120, 140)
+        )
+        self.stew.servings = 8
+        self.stew.save()
+        card.refresh_from_db()
+        self.assertEqual(card.servings, 8)
+
+    def test_list_filters(self):
+        """Test each range filter of the list view."""
+        self.assertEqual(
+            self.list_ids(max_total_time=30), {self.quick.pk, self.toast.pk}
+        )
+        self.assertEqual(self.list_ids(max_prep_time=15), {self.quick.pk})
+        self.assertEqual(
+            self.list_ids(max_cook_time=5), {self.quick.pk, self.toast.pk}
+        )
+        self.assertEqual(
+            self.list_ids(min_servings=2), {self.quick.pk, self.stew.pk}
+        )
+        self.assertEqual(
+            self.list_ids(min_servings=2, max_servings=4), {self.quick.pk}
+        )
+        self.assertEqual(
+            self.list_ids(min_servings=2, max_total_time=30),
+            {self.quick.pk}
+        )
+
+    def test_invalid_values_are_ignored(self):
+        """Test that unusable filter values do not filter."""
+        self.assertEqual(len(self.list_ids(max_total_time='soon')), 4)
+        self.assertEqual(len(self.list_ids(min_servings='2.5')), 4)
+
+    def test_filters_combine_with_tags_and_search(self):
+        """Test range filters together with tags and a search query."""
+        tag = Tag.objects.create(name="Salads")
+        self.quick.tags.add(tag)
+        self.mystery.tags.add(tag)
+        self.assertEqual(
+            self.list_ids(tag="Salads", max_total_time=30), {self.quick.pk}
+        )
+        self.assertEqual(
+            self.list_ids(q="salad", min_servings=1), {self.quick.pk}
+        )
+
+    def test_pagination_keeps_filters(self):
+        """Test that page links carry the range filters."""
+        for number in range(RecipeListView.paginate_by + 1):
+            Recipe.objects.create(
+                name=f"Snack {number}", instructions="Eat", prep_time=5
+            )
+        response = self.client.get(
+            reverse('recipes:list'), {'max_prep_time': 5}
+        )
+        self.assertEqual(
+            len(card_ids(response)), RecipeListView.paginate_by
+        )
+        self.assertIn('max_prep_time=5', response.context['filter_params'])
+        self.assertContains(response, 'max_prep_time=5&amp;')
+
+    def test_api_filters(self):
+        """Test the range filters of the list and search endpoints."""
+        response = self.client.get(
+            reverse('recipes:api-list'), {'max_total_time': 30}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {recipe['id'] for recipe in response.json()['results']},
+            {self.quick.pk, self.toast.pk}
+        )
+        response = self.client.get(
+            reverse('recipes:api-search'), {'q': 'salad', 'min_servings': 1}
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            [self.quick.pk]
+        )
+
+    @override_settings(RECIPES_SEARCH_MAX_RESULTS=3)
+    def test_search_filters_reach_past_kept_results(self):
+        """Test that range filters of a search find the matches ranked
+        below the results kept per search."""
+        # Ties are ranked newest first, so the first recipe comes last.
+        quick = Recipe.objects.create(
+            name="Garlic bread 9", instructions="Bake", prep_time=10
+        )
+        for number in range(4):
+            Recipe.objects.create(
+                name=f"Garlic bread {number}", instructions="Bake",
+                prep_time=30,
+            )
+        self.assertNotIn(quick.pk, cached_search_ids('garlic'))
+        self.assertEqual(
+            self.list_ids(q='garlic', max_prep_time=10), {quick.pk}
+        )
+        response = self.client.get(
+            reverse('recipes:api-search'),
+            {'q': 'garlic', 'max_prep_time': 10},
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            [quick.pk]
+        )
+
+    def test_api_rejects_invalid_filters(self):
+        """Test that the API rejects unusable filter values."""
+        for value in ['soon', '-5']:
+            response = self.client.get(
+                reverse('recipes:api-list'), {'max_total_time': value}
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('max_total_time', response.json()['error'])
+
+    def test_servings_range_uses_index(self):
+        """Test that a servings range is searched in its index."""
+        plan = self.plan(RecipeCard.objects.filter(
+            servings__gte=2, servings__lte=4
+        ).order_by())
+        self.assertIn('card_servings_idx', plan)
+        self.assertIn('SEARCH', plan)
+
+    def test_counting_uses_range_index(self):
+        """Test that counting the recipes within a time range reads only
+        the range index."""
+        plan = self.plan(
+            RecipeCard.objects.filter(total_time__lte=30).order_by()
+            .values('pk')
+        )
+        self.assertIn('card_total_time_idx', plan)
+        self.assertIn('COVERING INDEX', plan)
+
+    def test_filtered_lists_avoid_table_scans(self):
+        """Test that filtered list, API and search queries use indexes."""
+        for filters in [{'total_time__lte': 30}, {'prep_time__lte': 10},
+                        {'cook_time__lte': 10}, {'servings__gte': 4}]:
+            with self.subTest(filters=filters):
+                self.assertNoTableScan(
+                    self.plan(RecipeCard.objects.filter(**filters)[:21]),
+                    'recipes_recipecard'
+                )
+                self.assertNoTableScan(
+                    self.plan(Recipe.objects.filter(**filters)
+                              .order_by('-created_at', '-id')[:21]),
+                    'recipes_recipe'
+                )
+        plan = self.plan(RecipeCard.objects.filter(
+            pk__in=[self.quick.pk, self.stew.pk], total_time__lte=30
+        ).order_by().values_list('pk', flat=True))
+        self.assertNoTableScan(plan, 'recipes_recipecard')
+
+
+@override_settings(RECIPES_METRICS_TOKEN='scrape-token')
+class RequestMetricsTest(TestCase):
+    """Test cases for the request metrics middleware and endpoint."""
+
+    scraper = {'Authorization': 'Bearer scrape-token'}
+
+    def setUp(self):
+        """Create a recipe and start from empty metrics."""
+        metrics.registry.clear()
+        self.recipe = Recipe.objects.create(
+            name="Pancakes", instructions="Fry", servings=2
+        )
+        for name in ["Flour", "Milk", "Egg"]:
+            self.recipe.ingredients.create(name=name)
+
+    def scrape(self) -> dict[str, float]:
+        """Return the samples served at ``/metrics`` by name and labels."""
+        response = self.client.get(reverse('metrics'), headers=self.scraper)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if line and not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_records_route_metrics(self):
+        """Test the histograms recorded for a page view."""
+        self.client.get(reverse('recipes:detail', args=[self.recipe.pk]))
+        samples = self.scrape()
+        labels = '{route="recipes:detail",method="GET"}'
+        self.assertEqual(
+            samples[f'recipes_request_duration_seconds_count{labels}'], 1
+        )
+        self.assertEqual(
+            samples[f'recipes_request_queries_sum{labels}'],
+            QUERY_BUDGETS['recipes:detail']
+        )
+        # The recipe and its three ingredients.
+        self.assertGreaterEqual(
+            samples[f'recipes_request_rows_sum{labels}'], 4
+        )
+        self.assertGreater(
+            samples[f'recipes_request_template_seconds_sum{labels}'], 0
+        )
+        self.assertEqual(samples[
+            'recipes_requests_total'
+            '{route="recipes:detail",method="GET",status="200"}'
+        ], 1)
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test the bucket counts of a histogram."""
+        for _ in range(3):
+            self.client.get(reverse('recipes:list'))
+        samples = self.scrape()
+        labels = 'route="recipes:list",method="GET"'
+        buckets = [
+            samples[
+                f'recipes_request_queries_bucket{{{labels},le="{bound}"}}'
+            ]
+            for bound in (*metrics.QUERY_BUCKETS, '+Inf')
+        ]
+        self.assertEqual(buckets, sorted(buckets))
+        self.assertEqual(buckets[-1], 3)
+
+    def test_cache_hit_counts(self):
+        """Test that page cache hits and misses are counted."""
+        url = reverse('recipes:detail', args=[self.recipe.pk])
+        self.client.get(url)
+        self.client.get(url)
+        samples = self.scrape()
+        for result in ('hit', 'miss'):
+            self.assertEqual(samples[
+                f'recipes_cache_requests_total'
+                f'{{cache="detail",result="{result}"}}'
+            ], 1)
+
+    def test_metrics_require_staff_or_token(self):
+        """Test that only staff users and bearers of the token can read
+        the metrics."""
+        url = reverse('metrics')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+        for header in ['Bearer wrong', 'Basic scrape-token']:
+            with self.subTest(header=header):
+                self.assertEqual(self.client.get(
+                    url, headers={'Authorization': header}
+                ).status_code, 401)
+        with self.settings(RECIPES_METRICS_TOKEN=None):
+            self.assertEqual(
+                self.client.get(url, headers=self.scraper).status_code, 401
+            )
+        staff = User.objects.create_user('staff', password='pw',
+                                         is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_unmatched_route(self):
+        """Test that requests matching no URL share one route label."""
+        self.client.get('/no-such-page/')
+        self.assertEqual(self.scrape()[
+            'recipes_requests_total'
+            '{route="unmatched",method="GET",status="404"}'
+        ], 1)
+
+    async def test_async_requests(self):
+        """Test that requests through the async handler are recorded."""
+        await self.async_client.get(reverse('recipes:list'))
+        response = await self.async_client.get(
+            reverse('metrics'), headers=self.scraper
+        )
+        self.assertIn(
+            'recipes_request_queries_count'
+            '{route="recipes:list",method="GET"} 1',
+            response.content.decode()
+        )
+
+    def test_queries_outside_requests_are_ignored(self):
+        """Test that queries run outside a request record nothing."""
+        Recipe.objects.count()
+        self.assertNotIn('recipes_request_queries_count', ''.join(
+            line for line in metrics.registry.render().splitlines()
+            if not line.startswith('#')
+        ))
+
+    def test_label_escaping(self):
+        """Test that label values are escaped."""
+        self.assertEqual(
+            metrics._labels((('path', 'a"b\\c\nd'),)),
+            '{path="a\\"b\\\\c\\nd"}'
+        )
+
+    @override_settings(RECIPES_SLOW_REQUEST_SECONDS=0)
+    def test_slow_request_log(self):
+        """Test that slow requests are logged with their queries."""
+        with self.assertLogs('recipes.metrics', 'WARNING') as logs:
+            self.client.get(reverse('recipes:detail', args=[self.recipe.pk]))
+        message = logs.output[0]
+        self.assertIn('Slow request GET', message)
+        self.assertIn('(recipes:detail)', message)
+        self.assertIn('Slowest queries:', message)
+        self.assertIn('recipes_ingredient', message)
+
+    @override_settings(RECIPES_SLOW_REQUEST_SECONDS=None)
+    def test_slow_request_log_disabled(self):
+        """Test that no slow request is logged without a threshold."""
+        with self.assertNoLogs('recipes.metrics'):
+            self.client.get(reverse('recipes:list'))
+
+
+class BenchmarkTest(TestCase):
+    """Test cases for the synthetic catalog and the benchmark suite."""
+
+    def result(self, **values):
+        """Return a scenario result with ``values`` overriding defaults."""
+        return {
+            'operations': 10, 'errors': 0, 'unit': 'requests',
+            'throughput': 100.0, 'p50_ms': 8.0, 'p95_ms': 10.0,
+            'p99_ms': 12.0, 'queries': 3, **values,
+        }
+
+    def run_document(self, size=100, **values):
+        """Return a run document with one ``list`` scenario."""
+        return {
+            'environment': {'size': size, 'seed': 0},
+            'scenarios': {'list': self.result(**values)},
+        }
+
+    def test_records_are_reproducible(self):
+        """Test that a seed always generates the same catalog."""
+        self.assertEqual(
+            list(synthetic.records(20, seed=3)),
+            list(synthetic.records(20, seed=3))
+        )
+        self.assertNotEqual(
+            list(synthetic.records(20, seed=3)),
+            list(synthetic.records(20, seed=4))
+        )
+
+    def test_records_are_skewed(self):
+        """Test that popular ingredients are much more common than rare
+        ones."""
+        counts = Counter(
+            ingredient['name']
+            for record in synthetic.records(2000)
+            for ingredient in record['ingredients']
+        )
+        popular = synthetic.INGREDIENTS[0][0]
+        rare = synthetic.search_terms()['rare']
+        self.assertEqual(counts.most_common(1)[0][0], popular)
+        self.assertGreater(counts[popular], 10 * counts[rare])
+
+    def test_run_scenarios(self):
+        """Test a short run of every scenario on a small catalog."""
+        self.assertEqual(benchmark.build_catalog(60, seed=1), 60)
+        runner = benchmark.Benchmark(seed=1, requests=10, warmup=1)
+        results = runner.run()
+        self.assertEqual(list(results), list(benchmark.SCENARIOS))
+        for name, result in results.items():
+            with self.subTest(scenario=name):
+                self.assertEqual(result['errors'], 0)
+                self.assertGreater(result['throughput'], 0)
+                self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertEqual(results['list']['operations'], 10)
+        self.assertEqual(
+            results['detail']['queries'], QUERY_BUDGETS['recipes:detail']
+        )
+        self.assertEqual(results['import']['unit'], 'recipes')
+        # Imported records are rolled back.
+        self.assertEqual(Recipe.objects.count(), 60)
+
+    def test_compare_finds_regressions(self):
+        """Test which changes count as regressions."""
+        baseline = self.run_document()
+        self.assertEqual(
+            benchmark.compare(self.run_document(p95_ms=12.0), baseline), []
+        )
+        for values, expected in [
+            ({'p95_ms': 20.0}, 'p95'),
+            ({'throughput': 50.0}, 'requests/s'),
+            ({'queries': 4}, 'queries'),
+            ({'errors': 1}, 'errors'),
+        ]:
+            with self.subTest(values=values):
+                regressions = benchmark.compare(
+                    self.run_document(**values), baseline
+                )
+                self.assertEqual(len(regressions), 1)
+                self.assertIn(expected, regressions[0])
+
+    def test_compare_needs_the_same_catalog(self):
+        """Test that runs on different catalogs cannot be compared."""
+        with self.assertRaises(benchmark.BenchmarkError):
+            benchmark.compare(
+                self.run_document(size=1000), self.run_document()
+            )
+
+
+class DatabaseProfileTest(TestCase):
+    """Test cases for the SQLite database profiles and their upkeep."""
+
+    def setUp(self):
+        """Create a scratch database file."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'scratch.sqlite3')
+
+    def pragma(self, db, name):
+        """Return the value of a pragma on connection ``db``."""
+        with db.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_production_profile(self):
+        """Test the pragmas and settings of production connections."""
+        db = benchmark.profile_connection('production', self.path, 'scratch')
+        self.addCleanup(db.close)
+        self.assertEqual(self.pragma(db, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(db, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma(db, 'cache_size'), -32768)
+        self.assertEqual(self.pragma(db, 'mmap_size'), 268435456)
+        self.assertEqual(self.pragma(db, 'temp_store'), 2)  # MEMORY
+        self.assertEqual(self.pragma(db, 'busy_timeout'), 5000)
+        self.assertEqual(db.transaction_mode, 'IMMEDIATE')
+        self.assertTrue(db.settings_dict['CONN_HEALTH_CHECKS'])
+        self.assertGreater(db.settings_dict['CONN_MAX_AGE'], 0)
+
+    def test_development_profile(self):
+        """Test that development connections keep SQLite's defaults."""
+        db = benchmark.profile_connection(
+            'development', self.path, 'scratch'
+        )
+        self.addCleanup(db.close)
+        self.assertEqual(self.pragma(db, 'journal_mode'), 'delete')
+        self.assertEqual(self.pragma(db, 'synchronous'), 2)  # FULL
+        self.assertEqual(db.settings_dict['CONN_MAX_AGE'], 0)
+
+    def test_copy_database(self):
+        """Test that benchmark copies leave write-ahead logging off."""
+        db = benchmark.profile_connection('production', self.path, 'scratch')
+        with db.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (x)')
+            cursor.execute('INSERT INTO t VALUES (1)')
+        db.close()
+        copy = self.path + '.copy'
+        benchmark.copy_database(self.path, copy)
+        db = benchmark.profile_connection('development', copy, 'copy')
+        self.addCleanup(db.close)
+        self.assertEqual(self.pragma(db, 'journal_mode'), 'delete')
+        with db.cursor() as cursor:
+            cursor.execute('SELECT x FROM t')
+            self.assertEqual(cursor.fetchall(), [(1,)])
+
+    def test_optimize_interval(self):
+        """Test that optimizing is due once per interval."""
+        with override_settings(RECIPES_SQLITE_OPTIMIZE_INTERVAL=3600):
+            database.optimize_due()
+            self.assertFalse(database.optimize_due())
+        with override_settings(RECIPES_SQLITE_OPTIMIZE_INTERVAL=0):
+            self.assertTrue(database.optimize_due())
+        with override_settings(RECIPES_SQLITE_OPTIMIZE_INTERVAL=None):
+            self.assertFalse(database.optimize_due())
+
+    def test_optimize(self):
+        """Test that optimizing runs PRAGMA optimize."""
+        with CaptureQueriesContext(connection) as context:
+            database.optimize(connection)
+        self.assertEqual(
+            [query['sql'] for query in context.captured_queries],
+            ['PRAGMA optimize']
+        )
+
+    @override_settings(RECIPES_SQLITE_OPTIMIZE_INTERVAL=0)
+    def test_requests_skip_optimizing_within_transactions(self):
+        """Test that connections in a transaction are not optimized."""
+        with CaptureQueriesContext(connection) as context:
+            database.optimize_connections(sender=None)
+        self.assertEqual(context.captured_queries, [])
+
+
+@override_settings(RECIPES_READ_REPLICAS=['replica'])
+class ReplicaRoutingTest(TransactionTestCase):
+    """Test cases for reading the catalog from a lagging read replica.
+
+    Queries on the replica run outside the test transaction, so changes
+    are committed and flushed after each test instead.
+    """
+
+    def setUp(self):
+        """Copy the database to a replica file, then rename a recipe on
+        the primary only, as if the replica lagged behind."""
+        self.recipe = Recipe.objects.create(
+            name="Tomato soup", instructions="Simmer."
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'replica.sqlite3')
+        connection.ensure_connection()
+        replica_file = sqlite3.connect(path)
+        connection.connection.backup(replica_file)
+        replica_file.close()
+        replica = type(connections['default'])(
+            {**connection.settings_dict, 'NAME': path}, 'replica'
+        )
+        connections['replica'] = replica
+        self.addCleanup(self.remove_replica, replica)
+        cache.clear()
+        search_results.clear()
+        self.recipe.name = "Lentil soup"
+        self.recipe.save()
+
+    @staticmethod
+    def remove_replica(replica):
+        """Close and forget the replica connection."""
+        replica.close()
+        del connections['replica']
+
+    def test_router(self):
+        """Test that only reads of views using replicas go to one."""
+        router = routers.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Recipe))
+        with routers.routing(routers.RoutingState()) as state:
+            self.assertIsNone(router.db_for_read(Recipe))
+            routers.use_replicas()
+            self.assertEqual(router.db_for_read(Recipe), 'replica')
+            self.assertIsNone(
+                router.db_for_read(Ingredient, instance=self.recipe)
+            )
+            self.assertEqual(router.db_for_write(Recipe), 'default')
+            self.assertTrue(state.wrote)
+            self.assertIsNone(router.db_for_read(Recipe))
+        with routers.routing(routers.RoutingState(sticky=True)):
+            routers.use_replicas()
+            self.assertIsNone(router.db_for_read(Recipe))
+        self.assertFalse(router.allow_migrate('replica', 'recipes'))
+        self.assertIsNone(router.allow_migrate('default', 'recipes'))
+
+    def test_catalog_views_read_from_replica(self):
+        """Test that list, detail, search and API reads use the replica."""
+        detail = reverse('recipes:detail', args=[self.recipe.pk])
+        for url in (reverse('recipes:list'), detail,
+                    reverse('recipes:list') + '?q=tomato'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, "Tomato soup")
+                self.assertNotContains(response, "Lentil soup")
+        response = self.client.get(
+            reverse('recipes:api-detail', args=[self.recipe.pk])
+        )
+        self.assertEqual(response.json()['name'], "Tomato soup")
+
+    def test_export_reads_from_replica(self):
+        """Test that the streamed export body is read from the replica."""
+        staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('recipes:export'))
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn("Tomato soup", content)
+        self.assertNotIn("Lentil soup", content)
+
+    def test_admin_reads_from_primary(self):
+        """Test that the admin reads the primary."""
+        admin = User.objects.create_superuser('admin', password='pw')
+        self.client.force_login(admin)
+        response = self.client.get(reverse(
+            'admin:recipes_recipe_change', args=[self.recipe.pk]
+        ))
+        self.assertContains(response, "Lentil soup")
+
+    def test_reads_stick_to_primary_after_a_write(self):
+        """Test that a client reads the primary for a while after it
+        writes."""
+        User.objects.create_superuser('admin', password='pw')
+        response = self.client.post(
+            reverse('admin:login'), {'username': 'admin', 'password': 'pw'}
+        )
+        self.assertIn(routers.STICKY_COOKIE, response.cookies)
+        detail = reverse('recipes:api-detail', args=[self.recipe.pk])
+        self.assertEqual(
+            self.client.get(detail).json()['name'], "Lentil soup"
+        )
+        self.client.cookies[routers.STICKY_COOKIE] = '0'
+        self.assertEqual(
+            self.client.get(detail).json()['name'], "Tomato soup"
+        )
+
+    def test_no_sticky_cookie_without_writes(self):
+        """Test that reading does not send a client to the primary."""
+        response = self.client.get(reverse('recipes:list'))
+        self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+
+    def test_pages_read_right_after_a_write_are_not_cached(self):
+        """Test that pages read from the replica are cached only once it
+        has had time to catch up with the last write."""
+        detail = reverse('recipes:detail', args=[self.recipe.pk])
+        self.client.get(detail)
+        self.client.get(reverse('recipes:list'))
+        self.client.get(reverse('recipes:list') + '?q=tomato')
+        self.assertIsNone(get_detail(self.recipe.pk))
+        self.assertIsNone(cache.get(card_key(self.recipe.pk)))
+        self.assertEqual(search_results.stats()['entries'], 0)
+
+        cache.set(WRITTEN_AT_KEY, 0, None)
+        self.client.get(detail)
+        self.client.get(reverse('recipes:list'))
+        self.client.get(reverse('recipes:list') + '?q=tomato')
+        self.assertIsNotNone(get_detail(self.recipe.pk))
+        self.assertIsNotNone(cache.get(card_key(self.recipe.pk)))
+        self.assertEqual(search_results.stats()['entries'], 1)
+
+
+@override_settings(
+    RECIPES_BACKGROUND_JOBS=True, RECIPES_JOB_COALESCE_SECONDS=0,
+    RECIPES_JOB_MAX_ATTEMPTS=2, RECIPES_JOB_RETRY_SECONDS=10,
+)
+class JobQueueTest(TestCase):
+    """Test cases for the background job queue."""
+
+    def setUp(self):
+        """Load foods, create a recipe with ingredients and register a
+        task failing for some keys."""
+        nutrition.load_foods(StringIO(FOOD_TABLE))
+        self.recipe = Recipe.objects.create(
+            name="Onion tart", instructions="Bake", servings=2
+        )
+        for name in ["Butter", "Flour", "Onions"]:
+            self.recipe.ingredients.create(
+                name=name, quantity=Decimal('100'), unit='g'
+            )
+        self.runs = []
+        jobs.task('test.flaky')(self.flaky)
+        self.addCleanup(jobs.TASKS.pop, 'test.flaky')
+
+    def flaky(self, keys):
+        """Record a run, failing if it includes the key 'bad'."""
+        self.runs.append(list(keys))
+        if 'bad' in keys:
+            raise ValueError("bad key")
+
+    def make_available(self):
+        """Make every waiting job available now."""
+        Job.objects.update(available_at=timezone.now())
+
+    def test_changes_are_coalesced_into_one_job(self):
+        """Test that a recipe and its ingredients queue one refresh job,
+        and similar recipes one job for the whole catalog."""
+        self.assertEqual(
+            list(Job.objects.values_list('task', 'key').order_by('task')),
+            [(tasks.REFRESH_RECIPES, str(self.recipe.pk)),
+             (tasks.UPDATE_SIMILAR_RECIPES, '')]
+        )
+        self.assertFalse(RecipeCard.objects.filter(pk=self.recipe.pk).exists())
+        self.assertGreater(
+            Job.objects.get(task=tasks.UPDATE_SIMILAR_RECIPES).available_at,
+            timezone.now() + timedelta(seconds=tasks.SIMILARITY_DELAY - 5)
+        )
+
+    def test_worker_updates_derived_data(self):
+        """Test that running the jobs builds the card, the nutrition
+        totals and the similar recipes."""
+        Recipe.objects.create(name="Onion soup", instructions="Simmer") \
+            .ingredients.create(name="Onions")
+        self.make_available()
+        self.assertEqual(jobs.Worker().run(burst=True), 3)
+        self.assertFalse(Job.objects.exists())
+        card = RecipeCard.objects.get(pk=self.recipe.pk)
+        self.assertEqual(card.ingredient_count, 3)
+        self.recipe.refresh_from_db()
+        self.assertAlmostEqual(self.recipe.calories, 717 + 364 + 40)
+        self.assertEqual(card.calories_per_serving,
+                         round(self.recipe.calories / 2, 1))
+        self.assertFalse(SimilarityUpdate.objects.exists())
+        counter = JobCounter.objects.get(task=tasks.REFRESH_RECIPES)
+        self.assertEqual((counter.succeeded, counter.failed), (2, 0))
+
+    def test_jobs_of_a_task_run_in_batches(self):
+        """Test that available jobs of one task run with one call, up to
+        the batch size."""
+        jobs.enqueue('test.flaky', ['a', 'b', 'c'])
+        Job.objects.exclude(task='test.flaky').delete()
+        worker = jobs.Worker(batch_size=2)
+        self.assertEqual(worker.run(burst=True), 3)
+        self.assertEqual(self.runs, [['a', 'b'], ['c']])
+
+    def test_failed_batch_is_retried_job_by_job(self):
+        """Test that a failing job is retried later without holding back
+        the rest of its batch, and kept after its last attempt."""
+        Job.objects.all().delete()
+        jobs.enqueue('test.flaky', ['good', 'bad'])
+        with self.assertLogs('recipes.jobs', 'WARNING') as logs:
+            jobs.Worker().run_once()
+        self.assertIn("retrying in 10 s", logs.output[-1])
+        self.assertEqual(self.runs, [['good', 'bad'], ['good'], ['bad']])
+        job = Job.objects.get()
+        self.assertEqual((job.key, job.attempts, job.worker),
+                         ('bad', 1, ''))
+        self.assertIn("ValueError: bad key", job.last_error)
+        self.assertGreater(job.available_at,
+                           timezone.now() + timedelta(seconds=5))
+        self.assertEqual(jobs.Worker().run_once(), 0)
+
+        self.make_available()
+        with self.assertLogs('recipes.jobs', 'ERROR'):
+            jobs.Worker().run_once()
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 2)
+        self.assertIsNotNone(job.failed_at)
+        self.make_available()
+        self.assertEqual(jobs.Worker().run_once(), 0)
+        counter = JobCounter.objects.get(task='test.flaky')
+        self.assertEqual(
+            (counter.succeeded, counter.retried, counter.failed), (1, 1, 1)
+        )
+
+        jobs.enqueue('test.flaky', ['bad'])
+        job.refresh_from_db()
+        self.assertEqual((job.attempts, job.failed_at), (0, None))
+
+    def test_claimed_jobs_are_hidden_until_the_timeout(self):
+        """Test that a job claimed by a worker that died is claimed again
+        once its visibility timeout has passed."""
+        Job.objects.all().delete()
+        jobs.enqueue('test.flaky', ['a'])
+        name, claimed = jobs.Worker(name='dead').claim()
+        self.assertEqual((name, len(claimed)), ('test.flaky', 1))
+        self.assertEqual(jobs.Worker().run_once(), 0)
+
+        Job.objects.update(locked_until=timezone.now())
+        self.assertEqual(jobs.Worker().run_once(), 1)
+        self.assertEqual(self.runs, [['a']])
+        self.assertFalse(Job.objects.exists())
+
+    def test_job_queued_while_running_runs_again(self):
+        """Test that queueing a running job makes it run once more."""
+        Job.objects.all().delete()
+        jobs.enqueue('test.flaky', ['a'])
+        worker = jobs.Worker()
+        name, claimed = worker.claim()
+        jobs.enqueue('test.flaky', ['a'])
+        worker.run_batch(name, claimed)
+        job = Job.objects.get()
+        self.assertEqual((job.worker, job.locked_until), ('', None))
+        self.assertEqual(worker.run(burst=True), 1)
+        self.assertEqual(self.runs, [['a'], ['a']])
+
+    def test_without_background_jobs_work_is_done_at_once(self):
+        """Test that nothing is queued unless background jobs are on."""
+        Job.objects.all().delete()
+        with self.settings(RECIPES_BACKGROUND_JOBS=False):
+            self.recipe.ingredients.create(name="Milk")
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(
+            RecipeCard.objects.get(pk=self.recipe.pk).ingredient_count, 4
+        )
+
+    def test_run_jobs_command(self):
+        """Test that the command runs the available jobs and exits."""
+        out = StringIO()
+        call_command('run_jobs', '--burst', stdout=out)
+        self.assertIn("Ran 1 jobs.", out.getvalue())
+        self.assertTrue(RecipeCard.objects.filter(pk=self.recipe.pk).exists())
+        with self.assertRaises(CommandError):
+            call_command('run_jobs', '--threads', '0')
+
+    def test_metrics(self):
+        """Test that /metrics serves the backlog and finished jobs."""
+        Job.objects.all().delete()
+        jobs.enqueue('test.flaky', ['good', 'bad'])
+        with self.assertLogs('recipes.jobs', 'WARNING'):
+            jobs.Worker().run_once()
+            self.make_available()
+            jobs.Worker().run_once()
+        jobs.enqueue('test.flaky', ['later'])
+        self.client.force_login(User.objects.create_user(
+            'staff', password='pw', is_staff=True
+        ))
+        body = self.client.get(reverse('metrics')).content.decode()
+        for sample in [
+            '# TYPE recipes_jobs_backlog gauge',
+            'recipes_jobs_backlog{task="test.flaky",state="waiting"} 1',
+            'recipes_jobs_backlog{task="test.flaky",state="failed"} 1',
+            'recipes_jobs_backlog{task="test.flaky",state="running"} 0',
+            'recipes_jobs_total{task="test.flaky",result="succeeded"} 1',
+            'recipes_jobs_total{task="test.flaky",result="failed"} 1',
+            'recipes_jobs_oldest_seconds{task="test.flaky"} ',
+            'recipes_jobs_seconds_total{task="test.flaky"} ',
+        ]:
+            self.assertIn(sample, body)
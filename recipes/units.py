@@ -0,0 +1,230 @@
+"""Scaling of recipes to a number of servings and unit conversion.
+
+Free-text ``Ingredient.unit`` values are parsed into a registry of
+canonical units, each with a dimension (volume or mass) and its size in
+the base unit of that dimension (millilitres or grams). Conversion only
+happens within a dimension: converting cups of flour to grams would need
+the density of every ingredient.
+
+Quantities are scaled and converted in batches: the amounts, scale
+factors and unit sizes of every row are laid out as parallel
+``array('d')`` columns and multiplied element-wise in one pass, rather
+than with ``Decimal`` arithmetic per ingredient. Only choosing a readable
+display unit and rounding are done per row. Units that are not in the
+registry ("clove", "pinch") are scaled but kept as written.
+"""
+import math
+import operator
+from array import array
+from decimal import Decimal
+from functools import lru_cache
+
+from .models import Ingredient, Recipe
+
+VOLUME = 'volume'
+MASS = 'mass'
+
+# Canonical units: (dimension, size in millilitres or grams).
+UNITS = {
+    'ml': (VOLUME, 1.0),
+    'cl': (VOLUME, 10.0),
+    'dl': (VOLUME, 100.0),
+    'l': (VOLUME, 1000.0),
+    'tsp': (VOLUME, 4.92892),
+    'tbsp': (VOLUME, 14.7868),
+    'fl oz': (VOLUME, 29.5735),
+    'cup': (VOLUME, 236.588),
+    'pint': (VOLUME, 473.176),
+    'quart': (VOLUME, 946.353),
+    'gallon': (VOLUME, 3785.41),
+    'mg': (MASS, 0.001),
+    'g': (MASS, 1.0),
+    'kg': (MASS, 1000.0),
+    'oz': (MASS, 28.3495),
+    'lb': (MASS, 453.592),
+}
+
+ALIASES = {
+    'milliliter': 'ml', 'millilitre': 'ml',
+    'centiliter': 'cl', 'centilitre': 'cl',
+    'deciliter': 'dl', 'decilitre': 'dl',
+    'liter': 'l', 'litre': 'l', 'lt': 'l', 'ltr': 'l',
+    'teaspoon': 'tsp',
+    'tablespoon': 'tbsp', 'tbs': 'tbsp', 'tbl': 'tbsp',
+    'fluid ounce': 'fl oz', 'floz': 'fl oz',
+    'c': 'cup',
+    'pt': 'pint', 'qt': 'quart', 'gal': 'gallon',
+    'milligram': 'mg', 'gram': 'g', 'gr': 'g', 'grm': 'g',
+    'kilogram': 'kg', 'kilo': 'kg',
+    'ounce': 'oz', 'pound': 'lb',
+}
+
+# Display units of each system, largest first, with the smallest amount
+# (in base units) shown in them.
+SYSTEMS = {
+    'metric': {
+        VOLUME: [('l', 1000.0), ('ml', 0.0)],
+        MASS: [('kg', 1000.0), ('g', 0.0)],
+    },
+    'us': {
+        VOLUME: [
+            ('cup', UNITS['cup'][1] / 4),
+            ('tbsp', UNITS['tbsp'][1]),
+            ('tsp', 0.0),
+        ],
+        MASS: [('lb', UNITS['lb'][1]), ('oz', 0.0)],
+    },
+}
+
+MAX_SERVINGS = 1000
+SIGNIFICANT_DIGITS = 3
+CENT = Decimal('0.01')
+
+
+class ScalingError(ValueError):
+    """Raised when a recipe cannot be scaled as requested."""
+
+
+@lru_cache(maxsize=1024)
+def parse_unit(text: str) -> str | None:
+    """Return the canonical unit for a free-text unit, or None."""
+    unit = ' '.join(text.lower().replace('.', ' ').split())
+    if not unit:
+        return None
+    # Plurals: "cups", "lbs", "fluid ounces".
+    for candidate in (unit, unit.removesuffix('s')):
+        if candidate in UNITS:
+            return candidate
+        if candidate in ALIASES:
+            return ALIASES[candidate]
+    return None
+
+
+def parse_scaling(params) -> tuple[int | None, str | None]:
+    """Return the ``servings`` and ``units`` requested in ``params``."""
+    servings = params.get('servings') or None
+    if servings is not None:
+        try:
+            servings = int(servings)
+        except ValueError:
+            raise ScalingError("servings must be an integer.")
+        if not 1 <= servings <= MAX_SERVINGS:
+            raise ScalingError(
+                f"servings must be between 1 and {MAX_SERVINGS}."
+            )
+    system = params.get('units') or None
+    if system is not None and system not in SYSTEMS:
+        raise ScalingError(
+            f"units must be one of: {', '.join(SYSTEMS)}."
+        )
+    return servings, system
+
+
+def scale_factor(servings: int | None, target: int | None) -> float:
+    """Return the factor scaling a recipe of ``servings`` to ``target``."""
+    if target is None:
+        return 1.0
+    if not servings:
+        raise ScalingError("The recipe does not say how many it serves.")
+    return target / servings
+
+
+def _display(amount: float, dimension: str, system: str):
+    """Return the ``(unit, value)`` of a base amount in ``system``."""
+    for unit, minimum in SYSTEMS[system][dimension]:
+        if amount >= minimum:
+            return unit, amount / UNITS[unit][1]
+
+
+def round_quantity(value: float) -> Decimal:
+    """Round to a few significant digits and at most two decimals."""
+    if value == 0:
+        return Decimal('0.00')
+    return Decimal(f'{value:.{SIGNIFICANT_DIGITS}g}').quantize(CENT)
+
+
+def format_amount(amount: float, dimension: str, system: str):
+    """Return the rounded ``(quantity, unit)`` of a base amount of
+    ``dimension`` in ``system``."""
+    unit, value = _display(amount, dimension, system)
+    return round_quantity(value), unit
+
+
+def convert(quantities, units, factors, system: str | None = None):
+    """Scale, and convert to ``system`` if given, many quantities at once.
+
+    ``quantities`` (Decimals or None), ``units`` (free text) and
+    ``factors`` are parallel sequences. Returns ``(quantity, unit)``
+    pairs; missing quantities stay None.
+    """
+    units = list(units)
+    parsed = [parse_unit(unit) for unit in units]
+    amounts = array('d', (
+        math.nan if quantity is None else float(quantity)
+        for quantity in quantities
+    ))
+    sizes = array('d', (
+        UNITS[unit][1] if system and unit else 1.0 for unit in parsed
+    ))
+    values = array('d', map(
+        operator.mul, map(operator.mul, amounts, array('d', factors)), sizes
+    ))
+    results = []
+    for value, unit, text in zip(values, parsed, units):
+        if math.isnan(value):
+            results.append((None, text))
+            continue
+        if system and unit:
+            text, value = _display(value, UNITS[unit][0], system)
+        results.append((round_quantity(value), text))
+    return results
+
+
+def scale_ingredients(ingredients, factor: float = 1.0,
+                      system: str | None = None) -> list[dict]:
+    """Return ``{'quantity', 'unit', 'name'}`` dicts for ``ingredients``
+    scaled by ``factor``."""
+    ingredients = list(ingredients)
+    converted = convert(
+        [ingredient.quantity for ingredient in ingredients],
+        [ingredient.unit for ingredient in ingredients],
+        [factor] * len(ingredients),
+        system,
+    )
+    return [
+        {'quantity': quantity, 'unit': unit, 'name': ingredient.name}
+        for ingredient, (quantity, unit) in zip(ingredients, converted)
+    ]
+
+
+def scale_recipes(plan, system: str | None = None) -> dict[int, list[dict]]:
+    """Return the scaled ingredients of every recipe of a meal plan.
+
+    ``plan`` maps recipe ids to the wanted servings, or to None to keep a
+    recipe's own. All ingredients are loaded with one query and converted
+    in a single batch. Missing recipes are left out.
+    """
+    plan = dict(plan)
+    servings = dict(
+        Recipe.objects.filter(pk__in=plan).values_list('pk', 'servings')
+    )
+    factors = {
+        recipe_id: scale_factor(servings[recipe_id], plan[recipe_id])
+        for recipe_id in servings
+    }
+    rows = list(
+        Ingredient.objects.filter(recipe_id__in=factors)
+        .values_list('recipe_id', 'quantity', 'unit', 'name')
+    )
+    converted = convert(
+        [row[1] for row in rows],
+        [row[2] for row in rows],
+        [factors[row[0]] for row in rows],
+        system,
+    )
+    scaled = {recipe_id: [] for recipe_id in servings}
+    for (recipe_id, _, _, name), (quantity, unit) in zip(rows, converted):
+        scaled[recipe_id].append(
+            {'quantity': quantity, 'unit': unit, 'name': name}
+        )
+    return scaled
@@ -1,10 +1,60 @@
+from django.conf import settings
 from django.urls import path
-from .views import RecipeListView, RecipeDetailView
+from . import api, views
+from .views import export_recipes, search_cache_stats
 
 app_name = 'recipes'
 
+
+def view(sync_view, async_view):
+    """Return the view selected by ``RECIPES_ASYNC_VIEWS``."""
+    if getattr(settings, 'RECIPES_ASYNC_VIEWS', False):
+        return async_view.as_view()
+    return sync_view.as_view()
+
+
 urlpatterns = [
-    path('', RecipeListView.as_view(), name='list'),
-    path('<int:id>/', RecipeDetailView.as_view(), name='detail'),
+    path(
+        '',
+        view(views.RecipeListView, views.AsyncRecipeListView),
+        name='list'
+    ),
+    path(
+        '<int:id>/',
+        view(views.RecipeDetailView, views.AsyncRecipeDetailView),
+        name='detail'
+    ),
+    path(
+        'search-cache/',
+        search_cache_stats,
+        name='search-cache-stats'
+    ),
+    path('export/', export_recipes, name='export'),
+    path(
+        'shopping-list/',
+        views.ShoppingListView.as_view(),
+        name='shopping-list'
+    ),
+    path('suggest/', api.SuggestApiView.as_view(), name='suggest'),
+    path(
+        'api/recipes/',
+        view(api.RecipeListApiView, api.AsyncRecipeListApiView),
+        name='api-list'
+    ),
+    path(
+        'api/recipes/batch/',
+        view(api.RecipeBatchApiView, api.AsyncRecipeBatchApiView),
+        name='api-batch'
+    ),
+    path(
+        'api/recipes/<int:id>/',
+        view(api.RecipeDetailApiView, api.AsyncRecipeDetailApiView),
+        name='api-detail'
+    ),
+    path(
+        'api/search/',
+        view(api.RecipeSearchApiView, api.AsyncRecipeSearchApiView),
+        name='api-search'
+    ),
+    path('api/match/', api.RecipeMatchApiView.as_view(), name='api-match'),
 ]
-
@@ -1,44 +1,547 @@
-from django.views.generic import ListView, DetailView
-from django.db.models import Q
-from .models import Recipe
+import math
 
+from asgiref.sync import sync_to_async
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag, urlencode
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.views.generic import DetailView, ListView, TemplateView
+from . import cache, exporting, fuzzy, metrics, routers, shopping, units
+from .models import Recipe, RecipeCard, RecipeNeighbor
+from .pagination import IdListPaginator, InvalidCursor, KeysetPaginator
+from .routers import ReplicaReadsMixin
+from .search import (
+    aall_matches, acached_search_ids, all_matches, cached_search_ids,
+    get_max_results, is_complete,
+)
 
-class RecipeListView(ListView):
-    """View for listing all recipes with optional search filtering."""
-    model = Recipe
+
+class RecipeListView(ReplicaReadsMixin, ListView):
+    """View for listing all recipes with optional search filtering.
+
+    Cards are read from the ``RecipeCard`` projection, one table without
+    joins. ``?tag=`` may be repeated to narrow the list to recipes carrying
+    all of the given tags, and the tags of the current results are listed
+    as facets with their counts. Results are paginated with opaque
+    ``after``/``before`` cursors rather than page numbers, so deep pages
+    are as cheap as the first one. Search results are paged over their
+    cached, ranked ids; a search finding nothing is retried with misspelled
+    words corrected.
+
+    ``?min_calories=``/``?max_calories=`` bound the calories per serving
+    and ``?sort=calories`` (or ``-calories``) orders by them, both over
+    the indexed ``RecipeCard.calories_per_serving`` column.
+    ``?max_prep_time=``, ``?max_cook_time=``, ``?max_total_time=`` (in
+    minutes) and ``?min_servings=``/``?max_servings=`` are range filters
+    over indexed card columns too; recipes missing the value are left
+    out.
+
+    Reads go to a read replica when there are any.
+    """
+    model = RecipeCard
     template_name = 'recipes/list.html'
     context_object_name = 'recipes'
-    paginate_by = None
+    paginate_by = 24
+    paginator_class = KeysetPaginator
+    facet_limit = 20
+    corrected_query = None
+    sorts = {
+        'calories': ['calories_per_serving', 'pk'],
+        '-calories': ['-calories_per_serving', '-pk'],
+    }
+    # Range filter parameters: (card field lookup, value type).
+    range_filters = {
+        'min_calories': ('calories_per_serving__gte', float),
+        'max_calories': ('calories_per_serving__lte', float),
+        'max_prep_time': ('prep_time__lte', int),
+        'max_cook_time': ('cook_time__lte', int),
+        'max_total_time': ('total_time__lte', int),
+        'min_servings': ('servings__gte', int),
+        'max_servings': ('servings__lte', int),
+    }
+
+    def get_query(self) -> str:
+        """Return the search query, stripped of whitespace."""
+        return self.request.GET.get('q', '').strip()
+
+    def get_tags(self) -> list[str]:
+        """Return the distinct tag names selected with ``?tag=``."""
+        return list(dict.fromkeys(
+            name.strip() for name in self.request.GET.getlist('tag')
+            if name.strip()
+        ))
+
+    def get_ranges(self) -> dict:
+        """Return the values of the range filters given, by parameter.
+
+        Missing or invalid values leave that bound out.
+        """
+        ranges = {}
+        for name, (_, type_) in self.range_filters.items():
+            try:
+                value = type_(self.request.GET.get(name, ''))
+            except ValueError:
+                continue
+            if math.isfinite(value):
+                ranges[name] = value
+        return ranges
+
+    def get_sort(self) -> str | None:
+        """Return the selected ``?sort=`` order, or None for the default."""
+        sort = self.request.GET.get('sort')
+        return sort if sort in self.sorts else None
+
+    def get_ordering(self):
+        """Return the ordering of the selected sort, if any."""
+        sort = self.get_sort()
+        return self.sorts[sort] if sort else None
+
+    def is_filtered(self) -> bool:
+        """Return True if tags or range filters narrow the results."""
+        return bool(self.get_tags()) or bool(self.get_ranges())
 
     def get_queryset(self):
-        """Filter recipes based on search query, or return all if no query."""
-        query = self.request.GET.get('q', '').strip()
-        
-        queryset = Recipe.objects.all()
-        
-        if query:
-            # Search across recipe name, description, and ingredient names
-            # Case-insensitive search using icontains
+        """Return the cards of recipes carrying all selected tags, within
+        the range filters, in the selected order.
+
+        Sorting by calories leaves out recipes whose calories are unknown.
+        """
+        queryset = RecipeCard.objects.all()
+        tags = self.get_tags()
+        if tags:
+            queryset = queryset.tagged(tags)
+        ranges = self.get_ranges()
+        if ranges:
+            queryset = queryset.filter(**{
+                self.range_filters[name][0]: value
+                for name, value in ranges.items()
+            })
+        ordering = self.get_ordering()
+        if ordering:
             queryset = queryset.filter(
-                Q(name__icontains=query) |
-                Q(description__icontains=query) |
-                Q(ingredients__name__icontains=query)
-            ).distinct()
-        
+                calories_per_serving__isnull=False
+            ).order_by(*ordering)
         return queryset
 
+    def paginate_queryset(self, queryset, page_size):
+        """Return the page selected by the ``after``/``before`` cursors."""
+        query = self.get_query()
+        ids = None
+        if query:
+            # Full-text search across recipe name, description,
+            # instructions and ingredient names, ranked by relevance
+            ids = cached_search_ids(query)
+            if not ids:
+                self.corrected_query = fuzzy.correct_query(query)
+                if self.corrected_query:
+                    query = self.corrected_query
+                    ids = cached_search_ids(query)
+            self.matches = all_matches(query, ids)
+            if self.is_filtered() or self.get_sort():
+                ids = self.filter_ids(ids, list(
+                    self.matching_ids(queryset, ids)
+                ))
+        paginator = self.get_results_paginator(queryset, ids, page_size)
+        try:
+            page = paginator.get_page(
+                after=self.request.GET.get('after'),
+                before=self.request.GET.get('before'),
+            )
+        except InvalidCursor:
+            raise Http404("Invalid page cursor.")
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def matching_ids(self, queryset, ids):
+        """Return the ids of the search results in ``queryset``.
+
+        They are in the order of the selected sort, if any. Otherwise,
+        when the cached ``ids`` are complete, the order does not matter
+        and no sort is run; when they are not, the search runs again
+        within ``queryset`` and gives the ranked order.
+        """
+        if self.get_sort():
+            matching = queryset.filter(pk__in=self.matches)
+        elif is_complete(ids):
+            matching = queryset.filter(pk__in=ids).order_by()
+        else:
+            matching = self.matches.filter(
+                pk__in=queryset.order_by().values('pk')
+            )
+        return matching.values_list('pk', flat=True)[:get_max_results()]
+
+    def filter_ids(self, ids, matching) -> list[int]:
+        """Return the ranked ``ids`` that are also in ``matching``.
+
+        ``matching`` comes from ``matching_ids``, already in order when
+        sorted, which then replaces the ranking, or searched again.
+        """
+        if self.get_sort() or not is_complete(ids):
+            return matching
+        matching = set(matching)
+        return [pk for pk in ids if pk in matching]
+
+    def get_results_paginator(self, queryset, ids, page_size):
+        """Set ``self.results`` and return a paginator over them.
+
+        ``ids`` are the ranked search results, or None to list
+        ``queryset`` in its own order.
+        """
+        if ids is None:
+            self.results = queryset
+            return self.paginator_class(queryset, page_size)
+        # Facets count every match, not only the ids kept.
+        self.results = queryset.filter(pk__in=self.matches)
+        return IdListPaginator(RecipeCard.objects.all(), ids, page_size)
+
+    def filter_params(self, tags) -> str:
+        """Return the query string for the current search with ``tags``."""
+        params = [('q', self.get_query())] if self.get_query() else []
+        params.extend(('tag', name) for name in tags)
+        params.extend(
+            (name, value) for name, value in self.range_params().items()
+            if value
+        )
+        if self.get_sort():
+            params.append(('sort', self.get_sort()))
+        return urlencode(params)
+
+    def range_params(self) -> dict[str, str]:
+        """Return the range filters as query string values, '' if unset."""
+        ranges = self.get_ranges()
+        return {
+            name: f'{ranges[name]:g}' if name in ranges else ''
+            for name in self.range_filters
+        }
+
+    def facet_counts(self):
+        """Return ``(tag name, count)`` rows for the current results."""
+        return self.results.tag_counts()[:self.facet_limit]
+
+    def get_facets(self, counts) -> list[dict]:
+        """Return facets for the most common tags of the current results."""
+        selected = self.get_tags()
+        counts = list(counts)
+        shown = {name for name, _ in counts}
+        # Keep selected tags visible, so they can be removed, even when
+        # nothing matches.
+        counts.extend((name, 0) for name in selected if name not in shown)
+        facets = []
+        for name, count in counts:
+            is_selected = name in selected
+            tags = (
+                [tag for tag in selected if tag != name] if is_selected
+                else [*selected, name]
+            )
+            facets.append({
+                'name': name,
+                'count': count,
+                'selected': is_selected,
+                'params': self.filter_params(tags),
+            })
+        return facets
+
+    def get_filter_context(self, facet_counts, stale=False) -> dict:
+        """Return the search query, tag filters and facets context.
+
+        Cards of ``stale`` pages, read from a replica that may lag, are
+        not cached.
+        """
+        query = self.get_query()
+        selected = self.get_tags()
+        return {
+            'query': query,
+            'has_query': bool(query),
+            'corrected_query': self.corrected_query,
+            'selected_tags': selected,
+            **self.range_params(),
+            'sort': self.get_sort(),
+            'has_filters': self.is_filtered(),
+            'filter_params': self.filter_params(selected),
+            'facets': self.get_facets(facet_counts),
+            'card_cache_timeout': cache.get_card_timeout(stale),
+        }
+
     def get_context_data(self, **kwargs):
-        """Add search query to context."""
+        """Add the search query, tag filters and facets to context."""
         context = super().get_context_data(**kwargs)
-        context['query'] = self.request.GET.get('q', '').strip()
-        context['has_query'] = bool(context['query'])
+        context.update(self.get_filter_context(
+            self.facet_counts(), cache.replica_may_be_stale()
+        ))
         return context
 
 
-class RecipeDetailView(DetailView):
-    """View for displaying individual recipe details."""
+class AsyncRecipeListView(RecipeListView):
+    """Asynchronous version of ``RecipeListView`` for ASGI deployments.
+
+    Queries go through the async ORM, and cached search results are
+    served without leaving the event loop.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        self.object_list = self.get_queryset()
+        paginator, page, object_list, is_paginated = (
+            await self.apaginate_queryset(self.object_list, self.paginate_by)
+        )
+        counts = [row async for row in self.facet_counts()]
+        context = {
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': is_paginated,
+            'object_list': object_list,
+            self.context_object_name: object_list,
+            'view': self,
+            **self.get_filter_context(
+                counts, await cache.areplica_may_be_stale()
+            ),
+        }
+        return self.render_to_response(context)
+
+    async def apaginate_queryset(self, queryset, page_size):
+        """Asynchronous version of ``paginate_queryset``."""
+        query = self.get_query()
+        ids = None
+        if query:
+            ids = await acached_search_ids(query)
+            if not ids:
+                self.corrected_query = await sync_to_async(
+                    fuzzy.correct_query
+                )(query)
+                if self.corrected_query:
+                    query = self.corrected_query
+                    ids = await acached_search_ids(query)
+            self.matches = await aall_matches(query, ids)
+            if self.is_filtered() or self.get_sort():
+                ids = self.filter_ids(ids, [
+                    pk async for pk in self.matching_ids(queryset, ids)
+                ])
+        paginator = self.get_results_paginator(queryset, ids, page_size)
+        try:
+            page = await paginator.aget_page(
+                after=self.request.GET.get('after'),
+                before=self.request.GET.get('before'),
+            )
+        except InvalidCursor:
+            raise Http404("Invalid page cursor.")
+        return paginator, page, page.object_list, page.has_other_pages()
+
+
+class RecipeDetailView(ReplicaReadsMixin, DetailView):
+    """View for displaying individual recipe details.
+
+    Ingredients, tags and precomputed similar recipes are prefetched, so
+    the page renders in exactly four queries however many of them the
+    recipe has. Rendered pages are
+    cached until the recipe changes and carry ``ETag``/``Last-Modified``
+    validators derived from ``Recipe.updated_at``; a cached page is served,
+    or answered with 304 Not Modified, without touching the database.
+
+    ``?servings=N`` scales the ingredients and ``?units=metric|us``
+    converts them; pages for common servings counts are cached too.
+    Reads go to a read replica when there are any.
+    """
     model = Recipe
     template_name = 'recipes/detail.html'
     context_object_name = 'recipe'
     pk_url_kwarg = 'id'
+    queryset = Recipe.objects.prefetch_related(
+        'ingredients',
+        'tags',
+        Prefetch(
+            'neighbors',
+            queryset=RecipeNeighbor.objects.select_related('neighbor')
+            .only('recipe', 'score', 'neighbor__name'),
+        ),
+    )
+    variant = (None, None)
+
+    def get(self, request, *args, **kwargs):
+        """Serve the page from cache, rendering it on a miss."""
+        recipe_id = kwargs[self.pk_url_kwarg]
+        try:
+            self.variant = units.parse_scaling(request.GET)
+        except units.ScalingError as exc:
+            return HttpResponseBadRequest(str(exc))
+        cached = None
+        if cache.is_cached_variant(self.variant):
+            cached = cache.get_detail(recipe_id, self.variant)
+        if cached is None:
+            try:
+                response = super().get(request, *args, **kwargs)
+            except units.ScalingError as exc:
+                return HttpResponseBadRequest(str(exc))
+            response.render()
+            updated_at = self.object.updated_at
+            if (cache.is_cached_variant(self.variant)
+                    and not cache.replica_may_be_stale()):
+                cache.set_detail(
+                    recipe_id, updated_at, response.content, self.variant
+                )
+        else:
+            updated_at, content = cached
+            response = HttpResponse(content)
+        return self.conditional_response(recipe_id, updated_at, response)
+
+    def get_context_data(self, **kwargs):
+        """Add the ingredients, scaled and converted as requested."""
+        context = super().get_context_data(**kwargs)
+        servings, system = self.variant
+        ingredients = self.object.ingredients.all()
+        if servings or system:
+            factor = units.scale_factor(self.object.servings, servings)
+            ingredients = units.scale_ingredients(ingredients, factor, system)
+        context['ingredients'] = ingredients
+        context['servings'] = servings or self.object.servings
+        context['units'] = system
+        context['unit_systems'] = list(units.SYSTEMS)
+        return context
+
+    def conditional_response(self, recipe_id, updated_at, response):
+        """Add validators to ``response``, or answer 304 Not Modified."""
+        tag = f"{recipe_id}-{updated_at.timestamp()}"
+        if any(self.variant):
+            servings, system = self.variant
+            tag += f"-{servings or ''}-{system or ''}"
+        etag = quote_etag(tag)
+        last_modified = int(updated_at.timestamp())
+        not_modified = get_conditional_response(
+            self.request, etag=etag, last_modified=last_modified
+        )
+        if not_modified is not None:
+            return not_modified
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class AsyncRecipeDetailView(RecipeDetailView):
+    """Asynchronous version of ``RecipeDetailView`` for ASGI deployments."""
+
+    async def get(self, request, *args, **kwargs):
+        recipe_id = kwargs[self.pk_url_kwarg]
+        try:
+            self.variant = units.parse_scaling(request.GET)
+        except units.ScalingError as exc:
+            return HttpResponseBadRequest(str(exc))
+        cached = None
+        if cache.is_cached_variant(self.variant):
+            cached = await cache.aget_detail(recipe_id, self.variant)
+        if cached is None:
+            try:
+                self.object = await self.get_queryset().aget(pk=recipe_id)
+            except Recipe.DoesNotExist:
+                raise Http404("No recipe found matching the query")
+            try:
+                context = self.get_context_data(object=self.object)
+            except units.ScalingError as exc:
+                return HttpResponseBadRequest(str(exc))
+            response = self.render_to_response(context)
+            # Relations are prefetched, so rendering runs no queries.
+            response.render()
+            updated_at = self.object.updated_at
+            if (cache.is_cached_variant(self.variant)
+                    and not await cache.areplica_may_be_stale()):
+                await cache.aset_detail(
+                    recipe_id, updated_at, response.content, self.variant
+                )
+        else:
+            updated_at, content = cached
+            response = HttpResponse(content)
+        return self.conditional_response(recipe_id, updated_at, response)
+
+
+class ShoppingListView(TemplateView):
+    """Consolidated shopping list for a meal plan.
+
+    ``?recipes=12,15:2,20:0.5`` lists recipe ids with optional servings
+    multipliers; ``?units=metric|us`` picks the display units. The list is
+    rendered as HTML, or as ``?format=json`` or ``?format=csv``, and is
+    built with a single query however many recipes are planned.
+    """
+    template_name = 'recipes/shopping_list.html'
+    formats = ('html', 'json', 'csv')
+
+    def get(self, request, *args, **kwargs):
+        format = request.GET.get('format', 'html')
+        if format not in self.formats:
+            return HttpResponseBadRequest(f"Unknown format {format!r}.")
+        system = request.GET.get('units') or 'metric'
+        try:
+            if system not in units.SYSTEMS:
+                raise shopping.ShoppingListError(
+                    f"units must be one of: {', '.join(units.SYSTEMS)}."
+                )
+            plan = shopping.parse_plan(request.GET.getlist('recipes'))
+        except shopping.ShoppingListError as exc:
+            if format == 'json':
+                return JsonResponse({'error': str(exc)}, status=400)
+            return HttpResponseBadRequest(str(exc))
+        items = shopping.build_list(plan, system)
+
+        if format == 'json':
+            return JsonResponse(
+                {'units': system, 'items': items}, encoder=DjangoJSONEncoder
+            )
+        if format == 'csv':
+            response = HttpResponse(
+                shopping.to_csv(items), content_type='text/csv'
+            )
+            response.headers['Content-Disposition'] = (
+                'attachment; filename="shopping-list.csv"'
+            )
+            return response
+        return self.render_to_response(self.get_context_data(
+            items=items,
+            units=system,
+            unit_systems=list(units.SYSTEMS),
+            recipes=','.join(
+                f'{pk}:{multiplier:g}' for pk, multiplier in plan.items()
+            ),
+        ))
+
+
+@staff_member_required
+def search_cache_stats(request):
+    """Return this process's search result cache counters as JSON."""
+    return JsonResponse(cache.search_results.stats())
+
+
+def metrics_view(request):
+    """Return this process's request metrics for Prometheus to scrape.
+
+    Anyone else is asked for a bearer token; scrapes query the database.
+    """
+    if not metrics.is_authorized(request):
+        response = HttpResponse(status=401)
+        response['WWW-Authenticate'] = 'Bearer realm="metrics"'
+        return response
+    return HttpResponse(
+        metrics.registry.render(), content_type=metrics.CONTENT_TYPE
+    )
+
 
+@staff_member_required
+def export_recipes(request):
+    """Stream the whole catalog as ``?format=jsonl|csv``, ``&gzip=1``,
+    read from a read replica when there are any."""
+    format = request.GET.get('format', 'jsonl')
+    if format not in exporting.FORMATS:
+        return HttpResponseBadRequest(f"Unknown export format {format!r}.")
+    compress = request.GET.get('gzip') == '1'
+    filename = f'recipes.{format}' + ('.gz' if compress else '')
+    routers.use_replicas()
+    response = StreamingHttpResponse(
+        routers.stream(exporting.export(format, compress=compress)),
+        content_type=(
+            'application/gzip' if compress
+            else exporting.CONTENT_TYPES[format]
+        ),
+    )
+    response.headers['Content-Disposition'] = (
+        f'attachment; filename="{filename}"'
+    )
+    return response